@@ -92,7 +92,8 @@ class ExecUtils:
     return []
 
   @staticmethod
-  def RunCmd(cmd, timeout_sec=sys.maxsize, piped_output=True, extra_env=None):
+  def RunCmd(cmd, timeout_sec=sys.maxsize, piped_output=True, extra_env=None, rusage=None,
+             output_writer=None, monitor=None):
     """Executes a command.
     Args:
       cmd: string: A string specifying the command to execute.
@@ -100,6 +101,13 @@ class ExecUtils:
       piped_output: bool: Set to true if the output is to be dumped directly
           to termimal.
       extra_env: dict{string, string}: The extra environment variables to pass to the cmd.
+      rusage: dict: If given, it is filled with the cpu time of the cmd and all its children:
+          'utime' and 'stime'. The max RSS is not reported: the cmd is forked from this process
+          before it execs, so it would include the memory of this process.
+      output_writer: object: If given, the output of the cmd is passed to its write(bytes) method
+          as it is produced instead of being returned.
+      monitor: object: If given, its Start(pid) method is called once the cmd is started and its
+          Stop() method once the cmd is done.
     """
     TermColor.VInfo(2, 'Executing: %s' % cmd)
 
@@ -113,18 +121,38 @@ class ExecUtils:
       timer = None
       proc = None
 
-      if piped_output:
+      if piped_output or output_writer:
         proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE,
                                 stderr=subprocess.STDOUT, env=cmd_env)
       else:
         proc = subprocess.Popen(cmd, shell=True, env=cmd_env)
+      if monitor: monitor.Start(proc.pid)
 
       # Start timeout.
       timer = Timer(timeout_sec, ExecUtils.__ProcessTimedOut,
                     [proc, cmd, timeout_sec])
       timer.start()
-      (merged_out, unused) = proc.communicate()
+      merged_out = None
+      if output_writer:
+        for chunk in iter(lambda: proc.stdout.read1(1 << 16), b''):
+          output_writer.write(chunk)
+      elif rusage is None:
+        (merged_out, unused) = proc.communicate()
+      elif piped_output:
+        # stderr is merged into stdout so reading stdout to the end cannot block on a full stderr
+        # pipe.
+        merged_out = proc.stdout.read()
+      if rusage is not None:
+        # Reap the process with wait4 to get its resource usage.
+        (unused_pid, wait_status, usage) = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(wait_status)
+        if proc.stdout: proc.stdout.close()
+        rusage.update({'utime': usage.ru_utime, 'stime': usage.ru_stime})
+      elif output_writer:
+        proc.wait()
+        proc.stdout.close()
       timer.cancel()
+      if monitor: monitor.Stop()
       retcode = proc.poll()
       if not merged_out:
         merged_out = ''
@@ -141,6 +169,7 @@ class ExecUtils:
       if proc:
         ExecUtils.__KillSubchildren(proc.pid)
         proc.communicate()
+        if monitor: monitor.Stop()
       # Pass on the keyboard interrupt.
       if type(e) == KeyboardInterrupt: raise e
     return (301, '')
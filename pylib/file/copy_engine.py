@@ -0,0 +1,241 @@
+"""Parallel incremental copy of directory trees."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+from concurrent.futures import ThreadPoolExecutor
+import errno
+import hashlib
+import os
+import shutil
+import stat
+import threading
+
+from pylib.base.term_color import TermColor
+from pylib.file.file_utils import FileUtils
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+
+class CopyEngine(object):
+  """Class to copy directory trees.
+
+  The source tree is walked with scandir. Files whose destination already has the same size and
+  mtime are skipped. In strict mode the contents of such files are compared instead. The remaining
+  files are copied in parallel by a pool of threads using copy_file_range or sendfile, so the data
+  never passes through python. When the source and destination are on the same device, files are
+  cloned (reflink) if the file system supports it, or hardlinked if requested.
+
+  Every file is written to a temp file next to its destination and renamed into place. A failed
+  copy never leaves a partial file behind, and a destination that is a hardlink to another file is
+  replaced instead of being written through.
+
+  Members:
+    _threads: int: The number of copy threads.
+    _strict: bool: Compare the contents of files with the same size and mtime.
+    _link: string: One of LINK_MODES.
+    _stats: dict {string, int}: The stats of the current copy.
+    _can_clone: bool: False once the file system of the current copy failed to clone a file.
+    _lock: Lock: Protects the stats.
+  """
+
+  # Link modes:
+  #   none: Always copy the data.
+  #   reflink: Clone files on the same device if supported. Copy otherwise.
+  #   hardlink: Hardlink files on the same device. Copy otherwise. Note that changes to a
+  #       hardlinked file are visible in both trees.
+  #   auto: Clone if supported, hardlink otherwise.
+  LINK_MODES = ('none', 'reflink', 'hardlink', 'auto')
+
+  # From linux/fs.h.
+  FICLONE = 0x40049409
+
+  # Size of the chunks passed to the kernel in one call.
+  CHUNK_SIZE = 1 << 30
+
+  def __init__(self, threads=8, strict=False, link='reflink'):
+    if link not in self.LINK_MODES:
+      raise ValueError('Invalid link mode %s. Must be one of %s' % (link, self.LINK_MODES))
+    self._threads = max(threads, 1)
+    self._strict = strict
+    self._link = link
+    self._stats = {}
+    self._can_clone = True
+    self._lock = threading.Lock()
+
+  @classmethod
+  def AddArguments(cls, parser):
+    """Adds the options for the copy engine to the parser.
+
+    Args:
+      parser: ArgumentParser: The argument parser.
+    """
+    parser.add_argument('--copy_threads', type=int, default=8,
+                        help='Number of threads used to copy the files of a dir.')
+    parser.add_argument('--copy_strict', action='store_true', default=False,
+                        help='Compare the contents of files with the same size and mtime instead '
+                        'of skipping them.')
+    parser.add_argument('--copy_link', type=str, default='reflink', choices=cls.LINK_MODES,
+                        help='How to link files instead of copying them when the source and '
+                        'destination are on the same device.')
+
+  @classmethod
+  def FromArgs(cls, args):
+    """Returns: CopyEngine: The engine for the options added by AddArguments()."""
+    return CopyEngine(args.copy_threads, args.copy_strict, args.copy_link)
+
+  def CopyTree(self, src, dst):
+    """Copies the directory tree src to dst. Files in dst that are not in src are kept.
+
+    Args:
+      src: string: The source dir.
+      dst: string: The destination dir. Created if it does not exist.
+
+    Return:
+      dict {string, int}: The number of files copied, linked, skipped and failed and the number
+          of bytes copied.
+    """
+    self._stats = {'copied': 0, 'linked': 0, 'skipped': 0, 'failed': 0, 'bytes': 0}
+    self._can_clone = True
+    FileUtils.MakeDirs(dst)
+    same_device = FileUtils.IsSameDevice(src, dst)
+    with ThreadPoolExecutor(max_workers=self._threads) as pool:
+      try:
+        # Consume the results so that unexpected exceptions are raised here.
+        for x in pool.map(lambda x: self._CopyFile(x[0], x[1], x[2], same_device),
+                          self._Walk(src, dst)):
+          pass
+      except OSError as e:
+        TermColor.Error('Cannot copy %s to %s. %s: %s' % (src, dst, type(e), e))
+        self._Count('failed')
+    return self._stats
+
+  def _Walk(self, src, dst):
+    """Creates the dirs and links of the tree and yields the files to copy.
+
+    Return:
+      generator: (src, dst, stat) for each file.
+    """
+    dirs = [(src, dst)]
+    while dirs:
+      (src_dir, dst_dir) = dirs.pop()
+      FileUtils.MakeDirs(dst_dir)
+      for entry in os.scandir(src_dir):
+        dst_path = os.path.join(dst_dir, entry.name)
+        if entry.is_symlink():
+          self._CopyLink(entry.path, dst_path)
+        elif entry.is_dir():
+          dirs += [(entry.path, dst_path)]
+        elif entry.is_file():
+          yield (entry.path, dst_path, entry.stat())
+
+  def _CopyLink(self, src, dst):
+    """Recreates the symlink src at dst."""
+    target = os.readlink(src)
+    if os.path.islink(dst) and os.readlink(dst) == target:
+      self._Count('skipped')
+      return
+    if os.path.isdir(dst) and not os.path.islink(dst): shutil.rmtree(dst)
+    elif os.path.lexists(dst): os.remove(dst)
+    os.symlink(target, dst)
+    self._Count('copied')
+
+  def _CopyFile(self, src, dst, src_stat, same_device):
+    """Copies a single file if it changed."""
+    try:
+      if self._IsUpToDate(src, dst, src_stat):
+        self._Count('skipped')
+        return
+
+      tmp = os.path.join(os.path.dirname(dst), '.%s.copy_tmp' % os.path.basename(dst))
+      if os.path.lexists(tmp): os.remove(tmp)
+      hardlink = same_device and (self._link == 'hardlink' or
+                                  (self._link == 'auto' and not self._can_clone))
+      cloned = False
+      if not hardlink:
+        with open(src, 'rb') as fsrc, open(tmp, 'wb') as fdst:
+          if same_device and self._link in ('reflink', 'auto'): cloned = self._Clone(fsrc, fdst)
+          if not cloned and same_device and self._link == 'auto':
+            hardlink = True
+          elif not cloned:
+            self._CopyData(fsrc, fdst, src_stat.st_size)
+        if hardlink: os.remove(tmp)
+
+      if hardlink: os.link(src, tmp)
+      if not hardlink: shutil.copystat(src, tmp)
+      os.replace(tmp, dst)
+      if hardlink or cloned: self._Count('linked')
+      else: self._Count('copied', src_stat.st_size)
+    except (OSError, IOError) as e:
+      TermColor.Error('Cannot copy %s to %s. %s: %s' % (src, dst, type(e), e))
+      self._Count('failed')
+
+  def _IsUpToDate(self, src, dst, src_stat):
+    """Returns: bool: True if dst does not need to be copied again."""
+    try:
+      dst_stat = os.lstat(dst)
+    except OSError:
+      return False
+    if not stat.S_ISREG(dst_stat.st_mode) or dst_stat.st_size != src_stat.st_size: return False
+    if (dst_stat.st_dev, dst_stat.st_ino) == (src_stat.st_dev, src_stat.st_ino): return True
+    if self._strict: return self._GetHash(src) == self._GetHash(dst)
+    return dst_stat.st_mtime_ns == src_stat.st_mtime_ns
+
+  @classmethod
+  def _GetHash(cls, filename):
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as f:
+      for chunk in iter(lambda: f.read(1 << 20), b''):
+        md5.update(chunk)
+    return md5.hexdigest()
+
+  def _Clone(self, fsrc, fdst):
+    """Clones the file with a reflink.
+
+    Return:
+      bool: True if the file was cloned.
+    """
+    if not fcntl or not self._can_clone: return False
+    try:
+      fcntl.ioctl(fdst.fileno(), self.FICLONE, fsrc.fileno())
+      return True
+    except OSError as e:
+      # Do not try again if the file system does not support it.
+      if e.errno in (errno.EOPNOTSUPP, errno.ENOTSUP, errno.EXDEV, errno.EINVAL, errno.ENOTTY):
+        self._can_clone = False
+      return False
+
+  @classmethod
+  def _CopyData(cls, fsrc, fdst, size):
+    """Copies the data of the file in the kernel. Falls back to a copy in python."""
+    (src_fd, dst_fd) = (fsrc.fileno(), fdst.fileno())
+    offset = 0
+    for func in (getattr(os, 'copy_file_range', None), getattr(os, 'sendfile', None)):
+      if not func: continue
+      try:
+        while offset < size:
+          if func == os.sendfile:
+            # sendfile writes at the current position of the destination.
+            os.lseek(dst_fd, offset, os.SEEK_SET)
+            sent = os.sendfile(dst_fd, src_fd, offset, min(cls.CHUNK_SIZE, size - offset))
+          else:
+            sent = func(src_fd, dst_fd, min(cls.CHUNK_SIZE, size - offset), offset, offset)
+          if not sent: break
+          offset += sent
+        return
+      except OSError as e:
+        # Not supported for these files. Try the next method from where this one stopped.
+        if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+                           errno.ENOTSUP, errno.EBADF):
+          raise
+    fsrc.seek(offset)
+    fdst.seek(offset)
+    shutil.copyfileobj(fsrc, fdst, 1 << 20)
+
+  def _Count(self, key, size=0):
+    with self._lock:
+      self._stats[key] += 1
+      self._stats['bytes'] += size
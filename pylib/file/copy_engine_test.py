@@ -0,0 +1,66 @@
+"""Tests for copy_engine."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pylib.file.copy_engine import CopyEngine
+from pylib.file.file_utils import FileUtils
+
+
+class CopyEngineTest(unittest.TestCase):
+  """Tests for CopyEngine."""
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.src = os.path.join(self.dir, 'src')
+    self.dst = os.path.join(self.dir, 'dst')
+    FileUtils.MakeDirs(os.path.join(self.src, 'a', 'b'))
+    FileUtils.CreateFileWithData(os.path.join(self.src, 'top'), 'top\n')
+    FileUtils.CreateFileWithData(os.path.join(self.src, 'a', 'b', 'deep'), 'x' * 100000)
+    os.symlink('top', os.path.join(self.src, 'link'))
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def _Contents(self, *path):
+    return FileUtils.FileContents(os.path.join(self.dst, *path))
+
+  def test_copy(self):
+    stats = CopyEngine(threads=2, link='none').CopyTree(self.src, self.dst)
+    self.assertEqual((stats['copied'], stats['failed'], stats['bytes']), (3, 0, 100004))
+    self.assertEqual(self._Contents('a', 'b', 'deep'), 'x' * 100000)
+    self.assertEqual(os.readlink(os.path.join(self.dst, 'link')), 'top')
+
+    # Unchanged files are skipped.
+    stats = CopyEngine(threads=2, link='none').CopyTree(self.src, self.dst)
+    self.assertEqual((stats['copied'], stats['skipped']), (0, 3))
+
+    # Changed files are copied again. In strict mode, files with the same size and a different
+    # mtime are compared.
+    FileUtils.CreateFileWithData(os.path.join(self.src, 'top'), 'new\n')
+    os.utime(os.path.join(self.src, 'a', 'b', 'deep'), (1, 1))
+    stats = CopyEngine(threads=2, strict=True, link='none').CopyTree(self.src, self.dst)
+    self.assertEqual((stats['copied'], stats['skipped']), (1, 2))
+    self.assertEqual(self._Contents('top'), 'new\n')
+
+  def test_hardlink(self):
+    stats = CopyEngine(link='hardlink').CopyTree(self.src, self.dst)
+    self.assertEqual(stats['linked'], 2)
+    self.assertTrue(os.path.samefile(os.path.join(self.src, 'top'), os.path.join(self.dst, 'top')))
+
+    # A destination hardlinked to another file is replaced, not written through.
+    other = os.path.join(self.dir, 'other')
+    FileUtils.CreateFileWithData(other, 'other\n')
+    os.remove(os.path.join(self.dst, 'top'))
+    os.link(other, os.path.join(self.dst, 'top'))
+    CopyEngine(link='none').CopyTree(self.src, self.dst)
+    self.assertEqual(self._Contents('top'), 'top\n')
+    self.assertEqual(FileUtils.FileContents(other), 'other\n')
+
+if __name__ == '__main__':
+  unittest.main()
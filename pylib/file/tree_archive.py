@@ -0,0 +1,226 @@
+"""Archives of directory trees split in parts that can be written and read in parallel."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+
+from pylib.file.file_utils import FileUtils
+
+
+class TreeArchive(object):
+  """Class to pack a directory tree into a few large tar files and to unpack them.
+
+  Copying a tree of many small files is dominated by the metadata operations on the destination.
+  An archive turns them into a few large sequential writes. The files of the tree are split in
+  parts of about part_size bytes. Each part is a streaming tar, optionally compressed by an
+  external gzip (pigz if installed) or zstd process running alongside. The parts are independent,
+  so they can be written and extracted in parallel.
+
+  The archive of a tree is a dir with the parts and an index. The index lists the dirs of the tree,
+  the parts and the members of each part with their sizes. It is written last, so an archive
+  without an index is incomplete. The dirs are created from the index before the parts are
+  extracted, so that parts extracted side by side never race to create them.
+
+  Members:
+    _compression: string: One of COMPRESSIONS.
+    _part_size: int: The number of bytes of files after which a new part is started.
+  """
+
+  COMPRESSIONS = ('none', 'gzip', 'zstd')
+
+  # The suffix of the parts for each compression.
+  PART_SUFFIXES = {'none': '.tar', 'gzip': '.tar.gz', 'zstd': '.tar.zst'}
+
+  # The index of an archive.
+  INDEX_FILE = 'tree_archive.index'
+
+  # The prefix of the parts of an archive.
+  PART_PREFIX = 'tree_archive.'
+
+  def __init__(self, compression='gzip', part_size=1 << 30):
+    if compression not in self.COMPRESSIONS:
+      raise ValueError('Invalid compression %s. Must be one of %s' %
+                       (compression, self.COMPRESSIONS))
+    self._compression = compression
+    self._part_size = max(part_size, 1)
+
+  @classmethod
+  def AddArguments(cls, parser):
+    """Adds the options for archives to the parser.
+
+    Args:
+      parser: ArgumentParser: The argument parser.
+    """
+    parser.add_argument('--archive_compression', type=str, default='gzip',
+                        choices=cls.COMPRESSIONS, help='How to compress the parts of archives.')
+    parser.add_argument('--archive_part_mb', type=int, default=1024,
+                        help='The size in MB of the files in each part of archives.')
+
+  @classmethod
+  def FromArgs(cls, args):
+    """Returns: TreeArchive: The archive for the options added by AddArguments()."""
+    return TreeArchive(args.archive_compression, args.archive_part_mb << 20)
+
+  @classmethod
+  def IsArchive(cls, dir):
+    """Returns: bool: True if the dir holds a complete archive."""
+    return os.path.isfile(os.path.join(dir, cls.INDEX_FILE))
+
+  @classmethod
+  def ReadIndex(cls, dir):
+    """Returns: dict: The index of the archive in the dir. See Plan()."""
+    with open(os.path.join(dir, cls.INDEX_FILE)) as f: return json.load(f)
+
+  @classmethod
+  def Clean(cls, dir):
+    """Removes the archive in the dir, if any. The index is removed first."""
+    index_file = os.path.join(dir, cls.INDEX_FILE)
+    if os.path.lexists(index_file): os.remove(index_file)
+    if not os.path.isdir(dir): return
+    for entry in os.scandir(dir):
+      if entry.name.startswith(cls.PART_PREFIX): os.remove(entry.path)
+
+  def Plan(self, src):
+    """Splits the tree in parts.
+
+    Args:
+      src: string: The root of the tree.
+
+    Return:
+      dict: The index of the archive: the 'compression', the 'dirs' of the tree relative to src,
+          the file names of the 'parts' and the 'members' of each part as lists of
+          [path relative to src, size]. Links are members of size 0.
+    """
+    index = {'compression': self._compression, 'dirs': [], 'parts': [], 'members': []}
+    part_bytes = 0
+    dirs = ['']
+    while dirs:
+      rel_dir = dirs.pop()
+      if rel_dir: index['dirs'] += [rel_dir]
+      for entry in sorted(os.scandir(os.path.join(src, rel_dir)), key=lambda x: x.name):
+        rel_path = os.path.join(rel_dir, entry.name)
+        if entry.is_dir(follow_symlinks=False):
+          dirs += [rel_path]
+          continue
+        size = 0 if entry.is_symlink() else entry.stat(follow_symlinks=False).st_size
+        if not index['members'] or (part_bytes and part_bytes + size > self._part_size):
+          index['parts'] += ['%s%05d%s' % (self.PART_PREFIX, len(index['parts']),
+                                           self.PART_SUFFIXES[self._compression])]
+          index['members'] += [[]]
+          part_bytes = 0
+        index['members'][-1] += [[rel_path, size]]
+        part_bytes += size
+    return index
+
+  @classmethod
+  def WritePart(cls, src, dst, compression, part, members):
+    """Writes a part of the archive. The part is written to a temp file and renamed into place.
+
+    Args:
+      src: string: The root of the tree.
+      dst: string: The dir of the archive.
+      compression: string: The compression of the archive.
+      part: string: The file name of the part.
+      members: list([string, int]): The members of the part. See Plan().
+
+    Return:
+      (int, int): The number of members and the bytes of files written.
+    """
+    tmp = os.path.join(dst, '.%s.tmp' % part)
+    with open(tmp, 'wb') as f:
+      proc = cls._StartCodec(compression, False, stdout=f)
+      try:
+        with tarfile.open(fileobj=proc.stdin if proc else f, mode='w|') as tar:
+          for (rel_path, unused_size) in members:
+            tar.add(os.path.join(src, rel_path), arcname=rel_path, recursive=False)
+      finally:
+        if proc: cls._FinishCodec(proc, proc.stdin)
+    os.replace(tmp, os.path.join(dst, part))
+    return (len(members), sum(x for (unused_path, x) in members))
+
+  @classmethod
+  def WriteIndex(cls, dst, index):
+    """Writes the index of the archive, which completes it."""
+    tmp = os.path.join(dst, '.%s.tmp' % cls.INDEX_FILE)
+    with open(tmp, 'w') as f: json.dump(index, f)
+    os.replace(tmp, os.path.join(dst, cls.INDEX_FILE))
+
+  @classmethod
+  def CreateDirs(cls, dst, index):
+    """Creates the dirs of the tree of the archive in dst."""
+    FileUtils.MakeDirs(dst)
+    for rel_dir in index['dirs']:
+      path = os.path.join(dst, rel_dir)
+      if os.path.lexists(path) and not os.path.isdir(path): os.remove(path)
+      FileUtils.MakeDirs(path)
+
+  @classmethod
+  def ExtractPart(cls, src, dst, compression, part):
+    """Extracts a part of the archive. The dirs must have been created with CreateDirs(). Existing
+    files are replaced, never written through, as they may be hardlinks.
+
+    Args:
+      src: string: The dir of the archive.
+      dst: string: The root of the tree to extract to.
+      compression: string: The compression of the archive.
+      part: string: The file name of the part.
+
+    Return:
+      (int, int): The number of members and the bytes of files extracted.
+    """
+    (count, size) = (0, 0)
+    # Keep the links as they are, but never write outside of dst.
+    extract_args = {'filter': 'tar'} if hasattr(tarfile, 'tar_filter') else {}
+    with open(os.path.join(src, part), 'rb') as f:
+      proc = cls._StartCodec(compression, True, stdin=f)
+      try:
+        with tarfile.open(fileobj=proc.stdout if proc else f, mode='r|') as tar:
+          for member in tar:
+            path = os.path.join(dst, member.name)
+            if os.path.lexists(path):
+              if os.path.isdir(path) and not os.path.islink(path): shutil.rmtree(path)
+              else: os.remove(path)
+            tar.extract(member, dst, **extract_args)
+            count += 1
+            size += member.size if member.isfile() else 0
+      finally:
+        if proc: cls._FinishCodec(proc, proc.stdout)
+    return (count, size)
+
+  @classmethod
+  def _StartCodec(cls, compression, decompress, **kwargs):
+    """Starts the process compressing or decompressing a part.
+
+    Args:
+      compression: string: One of COMPRESSIONS.
+      decompress: bool: Decompress instead of compressing.
+      kwargs: dict: The file for the stdin or stdout of the process. The other end is a pipe.
+
+    Return:
+      Popen: The process. None for no compression.
+    """
+    if compression == 'none': return None
+    if compression == 'gzip':
+      cmd = [shutil.which('pigz') or 'gzip', '-c']
+    else:
+      cmd = ['zstd', '-q', '-c', '-T0']
+    if decompress: cmd += ['-d']
+    pipe = 'stdin' if 'stdout' in kwargs else 'stdout'
+    kwargs[pipe] = subprocess.PIPE
+    return subprocess.Popen(cmd, **kwargs)
+
+  @classmethod
+  def _FinishCodec(cls, proc, pipe):
+    """Closes the pipe to the process and waits for it.
+
+    Raises:
+      IOError: If the process failed.
+    """
+    pipe.close()
+    if proc.wait():
+      raise IOError('%s failed with status %d' % (' '.join(proc.args), proc.returncode))
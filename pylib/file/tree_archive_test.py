@@ -0,0 +1,81 @@
+"""Tests for tree_archive."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pylib.file.file_utils import FileUtils
+from pylib.file.tree_archive import TreeArchive
+
+
+class TreeArchiveTest(unittest.TestCase):
+  """Tests for TreeArchive."""
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.src = os.path.join(self.dir, 'src')
+    self.archive = os.path.join(self.dir, 'archive')
+    self.dst = os.path.join(self.dir, 'dst')
+    FileUtils.MakeDirs(os.path.join(self.src, 'a', 'b'))
+    FileUtils.MakeDirs(os.path.join(self.src, 'empty'))
+    FileUtils.MakeDirs(self.archive)
+    for i in range(10):
+      FileUtils.CreateFileWithData(os.path.join(self.src, 'a', 'b', 'f%d' % i), 'x' * 1000)
+    FileUtils.CreateFileWithData(os.path.join(self.src, 'top'), 'top\n')
+    os.symlink('top', os.path.join(self.src, 'link'))
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def _Pack(self, archive):
+    index = archive.Plan(self.src)
+    for (part, members) in zip(index['parts'], index['members']):
+      TreeArchive.WritePart(self.src, self.archive, index['compression'], part, members)
+    self.assertFalse(TreeArchive.IsArchive(self.archive))
+    TreeArchive.WriteIndex(self.archive, index)
+    self.assertTrue(TreeArchive.IsArchive(self.archive))
+    return index
+
+  def _Unpack(self):
+    index = TreeArchive.ReadIndex(self.archive)
+    TreeArchive.CreateDirs(self.dst, index)
+    return [TreeArchive.ExtractPart(self.archive, self.dst, index['compression'], x)
+            for x in index['parts']]
+
+  def test_plan(self):
+    index = TreeArchive('none', 2500).Plan(self.src)
+    self.assertEqual(sorted(index['dirs']), ['a', 'a/b', 'empty'])
+    # Each part holds about the part size of files.
+    self.assertEqual([sum(y for (x, y) in z) for z in index['members']],
+                     [2004, 2000, 2000, 2000, 2000])
+    self.assertEqual(index['parts'][0], 'tree_archive.00000.tar')
+    self.assertEqual(sorted(x for y in index['members'] for (x, unused_size) in y),
+                     ['a/b/f%d' % x for x in range(10)] + ['link', 'top'])
+
+  def test_round_trip(self):
+    for compression in TreeArchive.COMPRESSIONS:
+      if compression == 'zstd' and not shutil.which('zstd'): continue
+      TreeArchive.Clean(self.archive)
+      self.assertEqual(os.listdir(self.archive), [])
+      shutil.rmtree(self.dst, True)
+      FileUtils.MakeDirs(self.dst)
+      # Existing files are replaced, not written through.
+      os.link(os.path.join(self.src, 'top'), os.path.join(self.dst, 'top'))
+
+      index = self._Pack(TreeArchive(compression, 4000))
+      self.assertEqual(len(index['parts']), 3)
+      self.assertEqual(sum(x for (unused_count, x) in self._Unpack()), 10004)
+      self.assertEqual(FileUtils.FileContents(os.path.join(self.dst, 'a', 'b', 'f9')), 'x' * 1000)
+      self.assertEqual(FileUtils.FileContents(os.path.join(self.src, 'top')), 'top\n')
+      self.assertEqual(os.readlink(os.path.join(self.dst, 'link')), 'top')
+      self.assertTrue(os.path.isdir(os.path.join(self.dst, 'empty')))
+      self.assertNotEqual(os.stat(os.path.join(self.dst, 'top')).st_ino,
+                          os.stat(os.path.join(self.src, 'top')).st_ino)
+
+
+if __name__ == '__main__':
+  unittest.main()
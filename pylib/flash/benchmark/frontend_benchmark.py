@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+"""Benchmarks the python front end of flash on a synthetic tree.
+
+Times rule discovery, RULES parsing and target expansion, dependency flattening and makefile
+generation. No compiler is invoked. The results are written as json so that runs can be compared
+over time, e.g.
+  python -m pylib.flash.benchmark.frontend_benchmark --dirs=1000 --output=/tmp/flash.json
+"""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from pylib.base.flags import Flags
+from pylib.base.term_color import TermColor
+
+from pylib.flash.benchmark.synthetic_tree import SyntheticTree
+from pylib.flash.cmd_handler import CmdHandler
+from pylib.flash.gen_makefile import GenMakefile
+from pylib.flash.rules import Rules
+
+
+class FrontendBenchmark(object):
+  """Class to benchmark the flash front end."""
+
+  # The phases timed for each run, in order.
+  PHASES = ['discovery', 'parse', 'flatten', 'genmakefile']
+
+  @classmethod
+  def Run(cls, root, runs):
+    """Runs the benchmark.
+
+    Args:
+      root: string: The root of the tree to benchmark.
+      runs: int: Number of times each phase is run.
+
+    Return:
+      dict: The results of the benchmark.
+    """
+    # All paths in flash are relative to the src root.
+    os.environ['R77_SRC_ROOT'] = root
+    make_dir = tempfile.mkdtemp(prefix='flash_benchmark_')
+    results = []
+    counts = {}
+    try:
+      for i in range(runs):
+        (times, counts) = cls._RunOnce(root, make_dir)
+        TermColor.Info('Run %d: %s' % (i, ' '.join(['%s=%.3fs' % (p, times[p])
+                                                     for p in cls.PHASES])))
+        results += [times]
+    finally:
+      shutil.rmtree(make_dir, ignore_errors=True)
+
+    summary = {}
+    for phase in cls.PHASES + ['total']:
+      values = sorted([x[phase] for x in results])
+      summary[phase] = {'min': values[0],
+                        'median': values[len(values) // 2],
+                        'mean': sum(values) / len(values)}
+
+    return {'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'commit': cls._GetCommit(),
+            'python': platform.python_version(),
+            'tree': counts,
+            'runs': results,
+            'summary': summary,
+            # Note: ru_maxrss is reported in KB on linux.
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0}
+
+  @classmethod
+  def _RunOnce(cls, root, make_dir):
+    """Runs all the phases once on a fresh state.
+
+    Return:
+      (dict, dict): The time in seconds for each phase and the counts of the processed items.
+    """
+    Rules.Reset()
+    gen_makefile = GenMakefile(False, make_dir)
+    gen_makefile.GenMainMakeFile()
+    times = {}
+
+    start = time.time()
+    rules = CmdHandler._ComputeRules([os.path.join(root, '...')])
+    times['discovery'] = time.time() - start
+
+    start = time.time()
+    (targets, failed_expand) = Rules.GetExpandedRules(rules)
+    times['parse'] = time.time() - start
+
+    start = time.time()
+    (specs, successful, failed_flatten) = gen_makefile.FlattenRules(targets)
+    times['flatten'] = time.time() - start
+
+    start = time.time()
+    gen_makefile.WriteAutoMakeFiles(specs)
+    times['genmakefile'] = time.time() - start
+
+    times['total'] = sum([times[x] for x in cls.PHASES])
+    counts = {'rules_files': len(rules), 'targets': len(targets),
+              'failed': len(failed_expand) + len(failed_flatten),
+              'targets_by_type': {k: len(v) for (k, v) in successful.items()}}
+    gen_makefile.Cleanup()
+    return (times, counts)
+
+  @classmethod
+  def _GetCommit(cls):
+    """Returns the commit of the flash sources being benchmarked. None if unknown."""
+    try:
+      return subprocess.check_output(
+          ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+          stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+      return None
+
+
+def main():
+  Flags.PARSER.add_argument('--root', type=str, default='',
+                            help='Benchmark an existing tree. A synthetic tree is generated in a '
+                            'temp dir if not specified.')
+  Flags.PARSER.add_argument('--runs', type=int, default=3,
+                            help='Number of times each phase is run.')
+  Flags.PARSER.add_argument('--output', type=str, default='',
+                            help='File to write the json results to. Printed if not specified.')
+  SyntheticTree.AddArguments(Flags.PARSER)
+  Flags.InitArgs()
+
+  root = os.path.abspath(Flags.ARGS.root) if Flags.ARGS.root else None
+  config = None
+  try:
+    if not root:
+      root = tempfile.mkdtemp(prefix='flash_tree_')
+      config = SyntheticTree.GetConfig(Flags.ARGS)
+      start = time.time()
+      stats = SyntheticTree.Generate(root, config)
+      TermColor.Info('Generated %s in %.2fs' % (stats, time.time() - start))
+
+    results = FrontendBenchmark.Run(root, Flags.ARGS.runs)
+    results['config'] = config
+  finally:
+    if config and root: shutil.rmtree(root, ignore_errors=True)
+
+  data = json.dumps(results, indent=2, sort_keys=True)
+  if Flags.ARGS.output:
+    with open(Flags.ARGS.output, 'w') as f: f.write(data + '\n')
+    TermColor.Success('Results written to %s' % Flags.ARGS.output)
+  else:
+    print(data)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
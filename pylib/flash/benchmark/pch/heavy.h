@@ -0,0 +1,21 @@
+// Copyright 2016 Room77, Inc.
+// A header that pulls in a large part of the standard library. Used to benchmark precompiled
+// headers.
+
+#ifndef _PYLIB_FLASH_BENCHMARK_PCH_HEAVY_H_
+#define _PYLIB_FLASH_BENCHMARK_PCH_HEAVY_H_
+
+#include <algorithm>
+#include <functional>
+#include <iostream>
+#include <map>
+#include <memory>
+#include <regex>
+#include <set>
+#include <sstream>
+#include <string>
+#include <unordered_map>
+#include <unordered_set>
+#include <vector>
+
+#endif  // _PYLIB_FLASH_BENCHMARK_PCH_HEAVY_H_
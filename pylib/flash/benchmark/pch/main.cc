@@ -0,0 +1,22 @@
+// Copyright 2016 Room77, Inc.
+
+#include "pylib/flash/benchmark/pch/heavy.h"
+
+namespace bench {
+int Unit0(const std::string& input);
+int Unit1(const std::string& input);
+int Unit2(const std::string& input);
+int Unit3(const std::string& input);
+int Unit4(const std::string& input);
+int Unit5(const std::string& input);
+int Unit6(const std::string& input);
+int Unit7(const std::string& input);
+}  // namespace bench
+
+int main() {
+  std::string input = "the quick brown fox jumps over the lazy dog";
+  std::cout << bench::Unit0(input) + bench::Unit1(input) + bench::Unit2(input) +
+      bench::Unit3(input) + bench::Unit4(input) + bench::Unit5(input) + bench::Unit6(input) +
+      bench::Unit7(input) << std::endl;
+  return 0;
+}
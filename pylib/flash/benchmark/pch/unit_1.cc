@@ -0,0 +1,12 @@
+// Copyright 2016 Room77, Inc.
+
+#include "pylib/flash/benchmark/pch/heavy.h"
+
+namespace bench {
+
+// Intentionally trivial. The compile time is dominated by parsing heavy.h.
+int Unit1(const std::string& input) {
+  return input.size() + 1;
+}
+
+}  // namespace bench
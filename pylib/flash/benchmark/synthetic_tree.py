@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+"""Generates synthetic source trees with RULES files to benchmark flash."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+import random
+import sys
+
+from pylib.base.flags import Flags
+from pylib.base.term_color import TermColor
+from pylib.file.file_utils import FileUtils
+
+
+class SyntheticTree(object):
+  """Class to generate a synthetic source tree.
+
+  The tree has a '.git' dir at its root so that it is picked up as the src root. Each dir has a
+  RULES file with a mix of cc, proto, swig and py libraries, a cc_bin depending on all the cc
+  libraries of the dir and a py_bin if the dir has py libraries. Dependencies only point to
+  rules generated earlier, so the graph is always acyclic. A few 'hub' libraries receive a large
+  share of all dependencies to model the high fan-in of common base libraries.
+  """
+
+  # Default configuration. See AddArguments() for a description of each option.
+  DEFAULTS = {'dirs': 200,
+              'rules_per_dir': 4,
+              'srcs_per_rule': 6,
+              'fan_out': 4,
+              'hubs': 10,
+              'hub_ratio': 0.3,
+              'proto_ratio': 0.1,
+              'swig_ratio': 0.05,
+              'py_ratio': 0.15,
+              'seed': 77}
+
+  # Libraries each rule type can depend on. See Rules.FLATTENED_RULE_TYPES. Protos are only
+  # supported for cc referrers, so swig and py libraries only depend on cc libraries without
+  # protos in their closure. swig libraries are converted to shared libraries when built, so
+  # nothing depends on them.
+  ALLOWED_DEPS = {'cc_lib': ['cc_lib', 'proto_lib'],
+                  'swig_lib': ['cc_lib_no_proto'],
+                  'py_lib': ['py_lib', 'cc_lib_no_proto'],
+                  'proto_lib': []}
+
+  @classmethod
+  def AddArguments(cls, parser):
+    """Adds the options for the tree to the parser.
+
+    Args:
+      parser: ArgumentParser: The argument parser.
+    """
+    parser.add_argument('--dirs', type=int, default=cls.DEFAULTS['dirs'],
+                        help='Number of dirs with a RULES file.')
+    parser.add_argument('--rules_per_dir', type=int, default=cls.DEFAULTS['rules_per_dir'],
+                        help='Number of libraries in each RULES file.')
+    parser.add_argument('--srcs_per_rule', type=int, default=cls.DEFAULTS['srcs_per_rule'],
+                        help='Number of sources for each cc and py library.')
+    parser.add_argument('--fan_out', type=int, default=cls.DEFAULTS['fan_out'],
+                        help='Number of direct dependencies of each library.')
+    parser.add_argument('--hubs', type=int, default=cls.DEFAULTS['hubs'],
+                        help='Number of cc libraries that receive a large share of all the '
+                        'dependencies.')
+    parser.add_argument('--hub_ratio', type=float, default=cls.DEFAULTS['hub_ratio'],
+                        help='Fraction of the cc dependencies that point to a hub library.')
+    parser.add_argument('--proto_ratio', type=float, default=cls.DEFAULTS['proto_ratio'],
+                        help='Fraction of the libraries that are proto_lib.')
+    parser.add_argument('--swig_ratio', type=float, default=cls.DEFAULTS['swig_ratio'],
+                        help='Fraction of the libraries that are swig_lib.')
+    parser.add_argument('--py_ratio', type=float, default=cls.DEFAULTS['py_ratio'],
+                        help='Fraction of the libraries that are py_lib.')
+    parser.add_argument('--seed', type=int, default=cls.DEFAULTS['seed'],
+                        help='Seed for the random generator. The same seed and options always '
+                        'generate the same tree.')
+
+  @classmethod
+  def GetConfig(cls, args):
+    """Returns: dict: The tree configuration from the parsed arguments."""
+    return {k: getattr(args, k) for k in cls.DEFAULTS}
+
+  @classmethod
+  def GetDir(cls, root, index):
+    """Returns the dir for the index. Dirs are grouped 32 per parent to keep the tree nested."""
+    return os.path.join(root, 'tree', 'g%03d' % (index // 32), 'd%05d' % index)
+
+  @classmethod
+  def Generate(cls, root, config=None):
+    """Generates the tree.
+
+    Args:
+      root: string: The root of the tree. Created if it does not exist.
+      config: dict: The configuration of the tree. Missing values are taken from DEFAULTS.
+
+    Return:
+      dict: Stats about the generated tree.
+    """
+    conf = dict(cls.DEFAULTS)
+    conf.update(config or {})
+    rand = random.Random(conf['seed'])
+
+    FileUtils.MakeDirs(os.path.join(root, '.git'))
+    # All the libraries generated so far by type. Each is the absolute rule name from the root.
+    libs = {'cc_lib': [], 'cc_lib_no_proto': [], 'proto_lib': [], 'swig_lib': [], 'py_lib': []}
+    stats = {'dirs': 0, 'rules': 0, 'deps': 0, 'files': 0}
+    for index in range(conf['dirs']):
+      dirname = cls.GetDir(root, index)
+      rule_dir = '/' + os.path.relpath(dirname, root)
+      FileUtils.MakeDirs(dirname)
+
+      rules = []
+      dir_libs = {'cc_lib': [], 'py_lib': []}
+      for r in range(conf['rules_per_dir']):
+        rule_type = cls._PickType(rand, conf)
+        # swig libraries need a cc library to wrap.
+        if rule_type == 'swig_lib' and not libs['cc_lib_no_proto']: rule_type = 'cc_lib'
+
+        name = '%s_%d' % (rule_type.replace('_lib', ''), r)
+        deps = cls._PickDeps(rand, conf, rule_type, libs)
+        (srcs, files) = cls._GetSrcs(rule_type, name, conf['srcs_per_rule'])
+        for f in files:
+          FileUtils.CreateFileWithData(os.path.join(dirname, f[0]), f[1])
+        rules += [cls._FormatRule(rule_type, name, srcs, deps)]
+
+        rule = os.path.join(rule_dir, name)
+        libs[rule_type] += [rule]
+        if rule_type == 'cc_lib' and set(deps) <= set(libs['cc_lib_no_proto']):
+          libs['cc_lib_no_proto'] += [rule]
+        if rule_type in dir_libs: dir_libs[rule_type] += [name]
+        stats['rules'] += 1
+        stats['deps'] += len(deps)
+        stats['files'] += len(files)
+
+      # Binaries for the dir.
+      bin_deps = dir_libs['cc_lib']
+      if not bin_deps and libs['cc_lib']: bin_deps = [rand.choice(libs['cc_lib'])]
+      if bin_deps:
+        FileUtils.CreateFileWithData(os.path.join(dirname, 'main.cc'), '')
+        rules += [cls._FormatRule('cc_bin', 'bin', ['main.cc'], bin_deps)]
+        stats['rules'] += 1
+      if dir_libs['py_lib']:
+        FileUtils.CreateFileWithData(os.path.join(dirname, 'main.py'), '')
+        rules += [cls._FormatRule('py_bin', 'py_bin', [], dir_libs['py_lib'], main=['main.py'])]
+        stats['rules'] += 1
+
+      FileUtils.CreateFileWithData(os.path.join(dirname, 'RULES'), '\n'.join(rules))
+      stats['dirs'] += 1
+
+    return stats
+
+  @classmethod
+  def _PickType(cls, rand, conf):
+    """Returns a random library type based on the configured ratios."""
+    x = rand.random()
+    for rule_type in ['proto_lib', 'swig_lib', 'py_lib']:
+      ratio = conf[rule_type.replace('_lib', '_ratio')]
+      if x < ratio: return rule_type
+      x -= ratio
+    return 'cc_lib'
+
+  @classmethod
+  def _PickDeps(cls, rand, conf, rule_type, libs):
+    """Returns the dependencies for a new library of the given type."""
+    candidates = []
+    for dep_type in cls.ALLOWED_DEPS[rule_type]:
+      candidates += libs[dep_type]
+    if not candidates: return []
+
+    cc_type = next((x for x in cls.ALLOWED_DEPS[rule_type] if x.startswith('cc_lib')), None)
+    hubs = libs[cc_type][:conf['hubs']] if cc_type else []
+    deps = set()
+    for i in range(min(conf['fan_out'], len(candidates))):
+      if hubs and rand.random() < conf['hub_ratio']:
+        deps |= {rand.choice(hubs)}
+      else:
+        deps |= {rand.choice(candidates)}
+    # swig libraries always wrap at least one cc library.
+    if rule_type == 'swig_lib' and not deps: deps |= {rand.choice(libs[cc_type])}
+    return sorted(deps)
+
+  @classmethod
+  def _GetSrcs(cls, rule_type, name, count):
+    """Returns the sources for the rule and the files to create.
+
+    Return:
+      (list, list): The sources and a list of (file, contents) tuples.
+    """
+    if rule_type == 'proto_lib':
+      srcs = ['%s.proto' % name]
+      return (srcs, [(srcs[0], 'message M {}\n')])
+    if rule_type == 'swig_lib':
+      srcs = ['%s.i' % name]
+      return (srcs, [(srcs[0], '%%module %s\n' % name)])
+
+    ext = '.py' if rule_type == 'py_lib' else '.cc'
+    srcs = ['%s_%d%s' % (name, i, ext) for i in range(count)]
+    files = [(x, '') for x in srcs]
+    if rule_type == 'cc_lib':
+      files += [(x.replace('.cc', '.h'), '') for x in srcs]
+    return (srcs, files)
+
+  @classmethod
+  def _FormatRule(cls, rule_type, name, srcs, deps, main=None):
+    """Returns the text of the rule for the RULES file."""
+    fields = ['name = "%s"' % name]
+    if srcs: fields += ['src = %r' % srcs]
+    if rule_type == 'cc_lib':
+      fields += ['hdr = %r' % [x.replace('.cc', '.h') for x in srcs]]
+    if main: fields += ['main = %r' % main]
+    if deps: fields += ['dep = %r' % deps]
+    func = 'swig' if rule_type == 'swig_lib' else rule_type
+    return '%s(%s)\n' % (func, ',\n    '.join(fields))
+
+
+def main():
+  Flags.PARSER.add_argument('root', type=str, help='The root dir for the tree.')
+  SyntheticTree.AddArguments(Flags.PARSER)
+  Flags.InitArgs()
+  stats = SyntheticTree.Generate(Flags.ARGS.root, SyntheticTree.GetConfig(Flags.ARGS))
+  TermColor.Success('Generated %s in %s' % (stats, Flags.ARGS.root))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,263 @@
+"""Records the inputs used by the last successful build of a rule."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import hashlib
+import json
+import os
+import time
+
+from pylib.base.exec_utils import ExecUtils
+from pylib.base.flags import Flags
+from pylib.base.term_color import TermColor
+from pylib.file.file_utils import FileUtils
+
+from pylib.flash.rules import Rules
+
+Flags.PARSER.add_argument('--build_record', action='store_true', default=False,
+                          help='Record the inputs of each cc rule after a successful build. '
+                               'Used by explain to report the changes since the last build.')
+
+
+class BuildRecord(object):
+  """Class to record and compare the inputs of cc rules.
+
+  make only rebuilds a target when one of its prerequisites is newer. It does not know about
+  flags, compilers or whether a newer file actually changed. The record of the last successful
+  build keeps all of these so that 'flash explain' can report the actual reason for a rebuild.
+  Records are only written with --build_record, as each one costs a make and hashes the changed
+  inputs of the rule.
+
+  A record is a dict of the form:
+    {
+      'target': string, 'compiler': string, 'ccflags': string,
+      'flag': list, 'link': list, 'dep': list, 'src': list, 'hdr': list,
+      'files': {file: [mtime, size, md5]}
+    }
+  """
+
+  # Fields of the rule stored in the record.
+  RULE_FIELDS = ('flag', 'link', 'dep', 'src', 'hdr')
+
+  # Wrappers that may precede the actual compiler in the makefile.
+  COMPILER_WRAPPERS = ('ccache', 'distcc')
+
+  # Line after which makedepend writes the dependencies.
+  DEPEND_MARKER = '# DO NOT DELETE'
+
+  # Cache of the compiler data for each makefile.
+  _COMPILERS = {}
+
+  @classmethod
+  def GetRecordFile(cls, rule):
+    """Returns the file storing the record for the rule."""
+    return os.path.join(FileUtils.GetBinPathForFile(rule) + '_deps', 'build_record.json')
+
+  @classmethod
+  def Load(cls, rule):
+    """Returns the record for the last successful build of the rule. None if not present."""
+    try:
+      return json.loads(FileUtils.FileContents(cls.GetRecordFile(rule)) or 'null')
+    except ValueError as e:
+      TermColor.Warning('Invalid build record for %s. Error: %s' % (rule, e))
+      return None
+
+  @classmethod
+  def Save(cls, rule, record):
+    """Saves the record for the rule."""
+    record_file = cls.GetRecordFile(rule)
+    FileUtils.MakeDirs(os.path.dirname(record_file))
+    # Write to a temp file first so that an interrupted build never leaves a partial record.
+    FileUtils.CreateFileWithData(record_file + '.tmp', json.dumps(record, sort_keys=True))
+    os.rename(record_file + '.tmp', record_file)
+
+  @classmethod
+  def Update(cls, rule, makefile, deps_file):
+    """Records the inputs of the rule after a successful build.
+
+    Args:
+      rule: string: The rule that was built.
+      makefile: string: The *main* makefile name.
+      deps_file: string: The makefile used to build the rule.
+    """
+    try:
+      cls.Save(rule, cls.Create(rule, makefile, deps_file, cls.Load(rule)))
+    except (OSError, IOError) as e:
+      # The record is only used to explain rebuilds. Never fail the build because of it.
+      TermColor.Warning('Could not save build record for %s. Error: %s' % (rule, e))
+
+  @classmethod
+  def Create(cls, rule, makefile, deps_file, previous=None):
+    """Creates the record for the current state of the rule.
+
+    Args:
+      rule: string: The rule for the record.
+      makefile: string: The *main* makefile name.
+      deps_file: string: The makefile used to build the rule. Contains the makedepend output.
+      previous: dict: The previous record of the rule. File hashes are reused from it when the
+          mtime and size of a file did not change.
+
+    Return:
+      dict: The record.
+    """
+    rule_data = Rules.GetRule(rule) or {}
+    record = {'target': rule}
+    record.update(cls.GetCompiler(makefile))
+    for field in cls.RULE_FIELDS:
+      record[field] = sorted(rule_data.get(field, set()))
+    record['hdr'] = sorted(set(record['hdr']) | rule_data.get('pch', set()))
+
+    files = set(record['src']) | set(record['hdr']) | cls.GetMakeDepends(deps_file)
+    previous_files = previous.get('files', {}) if previous else {}
+    record['files'] = {}
+    for f in files:
+      info = cls.GetFileInfo(f, previous_files.get(f))
+      if info: record['files'][f] = info
+    return record
+
+  @classmethod
+  def GetFileInfo(cls, filename, previous=None):
+    """Returns the [mtime, size, md5] for the file.
+
+    Args:
+      filename: string: The file to check.
+      previous: list: The previous info for the file. The hash is reused if the mtime and size
+          are the same.
+
+    Return:
+      list: The info for the file. None if the file does not exist.
+    """
+    try:
+      st = os.stat(filename)
+    except OSError:
+      return None
+    if previous and previous[0] == st.st_mtime and previous[1] == st.st_size:
+      return previous
+
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as f:
+      for chunk in iter(lambda: f.read(1 << 16), b''):
+        md5.update(chunk)
+    return [st.st_mtime, st.st_size, md5.hexdigest()]
+
+  @classmethod
+  def GetMakeDepends(cls, deps_file):
+    """Returns the set of files the objects depend on as found by makedepend."""
+    deps = set()
+    data = FileUtils.FileContents(deps_file) or ''
+    marker = data.find(cls.DEPEND_MARKER)
+    if marker == -1: return deps
+
+    for line in data[marker:].splitlines()[1:]:
+      (obj, sep, files) = line.partition(':')
+      if sep: deps |= set(files.split())
+    return deps
+
+  @classmethod
+  def GetCompiler(cls, makefile):
+    """Returns the compiler and the default flags used by the makefile.
+
+    Return:
+      dict: {'compiler': string, 'ccflags': string}.
+    """
+    if makefile in cls._COMPILERS: return cls._COMPILERS[makefile]
+
+    (status, out) = ExecUtils.RunCmd(
+        "make -s -f %s --eval='flash_print_%%: ; @echo $($*)' flash_print_CC flash_print_CCFLAGS"
+        % makefile)
+    out = out.decode('utf-8', 'replace') if isinstance(out, bytes) else out
+    lines = out.splitlines() if not status else []
+    (cc, ccflags) = lines if len(lines) == 2 else ('', '')
+
+    compiler = [x for x in cc.split() if x not in cls.COMPILER_WRAPPERS]
+    version = 'unknown'
+    if compiler:
+      (status, out) = ExecUtils.RunCmd('%s --version' % compiler[0])
+      out = out.decode('utf-8', 'replace') if isinstance(out, bytes) else out
+      if not status and out.strip(): version = out.strip().splitlines()[0]
+
+    cls._COMPILERS[makefile] = {'compiler': '%s: %s' % (cc.strip(), version),
+                                'ccflags': ccflags.strip()}
+    return cls._COMPILERS[makefile]
+
+  @classmethod
+  def Diff(cls, old, new):
+    """Returns the differences between two records of a rule.
+
+    Args:
+      old: dict: The record of the last successful build.
+      new: dict: The record for the current state of the rule.
+
+    Return:
+      list: List of strings, one per difference.
+    """
+    return cls.DiffRule(old, new) + cls.DiffFiles(old, new)
+
+  @classmethod
+  def DiffRule(cls, old, new):
+    """Returns the differences in the compiler, flags and fields of the rule. make does not track
+    these, so the outputs of the rule may be stale even if make has nothing to do.
+
+    Args:
+      old: dict: The record of the last successful build.
+      new: dict: The record for the current state of the rule.
+
+    Return:
+      list: List of strings, one per difference.
+    """
+    diffs = []
+    if old.get('compiler') != new.get('compiler'):
+      diffs += ['compiler changed: %s -> %s' % (old.get('compiler'), new.get('compiler'))]
+    if old.get('ccflags') != new.get('ccflags'):
+      diffs += ['default flags changed: %s -> %s' % (old.get('ccflags'), new.get('ccflags'))]
+
+    for field in cls.RULE_FIELDS:
+      added = set(new.get(field, [])) - set(old.get(field, []))
+      removed = set(old.get(field, [])) - set(new.get(field, []))
+      if added: diffs += ['%s added: %s' % (field, ' '.join(sorted(added)))]
+      if removed: diffs += ['%s removed: %s' % (field, ' '.join(sorted(removed)))]
+    return diffs
+
+  @classmethod
+  def DiffFiles(cls, old, new):
+    """Returns the differences in the input files of the rule.
+
+    Args:
+      old: dict: The record of the last successful build.
+      new: dict: The record for the current state of the rule.
+
+    Return:
+      list: List of strings, one per difference.
+    """
+    diffs = []
+    old_files = old.get('files', {})
+    for (f, info) in sorted(new.get('files', {}).items()):
+      if f not in old_files:
+        diffs += ['new input: %s' % f]
+      else:
+        change = cls.DescribeFileChange(old_files[f], info)
+        if change: diffs += ['%s: %s' % (f, change)]
+    for f in sorted(set(old_files) - set(new.get('files', {}))):
+      diffs += ['input no longer present: %s' % f]
+    return diffs
+
+  @classmethod
+  def DescribeFileChange(cls, old, new):
+    """Describes the change between two file infos.
+
+    Return:
+      string: The description of the change. None if the file did not change.
+    """
+    if not old: return 'new input'
+    if not new: return 'deleted'
+    if old == new: return None
+    if old[2] == new[2]:
+      return 'touched but content unchanged (mtime %s -> %s)' % (
+          cls._FormatTime(old[0]), cls._FormatTime(new[0]))
+    return 'content changed (mtime %s -> %s, size %d -> %d)' % (
+        cls._FormatTime(old[0]), cls._FormatTime(new[0]), old[1], new[1])
+
+  @classmethod
+  def _FormatTime(cls, mtime):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mtime))
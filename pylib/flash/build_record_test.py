@@ -0,0 +1,61 @@
+"""Tests for build_record."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pylib.file.file_utils import FileUtils
+from pylib.flash.build_record import BuildRecord
+
+
+class BuildRecordTest(unittest.TestCase):
+  """Tests for BuildRecord."""
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.src = os.path.join(self.dir, 'a.cc')
+    FileUtils.CreateFileWithData(self.src, 'int a;\n')
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_file_changes(self):
+    old = BuildRecord.GetFileInfo(self.src)
+    self.assertIs(BuildRecord.GetFileInfo(self.src, old), old)
+    self.assertEqual(BuildRecord.DescribeFileChange(old, old), None)
+
+    os.utime(self.src, (old[0] + 10, old[0] + 10))
+    new = BuildRecord.GetFileInfo(self.src, old)
+    self.assertEqual(new[2], old[2])
+    self.assertTrue(BuildRecord.DescribeFileChange(old, new).startswith('touched'))
+
+    FileUtils.CreateFileWithData(self.src, 'int b;\n')
+    os.utime(self.src, (old[0] + 20, old[0] + 20))
+    new = BuildRecord.GetFileInfo(self.src, old)
+    self.assertNotEqual(new[2], old[2])
+    self.assertTrue(BuildRecord.DescribeFileChange(old, new).startswith('content changed'))
+    self.assertEqual(BuildRecord.DescribeFileChange(old, None), 'deleted')
+
+  def test_diff(self):
+    info = BuildRecord.GetFileInfo(self.src)
+    old = {'compiler': 'g++ 4.9', 'flag': ['-O2'], 'dep': ['/lib'], 'files': {self.src: info}}
+    new = {'compiler': 'g++ 5.1', 'flag': ['-O2', '-DX'], 'dep': [],
+           'files': {self.src: info, '/b.h': info}}
+    self.assertEqual(BuildRecord.DiffRule(old, new),
+                     ['compiler changed: g++ 4.9 -> g++ 5.1', 'flag added: -DX',
+                      'dep removed: /lib'])
+    self.assertEqual(BuildRecord.DiffFiles(old, new), ['new input: /b.h'])
+
+  def test_make_depends(self):
+    deps_file = os.path.join(self.dir, 'deps.mak')
+    FileUtils.CreateFileWithData(deps_file, 'x: y\n\n# DO NOT DELETE THIS LINE\n\n'
+                                 '/o/a.o: /a.h /b.h\n/o/b.o: /b.h\n')
+    self.assertEqual(BuildRecord.GetMakeDepends(deps_file), {'/a.h', '/b.h'})
+
+
+if __name__ == '__main__':
+  unittest.main()
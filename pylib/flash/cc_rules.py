@@ -4,16 +4,20 @@
 __author__ = 'pramodg@room77.com (Pramod Gupta)'
 __copyright__ = 'Copyright 2012 Room77, Inc.'
 
+import hashlib
 import itertools
 import os
 import shutil
 import time
 
+from pylib.base.flags import Flags
 from pylib.base.term_color import TermColor
 from pylib.base.exec_utils import ExecUtils
 from pylib.file.file_utils import FileUtils
 
+from pylib.flash.build_record import BuildRecord
 from pylib.flash.make_rules import MakeRules
+from pylib.flash.unity_build import UnityBuild
 from pylib.flash.utils import Utils
 
 
@@ -26,6 +30,38 @@ class CCRules(MakeRules):
     if not target : return None
     return 'depend' + target.replace('/', '_')
 
+  @classmethod
+  def GetPchDir(cls):
+    """Returns the dir where all precompiled headers are generated."""
+    return os.path.join(FileUtils.GetBinDir(), '__pch__')
+
+  @classmethod
+  def GetPchHeader(cls, item):
+    """Returns the generated header to precompile for the rule.
+
+    All the 'pch' headers in the closure of the rule are included by a single generated header
+    since only one precompiled header can be used per translation unit. The 'pch' headers of the
+    dependencies are intentionally flattened into the rule, as its sources include them too. The
+    header is shared by all rules with the same pch headers and flags.
+
+    Args:
+      item: RuleData: The flattened data for the rule.
+
+    Return:
+      string: The header to precompile. None if the rule does not use a precompiled header.
+    """
+    pch = sorted(item.get('pch', set()))
+    if not pch: return None
+
+    key = hashlib.md5('\n'.join(pch + ['--'] + sorted(item.get('flag', set()))).encode())
+    header = os.path.join(cls.GetPchDir(), key.hexdigest(), 'flash_pch.h')
+    data = ''.join(['#include "%s"\n' % x for x in pch])
+    # Only rewrite the header on changes. Otherwise all objects using it are rebuilt.
+    if FileUtils.FileContents(header) != data:
+      FileUtils.MakeDirs(os.path.dirname(header))
+      FileUtils.CreateFileWithData(header, data)
+    return header
+
   @classmethod
   def WriteMakefile(cls, specs, makefile):
     """Writes the auto make file for the given spec.
@@ -40,6 +76,8 @@ class CCRules(MakeRules):
     f.write('\nCFLAGS = $(DEFAULT_CFLAGS) $(ENV_CFLAGS)\n')
     f.write('\nCCFLAGS = $(DEFAULT_CCFLAGS) $(ENV_CCFLAGS)\n')
     index = 0
+    # Precompiled headers already written to the makefile.
+    pch_written = set()
     for item in specs:
       index += 1
       target = item['_target']
@@ -54,7 +92,8 @@ class CCRules(MakeRules):
       f.write('CFLAGS_%d = %s\n' % (index, str.join(' ', item.get('flag', set()))))
 
       f.write('\n# Srcs for %s\n' % target)
-      f.write('CC_SRC_%d = %s\n' % (index, str.join('\\\n  ', item.get('src', set()))))
+      srcs = UnityBuild.GetSrcs(item, target_bin, target_dep_dir)
+      f.write('CC_SRC_%d = %s\n' % (index, str.join('\\\n  ', srcs)))
       f.write('\nCC_SRC_C_%d = $(filter %%.c,$(CC_SRC_%d))\n' % (index, index))
       f.write('CC_SRC_CC_%d = $(filter %%.cc,$(CC_SRC_%d))\n' % (index, index))
       f.write('CC_SRC_CPP_%d = $(filter %%.cpp,$(CC_SRC_%d))\n' % (index, index))
@@ -78,18 +117,45 @@ class CCRules(MakeRules):
               '.cpp=.o))\n' %
               (index, index, index))
 
+      f.write('\n# Precompiled header for %s\n' % target)
+      pch_header = cls.GetPchHeader(item)
+      if pch_header:
+        f.write('CC_PCH_%d = %s\n' % (index, pch_header))
+        f.write('CC_PCH_OUT_%d = $(CC_PCH_%d).$(PCH_EXT)\n' % (index, index))
+        f.write('CFLAGS_PCH_%d = -include $(CC_PCH_%d)\n' % (index, index))
+        # The precompiled header is built once for all rules with the same flags. The rules are
+        # built by parallel makes that may all build the shared header, so it is compiled to a
+        # temp file of the make process and renamed into place. The compiler never reads a
+        # partially written header.
+        if pch_header not in pch_written:
+          pch_written |= {pch_header}
+          f.write('\n$(CC_PCH_OUT_%d) : $(CC_PCH_%d) %s\n' %
+                  (index, index, str.join(' ', sorted(item.get('pch', set())))))
+          f.write('\t@echo "Precompiling header for %s"\n' % target)
+          f.write('\t$(CC) $(CFLAGS_%d) $(CCFLAGS) -x c++-header -MMD -MP -MT $@ '
+                  '-MF $@.$$$$.d -o $@.$$$$.tmp -c $< && mv -f $@.$$$$.d $@.d && '
+                  'mv -f $@.$$$$.tmp $@ || { rm -f $@.$$$$.d $@.$$$$.tmp; exit 1; }\n' % index)
+          # Rebuild the precompiled header if any of the headers it includes change.
+          f.write('\n-include $(CC_PCH_OUT_%d).d\n' % index)
+        f.write('\n$(CC_OBJ_CC_%d) $(CC_OBJ_CPP_%d) : $(CC_PCH_OUT_%d)\n' %
+                (index, index, index))
+      else:
+        f.write('CFLAGS_PCH_%d =\n' % index)
+
       f.write('\n$(CC_OBJ_C_%d) : $(CC_TARGET_DEP_DIR_%d)%%.o: %%.c\n' % (index, index))
       f.write('\t@mkdir -p $(dir $@)\n')
       f.write('\t$(C) $(CFLAGS_%d) $(CFLAGS) -o $@ -c $<\n' % index)
 
       f.write('\n$(CC_OBJ_CC_%d) : $(CC_TARGET_DEP_DIR_%d)%%.o: %%.cc\n' % (index, index))
       f.write('\t@mkdir -p $(dir $@)\n')
-      f.write('\t$(CC) $(CFLAGS_%d) $(CCFLAGS) -o $@ -c $<\n' % index)
+      f.write('\t$(CC) $(CFLAGS_%d) $(CFLAGS_PCH_%d) $(CCFLAGS) -o $@ -c $<\n' %
+              (index, index))
 
       f.write('\n$(CC_OBJ_CPP_%d) : $(CC_TARGET_DEP_DIR_%d)%%.o: %%.cpp\n' %
               (index, index))
       f.write('\t@mkdir -p $(dir $@)\n')
-      f.write('\t$(CC) $(CFLAGS_%d) $(CCFLAGS) -o $@ -c $<\n' % index)
+      f.write('\t$(CC) $(CFLAGS_%d) $(CFLAGS_PCH_%d) $(CCFLAGS) -o $@ -c $<\n' %
+              (index, index))
 
       # Write the target.
       f.write('\n%s : $(CC_OBJ_C_%d) $(CC_OBJ_CC_%d) $(CC_OBJ_CPP_%d) $(CC_HDR_%d)\n' %
@@ -152,6 +218,13 @@ class CCRules(MakeRules):
     f.close()
 
 
+  @classmethod
+  def MakeRules(cls, rules, makefile):
+    """@override"""
+    # Find the compiler once before the workers are forked. They all inherit it.
+    if rules and Flags.ARGS.build_record: BuildRecord.GetCompiler(makefile)
+    return super(CCRules, cls).MakeRules(rules, makefile)
+
   @classmethod
   def _MakeSingeRule(cls, rule, makefile, deps_file):
     """Builds a Single Rule.
@@ -163,12 +236,29 @@ class CCRules(MakeRules):
       (int): Returns the result status.
           The status is '1' for success, '0' for 'ignore', '-1' for fail.
     """
+    if not cls.MakeDepends(rule, makefile): return -1
+
+    status = super(CCRules, cls)._MakeSingeRule(rule, makefile, deps_file)
+    # Record the inputs of the build. Used by 'flash explain'.
+    if status == 1 and Flags.ARGS.build_record: BuildRecord.Update(rule, makefile, deps_file)
+    return status
+
+  @classmethod
+  def MakeDepends(cls, rule, makefile):
+    """Generates the dependencies for the rule in its deps file.
+
+    Args:
+      rule: string: The rule for which the dependencies are generated.
+      makefile: string: The *main* makefile name.
+
+    Return:
+      bool: True if the dependencies were generated successfully.
+    """
     # Get dependencies list for the rule. Run this with the original main file.
     (status, out) = ExecUtils.RunCmd('make -f %s %s' %
                                      (makefile, cls.GetDepsRuleName(rule)))
     if status:
       TermColor.Error('Could not make dependency for rule %s' %
                       Utils.RuleDisplayName(rule))
-      return -1
-
-    return super(CCRules, cls)._MakeSingeRule(rule, makefile, deps_file)
+      return False
+    return True
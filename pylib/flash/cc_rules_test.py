@@ -0,0 +1,86 @@
+"""Tests for cc_rules."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import argparse
+import os
+import shutil
+import tempfile
+import unittest
+
+from pylib.base.flags import Flags
+from pylib.file.file_utils import FileUtils
+from pylib.flash.cc_rules import CCRules
+from pylib.flash.rule_data import RuleData
+from pylib.flash.rules import Rules
+
+
+class CCRulesTest(unittest.TestCase):
+  """Tests for CCRules."""
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.args = Flags.ARGS
+    Flags.ARGS = argparse.Namespace(unity=False, verbose=0)
+    self.src_root = os.environ.get('R77_SRC_ROOT')
+    os.environ['R77_SRC_ROOT'] = self.dir
+    self.makefile = os.path.join(self.dir, 'Makefile.auto.cc.1')
+
+  def tearDown(self):
+    Flags.ARGS = self.args
+    if self.src_root is None: del os.environ['R77_SRC_ROOT']
+    else: os.environ['R77_SRC_ROOT'] = self.src_root
+    shutil.rmtree(self.dir)
+
+  def _Rule(self, name, rule_type, **kwargs):
+    """Returns: RuleData: The data for a rule in the src root."""
+    args = {'_target': os.path.join(self.dir, name), '_type': rule_type,
+            'src': {os.path.join(self.dir, name + '.cc')}, 'flag': {'-O2'}}
+    args.update(kwargs)
+    return RuleData(args)
+
+  def test_pch(self):
+    pch = os.path.join(self.dir, 'common.h')
+    lib = self._Rule('lib', 'cc_lib', pch={pch})
+    # The rule inherits the precompiled header of its dependency.
+    binary = self._Rule('bin', 'cc_bin', dep={os.path.join(self.dir, 'lib')})
+    Rules._MergeDepData(lib['_target'], lib, binary['_target'], binary)
+    plain = self._Rule('plain', 'cc_lib')
+    CCRules.WriteMakefile([lib, binary, plain], self.makefile)
+    makefile = FileUtils.FileContents(self.makefile)
+
+    header = CCRules.GetPchHeader(lib)
+    self.assertTrue(header.startswith(CCRules.GetPchDir()))
+    self.assertEqual(FileUtils.FileContents(header), '#include "%s"\n' % pch)
+    self.assertEqual(CCRules.GetPchHeader(binary), header)
+    for index in [1, 2]:
+      self.assertIn('CC_PCH_%d = %s\n' % (index, header), makefile)
+      self.assertIn('CC_PCH_OUT_%d = $(CC_PCH_%d).$(PCH_EXT)\n' % (index, index), makefile)
+      self.assertIn('CFLAGS_PCH_%d = -include $(CC_PCH_%d)\n' % (index, index), makefile)
+      self.assertIn('$(CC_OBJ_CC_%d) $(CC_OBJ_CPP_%d) : $(CC_PCH_OUT_%d)\n' %
+                    (index, index, index), makefile)
+      self.assertIn('$(CC) $(CFLAGS_%d) $(CFLAGS_PCH_%d) $(CCFLAGS) -o $@ -c $<\n' %
+                    (index, index), makefile)
+    self.assertIn('CFLAGS_PCH_3 =\n', makefile)
+    self.assertNotIn('CC_PCH_3', makefile)
+
+    # The shared header is precompiled by a single rule, to a temp file renamed into place.
+    self.assertEqual(makefile.count(' -x c++-header '), 1)
+    self.assertIn('$(CC_PCH_OUT_1) : $(CC_PCH_1) %s\n' % pch, makefile)
+    self.assertIn('-MF $@.$$$$.d -o $@.$$$$.tmp -c $< && mv -f $@.$$$$.d $@.d && '
+                  'mv -f $@.$$$$.tmp $@ || { rm -f $@.$$$$.d $@.$$$$.tmp; exit 1; }\n', makefile)
+    self.assertIn('-include $(CC_PCH_OUT_1).d\n', makefile)
+
+  def test_pch_flags(self):
+    # The header is precompiled with the flags of the rule, so different flags use another one.
+    pch = {os.path.join(self.dir, 'common.h')}
+    header = CCRules.GetPchHeader(self._Rule('a', 'cc_lib', pch=pch))
+    self.assertEqual(CCRules.GetPchHeader(self._Rule('b', 'cc_lib', pch=pch)), header)
+    self.assertNotEqual(CCRules.GetPchHeader(self._Rule('c', 'cc_lib', pch=pch, flag={'-O0'})),
+                        header)
+    self.assertIsNone(CCRules.GetPchHeader(self._Rule('d', 'cc_lib')))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+"""Handles explain. Reports why the targets of a rule would be rebuilt."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import re
+import sys
+
+from pylib.base.exec_utils import ExecUtils
+from pylib.base.flags import Flags
+from pylib.base.term_color import TermColor
+
+from pylib.flash.build_record import BuildRecord
+from pylib.flash.cc_rules import CCRules
+from pylib.flash.cmd_handler import CmdHandler
+from pylib.flash.gen_makefile import GenMakefile
+from pylib.flash.js_rules import JSRules
+from pylib.flash.ng_rules import NGRules
+from pylib.flash.nge2e_rules import NGe2eRules
+from pylib.flash.pkg_rules import PkgRules
+from pylib.flash.py_rules import PyRules
+from pylib.flash.swig_rules import SwigRules
+from pylib.flash.utils import Utils
+
+
+class Explainer(CmdHandler):
+  """Class to handle explain.
+
+  make is run in dry run mode with basic debugging to find the targets that would be remade and
+  the prerequisites that caused it. For cc rules, each prerequisite is then compared with the
+  record of the last successful build to report what actually changed. Changes that make does
+  not track (flags, compiler, dependencies) are reported from the record as well.
+  """
+
+  RULES_MAP = {'cc': CCRules,
+               'js': JSRules,
+               'ng': NGRules,
+               'nge2e': NGe2eRules,
+               'pkg': PkgRules,
+               'py': PyRules,
+               'swig': SwigRules}
+
+  # Patterns for the output of 'make --debug=b'. Older versions of make quote with `name'.
+  NEWER_RE = re.compile(r"Prerequisite [`'](.*)' is newer than target [`'](.*)'\.")
+  MISSING_RE = re.compile(r"File [`'](.*)' does not exist\.")
+  REMAKE_RE = re.compile(r"Must remake target [`'](.*)'\.")
+
+  @classmethod
+  def WorkHorse(cls, rules):
+    """Runs the workhorse for the command.
+
+    Args:
+      rules: list: List of rules to be handled.
+
+    Return:
+      (list, list): Returns a tuple of list in the form
+          (successful_rules, failed_rules) specifying rules that succeeded and
+          ones that failed.
+    """
+    gen_makefile = GenMakefile(Flags.ARGS.debug)
+    gen_makefile.GenMainMakeFile()
+    (success_genmake, failed_genmake) = gen_makefile.GenAutoMakeFileFromRules(
+        rules, Flags.ARGS.allowed_rule_types)
+
+    successful_rules = []; failed_rules = []
+    for (k, v) in list(success_genmake.items()):
+      if k not in cls.RULES_MAP:
+        TermColor.Error('Explain for %s not supported' % k)
+        failed_rules += v
+        continue
+
+      for rule in v:
+        if cls._ExplainRule(cls.RULES_MAP[k], rule, gen_makefile.GetMakeFileName()):
+          successful_rules += [rule]
+        else:
+          failed_rules += [rule]
+
+    return (successful_rules, failed_genmake + failed_rules)
+
+  @classmethod
+  def _ExplainRule(cls, rules_class, rule, makefile):
+    """Explains the rebuild of a single rule.
+
+    Args:
+      rules_class: MakeRules: The class handling the rule type.
+      rule: string: The rule to explain.
+      makefile: string: The *main* makefile name.
+
+    Return:
+      bool: True if the rule could be explained.
+    """
+    deps_file = rules_class.CreateDepsFile(rule, makefile)
+    if not deps_file: return False
+    if rules_class == CCRules and not CCRules.MakeDepends(rule, makefile): return False
+
+    (status, out) = ExecUtils.RunCmd('make -r -n --debug=b -f %s %s' % (deps_file, rule))
+    out = out.decode('utf-8', 'replace') if isinstance(out, bytes) else out
+    if status:
+      TermColor.Error('Could not explain %s' % Utils.RuleDisplayName(rule))
+      return False
+
+    remade = cls.ParseMakeDebug(out)
+    old_record = BuildRecord.Load(rule) if rules_class == CCRules else None
+    new_record = (BuildRecord.Create(rule, makefile, deps_file, old_record) if old_record
+                  else None)
+
+    TermColor.Info('')
+    if not remade:
+      TermColor.Success('%s is up to date.' % Utils.RuleDisplayName(rule))
+    else:
+      TermColor.Warning('%s: %d targets would be remade.' %
+                        (Utils.RuleDisplayName(rule), len(remade)))
+      for (target, reasons) in remade:
+        TermColor.Info('  %s' % target)
+        for reason in reasons:
+          TermColor.Info('    %s' % cls._DescribeReason(reason, remade, old_record, new_record))
+
+    if rules_class != CCRules: return True
+    if not old_record:
+      TermColor.Info('  No record of a previous successful build of %s. Build with '
+                     '--build_record to keep one.' % Utils.RuleDisplayName(rule))
+      return True
+
+    # make does not track these. Stale outputs may not be rebuilt at all.
+    changes = BuildRecord.DiffRule(old_record, new_record)
+    if changes:
+      TermColor.Warning('  Changes since the last successful build:')
+      for change in changes: TermColor.Warning('    %s' % change)
+    return True
+
+  @classmethod
+  def ParseMakeDebug(cls, out):
+    """Parses the output of 'make -n --debug=b'.
+
+    Args:
+      out: string: The output of make.
+
+    Return:
+      list: List of tuples (target, reasons) for each target that would be remade, in the order
+          make would remake them. Each reason is a tuple ('newer', prerequisite) or
+          ('missing', target).
+    """
+    remade = []
+    reasons = {}
+    for line in out.splitlines():
+      line = line.strip()
+      m = cls.NEWER_RE.match(line)
+      if m:
+        reasons.setdefault(m.group(2), []).append(('newer', m.group(1)))
+        continue
+      m = cls.MISSING_RE.match(line)
+      if m:
+        reasons.setdefault(m.group(1), []).append(('missing', m.group(1)))
+        continue
+      m = cls.REMAKE_RE.match(line)
+      if m:
+        target = m.group(1)
+        remade += [(target, reasons.pop(target, []))]
+    return remade
+
+  @classmethod
+  def _DescribeReason(cls, reason, remade, old_record, new_record):
+    """Returns a user friendly description for the reason a target is remade."""
+    (kind, name) = reason
+    if kind == 'missing':
+      # Rules are named after their dir in the src tree and never exist as files.
+      if name == remade[-1][0]: return 'rule targets are always remade (relink only)'
+      return 'does not exist'
+    if name in [x for (x, _) in remade]: return 'prerequisite is remade: %s' % name
+
+    change = None
+    if old_record:
+      change = BuildRecord.DescribeFileChange(old_record.get('files', {}).get(name),
+                                              new_record.get('files', {}).get(name))
+    return '%s: %s' % (name, change or 'is newer than the target')
+
+
+def main():
+  try:
+    Explainer.Init(Flags.PARSER)
+    Flags.InitArgs()
+    return Explainer.Run()
+  except KeyboardInterrupt as e:
+    TermColor.Warning('KeyboardInterrupt')
+    return 1
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -6,6 +6,7 @@ __author__ = 'pramodg@room77.com (Pramod Gupta)'
 __copyright__ = 'Copyright 2012 Room77, Inc.'
 
 import argparse
+import resource
 import sys
 import time
 
@@ -15,6 +16,7 @@ from pylib.base.term_color import TermColor
 from pylib.flash.build import Builder
 from pylib.flash.clean import Cleaner
 from pylib.flash.dep_graph import DepGraph
+from pylib.flash.explain import Explainer
 from pylib.flash.run import Runner
 from pylib.flash.test import Tester
 
@@ -24,7 +26,7 @@ class Flash:
   """
   # List of supported commands.
   SUPPORTED_CMDS = ['build', 'clean', 'cleanall', 'cleano', 'run', 'test',
-                    'depgraph', 'help']
+                    'depgraph', 'explain', 'help']
   def Run(self):
     self._Init()
 
@@ -34,7 +36,9 @@ class Flash:
     except KeyboardInterrupt as e:
       TermColor.Warning('KeyboardInterrupt')
       status = 1
-    duration = 'Took %.2fs' % (time.time() - start)
+    # Note: ru_maxrss is reported in KB on linux.
+    duration = 'Took %.2fs. Peak RSS: %.1fMB' % (
+        time.time() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0)
     if not status:
       TermColor.Success(duration)
     else:
@@ -109,6 +113,16 @@ class Flash:
   def _Handle_depgraph_run(self):
     return DepGraph.Run()
 
+  def _Handle_explain_init(self, parser):
+    """
+    Args:
+      parser: ArgumentParser: The argument parser for the command.
+    """
+    Explainer.Init(parser)
+
+  def _Handle_explain_run(self):
+    return Explainer.Run()
+
   def _Handle_help_init(self, parser):
     """
     Args:
@@ -24,6 +24,7 @@ from pylib.flash.nge2e_rules import NGe2eRules
 from pylib.flash.pkg_rules import PkgRules
 from pylib.flash.proto_rules import ProtoRules
 from pylib.flash.py_rules import PyRules
+from pylib.flash.rule_data import RuleData
 from pylib.flash.swig_rules import SwigRules
 from pylib.flash.rules import Rules, RulesParseError
 from pylib.flash.utils import Utils
@@ -156,11 +157,29 @@ class GenMakefile:
            ({type: successful_rules}, failed_rules) specifying rules for which
            the make rules were successfully generated and for which it failed.
     """
+    (successful_expand, failed_expand) = Rules.GetExpandedRules(rules, allowed_rule_types)
+    (specs, successful_rules, failed_rules) = self.FlattenRules(successful_expand)
+    self.WriteAutoMakeFiles(specs)
+    # The makefiles are written, so no more rules are flattened. Drop the references the pool holds
+    # so that the sets are freed along with the rules.
+    RuleData.ClearPool()
+    return (successful_rules, failed_expand + failed_rules)
+
+  def FlattenRules(self, targets):
+    """Flattens the dependencies of the targets.
+
+    Args:
+      targets: list: List of expanded targets to flatten.
+
+    Return:
+      (dict {string : list}, dict {string : list}, list): Returns a tuple in the form
+          (specs, successful_rules, failed_rules) where specs maps each rule type to the flattened
+          RuleData of its targets and successful_rules maps each rule type to its targets.
+    """
     specs = {}
     successful_rules = {}
-
-    (successful_expand, failed_rules) = Rules.GetExpandedRules(rules, allowed_rule_types)
-    for target in successful_expand:
+    failed_rules = []
+    for target in targets:
       rule_data = Rules.GetRule(target)
 
       # Expand dependency list.
@@ -189,6 +208,8 @@ class GenMakefile:
         SwigRules.WriteMakefile(rule_data, self.GetAutoMakeFileName('swig'))
         SwigRules.UpdateSwigRuleWithFormattedData(rule_data)
 
+      # The rule is complete. Share its sets with all other identical rules.
+      rule_data.Freeze()
 
       # Get the rule type again as it may have been updated.
       rule_type = rule_data.get('_type' , '')
@@ -204,7 +225,15 @@ class GenMakefile:
       successful_rules[rule_type_base] = (
           successful_rules.get(rule_type_base, []) + [target])
 
-    # Generate the automake file for each rule type.
+    return (specs, successful_rules, failed_rules)
+
+  def WriteAutoMakeFiles(self, specs):
+    """Writes the automake file for each rule type.
+
+    Args:
+      specs: dict {string : list}: The flattened RuleData for each rule type as returned by
+          FlattenRules().
+    """
     for (k, v) in list(specs.items()):
       if k == 'cc':
         CCRules.WriteMakefile(v, self.GetAutoMakeFileName('cc'))
@@ -224,5 +253,3 @@ class GenMakefile:
         PyRules.WriteMakefile(v, self.GetAutoMakeFileName('py'))
       else:
         TermColor.Info('No make file to be generated for %s' % k)
-
-    return (successful_rules, failed_rules)
@@ -99,14 +99,8 @@ class MakeRules(object):
 
     TermColor.Info('Building %s' % Utils.RuleDisplayName(rule))
 
-    deps_file = cls.GetDepsFileName(makefile, rule, '.main.')
-    try:
-      shutil.copy(makefile, deps_file)
-      cls._PrepareDepsFile(rule, deps_file)
-    except (OSError, IOError) as e:
-      TermColor.Error('Could not create makefile for rule %s' %
-                      Utils.RuleDisplayName(rule))
-      return (-1, rule)
+    deps_file = cls.CreateDepsFile(rule, makefile)
+    if not deps_file: return (-1, rule)
 
     # Make the rule.
     status = cls._MakeSingeRule(rule, makefile, deps_file)
@@ -119,6 +113,27 @@ class MakeRules(object):
     # Everything done. Mark the rule as successful.
     return (1, rule)
 
+  @classmethod
+  def CreateDepsFile(cls, rule, makefile):
+    """Creates the makefile used to build a single rule.
+
+    Args:
+      rule: string: The rule to build.
+      makefile: string: The *main* makefile name.
+
+    Return:
+      string: The deps file for the rule. None on error.
+    """
+    deps_file = cls.GetDepsFileName(makefile, rule, '.main.')
+    try:
+      shutil.copy(makefile, deps_file)
+      cls._PrepareDepsFile(rule, deps_file)
+    except (OSError, IOError) as e:
+      TermColor.Error('Could not create makefile for rule %s' %
+                      Utils.RuleDisplayName(rule))
+      return None
+    return deps_file
+
   @classmethod
   def _PrepareDepsFile(cls, rule, deps_file):
     """Prepares the deps file for each rule. By default nothing is required.
@@ -0,0 +1,149 @@
+"""Compact storage for the data of a single rule."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import sys
+import threading
+
+
+class RuleData(object):
+  """Holds the data for a single rule.
+
+  The rule data used to be a plain dict of sets. For large trees this is very
+  expensive since every flattened rule holds its own copy of the srcs and hdrs
+  of all its dependencies. This class keeps the same dict like accessors used
+  by the different rule types but:
+    1. Uses slots for the common fields.
+    2. Interns all path strings.
+    3. Shares frozen sets between rules whenever the content is identical.
+
+  Sets are only mutable while a rule is being flattened (see Merge()). Call
+  Freeze() once a rule is complete to move all its sets to the shared pool.
+  """
+
+  # Fields present on most rules. All other fields are stored in _extra.
+  FIELDS = ('name', 'src', 'hdr', 'dep', 'main', 'prebuild', 'flag', 'link', 'pch',
+            'unity_unsafe', '_target', '_type')
+
+  __slots__ = FIELDS + ('_extra',)
+
+  # Pool of all frozen sets in use. Maps a frozenset to its shared instance. The pool holds strong
+  # references, so it is cleared once the makefiles are generated (see ClearPool()).
+  _POOL = {}
+  _POOL_LOCK = threading.Lock()
+
+  def __init__(self, args=None):
+    """Initializes the rule data.
+
+    Args:
+      args: dict: The arguments passed to the rule function.
+    """
+    self._extra = None
+    if args:
+      for (k, v) in args.items(): self[k] = v
+    self.Freeze()
+
+  @classmethod
+  def Intern(cls, value):
+    """Returns the interned version of the value if it is a string."""
+    return sys.intern(value) if type(value) == str else value
+
+  @classmethod
+  def Share(cls, values):
+    """Returns the shared frozen set for the values.
+
+    Args:
+      values: iterable: The values to freeze.
+
+    Return:
+      frozenset: The shared frozenset with the same content.
+    """
+    frozen = frozenset(values)
+    with cls._POOL_LOCK:
+      return cls._POOL.setdefault(frozen, frozen)
+
+  @classmethod
+  def PoolSize(cls):
+    """Returns: int: The number of distinct sets in the shared pool."""
+    return len(cls._POOL)
+
+  @classmethod
+  def ClearPool(cls):
+    """Clears the shared pool. Sets already shared by rules are not affected."""
+    with cls._POOL_LOCK:
+      cls._POOL.clear()
+
+  def Freeze(self):
+    """Moves all the sets in the rule to the shared pool."""
+    for key in self:
+      value = self[key]
+      if isinstance(value, (set, frozenset)):
+        self[key] = self.Share(value)
+
+  def Merge(self, key, values):
+    """Merges the values in the field for the key.
+
+    Sets are copied on the first merge and updated in place after that. This
+    keeps flattening linear in the size of the dependencies and guarantees
+    that the data of a dependency is never modified through its referrer.
+
+    Args:
+      key: string: The field to update.
+      values: The values to merge. Usually a set.
+    """
+    current = self.get(key)
+    if current is None:
+      self[key] = set(values) if isinstance(values, (set, frozenset)) else values
+    elif type(current) == set:
+      current |= values
+    elif isinstance(current, frozenset):
+      self[key] = set(current) | values
+    else:
+      self[key] = current | values
+
+  def get(self, key, default=None):
+    if key in self.FIELDS:
+      return getattr(self, key, default)
+    if not self._extra: return default
+    return self._extra.get(key, default)
+
+  def pop(self, key, default=None):
+    value = self.get(key, default)
+    if key in self.FIELDS:
+      if hasattr(self, key): delattr(self, key)
+    elif self._extra:
+      self._extra.pop(key, None)
+    return value
+
+  def items(self):
+    return [(k, self[k]) for k in self]
+
+  def __getitem__(self, key):
+    value = self.get(key, self)
+    if value is self: raise KeyError(key)
+    return value
+
+  def __setitem__(self, key, value):
+    if key in self.FIELDS:
+      setattr(self, key, value)
+      return
+
+    if self._extra is None: self._extra = {}
+    self._extra[key] = value
+
+  def __contains__(self, key):
+    if key in self.FIELDS: return hasattr(self, key)
+    return bool(self._extra) and key in self._extra
+
+  def __iter__(self):
+    for key in self.FIELDS:
+      if hasattr(self, key): yield key
+    if self._extra:
+      for key in list(self._extra): yield key
+
+  def __bool__(self):
+    return True
+
+  def __repr__(self):
+    return repr(dict(self.items()))
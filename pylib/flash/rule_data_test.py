@@ -0,0 +1,52 @@
+"""Tests for rule_data."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import unittest
+
+from pylib.flash.rule_data import RuleData
+
+
+class RuleDataTest(unittest.TestCase):
+  """Tests for RuleData."""
+
+  def test_accessors(self):
+    data = RuleData({'name': 'lib', 'src': {'/a.cc'}, 'pack': 1, '_type': 'cc_lib'})
+    self.assertEqual(data['name'], 'lib')
+    self.assertEqual(data.get('src'), frozenset(['/a.cc']))
+    self.assertEqual(data.get('pack'), 1)
+    self.assertEqual(data.get('hdr', set()), set())
+    self.assertTrue('pack' in data)
+    self.assertFalse('hdr' in data)
+    self.assertRaises(KeyError, lambda: data['hdr'])
+    self.assertEqual(set(data), {'name', 'src', 'pack', '_type'})
+
+    data['_type'] = 'cc_bin'
+    self.assertEqual(data['_type'], 'cc_bin')
+    self.assertEqual(data.pop('src', set()), frozenset(['/a.cc']))
+    self.assertFalse('src' in data)
+    self.assertEqual(data.pop('src', set()), set())
+
+  def test_shared_sets(self):
+    a = RuleData({'flag': {'-O2', '-g'}, 'src': {'/a.cc'}})
+    b = RuleData({'flag': {'-g', '-O2'}, 'src': {'/b.cc'}})
+    self.assertIs(a['flag'], b['flag'])
+    self.assertIsNot(a['src'], b['src'])
+
+  def test_merge_does_not_modify_dep(self):
+    dep = RuleData({'src': {'/dep.cc'}})
+    referrer = RuleData({'name': 'bin'})
+    referrer.Merge('src', dep['src'])
+    referrer.Merge('src', {'/bin.cc'})
+    self.assertEqual(referrer['src'], {'/dep.cc', '/bin.cc'})
+    self.assertEqual(dep['src'], {'/dep.cc'})
+
+    referrer.Freeze()
+    self.assertIsInstance(referrer['src'], frozenset)
+    other = RuleData({'src': {'/bin.cc', '/dep.cc'}})
+    self.assertIs(referrer['src'], other['src'])
+
+
+if __name__ == '__main__':
+  unittest.main()
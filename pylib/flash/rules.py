@@ -15,6 +15,7 @@ import types
 from pylib.base.term_color import TermColor
 
 from pylib.flash.proto_rules import ProtoRules
+from pylib.flash.rule_data import RuleData
 from pylib.flash.swig_rules import SwigRules
 from pylib.flash.utils import Utils
 
@@ -51,7 +52,7 @@ class Rules:
   LOAD_LOCK = threading.Lock()
 
   # These rules are collected from the RULES files.
-  # Each is a dict from rule_name -> dict {rule data}. A rule data usually
+  # Each is a dict from rule_name -> RuleData. A rule data usually
   # consists of different fields like 'src', 'hdr', 'deps',
   # 'flags', etc.
   rules = {}
@@ -62,6 +63,16 @@ class Rules:
   # Rules already loaded.
   loaded = set()
 
+  @classmethod
+  def Reset(cls):
+    """Forgets all the loaded rules. The RULES files are read again on the next load."""
+    with cls.LOAD_LOCK:
+      cls.basedir = ''
+      cls.rules = {}
+      cls.rules_by_dir = {}
+      cls.loaded = set()
+    RuleData.ClearPool()
+
   @classmethod
   def AddRuleForDir(cls, name, rule_type):
     """Adds the rules to base dir.
@@ -109,7 +120,7 @@ class Rules:
       expanded_name: string: The expanded name of the rule.
 
     Return:
-      dict: Dictionary containing the data for the rule.
+      RuleData: The data for the rule. An empty dict if the rule is unknown.
     """
     return cls.rules.get(expanded_name, {})
 
@@ -134,7 +145,7 @@ class Rules:
       TermColor.Error(err_str)
       raise RulesParseError(err_str)
 
-    cls.rules[rule] = args
+    cls.rules[rule] = RuleData(args)
 
   @classmethod
   def Expand(cls, name):
@@ -146,7 +157,7 @@ class Rules:
     Exceptions:
       RulesParseError: Raises exception if parsing fails.
     """
-    sname = name.strip()
+    sname = RuleData.Intern(name.strip())
     if not sname:
       err_str = 'Empty names are not allowed in RULES specification'
       TermColor.Error(err_str)
@@ -155,9 +166,9 @@ class Rules:
     if not cls.basedir:  # no basedir specified
       return sname
     elif sname[0] == '/':  # absolute path
-      return Utils.RuleNormalizedName(sname)
+      return RuleData.Intern(Utils.RuleNormalizedName(sname))
     else:  # relative path
-      return Utils.RuleNormalizedName(os.path.join(cls.basedir, sname))
+      return RuleData.Intern(Utils.RuleNormalizedName(os.path.join(cls.basedir, sname)))
 
   @classmethod
   def ValidateRule(cls, name, rule_type, args):
@@ -178,7 +189,8 @@ class Rules:
       raise RulesParseError(err_str)
 
     # Get the expanded names for all src, hdr, dep args.
-    for field in ['src', 'hdr', 'dep', 'main', 'prebuild', 'flag', 'link']:
+    for field in ['src', 'hdr', 'dep', 'main', 'prebuild', 'flag', 'link', 'pch',
+                  'unity_unsafe']:
       field_data = args.get(field, [])
       if not field_data: continue
       if not isinstance(field_data, list):
@@ -195,12 +207,12 @@ class Rules:
       args: dict: The arguments passed to the rule function.
     """
     # Get the expanded names for all src, hdr, dep args.
-    for field in ['src', 'hdr', 'dep', 'main', 'prebuild']:
+    for field in ['src', 'hdr', 'dep', 'main', 'prebuild', 'pch', 'unity_unsafe']:
       args[field] = set([ cls.Expand(x) for x in args.get(field, []) ])
 
     # Convert lists to sets.
     for field in ['flag', 'link']:
-      args[field] = set([ x for x in args.get(field, []) ])
+      args[field] = set([ RuleData.Intern(x) for x in args.get(field, []) ])
 
   @classmethod
   def AddRule(cls, args, rule_type):
@@ -347,7 +359,7 @@ class Rules:
     Args:
       new_dep: string: The new dependency which needs to be flattened.
       referrer: string: The referrer for which the new dep is flattened.
-      referrer_data: dict: The rule data for the referrer.
+      referrer_data: RuleData: The rule data for the referrer.
 
     Exceptions:
       RulesParseError: Raises exception if parsing fails.
@@ -385,7 +397,7 @@ class Rules:
     for d in new_dep_data.get('dep', set()):
       if d not in referrer_data.get('dep', set()):
         with cls.LOAD_LOCK:
-          referrer_data['dep'] |= set([d])
+          referrer_data.Merge('dep', {d})
         Rules.Flatten(d, new_dep, referrer_data)
 
   @classmethod
@@ -395,9 +407,9 @@ class Rules:
 
     Args:
       new_dep: string: The new dependency which needs to be flattened.
-      new_dep_data: dict: The rule data for the new dep.
+      new_dep_data: RuleData: The rule data for the new dep.
       referrer: string: The referrer for which the new dep is flattened.
-      referrer_data: dict: The rule data for the referrer.
+      referrer_data: RuleData: The rule data for the referrer.
     """
     merge_ignore = {'name', 'dep'}
     if (new_dep_data.get('_type' , 'invalid') == 'proto_lib'):
@@ -406,29 +418,22 @@ class Rules:
           referrer_data.get('_type', 'invalid'))
       for key in list(proto_data):
         with cls.LOAD_LOCK:
-          if key in referrer_data:
-            referrer_data[key] |= proto_data[key]
-          else:
-            referrer_data[key] = proto_data[key]
+          referrer_data.Merge(key, proto_data[key])
     elif (new_dep_data.get('_type' , 'invalid') == 'swig_lib'):
       merge_ignore |= {'src'}
       swig_data = SwigRules.GetSwigRuleFormattedData(new_dep_data)
       for key in list(swig_data):
         with cls.LOAD_LOCK:
-          if key in referrer_data:
-            referrer_data[key] |= swig_data[key]
-          else:
-            referrer_data[key] = swig_data[key]
+          referrer_data.Merge(key, swig_data[key])
 
-    # Merge all other keys from the new dep.
+    # Merge all other keys from the new dep. Note: 'pch' is merged on purpose. The headers a
+    # library precompiles are included by the sources of the rules depending on it, so those are
+    # compiled against the same precompiled header. See CCRules.GetPchHeader().
     with cls.LOAD_LOCK:
       for key in list(new_dep_data):
         if key in merge_ignore or key.find('_') == 0:
           continue
-        if key in referrer_data:
-          referrer_data[key] |= new_dep_data[key]
-        else:
-          referrer_data[key] = new_dep_data[key]
+        referrer_data.Merge(key, new_dep_data[key])
 
 ###################################################################
 # Global Methods used in the 'RULES' file.
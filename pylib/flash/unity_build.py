@@ -0,0 +1,214 @@
+"""Groups the sources of cc rules into unity (jumbo) translation units."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import itertools
+import json
+import os
+import re
+
+from pylib.base.flags import Flags
+from pylib.base.term_color import TermColor
+from pylib.file.file_utils import FileUtils
+
+Flags.PARSER.add_argument('--unity', action='store_true', default=False,
+                          help='Compile the cc sources of each rule in a few large batches. '
+                          'Speeds up clean builds.')
+Flags.PARSER.add_argument('--unity_batch_kb', type=int, default=512,
+                          help='Max size of the sources included in a single unity batch (KB).')
+Flags.PARSER.add_argument('--unity_isolate_limit', type=int, default=4,
+                          help='Sources edited since the last unity build are compiled on their '
+                          'own if there are at most these many of them. Otherwise the batches '
+                          'are rebuilt.')
+
+
+class UnityBuild(object):
+  """Class to group the sources of a cc rule into unity batches.
+
+  Each batch is a generated source that includes a part of the sources of the rule. The
+  batches replace the sources in the makefile so the existing obj, makedepend and link rules are
+  used unchanged.
+
+  The sources keep their batch across builds: the batches of the last build are saved in the unity
+  dir. A new source is added to the last batch, or to a new one if the last batch is full, and a
+  removed source only changes its own batch. So adding or removing a source never moves the other
+  sources to other batches. A batch may grow past --unity_batch_kb as its sources grow. The
+  batches are regrouped from scratch by a clean build.
+
+  Incremental builds: once a batch is built, editing one of its sources would rebuild the whole
+  batch on every edit. Instead, if only a few sources changed since the last build, they are taken
+  out of their batch and compiled on their own. They stay out of the batch on the following
+  builds, so from then on the edit-compile cycle only rebuilds the edited file.
+
+  Note the costs of this:
+  - The first edit of a source still rebuilds its batch once. The object of the batch includes the
+    code of the source, so the batch must be rewritten without it to not define it twice.
+  - The isolated sources accumulate across builds. Once more than --unity_isolate_limit sources
+    are out of their batches, all the batches are rebuilt with all the sources, which is as costly
+    as a clean unity build of the rule.
+  """
+
+  # Extensions of the sources that can be batched. c sources use a different compiler.
+  EXTENSIONS = ('.cc', '.cpp')
+
+  # Header written at the top of each batch.
+  HEADER = '// Unity batch generated by flash. DO NOT EDIT.\n'
+
+  # The file in the unity dir with the sources of each batch of the last build.
+  BATCHES_FILE = 'batches.json'
+
+  INCLUDE_RE = re.compile(r'^#include "(.*)"$', re.MULTILINE)
+
+  @classmethod
+  def GetUnityDir(cls, target_bin):
+    """Returns the dir where the unity batches for the target are generated."""
+    return target_bin + '_unity'
+
+  @classmethod
+  def GetObj(cls, src, target_dep_dir):
+    """Returns the object file built for the source. Must match the CC_OBJ_* rules."""
+    return target_dep_dir + os.path.splitext(src)[0] + '.o'
+
+  @classmethod
+  def GetSrcs(cls, item, target_bin, target_dep_dir):
+    """Returns the sources to compile for the rule.
+
+    Args:
+      item: RuleData: The flattened data for the rule.
+      target_bin: string: The bin path for the target.
+      target_dep_dir: string: The dir where the objects of the target are built.
+
+    Return:
+      list: The sources to compile. These are the sources of the rule if unity builds are
+          disabled. Otherwise the unity batches followed by the sources compiled on their own.
+    """
+    srcs = item.get('src', set())
+    if not Flags.ARGS.unity: return sorted(srcs)
+
+    unsafe = item.get('unity_unsafe', set())
+    gen_dir = FileUtils.GetGenDir()
+    eligible = []
+    separate = []
+    for src in sorted(srcs):
+      # Generated sources may not exist yet. Leave them to the normal rules.
+      if (os.path.splitext(src)[1] in cls.EXTENSIONS and src not in unsafe and
+          not src.startswith(gen_dir) and os.path.isfile(src)):
+        eligible += [src]
+      else:
+        separate += [src]
+
+    if len(eligible) < 2: return sorted(srcs)
+
+    unity_dir = cls.GetUnityDir(target_bin)
+    batches = cls.CreateBatches(unity_dir, eligible, Flags.ARGS.unity_batch_kb * 1024)
+    isolated = cls.GetIsolatedSrcs(batches, target_dep_dir, Flags.ARGS.unity_isolate_limit)
+    if isolated:
+      TermColor.VInfo(1, 'Compiling outside the unity batches: %s' % sorted(isolated))
+
+    FileUtils.MakeDirs(unity_dir)
+    cls.SaveBatches(unity_dir, batches)
+    for (batch, batch_srcs) in batches:
+      data = cls.HEADER + ''.join(['#include "%s"\n' % x for x in batch_srcs
+                                   if x not in isolated])
+      # Only rewrite the batch on changes. Otherwise the whole batch is rebuilt.
+      if FileUtils.FileContents(batch) != data:
+        FileUtils.CreateFileWithData(batch, data)
+
+    return [x for (x, _) in batches] + separate + sorted(isolated)
+
+  @classmethod
+  def CreateBatches(cls, unity_dir, srcs, max_size):
+    """Splits the sources in batches. The sources in the batches of the last build stay in them.
+
+    Args:
+      unity_dir: string: The dir where the batches are generated.
+      srcs: list: The sorted list of sources to batch.
+      max_size: int: The max size of the sources added to a batch. A source larger than this is
+          put in a batch of its own.
+
+    Return:
+      list: List of tuples (batch, srcs) where batch is the generated source for the batch.
+    """
+    groups = []
+    assigned = set()
+    srcs_set = set(srcs)
+    for (name, batch_srcs) in cls.LoadBatches(unity_dir):
+      batch_srcs = [x for x in batch_srcs if x in srcs_set and x not in assigned]
+      if not batch_srcs: continue
+      groups += [(name, batch_srcs)]
+      assigned |= set(batch_srcs)
+
+    # Add the new sources to the last batch while it has room, then to new batches.
+    names = set([x for (x, _) in groups])
+    size = sum([os.path.getsize(x) for x in groups[-1][1]]) if groups else 0
+    for src in srcs:
+      if src in assigned: continue
+      src_size = os.path.getsize(src)
+      if not groups or size + src_size > max_size:
+        name = next(x for x in ('unity_%d.cc' % i for i in itertools.count()) if x not in names)
+        names |= {name}
+        groups += [(name, [])]
+        size = 0
+      groups[-1][1].append(src)
+      size += src_size
+
+    return [(os.path.join(unity_dir, name), sorted(x)) for (name, x) in groups]
+
+  @classmethod
+  def LoadBatches(cls, unity_dir):
+    """Returns the batches of the last build.
+
+    Args:
+      unity_dir: string: The dir where the batches are generated.
+
+    Return:
+      list: List of tuples (name, srcs) where name is the file name of the batch, in the order
+          the batches were created. Empty if unknown.
+    """
+    filename = os.path.join(unity_dir, cls.BATCHES_FILE)
+    try:
+      return [(str(x), list(y)) for (x, y) in json.loads(FileUtils.FileContents(filename) or '[]')]
+    except (ValueError, TypeError):
+      TermColor.Warning('Ignoring invalid unity batches: %s' % filename)
+      return []
+
+  @classmethod
+  def SaveBatches(cls, unity_dir, batches):
+    """Saves the batches for the next build.
+
+    Args:
+      unity_dir: string: The dir where the batches are generated.
+      batches: list: The batches returned by CreateBatches().
+    """
+    data = json.dumps([[os.path.basename(x), y] for (x, y) in batches], indent=2)
+    filename = os.path.join(unity_dir, cls.BATCHES_FILE)
+    if FileUtils.FileContents(filename) != data: FileUtils.CreateFileWithData(filename, data)
+
+  @classmethod
+  def GetIsolatedSrcs(cls, batches, target_dep_dir, limit):
+    """Returns the sources to compile outside their batch.
+
+    These are the sources already outside their batch in the last build and the ones modified
+    after their batch was last built.
+
+    Args:
+      batches: list: The batches returned by CreateBatches().
+      target_dep_dir: string: The dir where the objects of the target are built.
+      limit: int: The max number of sources to isolate.
+
+    Return:
+      set: The sources to compile on their own. Empty if all batches must be rebuilt.
+    """
+    isolated = set()
+    for (batch, batch_srcs) in batches:
+      obj = cls.GetObj(batch, target_dep_dir)
+      if not os.path.isfile(obj): continue
+      obj_mtime = os.path.getmtime(obj)
+      included = set(cls.INCLUDE_RE.findall(FileUtils.FileContents(batch) or ''))
+      for src in batch_srcs:
+        if src not in included or os.path.getmtime(src) > obj_mtime:
+          isolated |= {src}
+
+    if len(isolated) > limit: return set()
+    return isolated
@@ -0,0 +1,158 @@
+"""Tests for unity_build."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import argparse
+import os
+import re
+import shutil
+import tempfile
+import time
+import unittest
+
+from pylib.base.flags import Flags
+from pylib.file.file_utils import FileUtils
+from pylib.flash.cc_rules import CCRules
+from pylib.flash.unity_build import UnityBuild
+
+
+class UnityBuildTest(unittest.TestCase):
+  """Tests for UnityBuild."""
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.args = Flags.ARGS
+    self.unity_dir = os.path.join(self.dir, 'bin_unity')
+    self.dep_dir = os.path.join(self.dir, 'bin_deps')
+    self.srcs = []
+    for i in range(4):
+      src = os.path.join(self.dir, 'src_%d.cc' % i)
+      FileUtils.CreateFileWithData(src, 'x' * 100)
+      self.srcs += [src]
+
+  def tearDown(self):
+    Flags.ARGS = self.args
+    shutil.rmtree(self.dir)
+
+  def _Build(self, batches, isolated=set()):
+    """Writes the batches and their objects as a build would."""
+    FileUtils.MakeDirs(self.unity_dir)
+    for (batch, srcs) in batches:
+      FileUtils.CreateFileWithData(batch, ''.join(
+          ['#include "%s"\n' % x for x in srcs if x not in isolated]))
+      obj = UnityBuild.GetObj(batch, self.dep_dir)
+      FileUtils.MakeDirs(os.path.dirname(obj))
+      FileUtils.CreateFileWithData(obj)
+
+  def _Touch(self, src):
+    mtime = time.time() + 10
+    os.utime(src, (mtime, mtime))
+
+  def test_create_batches(self):
+    batches = UnityBuild.CreateBatches(self.unity_dir, self.srcs, 250)
+    self.assertEqual([x for (_, x) in batches], [self.srcs[0:2], self.srcs[2:4]])
+    self.assertEqual(batches[1][0], os.path.join(self.unity_dir, 'unity_1.cc'))
+
+    # Sources larger than the limit get a batch of their own.
+    batches = UnityBuild.CreateBatches(self.unity_dir, self.srcs, 50)
+    self.assertEqual(len(batches), 4)
+
+  def test_stable_batches(self):
+    batches = UnityBuild.CreateBatches(self.unity_dir, self.srcs, 250)
+    FileUtils.MakeDirs(self.unity_dir)
+    UnityBuild.SaveBatches(self.unity_dir, batches)
+
+    # A new source goes to the last batch if it has room, else to a new batch. The other sources
+    # keep their batches even if the new source sorts before them.
+    new = os.path.join(self.dir, 'src_0a.cc')
+    FileUtils.CreateFileWithData(new, 'x' * 10)
+    srcs = sorted(self.srcs + [new])
+    self.assertEqual(UnityBuild.CreateBatches(self.unity_dir, srcs, 250),
+                     [batches[0], (batches[1][0], sorted(self.srcs[2:4] + [new]))])
+    self.assertEqual(UnityBuild.CreateBatches(self.unity_dir, srcs, 200),
+                     batches + [(os.path.join(self.unity_dir, 'unity_2.cc'), [new])])
+
+    # A removed source only changes its batch. The name of an emptied batch is reused.
+    self.assertEqual(UnityBuild.CreateBatches(self.unity_dir, self.srcs[1:], 250),
+                     [(batches[0][0], self.srcs[1:2]), batches[1]])
+    UnityBuild.SaveBatches(self.unity_dir, UnityBuild.CreateBatches(
+        self.unity_dir, self.srcs[2:], 250))
+    self.assertEqual(UnityBuild.CreateBatches(self.unity_dir, srcs, 250),
+                     [batches[1], (batches[0][0], sorted(self.srcs[0:2] + [new]))])
+
+  def test_isolated_srcs(self):
+    batches = UnityBuild.CreateBatches(self.unity_dir, self.srcs, 250)
+    # Nothing is isolated for a clean build.
+    self.assertEqual(UnityBuild.GetIsolatedSrcs(batches, self.dep_dir, 2), set())
+
+    self._Build(batches)
+    self.assertEqual(UnityBuild.GetIsolatedSrcs(batches, self.dep_dir, 2), set())
+
+    # Edited sources are compiled outside the batch and stay out of it.
+    self._Touch(self.srcs[1])
+    self.assertEqual(UnityBuild.GetIsolatedSrcs(batches, self.dep_dir, 2), {self.srcs[1]})
+    self._Build(batches, {self.srcs[1]})
+    self.assertEqual(UnityBuild.GetIsolatedSrcs(batches, self.dep_dir, 2), {self.srcs[1]})
+
+    # Too many edits rebuild the batches.
+    self._Touch(self.srcs[2])
+    self._Touch(self.srcs[3])
+    self.assertEqual(UnityBuild.GetIsolatedSrcs(batches, self.dep_dir, 2), set())
+
+  def test_makefile_across_edits(self):
+    Flags.ARGS = argparse.Namespace(unity=True, unity_batch_kb=1, unity_isolate_limit=2,
+                                    verbose=0)
+    src_root = os.environ.get('R77_SRC_ROOT')
+    os.environ['R77_SRC_ROOT'] = self.dir
+    try:
+      # Each batch of 1KB holds 2 sources.
+      for src in self.srcs: FileUtils.CreateFileWithData(src, 'x' * 400)
+      item = {'_target': os.path.join(self.dir, 'bin'), '_type': 'cc_lib', 'src': set(self.srcs)}
+      makefile = os.path.join(self.dir, 'Makefile.auto.cc.1')
+      target_bin = FileUtils.GetBinPathForFile(item['_target'])
+      unity_dir = UnityBuild.GetUnityDir(target_bin)
+      batches = [os.path.join(unity_dir, 'unity_%d.cc' % i) for i in range(2)]
+      dep_dir = target_bin + '_deps'
+
+      def Generate():
+        """Returns the sources of the makefile and the sources included by each batch."""
+        CCRules.WriteMakefile([item], makefile)
+        srcs = re.search(r'CC_SRC_1 = ((?:.*\\\n)*.*)\n', FileUtils.FileContents(makefile))
+        return ([x.strip() for x in srcs.group(1).split('\\\n')],
+                [UnityBuild.INCLUDE_RE.findall(FileUtils.FileContents(x)) for x in batches])
+
+      def Build():
+        """Creates the objects of the batches as a build would."""
+        for batch in batches:
+          obj = UnityBuild.GetObj(batch, dep_dir)
+          FileUtils.MakeDirs(os.path.dirname(obj))
+          FileUtils.CreateFileWithData(obj)
+
+      (srcs, included) = Generate()
+      self.assertEqual(srcs, batches)
+      self.assertEqual(included, [self.srcs[0:2], self.srcs[2:4]])
+      Build()
+
+      # The first edit of a source takes it out of its batch, which is rewritten once.
+      self._Touch(self.srcs[1])
+      (srcs, included) = Generate()
+      self.assertEqual(srcs, batches + [self.srcs[1]])
+      self.assertEqual(included, [self.srcs[0:1], self.srcs[2:4]])
+      Build()
+      batch_mtimes = [os.path.getmtime(x) for x in batches]
+
+      # The next edits only rebuild the source. The batches are not rewritten.
+      mtime = time.time() + 20
+      os.utime(self.srcs[1], (mtime, mtime))
+      (srcs, included) = Generate()
+      self.assertEqual(srcs, batches + [self.srcs[1]])
+      self.assertEqual(included, [self.srcs[0:1], self.srcs[2:4]])
+      self.assertEqual([os.path.getmtime(x) for x in batches], batch_mtimes)
+    finally:
+      if src_root is None: del os.environ['R77_SRC_ROOT']
+      else: os.environ['R77_SRC_ROOT'] = src_root
+
+
+if __name__ == '__main__':
+  unittest.main()
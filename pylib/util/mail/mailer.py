@@ -8,7 +8,10 @@ __copyright__ = 'Copyright 2013 Room77, Inc.'
 
 # Import smtplib for the actual sending function
 import getpass
+import gzip
+import re
 import smtplib
+import socket
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
@@ -16,15 +19,30 @@ from pylib.base.term_color import TermColor
 
 
 class Mailer(object):
-  """Simple mailer class."""
+  """Simple mailer class. All the messages sent by a mailer share a single SMTP connection."""
 
-  def __init__(self):
-    self.__server = smtplib.SMTP('localhost')
+  def __init__(self, host='localhost', port=0):
+    """
+    Args:
+      host: string: The SMTP server.
+      port: int: The port of the SMTP server. 0 for the default port.
+    """
+    self.__server = None
+    self.__server = smtplib.SMTP(host, port)
     self.__server.ehlo()
     self.__max_msg_limit_in_bytes = int(self.__server.esmtp_features.get('size', 0)) - 10
 
   def __del__(self):
-    self.__server.quit()
+    self.close()
+
+  def close(self):
+    """Closes the connection to the server."""
+    if not self.__server: return
+    try:
+      self.__server.quit()
+    except (smtplib.SMTPException, OSError):
+      pass
+    self.__server = None
 
   def send_message(self, msg):
     """Sends a Message.
@@ -42,7 +60,7 @@ class Mailer(object):
         return False
 
       receivers = msg.get('To', None)
-      if receivers: receivers = receivers.split()  # Split to get an array
+      if receivers: receivers = [x for x in re.split(r'[,\s]+', receivers) if x]
       if not receivers:
         TermColor.Error('Must specify receivers: %s.' % msg)
         return False
@@ -87,7 +105,8 @@ class Mailer(object):
       sender: string: The email id of the sender. Default = username@machinename
       receivers: list[string]: The email ids of receivers.
       subject: string: The subject for the mail.
-      filenames: list[string]: The list of file to read to append the data.
+      filenames: list[string]: The list of file to read to append the data. Files with the .gz
+          suffix are decompressed.
       body: string: The body for the mail before the files are appended.
 
     Return:
@@ -98,7 +117,8 @@ class Mailer(object):
     for filename in filenames:
       outer.attach(MIMEText('$cat %s\n' % filename))
       try:
-        with open(filename, 'r') as fp:
+        opener = gzip.open if filename.endswith('.gz') else open
+        with opener(filename, 'rt', errors='replace') as fp:
           outer.attach(MIMEText(fp.read()))
       except Exception as e:  # TODO(pramodg): Make this more restricitive
         err = 'Could not open file: %s. Error: %s : %s' % (filename, type(e) , e)
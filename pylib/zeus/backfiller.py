@@ -0,0 +1,417 @@
+#!/usr/bin/env python
+
+"""Handles backfill."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import datetime
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from collections import OrderedDict
+
+from pylib.base.flags import Flags
+from pylib.base.exec_utils import PicklableCallback
+from pylib.base.term_color import TermColor
+from pylib.file.file_utils import FileUtils
+
+from pylib.zeus.dated_dir_index import DatedDirIndex
+from pylib.zeus.history import History
+from pylib.zeus.journal import Journal
+from pylib.zeus.mail_digest import MailDigest
+from pylib.zeus.pipeline_config import PipelineConfig
+from pylib.zeus.pipeline_utils import PipelineUtils
+from pylib.zeus.proc_sampler import ProcSampler
+from pylib.zeus.runner import Runner
+from pylib.zeus.stage_link import StageLinks
+from pylib.zeus.task_resources import ResourceScheduler, TaskResources
+from pylib.zeus.task_shards import TaskShards
+
+
+class DateRun(object):
+  """Class to hold the state of the run of the pipeline for one date of a backfill.
+
+  Members:
+    config: PipelineConfig: The config for the date.
+    graph: TaskGraph: The graph of the run.
+    dir_deps: dict {string, set(string)}: The earlier tasks in the same dir for each task that
+        requires dir success.
+    out_dirs_status: dict {string, EXITCODE}: The out dir to its status.
+    out_dirs_pending: dict {string, int}: The out dir to the number of its unfinished tasks.
+    journal: Journal: The journal of the run. None if there is none.
+    history: History: The history the run is recorded in. None if there is none.
+    successful: list: The tasks that succeeded.
+    failed: list: The tasks that failed or were skipped.
+    task_usage: dict {string, dict}: The usage of each task that ran.
+    aborted_task: string: The task that aborted the backfill in this date. None if there is none.
+  """
+
+  def __init__(self, config, graph, dir_deps):
+    self.config = config
+    self.graph = graph
+    self.dir_deps = dir_deps
+    self.out_dirs_status = {}
+    self.out_dirs_pending = {}
+    for task in graph.tasks():
+      out_dir = PipelineUtils.GetOutDirForTask(task)
+      if out_dir: self.out_dirs_pending[out_dir] = self.out_dirs_pending.get(out_dir, 0) + 1
+    journal_file = Journal.GetJournalFile()
+    self.journal = Journal(journal_file, truncate=True) if journal_file else None
+    self.history = History.Open()
+    self.successful = []
+    self.failed = []
+    self.task_usage = {}
+    self.aborted_task = None
+
+
+class Backfiller(Runner):
+  """Class to run the pipeline for a range of dates.
+
+  Each date is run as by 'zeus run --date': it has its own config, out dir status, journal and
+  run in the history, so 'zeus continue --date' can resume any of them. The tasks of all the
+  dates share one pool and one resource budget. A task runs for a date only once it finished for
+  the previous date, as it may read the outputs of the previous date from the _PREV dirs.
+  Otherwise the dates do not wait for each other: the ready tasks of the earliest dates start
+  first and the tasks of later dates fill the rest of the pool, so the backfill takes about the
+  total work over the pool size instead of the sum of the runs.
+
+  Linked tasks are not supported, as the tasks of a chain would have to start together across
+  dates.
+  """
+
+  @classmethod
+  def Init(cls, parser):
+    super(Backfiller, cls).Init(parser)
+    parser.add_argument('--from_date', type=str, required=True,
+                        help='The first date to run the pipeline for, e.g. 20140101.')
+    parser.add_argument('--to_date', type=str, default='',
+                        help='The last date to run the pipeline for. Defaults to --date.')
+
+  @classmethod
+  def WorkHorse(cls, tasks):
+    """Runs the workhorse for the command.
+
+    Args:
+      tasks: OrderedDict {int, set(string)}: Dict from priority to set of tasks to execute at the
+          priority. Note: the dict is ordered by priority.
+
+    Return:
+      (list, list): Returns a tuple of list in the form
+          (successful_tasks, failed_tasks) specifying tasks that succeeded and
+          ones that failed, for all the dates.
+    """
+    start = time.time()
+    dates = cls._GetDates(Flags.ARGS.from_date,
+                          Flags.ARGS.to_date or PipelineConfig.Instance().pipeline_date())
+
+    os.chdir(FileUtils.GetSrcRoot())
+    config = PipelineConfig.Instance()
+    runs = OrderedDict()
+    for date in dates:
+      PipelineConfig.Select(config.ForDate(date))
+      cls._CreateDirsForTasks(tasks)
+      (graph, dir_deps) = cls._CreateTaskGraph(tasks)
+      if StageLinks.Instance().links():
+        TermColor.Error('Cannot backfill linked tasks: %s' % PipelineUtils.TasksDisplayNames(
+            sorted(set(sum([list(x) for x in StageLinks.Instance().links()], [])))))
+        PipelineConfig.Select(config)
+        return ([], graph.tasks())
+      runs[date] = DateRun(PipelineConfig.Instance(), graph, dir_deps)
+      if runs[date].history:
+        runs[date].history.StartRun(config.pipeline_id(), date, start)
+    # All the dated dirs of the backfill exist now. Index them once for the whole backfill.
+    graph = runs[dates[0]].graph
+    DatedDirIndex.Instance().Load(cls._GetDatedDirParents(graph.tasks()))
+    TermColor.Info('Backfilling %d dates from %s to %s' % (len(dates), dates[0], dates[-1]))
+    title = '[%s:%s-%s]' % (config.pipeline_id(), dates[0], dates[-1])
+    # The status server must run before the pool is forked.
+    status = cls._CreateStatusServer(title, [cls._GetDatedTaskDisplayName(x, y) for y in dates
+                                             for x in graph.tasks()])
+
+    pool_size = Flags.ARGS.pool_size or max(multiprocessing.cpu_count(), 1)
+    pool = multiprocessing.get_context('fork').Pool(processes=pool_size)
+    completed = queue.Queue()
+    # The (date, task) of the running tasks to the time they started at and to the slots of the
+    # pool they hold. A task never runs for two dates at the same time.
+    running = {}
+    slots = {}
+    shard_counts = {x: cls._GetShardCount(x, pool_size) for x in graph.tasks()}
+    shard_results = {}
+    durations = {}
+    history = runs[dates[0]].history
+    if history: durations = cls._GetMedianDurations(history, graph.tasks())
+    scheduler = cls._CreateResourceScheduler(pool_size)
+    resources = {x: cls._LoadTaskResources(x, shard_counts[x]) for x in graph.tasks()}
+    digest = None
+    if Flags.ARGS.mail_digest:
+      digest = MailDigest(PipelineUtils.ZeusEmailId(Flags.ARGS.mail_domain), title,
+                          Flags.ARGS.smtp_host, Flags.ARGS.smtp_port)
+    aborted_task = None
+    last_progress = time.time()
+    try:
+      while True:
+        ready = [] if aborted_task else cls._GetReadyTasks(runs, durations)
+        blocked = set()
+        reserved = None
+        while ready and sum(slots.values()) < pool_size:
+          (date, task) = ready.pop(0)
+          run = runs[date]
+          # Keep the pool for the shards instead of filling it with smaller tasks.
+          if running and sum(slots.values()) + shard_counts[task] > pool_size: break
+          PipelineConfig.Select(run.config)
+
+          skip_reason = cls._GetSkipReason(task, run.graph, run.dir_deps.get(task, set()))
+          if skip_reason:
+            run.failed += [task]
+            run.graph.Finish(task, Runner.EXITCODE['FAILURE'])
+            cls._UpdateOutDirStatus(task, None, run.out_dirs_status, run.out_dirs_pending)
+            if run.journal:
+              now = time.time()
+              run.journal.Record(task, 'SKIPPED', Runner.EXITCODE['FAILURE'], now, now,
+                                 skip_reason)
+            if status: status.Finish(cls._GetTaskDisplayName(task), False, 'SKIPPED', skip_reason)
+            TermColor.Failure('Skipped Task: %s due to %s' % (cls._GetTaskDisplayName(task),
+                                                              skip_reason))
+            # Skipping a task may make its dependents ready.
+            ready = [x for x in cls._GetReadyTasks(runs, durations) if x not in blocked]
+            continue
+
+          block_reason = scheduler.GetBlockReason(resources[task], reserved)
+          if block_reason:
+            blocked.add((date, task))
+            if not reserved and block_reason in ResourceScheduler.BUDGET_REASONS:
+              reserved = resources[task]
+            continue
+
+          scheduler.Acquire(task, resources[task])
+          run.graph.Start(task)
+          running[(date, task)] = time.time()
+          slots[(date, task)] = shard_counts[task]
+          if status: status.Start(cls._GetTaskDisplayName(task))
+          if shard_counts[task] == 1:
+            cls._SubmitDatedTask(pool, completed, date, task)
+            continue
+          for shard_index in range(shard_counts[task]):
+            cls._SubmitDatedTask(pool, completed, date, task, shard_index, shard_counts[task])
+
+        if status:
+          status.Queue([cls._GetDatedTaskDisplayName(y, x) for (x, y) in set(ready) | blocked])
+        if not running: break
+
+        try:
+          timeout = None
+          if Flags.ARGS.progress_interval:
+            timeout = max(last_progress + Flags.ARGS.progress_interval - time.time(), 0)
+          (date, res, task, usage) = completed.get(timeout=timeout)
+        except queue.Empty:
+          cls._ReportBackfillProgress(runs, running)
+          last_progress = time.time()
+          if digest and Flags.ARGS.mail_digest_interval:
+            digest.FlushIfDue(Flags.ARGS.mail_digest_interval)
+          continue
+
+        run = runs[date]
+        PipelineConfig.Select(run.config)
+        if isinstance(res, BaseException):
+          TermColor.Error('Could not process: %s. %s: %s' % (cls._GetTaskDisplayName(task),
+                                                             type(res), res))
+          res = Runner.EXITCODE['FAILURE']
+        if shard_counts[task] > 1:
+          # A sharded task finishes once all its shards and its merge step did.
+          if usage.get('merge'):
+            (res, usage) = TaskShards.CombineResults(shard_results.pop(task) + [(res, usage)])
+          else:
+            shard_results.setdefault(task, []).append((res, usage))
+            if len(shard_results[task]) < shard_counts[task]: continue
+            (res, usage) = TaskShards.CombineResults(shard_results.pop(task))
+            if res == Runner.EXITCODE['SUCCESS'] and TaskShards.GetMergeFile(task):
+              shard_results[task] = [(res, usage)]
+              slots[(date, task)] = 1
+              scheduler.Release(task)
+              scheduler.Acquire(task, TaskResources.Load(task))
+              cls._SubmitDatedTask(pool, completed, date, task, None, shard_counts[task])
+              continue
+
+        task_start = running.pop((date, task))
+        task_end = time.time()
+        slots.pop((date, task))
+        scheduler.Release(task)
+        run.graph.Finish(task, res)
+        if run.journal:
+          run.journal.Record(task, Runner.EXITCODE_DESCRIPTION.get(res, str(res)), res,
+                             task_start, task_end, usage.get('reason'))
+        if status:
+          status.Finish(cls._GetTaskDisplayName(task), res == Runner.EXITCODE['SUCCESS'],
+                        Runner.EXITCODE_DESCRIPTION.get(res, str(res)), usage.get('reason'))
+        if run.history:
+          run.history.RecordTask(PipelineUtils.TaskRelativeName(task), task_start,
+                                 task_end - task_start, res,
+                                 ProcSampler.GetPeakRssKb(usage) or None, usage.get('log_size'),
+                                 usage.get('cached', False))
+        if not usage.get('cached'): run.task_usage[task] = usage
+
+        if res == Runner.EXITCODE['SUCCESS']:
+          run.successful += [task]
+        elif res in [Runner.EXITCODE['FAILURE'], Runner.EXITCODE['ALLOW_FAIL']]:
+          run.failed += [task]
+        elif res == Runner.EXITCODE['ABORT_FAIL']:
+          run.failed += [task]
+          run.aborted_task = cls._GetTaskDisplayName(task)
+          aborted_task = cls._GetDatedTaskDisplayName(task, date)
+        else:
+          TermColor.Fatal('Invalid return %d code for %s' % (res, task))
+
+        cls._UpdateOutDirStatus(task, res, run.out_dirs_status, run.out_dirs_pending)
+        if usage.get('mail'):
+          (receiver, body) = usage['mail']
+          if digest and res != Runner.EXITCODE['ABORT_FAIL']:
+            digest.Add(receiver, Runner.EXITCODE_DESCRIPTION.get(res, str(res)),
+                       cls._GetTaskDisplayName(task), body)
+          else:
+            cls._SendMail(receiver, cls._GetMailSubjectForTask(task, res), body)
+      pool.close()
+      pool.join()
+    except KeyboardInterrupt:
+      pool.terminate()
+      raise
+    finally:
+      if status: status.Stop()
+      for run in runs.values():
+        if run.journal: run.journal.Close()
+
+    successful = []; failed = []
+    for (date, run) in runs.items():
+      PipelineConfig.Select(run.config)
+      # Tasks left at this point were either not started due to an abort or are blocked by a
+      # dependency cycle.
+      pending = run.graph.GetPendingTasks()
+      if pending and not aborted_task:
+        TermColor.Error('Could not run tasks for %s blocked by cyclic dependencies: %s' %
+                        (date, PipelineUtils.TasksDisplayNames(pending)))
+      run.failed += pending
+      if run.history:
+        run.history.FinishRun(time.time(), len(run.successful), len(run.failed))
+        run.history.Close()
+      cls._WriteOutDirsStatus({k: v for (k, v) in run.out_dirs_status.items()
+                               if run.out_dirs_pending.get(k)})
+      cls._SendFinalStatusMail(run.successful, run.failed, run.aborted_task,
+                               time.time() - start, run.task_usage)
+      TermColor.Info('Date %s: %d tasks successful, %d failed' % (date, len(run.successful),
+                                                                  len(run.failed)))
+      if run.task_usage: TermColor.Info(cls._GetUsageReport(run.task_usage))
+      successful += run.successful
+      failed += run.failed
+    PipelineConfig.Select(config)
+    if digest: digest.Flush()
+
+    if aborted_task:
+      TermColor.Failure('Aborted by task: %s' % aborted_task)
+    return (successful, failed)
+
+  @classmethod
+  def _GetDates(cls, from_date, to_date):
+    """Returns the dates of the backfill.
+
+    Args:
+      from_date: string: The first date, e.g. 20140101.
+      to_date: string: The last date.
+
+    Return:
+      list(string): The dates in order.
+    """
+    try:
+      date = datetime.datetime.strptime(from_date, '%Y%m%d')
+      end = datetime.datetime.strptime(to_date, '%Y%m%d')
+    except ValueError as e:
+      TermColor.Fatal('Invalid date: %s' % e)
+    if date > end: TermColor.Fatal('--from_date %s is after %s.' % (from_date, to_date))
+    dates = []
+    while date <= end:
+      dates += [date.strftime('%Y%m%d')]
+      date += datetime.timedelta(days=1)
+    return dates
+
+  @classmethod
+  def _GetReadyTasks(cls, runs, durations):
+    """Returns the tasks that can start, the tasks of the earliest dates first.
+
+    Args:
+      runs: OrderedDict {string, DateRun}: The date to its run, in order.
+      durations: dict {string, (float, int)}: The median duration of the tasks.
+
+    Return:
+      list((string, string)): The (date, task) that can start.
+    """
+    ready = []
+    prev_run = None
+    for (date, run) in runs.items():
+      tasks = [x for x in run.graph.GetReadyTasks()
+               if not prev_run or prev_run.graph.status(x) is not None]
+      ready += [(date, x) for x in cls._SortByDuration(tasks, durations)]
+      prev_run = run
+    return ready
+
+  @classmethod
+  def _SubmitDatedTask(cls, pool, completed, date, task, shard_index=None, shard_count=None):
+    """Submits a task, or a shard of a task, for a date to the pool.
+
+    Args:
+      pool: Pool: The pool of the backfill.
+      completed: Queue: The queue the date and the result are put in.
+      date: string: The date.
+      task: string: The task.
+      shard_index: int: The shard to run. None to run the merge step of a sharded task.
+      shard_count: int: The number of shards of the task. None if the task is not sharded.
+    """
+    usage = {'merge': True} if shard_count and shard_index is None else {}
+    pool.apply_async(PicklableCallback(),
+                     [(cls, '_RunDatedTask', date, task, shard_index, shard_count)],
+                     callback=lambda res: completed.put((date,) + tuple(res)),
+                     error_callback=lambda e: completed.put((date, e, task, usage)))
+
+  @classmethod
+  def _RunDatedTask(cls, date, task, shard_index=None, shard_count=None):
+    """Runs a single task for a date. See Runner._RunSingeTask()."""
+    PipelineConfig.Select(PipelineConfig.Instance().ForDate(date))
+    return cls._RunSingeTask(task, shard_index, shard_count)
+
+  @classmethod
+  def _GetTaskDisplayName(cls, task):
+    """Returns: string: The display name of the task with the date of the selected config."""
+    return cls._GetDatedTaskDisplayName(task, PipelineConfig.Instance().pipeline_date())
+
+  @classmethod
+  def _GetDatedTaskDisplayName(cls, task, date):
+    """Returns: string: The display name of the task for the date."""
+    return '%s [%s]' % (PipelineUtils.TaskDisplayName(task), date)
+
+  @classmethod
+  def _ReportBackfillProgress(cls, runs, running):
+    """Logs the progress of the backfill.
+
+    Args:
+      runs: OrderedDict {string, DateRun}: The date to its run, in order.
+      running: dict {(string, string), float}: The running (date, task) to their start times.
+    """
+    total = sum(len(x.graph.tasks()) for x in runs.values())
+    done = sum(len(x.graph.tasks()) - len(x.graph.GetPendingTasks()) for x in runs.values())
+    dates = sorted(set(date for (date, unused_task) in running))
+    TermColor.Info('Progress: %d/%d tasks done, %d running for %s.' % (
+        done - len(running), total, len(running), ', '.join(dates)))
+
+
+def main():
+  try:
+    Backfiller.Init(Flags.PARSER)
+    Flags.InitArgs()
+    return Backfiller.Run()
+  except KeyboardInterrupt as e:
+    TermColor.Warning('KeyboardInterrupt')
+    return 1
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,40 @@
+"""Tests for backfiller."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import argparse
+import unittest
+from collections import OrderedDict
+
+from pylib.zeus.backfiller import Backfiller
+from pylib.zeus.runner import Runner
+from pylib.zeus.task_graph import TaskGraph
+
+
+class BackfillerTest(unittest.TestCase):
+  """Tests for Backfiller."""
+
+  def test_dates(self):
+    self.assertEqual(Backfiller._GetDates('20131230', '20140102'),
+                     ['20131230', '20131231', '20140101', '20140102'])
+    self.assertEqual(Backfiller._GetDates('20140101', '20140101'), ['20140101'])
+
+  def test_ready_tasks(self):
+    # The tasks do not exist, so none of them declares dependencies.
+    runs = OrderedDict(
+        (x, argparse.Namespace(graph=TaskGraph(OrderedDict([('000', {'a', 'b'}), ('100', {'c'})]))))
+        for x in ['20140101', '20140102'])
+    durations = {'a': (1.0, 3), 'b': (2.0, 3)}
+    # A task waits for the previous date.
+    self.assertEqual(Backfiller._GetReadyTasks(runs, durations),
+                     [('20140101', 'b'), ('20140101', 'a')])
+
+    runs['20140101'].graph.Start('a')
+    runs['20140101'].graph.Finish('a', Runner.EXITCODE['FAILURE'])
+    self.assertEqual(Backfiller._GetReadyTasks(runs, durations),
+                     [('20140101', 'b'), ('20140102', 'a')])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+
+"""Benchmarks the scheduling overhead of zeus on a synthetic pipeline of no-op tasks.
+
+Runs 'zeus run', 'zeus continue' and 'zeus clean' on the pipeline and reports the time each spends
+in discovery, pool creation, env var preparation, mail and status writing, and the tasks per
+second. Everything runs in a temp dir and the mails go to a local sink. The results are written
+as json so that runs can be compared over time, e.g.
+  python -m pylib.zeus.benchmark.overhead_benchmark --dirs=50 --output=/tmp/zeus.json
+"""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import datetime
+import json
+import os
+import platform
+import shutil
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from pylib.base.flags import Flags
+from pylib.base.term_color import TermColor
+
+from pylib.zeus.benchmark.synthetic_pipeline import SyntheticPipeline
+
+
+class OverheadBenchmark(object):
+  """Class to benchmark the scheduling overhead of zeus.
+
+  Each command runs in its own process under PhaseTimers, as zeus parses its flags and sets up its
+  config once per process. Each run uses a new date, so the output dirs and the journal of a run
+  never overlap with the earlier ones. Only the task manifest is reused, as it would be by a daily
+  pipeline whose tree did not change. Before 'continue', the last records of the journal are
+  dropped, as if the run had been killed, so that their tasks are run again.
+  """
+
+  # The commands run on the pipeline, in order.
+  COMMANDS = ['run', 'continue', 'clean']
+
+  # The phases timed for each command. See PhaseTimers.
+  PHASES = ['discovery', 'pool', 'env_vars', 'mail', 'status', 'exec', 'task', 'workhorse']
+
+  # The date of the first run.
+  START_DATE = '20140101'
+
+  # The environment variable with the file PhaseTimers writes the results of a command to.
+  RESULTS_ENV = 'ZEUS_BENCHMARK_RESULTS'
+
+  @classmethod
+  def Run(cls, root, tasks, runs, pool_size, continue_ratio, task_mails):
+    """Runs the benchmark.
+
+    Args:
+      root: string: The root the synthetic pipeline was generated under.
+      tasks: int: The number of tasks of the pipeline.
+      runs: int: Number of times the commands are run.
+      pool_size: int: The pool size of the commands.
+      continue_ratio: float: The fraction of the tasks run again by 'continue'.
+      task_mails: bool: Send a mail for each task instead of only the final status mails.
+
+    Return:
+      dict: The results of the benchmark.
+    """
+    sink = MailSink()
+    results = []
+    try:
+      for i in range(runs):
+        date = (datetime.datetime.strptime(cls.START_DATE, '%Y%m%d') +
+                datetime.timedelta(days=i)).strftime('%Y%m%d')
+        result = {}
+        journal = None
+        for cmd in cls.COMMANDS:
+          dropped = 0
+          if cmd == 'continue': dropped = cls._DropJournalRecords(journal, continue_ratio)
+          mails = sink.messages()
+          result[cmd] = cls._RunCommand(root, cmd, date, pool_size, sink.port(), task_mails)
+          journal = result[cmd].pop('journal')
+          result[cmd]['mails'] = sink.messages() - mails
+          # 'clean' runs no task, so its rate is over all the tasks it cleans.
+          cls._AddRates(result[cmd], pool_size, result[cmd]['phases']['task']['calls'] or tasks)
+          if cmd == 'continue': result[cmd]['dropped'] = dropped
+          TermColor.Info('Run %d %s: %.2fs, %d tasks, %.0f tasks/s, %s' % (
+              i, cmd, result[cmd]['wall'], result[cmd]['tasks'], result[cmd]['tasks_per_sec'],
+              ' '.join(['%s=%.3fs' % (x, result[cmd]['phases'][x]['time']) for x in cls.PHASES])))
+        results += [result]
+    finally:
+      sink.Stop()
+
+    summary = {}
+    for cmd in cls.COMMANDS:
+      summary[cmd] = {x: cls._Summarize([y[cmd][x] for y in results])
+                      for x in ['wall', 'tasks_per_sec', 'overhead', 'overhead_per_task_ms',
+                                'worker_overhead']}
+      summary[cmd]['phases'] = {x: cls._Summarize([y[cmd]['phases'][x]['time'] for y in results])
+                                for x in cls.PHASES}
+
+    return {'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'commit': cls._GetCommit(),
+            'python': platform.python_version(),
+            'pool_size': pool_size,
+            'runs': results,
+            'summary': summary,
+            'mails': sink.messages()}
+
+  @classmethod
+  def _RunCommand(cls, root, cmd, date, pool_size, smtp_port, task_mails):
+    """Runs a zeus command on the pipeline.
+
+    Return:
+      dict: The results of the command. See PhaseTimers.
+    """
+    args = [sys.executable, '-m', 'pylib.zeus.benchmark.phase_timers', '--id=benchmark',
+            '--root=%s' % SyntheticPipeline.GetPipelineDir(root), '--out_dirs=out',
+            '--date=%s' % date, cmd, '--pool_size=%d' % pool_size]
+    if cmd != 'clean':
+      args += ['--smtp_host=localhost', '--smtp_port=%d' % smtp_port,
+               '--success_mail=benchmark@localhost', '--failure_mail=benchmark@localhost',
+               '--mail_domain=localhost']
+      if task_mails: args += ['--detailed_success_mail']
+
+    results_file = os.path.join(root, 'results.json')
+    log_file = os.path.join(root, 'zeus.log')
+    src_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__)))))
+    env = dict(os.environ)
+    env.update({'R77_SRC_ROOT': root, cls.RESULTS_ENV: results_file,
+                'PYTHONPATH': os.pathsep.join([src_dir] + [x for x in [env.get('PYTHONPATH')]
+                                                           if x])})
+    if os.path.exists(results_file): os.remove(results_file)
+    with open(log_file, 'w') as f:
+      subprocess.call(args, env=env, cwd=root, stdout=f, stderr=subprocess.STDOUT)
+    if not os.path.isfile(results_file):
+      with open(log_file) as f: log = f.read()
+      TermColor.Fatal('zeus %s failed:\n%s' % (cmd, log[-4096:]))
+    with open(results_file) as f: return json.load(f)
+
+  @classmethod
+  def _DropJournalRecords(cls, journal_file, ratio):
+    """Drops the last records of the journal, as if the run had been killed before their tasks
+    finished.
+
+    Args:
+      journal_file: string: The journal of the run.
+      ratio: float: The fraction of the records to drop.
+
+    Return:
+      int: The number of records dropped.
+    """
+    if not journal_file or not os.path.isfile(journal_file): return 0
+    with open(journal_file) as f: records = f.readlines()
+    keep = len(records) - int(len(records) * ratio)
+    with open(journal_file, 'w') as f: f.writelines(records[:keep])
+    return len(records) - keep
+
+  @classmethod
+  def _AddRates(cls, result, pool_size, tasks):
+    """Adds the rates and the overhead to the results of a command.
+
+    The overhead is the time of the command beyond running the tasks back to back on all the
+    slots of the pool. The worker overhead is the time the workers spend on the tasks besides
+    running them.
+
+    Args:
+      result: dict: The results of the command.
+      pool_size: int: The pool size of the command.
+      tasks: int: The number of tasks handled by the command.
+    """
+    phases = result['phases']
+    result['tasks'] = tasks
+    result['tasks_per_sec'] = tasks / result['wall'] if result['wall'] else 0
+    result['overhead'] = result['wall'] - phases['exec']['time'] / pool_size
+    result['overhead_per_task_ms'] = 1000 * result['overhead'] / tasks if tasks else 0
+    result['worker_overhead'] = phases['task']['time'] - phases['exec']['time']
+
+  @classmethod
+  def _Summarize(cls, values):
+    """Returns: dict: The min, median and mean of the values."""
+    values = sorted(values)
+    return {'min': values[0],
+            'median': values[len(values) // 2],
+            'mean': sum(values) / len(values)}
+
+  @classmethod
+  def _GetCommit(cls):
+    """Returns the commit of the zeus sources being benchmarked. None if unknown."""
+    try:
+      return subprocess.check_output(
+          ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+          stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+      return None
+
+
+class MailSink(socketserver.ThreadingTCPServer):
+  """Local SMTP server that accepts all mails and drops them. Only counts them.
+
+  Members:
+    _lock: Lock: Guards the counts.
+    _messages: int: The number of mails received.
+    _bytes: int: The size of the mails received.
+    _thread: Thread: The thread serving the connections.
+  """
+
+  # The max size of the mails advertised to the clients.
+  MAX_SIZE = 10 << 20
+
+  daemon_threads = True
+
+  def __init__(self):
+    socketserver.ThreadingTCPServer.__init__(self, ('localhost', 0), _MailSinkHandler)
+    self._lock = threading.Lock()
+    self._messages = 0
+    self._bytes = 0
+    self._thread = threading.Thread(target=self.serve_forever)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def port(self):
+    """Returns: int: The port the sink listens on."""
+    return self.server_address[1]
+
+  def messages(self):
+    """Returns: int: The number of mails received so far."""
+    with self._lock: return self._messages
+
+  def Received(self, size):
+    """Counts a mail of the given size."""
+    with self._lock:
+      self._messages += 1
+      self._bytes += size
+
+  def Stop(self):
+    """Stops the sink."""
+    self.shutdown()
+    self.server_close()
+    self._thread.join()
+
+
+class _MailSinkHandler(socketserver.StreamRequestHandler):
+  """Handler for an SMTP connection to the mail sink."""
+
+  def handle(self):
+    self._Reply('220 localhost zeus benchmark mail sink')
+    while True:
+      line = self.rfile.readline()
+      if not line: return
+      cmd = line.strip().split(b' ', 1)[0].upper()
+      if cmd == b'EHLO':
+        self._Reply('250-localhost\r\n250 SIZE %d' % MailSink.MAX_SIZE)
+      elif cmd == b'DATA':
+        self._Reply('354 End data with <CR><LF>.<CR><LF>')
+        size = 0
+        while True:
+          line = self.rfile.readline()
+          if not line: return
+          if line.rstrip(b'\r\n') == b'.': break
+          size += len(line)
+        self.server.Received(size)
+        self._Reply('250 OK')
+      elif cmd == b'QUIT':
+        self._Reply('221 Bye')
+        return
+      else:
+        self._Reply('250 OK')
+
+  def _Reply(self, reply):
+    """Sends the reply to the client."""
+    self.wfile.write(reply.encode('ascii') + b'\r\n')
+
+
+def main():
+  Flags.PARSER.add_argument('--runs', type=int, default=3,
+                            help='Number of times the commands are run.')
+  Flags.PARSER.add_argument('--pool_size', type=int, default=8,
+                            help='The pool size of the commands.')
+  Flags.PARSER.add_argument('--continue_ratio', type=float, default=0.1,
+                            help='Fraction of the tasks of each run that are run again by '
+                            '\'zeus continue\'.')
+  Flags.PARSER.add_argument('--task_mails', action='store_true', default=False,
+                            help='Send a mail for each task instead of only the final status '
+                            'mails.')
+  Flags.PARSER.add_argument('--output', type=str, default='',
+                            help='File to write the json results to. Printed if not specified.')
+  SyntheticPipeline.AddArguments(Flags.PARSER)
+  Flags.InitArgs()
+
+  root = tempfile.mkdtemp(prefix='zeus_benchmark_')
+  try:
+    config = SyntheticPipeline.GetConfig(Flags.ARGS)
+    start = time.time()
+    stats = SyntheticPipeline.Generate(root, config)
+    TermColor.Info('Generated %s in %.2fs' % (stats, time.time() - start))
+
+    results = OverheadBenchmark.Run(root, stats['tasks'], Flags.ARGS.runs, Flags.ARGS.pool_size,
+                                    Flags.ARGS.continue_ratio, Flags.ARGS.task_mails)
+    results['config'] = config
+    results['pipeline'] = stats
+  finally:
+    shutil.rmtree(root, ignore_errors=True)
+
+  data = json.dumps(results, indent=2, sort_keys=True)
+  if Flags.ARGS.output:
+    with open(Flags.ARGS.output, 'w') as f: f.write(data + '\n')
+    TermColor.Success('Results written to %s' % Flags.ARGS.output)
+  else:
+    print(data)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
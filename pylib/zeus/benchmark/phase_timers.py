@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+"""Runs a zeus command with timers around the phases of its scheduling.
+
+Takes the same arguments as zeus. The timings are written as json to the file in the
+ZEUS_BENCHMARK_RESULTS environment variable. Run by overhead_benchmark for each command.
+"""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import functools
+import json
+import multiprocessing
+import multiprocessing.context
+import multiprocessing.pool
+import os
+import sys
+import time
+
+from pylib.base.exec_utils import ExecUtils
+
+from pylib.zeus.benchmark.overhead_benchmark import OverheadBenchmark
+from pylib.zeus.cleaner import Cleaner
+from pylib.zeus.continuer import Continuer
+from pylib.zeus.dated_dir_index import DatedDirIndex
+from pylib.zeus.history import History
+from pylib.zeus.journal import Journal
+from pylib.zeus.mail_digest import MailDigest
+from pylib.zeus.pipeline_cmd_base import PipelineCmdBase
+from pylib.zeus.runner import Runner
+from pylib.zeus.zeus import Zeus
+
+
+class PhaseTimers(object):
+  """Class to time the phases of a zeus command.
+
+  The methods of each phase are replaced by wrappers that add their time and calls to counters in
+  shared memory. The counters are created before zeus forks its workers, so the time spent in the
+  workers is counted too. The times of a phase are summed over all the processes, so the phases of
+  the workers can add up to more than the time of the run. A call nested in another call of the
+  same phase in the same process is not counted again.
+
+  Members:
+    _methods: list((type, string, int)): The class, name and phase index of each timed method.
+    _times: RawArray: The total time of each phase.
+    _calls: RawArray: The number of calls of each phase.
+    _lock: Lock: Guards the counters.
+    _active: set((int, int)): The (pid, phase index) of the calls in progress.
+  """
+
+  # The methods timed for each phase, in order.
+  #   discovery: Finding the tasks, creating their dirs and their graph.
+  #   pool: Forking and joining the workers.
+  #   env_vars: Preparing the environment of each task. In the workers.
+  #   mail: Preparing and sending the mails, partly in the workers.
+  #   status: Writing the status of the out dirs, the journal and the history.
+  #   exec: Running the commands of the tasks. In the workers.
+  #   task: All the work for each task in the workers, including exec and env_vars.
+  #   workhorse: The whole command after discovery, including all the phases of the main process.
+  PHASES = [('discovery', [(PipelineCmdBase, '_GetTasks'), (Runner, '_CreateDirsForTasks'),
+                           (Runner, '_CreateTaskGraph'), (DatedDirIndex, 'Load')]),
+            ('pool', [(multiprocessing.context.BaseContext, 'Pool'),
+                      (multiprocessing.pool.Pool, 'join')]),
+            ('env_vars', [(Runner, '_GetEnvVarsForTask')]),
+            ('mail', [(Runner, '_GetMailForTask'), (Runner, '_SendMail'), (MailDigest, 'Flush')]),
+            ('status', [(Runner, '_UpdateOutDirStatus'), (Runner, '_WriteOutDirsStatus'),
+                        (Journal, 'Record'), (History, 'StartRun'), (History, 'RecordTask'),
+                        (History, 'FinishRun')]),
+            ('exec', [(ExecUtils, 'RunCmd')]),
+            ('task', [(Runner, '_RunSingeTask')]),
+            ('workhorse', [(Runner, 'WorkHorse'), (Continuer, 'WorkHorse'),
+                           (Cleaner, 'WorkHorse')])]
+
+  def __init__(self):
+    self._methods = [(owner, name, index)
+                     for (index, (unused_phase, methods)) in enumerate(self.PHASES)
+                     for (owner, name) in methods]
+    context = multiprocessing.get_context('fork')
+    self._times = context.RawArray('d', len(self.PHASES))
+    self._calls = context.RawArray('l', len(self.PHASES))
+    self._lock = context.Lock()
+    self._active = set()
+
+  def Install(self):
+    """Replaces the timed methods by their wrappers."""
+    for (owner, name, index) in self._methods:
+      method = owner.__dict__[name]
+      kind = type(method) if isinstance(method, (classmethod, staticmethod)) else None
+      timed = self._Wrap(method.__func__ if kind else method, index)
+      setattr(owner, name, kind(timed) if kind else timed)
+
+  def GetPhases(self):
+    """Returns: dict {string, dict}: The 'time' in seconds and the number of 'calls' of each
+    phase."""
+    with self._lock:
+      return {phase: {'time': self._times[i], 'calls': self._calls[i]}
+              for (i, (phase, unused_methods)) in enumerate(self.PHASES)}
+
+  def _Wrap(self, func, index):
+    """Returns the wrapper timing the function for the phase index."""
+    @functools.wraps(func)
+    def Timed(*args, **kwargs):
+      key = (os.getpid(), index)
+      if key in self._active: return func(*args, **kwargs)
+      self._active.add(key)
+      start = time.time()
+      try:
+        return func(*args, **kwargs)
+      finally:
+        duration = time.time() - start
+        self._active.discard(key)
+        with self._lock:
+          self._times[index] += duration
+          self._calls[index] += 1
+    return Timed
+
+
+def main():
+  timers = PhaseTimers()
+  timers.Install()
+  start = time.time()
+  status = Zeus().Run()
+  results = {'status': status, 'wall': time.time() - start, 'phases': timers.GetPhases(),
+             'journal': Journal.GetJournalFile()}
+  with open(os.environ[OverheadBenchmark.RESULTS_ENV], 'w') as f: json.dump(results, f)
+  return status
+
+
+if __name__ == '__main__':
+  sys.exit(main())
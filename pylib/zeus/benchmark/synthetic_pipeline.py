@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+"""Generates synthetic pipelines of no-op tasks to benchmark zeus."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+import random
+import stat
+import sys
+
+from pylib.base.flags import Flags
+from pylib.base.term_color import TermColor
+from pylib.file.file_utils import FileUtils
+
+
+class SyntheticPipeline(object):
+  """Class to generate a synthetic pipeline.
+
+  The pipeline is generated in the 'pipeline' dir under the root, which has a '.git' dir so that it
+  is picked up as the src root. The top level dirs are spread over a few priorities, so the dirs
+  at the same priority run side by side. Each dir has tasks at many priority levels, with several
+  tasks per level. The tasks do nothing, so running the pipeline only measures zeus itself. A
+  fraction of the tasks can fail, to also exercise the failure handling and mails.
+  """
+
+  # Default configuration. See AddArguments() for a description of each option.
+  DEFAULTS = {'dirs': 20,
+              'dir_levels': 4,
+              'levels': 20,
+              'tasks_per_level': 5,
+              'fail_ratio': 0.0,
+              'seed': 77}
+
+  # The no-op tasks.
+  SUCCESS_TASK = '#!/bin/bash\nexit 0\n'
+  FAILURE_TASK = '#!/bin/bash\nexit 1\n'
+
+  @classmethod
+  def AddArguments(cls, parser):
+    """Adds the options for the pipeline to the parser.
+
+    Args:
+      parser: ArgumentParser: The argument parser.
+    """
+    parser.add_argument('--dirs', type=int, default=cls.DEFAULTS['dirs'],
+                        help='Number of top level dirs of tasks.')
+    parser.add_argument('--dir_levels', type=int, default=cls.DEFAULTS['dir_levels'],
+                        help='Number of priorities the top level dirs are spread over.')
+    parser.add_argument('--levels', type=int, default=cls.DEFAULTS['levels'],
+                        help='Number of priority levels of the tasks in each dir.')
+    parser.add_argument('--tasks_per_level', type=int, default=cls.DEFAULTS['tasks_per_level'],
+                        help='Number of tasks at each priority level of each dir.')
+    parser.add_argument('--fail_ratio', type=float, default=cls.DEFAULTS['fail_ratio'],
+                        help='Fraction of the tasks that fail.')
+    parser.add_argument('--seed', type=int, default=cls.DEFAULTS['seed'],
+                        help='Seed for the random generator. The same seed and options always '
+                        'generate the same pipeline.')
+
+  @classmethod
+  def GetConfig(cls, args):
+    """Returns: dict: The pipeline configuration from the parsed arguments."""
+    return {k: getattr(args, k) for k in cls.DEFAULTS}
+
+  @classmethod
+  def GetPipelineDir(cls, root):
+    """Returns: string: The root dir of the pipeline generated under root."""
+    return os.path.join(root, 'pipeline')
+
+  @classmethod
+  def GetPriority(cls, index, count):
+    """Returns the priority for the index out of count levels. The priorities are spread evenly
+    over the 3 digits and never 0, which would merge the level into the priority of its parent."""
+    return '%03d' % ((index + 1) * (999 // max(count, 1)))
+
+  @classmethod
+  def Generate(cls, root, config=None):
+    """Generates the pipeline.
+
+    Args:
+      root: string: The root to generate the pipeline under. Created if it does not exist.
+      config: dict: The configuration of the pipeline. Missing values are taken from DEFAULTS.
+
+    Return:
+      dict: Stats about the generated pipeline.
+    """
+    conf = dict(cls.DEFAULTS)
+    conf.update(config or {})
+    if not 0 < conf['levels'] <= 999 or not 0 < conf['dir_levels'] <= 999:
+      raise ValueError('The number of levels must be between 1 and 999.')
+    rand = random.Random(conf['seed'])
+
+    FileUtils.MakeDirs(os.path.join(root, '.git'))
+    pipeline_dir = cls.GetPipelineDir(root)
+    stats = {'dirs': 0, 'tasks': 0, 'failing_tasks': 0, 'priorities': 0}
+    for d in range(conf['dirs']):
+      dirname = os.path.join(pipeline_dir, '%s_dir%d' % (
+          cls.GetPriority(d % conf['dir_levels'], conf['dir_levels']), d))
+      FileUtils.MakeDirs(dirname)
+      for level in range(conf['levels']):
+        priority = cls.GetPriority(level, conf['levels'])
+        for t in range(conf['tasks_per_level']):
+          fail = rand.random() < conf['fail_ratio']
+          filename = os.path.join(dirname, '%s_task%d' % (priority, t))
+          FileUtils.CreateFileWithData(filename, cls.FAILURE_TASK if fail else cls.SUCCESS_TASK)
+          os.chmod(filename, os.stat(filename).st_mode | stat.S_IXUSR | stat.S_IXGRP)
+          stats['tasks'] += 1
+          stats['failing_tasks'] += fail
+      stats['dirs'] += 1
+
+    stats['priorities'] = min(conf['dirs'], conf['dir_levels']) * conf['levels']
+    return stats
+
+
+def main():
+  Flags.PARSER.add_argument('root', type=str, help='The root dir for the pipeline.')
+  SyntheticPipeline.AddArguments(Flags.PARSER)
+  Flags.InitArgs()
+  stats = SyntheticPipeline.Generate(Flags.ARGS.root, SyntheticPipeline.GetConfig(Flags.ARGS))
+  TermColor.Success('Generated %s in %s' % (stats, SyntheticPipeline.GetPipelineDir(
+      Flags.ARGS.root)))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -5,27 +5,67 @@
 __author__ = 'pramodg@room77.com (Pramod Gupta)'
 __copyright__ = 'Copyright 2012 Room77, Inc.'
 
+import datetime
+import itertools
 import os
 import shutil
+import stat
 import sys
+import time
 
+from pylib.base.exec_utils import ExecUtils
 from pylib.base.flags import Flags
 from pylib.file.file_utils import FileUtils
 from pylib.base.term_color import TermColor
 
+from pylib.zeus.dated_dir_index import DatedDirIndex
 from pylib.zeus.pipeline_cmd_base import PipelineCmdBase
 from pylib.zeus.pipeline_config import PipelineConfig
 from pylib.zeus.pipeline_utils import PipelineUtils
+from pylib.zeus.task_cache import TaskCache
+from pylib.zeus.task_resources import TaskResources
 
 
 class Cleaner(PipelineCmdBase):
-  """Class to handle clean."""
+  """Class to handle clean.
+
+  By default the output dirs of the tasks for the date of the run are removed. With --keep_days or
+  --keep_runs, the dated output dirs of the tasks, or of the whole output tree with --all, are
+  removed once they expire instead. A dated dir is kept if it is one of the last --keep_runs dated
+  dirs in its parent, if it is dated within --keep_days of the date of the run, if it is the dir of
+  the date of the run or if the 'current' link in its parent points to it.
+
+  The expired dirs are first renamed out of the way, so that a run started meanwhile never takes
+  a partially removed dir for the previous date, and then removed in parallel.
+
+  With --keep_days or --keep_cache_days, the entries of the task cache that were not used within
+  that many days are removed as well. Their age is counted from now, not from the date of the run.
+  """
+
+  # The suffix of the expired dirs being removed.
+  TRASH_SUFFIX = '.deleting'
 
   @classmethod
   def Init(cls, parser):
     super(Cleaner, cls).Init(parser)
     parser.add_argument('--all', action='store_true', default=False,
                         help='Cleans all subdirs. Note this can be very dangerous!')
+    parser.add_argument('--keep_days', type=int, default=0,
+                        help='Remove the dated output dirs older than this many days before '
+                        '--date instead of the dirs for --date.')
+    parser.add_argument('--keep_runs', type=int, default=0,
+                        help='Remove the dated output dirs beyond the last this many in each dir '
+                        'instead of the dirs for --date.')
+    parser.add_argument('--keep_cache_days', type=int, default=0,
+                        help='Remove the entries of the task cache not used in this many days. '
+                        'Defaults to --keep_days.')
+    parser.add_argument('--task_cache_dir', type=str, default='',
+                        help='The dir of the task cache. Defaults to .cache in the pipeline output '
+                        'dir.')
+    parser.add_argument('--pool_size', type=int, default=0,
+                        help='The pool size for parallelization.')
+    parser.add_argument('--dry_run', action='store_true', default=False,
+                        help='Only list the expired dirs.')
 
   @classmethod
   def Run(cls):
@@ -37,6 +77,14 @@ class Cleaner(PipelineCmdBase):
     if not Flags.ARGS.all:
       return super(Cleaner, cls).Run()
 
+    if cls._HasRetention():
+      TermColor.Info('Cleaning expired dirs in the entire output tree: %s' %
+                     PipelineConfig.Instance().pipeline_output_dir())
+      failed = cls._CleanExpiredDirs(
+          cls._FindDatedDirParents(PipelineConfig.Instance().pipeline_output_dir()))
+      failed_cache = not cls._CleanTaskCache()
+      return 1 if failed or failed_cache else 0
+
     TermColor.Info('Cleaning entire output tree: %s' %
                     PipelineConfig.Instance().pipeline_output_dir())
     shutil.rmtree(PipelineConfig.Instance().pipeline_output_dir(), True)
@@ -58,13 +106,22 @@ class Cleaner(PipelineCmdBase):
     """
     success_tasks = []
     paths_to_clean = set()
+    # The dated dirs of the tasks are siblings of their dirs for the date of the run.
+    task_parents = {}
     for set_tasks in tasks.values():
       for task in set_tasks:
         paths = PipelineConfig.Instance().GetAllSubDirsForPath(
             PipelineUtils.GetTaskOutputRelativeDir(task))
         paths_to_clean |= set(paths.values())
+        task_parents[task] = set([os.path.dirname(x) for x in paths.values()])
         success_tasks += [task]
 
+    if cls._HasRetention():
+      failed_parents = cls._CleanExpiredDirs(set().union(*task_parents.values()))
+      cls._CleanTaskCache()
+      failed_tasks = [x for x in success_tasks if task_parents[x] & failed_parents]
+      return ([x for x in success_tasks if x not in failed_tasks], failed_tasks)
+
     TermColor.VInfo(1, 'Cleaning %d' % len(paths_to_clean))
     for i in paths_to_clean:
       TermColor.VInfo(3, 'Cleaning %s' % i)
@@ -72,6 +129,217 @@ class Cleaner(PipelineCmdBase):
 
     return (success_tasks, [])
 
+  @classmethod
+  def _HasRetention(cls):
+    """Returns: bool: True if the expired dated dirs are removed instead of those for the date."""
+    return bool(Flags.ARGS.keep_days or Flags.ARGS.keep_runs or Flags.ARGS.keep_cache_days)
+
+  @classmethod
+  def _FindDatedDirParents(cls, root):
+    """Finds the dirs containing dated dirs in the tree.
+
+    Args:
+      root: string: The root of the tree.
+
+    Return:
+      set(string): The dirs containing dated dirs. The dated dirs themselves are not searched.
+    """
+    parents = set()
+    for (dir, subdirs, unused_files) in os.walk(root):
+      dated = [x for x in subdirs if DatedDirIndex.DATE_RE.match(x) or
+               x.endswith(cls.TRASH_SUFFIX)]
+      if dated: parents.add(dir)
+      subdirs[:] = [x for x in subdirs if x not in dated]
+    return parents
+
+  @classmethod
+  def _GetExpiredDirs(cls, parent, date, keep_days, keep_runs):
+    """Returns the expired dated dirs in the parent.
+
+    Args:
+      parent: string: The dir containing the dated dirs.
+      date: string: The date of the run, e.g. 20140107.
+      keep_days: int: Keep the dirs dated within this many days before the date. 0 to not keep
+          dirs by date.
+      keep_runs: int: Keep the last this many dirs. 0 to not keep dirs by count.
+
+    Return:
+      list(string): The names of the expired dirs, oldest first, and of the expired dirs from an
+          earlier clean that were not completely removed.
+    """
+    try:
+      names = [x.name for x in os.scandir(parent) if x.is_dir(follow_symlinks=False)]
+    except OSError:
+      return []
+    dates = sorted([x for x in names if DatedDirIndex.DATE_RE.match(x)])
+
+    keep = set([date])
+    if keep_runs: keep |= set(dates[-keep_runs:])
+    if keep_days:
+      first_date = (datetime.datetime.strptime(date, '%Y%m%d') -
+                    datetime.timedelta(days=keep_days - 1)).strftime('%Y%m%d')
+      keep |= set([x for x in dates if x >= first_date])
+    current = os.path.join(parent, 'current')
+    if os.path.islink(current):
+      keep.add(os.path.basename(os.path.realpath(current)))
+
+    # Without any rule, nothing expires.
+    if not keep_days and not keep_runs: keep = set(dates)
+    return ([x for x in dates if x not in keep] +
+            sorted([x for x in names if x.endswith(cls.TRASH_SUFFIX)]))
+
+  @classmethod
+  def _CleanExpiredDirs(cls, parents):
+    """Removes the expired dated dirs in the parents.
+
+    Args:
+      parents: set(string): The dirs containing dated dirs.
+
+    Return:
+      set(string): The parents for which some dirs could not be removed.
+    """
+    trash_dirs = []; failed_parents = set()
+    for parent in sorted(parents):
+      for name in cls._GetExpiredDirs(parent, PipelineConfig.Instance().pipeline_date(),
+                                      Flags.ARGS.keep_days, Flags.ARGS.keep_runs):
+        path = os.path.join(parent, name)
+        if Flags.ARGS.dry_run:
+          TermColor.Info('Expired: %s' % path)
+          continue
+        if not name.endswith(cls.TRASH_SUFFIX):
+          # Move the dir out of the way first. Removing a large dir takes a while.
+          trash_dir = os.path.join(parent, '.%s%s' % (name, cls.TRASH_SUFFIX))
+          try:
+            os.rename(path, trash_dir)
+          except OSError as e:
+            TermColor.Error('Could not remove %s. Error: %s' % (path, e))
+            failed_parents.add(parent)
+            continue
+          path = trash_dir
+        trash_dirs += [path]
+
+    if Flags.ARGS.dry_run: return failed_parents
+    if not trash_dirs:
+      TermColor.Info('No expired dirs to clean.')
+      return failed_parents
+
+    start = time.time()
+    TermColor.Info('Cleaning %d expired dirs' % len(trash_dirs))
+    res = ExecUtils.ExecuteParallel(
+        list(zip(itertools.repeat(cls), itertools.repeat('_RunSingeTask'), trash_dirs)),
+        Flags.ARGS.pool_size)
+    if not res:
+      TermColor.Error('Could not clean the expired dirs.')
+      return failed_parents | set([os.path.dirname(x) for x in trash_dirs])
+
+    reclaimed = 0
+    for (size, errors, path) in res:
+      reclaimed += size
+      if errors: failed_parents.add(os.path.dirname(path))
+    TermColor.Info('Cleaned %d expired dirs. Reclaimed %s. Took %.2fs' % (
+        len(trash_dirs), TaskResources.FormatSize(reclaimed), time.time() - start))
+    return failed_parents
+
+  @classmethod
+  def _CleanTaskCache(cls):
+    """Removes the entries of the task cache that were not used within the retention.
+
+    Return:
+      bool: True if all the expired entries were removed.
+    """
+    keep_days = Flags.ARGS.keep_cache_days or Flags.ARGS.keep_days
+    cache_dir = (Flags.ARGS.task_cache_dir or
+                 os.path.join(PipelineConfig.Instance().pipeline_output_dir(), '.cache'))
+    if not keep_days or not os.path.isdir(cache_dir): return True
+
+    reclaimed = 0; errors = 0
+    entries = TaskCache.GetExpiredEntries(cache_dir, keep_days * 24 * 3600)
+    for path in entries:
+      if Flags.ARGS.dry_run:
+        TermColor.Info('Expired: %s' % path)
+        continue
+      name = os.path.basename(path)
+      if not name.endswith(cls.TRASH_SUFFIX):
+        # Move the entry out of the way first, so that it is never restored partially.
+        trash_dir = os.path.join(os.path.dirname(path), '.%s%s' % (name, cls.TRASH_SUFFIX))
+        try:
+          os.rename(path, trash_dir)
+        except OSError as e:
+          TermColor.Error('Could not remove %s. Error: %s' % (path, e))
+          errors += 1
+          continue
+        path = trash_dir
+      (size, entry_errors) = cls._RemoveTree(path)
+      reclaimed += size
+      errors += entry_errors
+
+    if entries and not Flags.ARGS.dry_run:
+      TermColor.Info('Cleaned %d expired task cache entries. Reclaimed %s' % (
+          len(entries), TaskResources.FormatSize(reclaimed)))
+    return not errors
+
+  @classmethod
+  def _RunSingeTask(cls, path):
+    """Removes a single expired dir.
+
+    Args:
+      path: string: The dir.
+
+    Return:
+      (int, int, string): The bytes reclaimed, the number of entries that could not be removed and
+          the dir.
+    """
+    TermColor.VInfo(3, 'Cleaning %s' % path)
+    (size, errors) = cls._RemoveTree(path)
+    TermColor.VInfo(2, 'Cleaned %s. Reclaimed %s' % (path, TaskResources.FormatSize(size)))
+    return (size, errors, path)
+
+  @classmethod
+  def _RemoveTree(cls, root):
+    """Removes the tree bottom up. Each dir is listed once and the sizes come from the listing,
+    so no entry is stat'ed twice. Links are removed, never followed.
+
+    Args:
+      root: string: The root of the tree.
+
+    Return:
+      (int, int): The bytes reclaimed and the number of entries that could not be removed.
+    """
+    size = 0; errors = 0
+    # The dirs to list and, once listed, to remove after all their entries.
+    stack = [(root, False)]
+    while stack:
+      (dir, listed) = stack.pop()
+      if listed:
+        try:
+          os.rmdir(dir)
+        except OSError as e:
+          errors += 1
+          TermColor.Error('Could not remove %s. Error: %s' % (dir, e))
+        continue
+
+      stack += [(dir, True)]
+      try:
+        entries = list(os.scandir(dir))
+      except OSError as e:
+        errors += 1
+        TermColor.Error('Could not list %s. Error: %s' % (dir, e))
+        continue
+      for entry in entries:
+        try:
+          if entry.is_dir(follow_symlinks=False):
+            stack += [(entry.path, False)]
+            continue
+          entry_stat = entry.stat(follow_symlinks=False)
+          os.unlink(entry.path)
+          # Hardlinked files only free their blocks with the last link.
+          if stat.S_ISREG(entry_stat.st_mode) and entry_stat.st_nlink == 1:
+            size += entry_stat.st_size
+        except OSError as e:
+          errors += 1
+          TermColor.Error('Could not remove %s. Error: %s' % (entry.path, e))
+    return (size, errors)
+
 
 def main():
   try:
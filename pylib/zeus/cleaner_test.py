@@ -0,0 +1,80 @@
+"""Tests for cleaner."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pylib.base.flags import Flags
+from pylib.file.file_utils import FileUtils
+from pylib.zeus.cleaner import Cleaner
+from pylib.zeus.task_cache import TaskCache
+
+
+class CleanerTest(unittest.TestCase):
+  """Tests for Cleaner."""
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.parent = os.path.join(self.dir, 'out', 'hotels')
+    for date in ['20140101', '20140103', '20140105', '20140106', '20140107']:
+      FileUtils.MakeDirs(os.path.join(self.parent, date))
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_expired_dirs(self):
+    self.assertEqual(Cleaner._GetExpiredDirs(self.parent, '20140107', 0, 2),
+                     ['20140101', '20140103', '20140105'])
+    self.assertEqual(Cleaner._GetExpiredDirs(self.parent, '20140107', 3, 0),
+                     ['20140101', '20140103'])
+    # The dir of the date of the run and the current dir are always kept.
+    with FileUtils.PushDir(self.parent): FileUtils.CreateLink('current', '20140101')
+    self.assertEqual(Cleaner._GetExpiredDirs(self.parent, '20140105', 0, 1),
+                     ['20140103', '20140106'])
+    self.assertEqual(Cleaner._GetExpiredDirs(self.parent, '20140107', 0, 0), [])
+
+  def test_find_parents(self):
+    FileUtils.MakeDirs(os.path.join(self.parent, '20140101', 'sub', '20140101'))
+    FileUtils.MakeDirs(os.path.join(self.dir, 'log', '.20131231' + Cleaner.TRASH_SUFFIX))
+    self.assertEqual(Cleaner._FindDatedDirParents(self.dir),
+                     set([self.parent, os.path.join(self.dir, 'log')]))
+
+  def test_remove_tree(self):
+    root = os.path.join(self.parent, '20140101')
+    FileUtils.MakeDirs(os.path.join(root, 'a', 'b'))
+    FileUtils.CreateFileWithData(os.path.join(root, 'a', 'b', 'data'), 'x' * 100)
+    FileUtils.CreateFileWithData(os.path.join(root, 'data'), 'x' * 10)
+    # Links are removed, not followed.
+    os.symlink(os.path.join(self.parent, '20140103'), os.path.join(root, 'link'))
+    self.assertEqual(Cleaner._RemoveTree(root), (110, 0))
+    self.assertFalse(os.path.exists(root))
+    self.assertTrue(os.path.isdir(os.path.join(self.parent, '20140103')))
+
+  def test_clean_task_cache(self):
+    cache_dir = os.path.join(self.dir, '.cache')
+    entries = [os.path.join(cache_dir, 'ab', x) for x in ['ab01', 'ab02']]
+    for entry in entries:
+      FileUtils.MakeDirs(entry)
+      FileUtils.CreateFileWithData(os.path.join(entry, TaskCache.MANIFEST), '{}')
+    old = time.time() - 3 * 24 * 3600
+    os.utime(os.path.join(entries[0], TaskCache.MANIFEST), (old, old))
+
+    args = Flags.ARGS
+    try:
+      Flags.ARGS = argparse.Namespace(keep_days=5, keep_cache_days=2, task_cache_dir=cache_dir,
+                                      dry_run=False)
+      self.assertTrue(Cleaner._CleanTaskCache())
+    finally:
+      Flags.ARGS = args
+    # Only the entry not used within --keep_cache_days is removed.
+    self.assertEqual(os.listdir(os.path.join(cache_dir, 'ab')), ['ab02'])
+
+
+if __name__ == '__main__':
+  unittest.main()
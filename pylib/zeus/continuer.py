@@ -14,6 +14,7 @@ from pylib.base.flags import Flags
 from pylib.base.term_color import TermColor
 from pylib.file.file_utils import FileUtils
 
+from pylib.zeus.journal import Journal
 from pylib.zeus.runner import Runner
 from pylib.zeus.pipeline_config import PipelineConfig
 from pylib.zeus.pipeline_utils import PipelineUtils
@@ -37,11 +38,23 @@ class Continuer(Runner):
     """
     already_successful = []
     tasks_to_run = OrderedDict()
+    # Replay the journal of the run. Only the tasks that failed are run again. Without a
+    # journal, all the tasks of out dirs that are not marked as successful are run again.
+    journal_file = Journal.GetJournalFile()
+    records = Journal.Replay(journal_file)
+    if records is not None:
+      TermColor.Info('Continuing from journal: %s' % journal_file)
     for priority, set_tasks in list(tasks.items()):
       new_task_set = set()
       for task in set_tasks:
-        out_dir = PipelineUtils.GetOutDirForTask(task)
-        if out_dir and os.path.exists(os.path.join(out_dir, 'SUCCESS')):
+        if records is not None:
+          # As with the status files of the out dirs, the tasks allowed to fail are not run again.
+          exit_code = records.get(task, {}).get('exit_code')
+          success = Runner.EXITCODE_FILE.get(exit_code) == 'SUCCESS'
+        else:
+          out_dir = PipelineUtils.GetOutDirForTask(task)
+          success = out_dir and os.path.exists(os.path.join(out_dir, 'SUCCESS'))
+        if success:
           already_successful += [task]
           continue
         new_task_set |= set([task])
@@ -56,6 +69,16 @@ class Continuer(Runner):
     (successful_run, failed_run) = super(Continuer, cls).WorkHorse(tasks_to_run)
     return (successful_run + already_successful, failed_run)
 
+  @classmethod
+  def _OpenJournal(cls):
+    """Opens the journal for the run. The records of the run being continued are kept.
+
+    Return:
+      Journal: The journal. None if the pipeline has no journal.
+    """
+    journal_file = Journal.GetJournalFile()
+    return Journal(journal_file) if journal_file else None
+
 
 def main():
   try:
@@ -0,0 +1,111 @@
+"""Index of the dated output dirs of a pipeline."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import bisect
+import glob
+import os
+import re
+
+import pylib.util.singleton as singleton
+
+
+class DatedDirIndex(singleton.Singleton):
+  """Class to look up dated sibling dirs, e.g. the dir for the previous date of an output dir.
+  This is a singleton class. Make sure to always access it through DatedDirIndex.Instance().
+
+  Each parent dir is listed once and the names of its dated subdirs (8 digits, e.g. 20140107)
+  are kept sorted. Lookups are binary searches on the sorted names, which sort in date order.
+  The runner builds the index for all the output dirs of the run before forking the workers so
+  that they all share it.
+
+  Members:
+    _dates: dict {string, list(string)}: The parent dir to the sorted names of its dated subdirs.
+  """
+
+  # Pattern for names containing only 8 digits, e.g. 20140107
+  DATE_RE = re.compile(r'^\d{8}$')
+
+  def __init__(self):
+    """Initialize the singleton instance."""
+    self._dates = {}
+
+  def Load(self, parents):
+    """Adds the parent dirs to the index.
+
+    Args:
+      parents: list: The dirs containing dated subdirs. Dirs already in the index are not listed
+          again.
+    """
+    for parent in parents:
+      self.GetDates(parent)
+
+  def Reset(self):
+    """Clears the index. Dated dirs created since it was built are only seen after a reset."""
+    self._dates = {}
+
+  def GetDates(self, parent):
+    """Returns the sorted names of the dated subdirs of the parent.
+
+    Args:
+      parent: string: The parent dir.
+
+    Return:
+      list: The sorted names of the dated subdirs. Empty if the parent does not exist.
+    """
+    parent = os.path.normpath(parent)
+    if parent not in self._dates:
+      dates = []
+      try:
+        for entry in os.scandir(parent):
+          if self.DATE_RE.match(entry.name) and entry.is_dir(): dates += [entry.name]
+      except OSError:
+        pass
+      self._dates[parent] = sorted(dates)
+    return self._dates[parent]
+
+  def GetPreviousDatedDir(self, path):
+    """Returns the sibling dir with the latest date before the date of the path.
+
+    Args:
+      path: string: The dated path, e.g. /pipeline/out/hotel/20140107.
+
+    Return:
+      string: The previous dated dir. None if there is none.
+    """
+    (parent, name) = os.path.split(os.path.normpath(path))
+    dates = self.GetDates(parent)
+    i = bisect.bisect_left(dates, name)
+    return os.path.join(parent, dates[i - 1]) if i else None
+
+  def GetNextDatedDir(self, path):
+    """Returns the sibling dir with the earliest date after the date of the path.
+
+    Args:
+      path: string: The dated path, e.g. /pipeline/out/hotel/20140107.
+
+    Return:
+      string: The next dated dir. None if there is none.
+    """
+    (parent, name) = os.path.split(os.path.normpath(path))
+    dates = self.GetDates(parent)
+    i = bisect.bisect_right(dates, name)
+    return os.path.join(parent, dates[i]) if i < len(dates) else None
+
+  def GetPreviousDatedDirContaining(self, path, pattern):
+    """Returns the latest sibling dir before the date of the path containing the pattern.
+
+    Args:
+      path: string: The dated path, e.g. /pipeline/out/hotel/20140107.
+      pattern: string: The pattern (glob.glob) that is expected to be present in the sibling dir.
+
+    Return:
+      string: The previous dated dir containing the pattern. None if there is none.
+    """
+    (parent, name) = os.path.split(os.path.normpath(path))
+    dates = self.GetDates(parent)
+    for date in reversed(dates[:bisect.bisect_left(dates, name)]):
+      prev_dir = os.path.join(parent, date)
+      if glob.glob(os.path.join(prev_dir, pattern)): return prev_dir
+    return None
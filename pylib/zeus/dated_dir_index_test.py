@@ -0,0 +1,55 @@
+"""Tests for dated_dir_index."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pylib.file.file_utils import FileUtils
+from pylib.zeus.dated_dir_index import DatedDirIndex
+
+
+class DatedDirIndexTest(unittest.TestCase):
+  """Tests for DatedDirIndex."""
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    # Created out of date order as a backfill would.
+    for name in ['20160103', '20160101', '20160105', 'current', '2016010']:
+      FileUtils.MakeDirs(os.path.join(self.dir, name))
+    FileUtils.CreateFileWithData(os.path.join(self.dir, '20160101', 'SUCCESS'))
+    FileUtils.CreateFileWithData(os.path.join(self.dir, '20160104'))
+    self.index = DatedDirIndex.Instance()
+    self.index.Reset()
+
+  def tearDown(self):
+    self.index.Reset()
+    shutil.rmtree(self.dir)
+
+  def _Path(self, name):
+    return os.path.join(self.dir, name) if name else None
+
+  def test_dates(self):
+    self.assertEqual(self.index.GetDates(self.dir), ['20160101', '20160103', '20160105'])
+    self.assertEqual(self.index.GetDates(os.path.join(self.dir, 'missing')), [])
+
+  def test_previous_and_next(self):
+    for (name, prev, next) in [('20160105', '20160103', None),
+                               ('20160104', '20160103', '20160105'),
+                               ('20160101', None, '20160103'),
+                               ('20170101', '20160105', None)]:
+      self.assertEqual(self.index.GetPreviousDatedDir(self._Path(name)), self._Path(prev))
+      self.assertEqual(self.index.GetNextDatedDir(self._Path(name)), self._Path(next))
+
+  def test_previous_containing(self):
+    self.assertEqual(self.index.GetPreviousDatedDirContaining(self._Path('20160105'), 'SUCCESS'),
+                     self._Path('20160101'))
+    self.assertIsNone(self.index.GetPreviousDatedDirContaining(self._Path('20160101'),
+                                                               'SUCCESS'))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -8,19 +8,27 @@ __copyright__ = 'Copyright 2012 Room77, Inc.'
 import itertools
 import os
 import sys
+import tarfile
 import time
 
 from pylib.base.flags import Flags
 from pylib.base.exec_utils import ExecUtils
 from pylib.base.term_color import TermColor
+from pylib.file.copy_engine import CopyEngine
 from pylib.file.file_utils import FileUtils
+from pylib.file.tree_archive import TreeArchive
 
 from pylib.zeus.pipeline_cmd_base import PipelineCmdBase
 from pylib.zeus.pipeline_config import PipelineConfig
 from pylib.zeus.pipeline_utils import PipelineUtils
 
 class Exporter(PipelineCmdBase):
-  """Class to handle export of the output directory to a public location."""
+  """Class to handle export of the output directory to a public location.
+
+  With --archive, each out dir is exported as an archive of a few large parts instead of a copy of
+  its tree (see TreeArchive). The parts of all the dirs are written in parallel. Import extracts
+  such archives.
+  """
 
   # The different exit codes that can be returned after running a task.
   EXITCODE = {
@@ -33,6 +41,11 @@ class Exporter(PipelineCmdBase):
     super(Exporter, cls).Init(parser)
     parser.add_argument('--pool_size', type=int, default=0,
                         help='The pool size for parallelization.')
+    parser.add_argument('--archive', action='store_true', default=False,
+                        help='Export each out dir as an archive instead of copying its tree. '
+                        'Faster for trees with many small files.')
+    CopyEngine.AddArguments(parser)
+    TreeArchive.AddArguments(parser)
 
   @classmethod
   def WorkHorse(cls, tasks):
@@ -83,22 +96,39 @@ class Exporter(PipelineCmdBase):
     for dir in target_dirs:
       FileUtils.MakeDirs(dir)
 
-    # Run all the copy tasks.
+    # Run all the copy tasks. Archives are written as one task per part.
     successful_dirs = []; failed_dirs = []
-    args = zip(itertools.repeat(cls), itertools.repeat('_RunSingeTask'),
-                          src_dirs, target_dirs)
-    dir_res = ExecUtils.ExecuteParallel(args, Flags.ARGS.pool_size)
-    if not dir_res:
+    if Flags.ARGS.archive:
+      indexes = {}
+      args = []
+      for (src_dir, target_dir) in zip(src_dirs, target_dirs):
+        TreeArchive.Clean(target_dir)
+        indexes[src_dir] = TreeArchive.FromArgs(Flags.ARGS).Plan(src_dir)
+        args += [(cls, '_ArchivePart', src_dir, target_dir, indexes[src_dir]['compression'], x, y)
+                 for (x, y) in zip(indexes[src_dir]['parts'], indexes[src_dir]['members'])]
+    else:
+      args = list(zip(itertools.repeat(cls), itertools.repeat('_RunSingeTask'),
+                      src_dirs, target_dirs))
+    dir_res = ExecUtils.ExecuteParallel(args, Flags.ARGS.pool_size) if args else []
+    if args and not dir_res:
       TermColor.Error('Could not process: %s' % all_tasks)
       return ([], all_tasks)
 
     for (res, dir) in dir_res:
-      if res == Exporter.EXITCODE['SUCCESS']:
-        successful_dirs += [dir]
-      elif res == Exporter.EXITCODE['FAILURE']:
+      if res == Exporter.EXITCODE['FAILURE']:
         failed_dirs += [dir]
-      else:
+      elif res != Exporter.EXITCODE['SUCCESS']:
         TermColor.Fatal('Invalid return %d code for %s' % (res, dir))
+    failed_dirs = sorted(set(failed_dirs))
+    successful_dirs = [x for x in src_dirs if x not in failed_dirs]
+
+    # The index completes the archive, so it is only written once all its parts are.
+    if Flags.ARGS.archive:
+      for (src_dir, target_dir) in zip(src_dirs, target_dirs):
+        if src_dir in failed_dirs: continue
+        TreeArchive.WriteIndex(target_dir, indexes[src_dir])
+        TermColor.Info('Archived %s to %s in %d parts' % (src_dir, target_dir,
+                                                         len(indexes[src_dir]['parts'])))
 
     # Get the reverse mapping from dirs to tasks.
     successful_tasks = []; failed_tasks = []
@@ -123,14 +153,43 @@ class Exporter(PipelineCmdBase):
     """
     TermColor.Info('Copying %s to %s' % (src_dir, target_dir))
     start = time.time()
-    res = FileUtils.CopyDirTree(src_dir, target_dir)
+    stats = CopyEngine.FromArgs(Flags.ARGS).CopyTree(src_dir, target_dir)
     time_taken = time.time() - start
-    status_code = Exporter.EXITCODE['FAILURE'] if not res else Exporter.EXITCODE['SUCCESS']
-    TermColor.Info('Finished copying %s to %s : Took %.2fs' % (src_dir, target_dir, time_taken))
+    status_code = Exporter.EXITCODE['FAILURE'] if stats['failed'] else Exporter.EXITCODE['SUCCESS']
+    TermColor.Info('Finished copying %s to %s : Took %.2fs. Copied: %d (%.1f MB), linked: %d, '
+                   'unchanged: %d, failed: %d' % (
+                       src_dir, target_dir, time_taken, stats['copied'], stats['bytes'] / 1e6,
+                       stats['linked'], stats['skipped'], stats['failed']))
 
     # Everything done. Mark the task as successful.
     return (status_code, src_dir)
 
+  @classmethod
+  def _ArchivePart(cls, src_dir, target_dir, compression, part, members):
+    """Writes a single part of the archive of a dir.
+
+    Args:
+      src dir: string: The src directory.
+      target dir: string: The directory of the archive.
+      compression: string: The compression of the archive.
+      part: string: The file name of the part.
+      members: list: The members of the part.
+
+    Return:
+      (EXITCODE, string): Returns a tuple of the result status and the src_dir.
+    """
+    TermColor.VInfo(1, 'Archiving %s to %s' % (src_dir, os.path.join(target_dir, part)))
+    start = time.time()
+    try:
+      (count, size) = TreeArchive.WritePart(src_dir, target_dir, compression, part, members)
+    except (OSError, IOError, tarfile.TarError) as e:
+      TermColor.Error('Cannot archive %s to %s. %s: %s' % (
+          src_dir, os.path.join(target_dir, part), type(e), e))
+      return (Exporter.EXITCODE['FAILURE'], src_dir)
+    TermColor.Info('Finished archiving %s to %s: Took %.2fs. Files: %d (%.1f MB)' % (
+        src_dir, part, time.time() - start, count, size / 1e6))
+    return (Exporter.EXITCODE['SUCCESS'], src_dir)
+
 
 def main():
   try:
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""Handles history."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+import statistics
+import sys
+import time
+
+from pylib.base.flags import Flags
+from pylib.base.term_color import TermColor
+
+from pylib.zeus.history import History
+from pylib.zeus.pipeline_cmd_base import PipelineCmdBase
+from pylib.zeus.pipeline_utils import PipelineUtils
+
+
+class Historian(PipelineCmdBase):
+  """Class to show the history of the runs of the pipeline and of its tasks."""
+
+  @classmethod
+  def Init(cls, parser):
+    super(Historian, cls).Init(parser)
+    parser.add_argument('--history_runs', type=int, default=10,
+                        help='The number of recent runs to show and to compute the trends from.')
+    History.AddArguments(parser)
+
+  @classmethod
+  def WorkHorse(cls, tasks):
+    """Runs the workhorse for the command.
+
+    Args:
+      tasks: OrderedDict {int, set(string)}: Dict from priority to set of tasks to execute at the
+          priority. Note: the dict is ordered by priority.
+
+    Return:
+      (list, list): Returns a tuple of list in the form
+          (successful_tasks, failed_tasks) specifying tasks that succeeded and
+          ones that failed.
+    """
+    filename = History.GetHistoryFile()
+    if not filename or not os.path.isfile(filename):
+      TermColor.Warning('No history for the pipeline.')
+      return ([], [])
+
+    history = History(filename)
+    try:
+      TermColor.Info('Recent runs:')
+      TermColor.Info('%-10s %-20s %10s %8s %8s' %
+                     ('Date', 'Start', 'Duration', 'Success', 'Failed'))
+      for run in history.GetRuns(Flags.ARGS.history_runs):
+        TermColor.Info('%-10s %-20s %10s %8s %8s' % (
+            run['pipeline_date'], time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run['start'])),
+            cls._FormatDuration(run['end'] - run['start']) if run['end'] else 'unfinished',
+            cls._FormatValue(run['successful']), cls._FormatValue(run['failed'])))
+
+      TermColor.Info('')
+      TermColor.Info('Tasks over the last %d runs:' % Flags.ARGS.history_runs)
+      TermColor.Info('%-50s %5s %10s %10s %7s %10s %10s' % (
+          'Task', 'Runs', 'Last', 'Median', 'Trend', 'Peak RSS', 'Log'))
+      shown = []
+      for set_tasks in tasks.values():
+        for task in sorted(set_tasks):
+          runs = history.GetTaskRuns(PipelineUtils.TaskRelativeName(task),
+                                     Flags.ARGS.history_runs)
+          if not runs: continue
+          cls._PrintTask(task, runs)
+          shown += [task]
+    finally:
+      history.Close()
+    return (shown, [])
+
+  @classmethod
+  def _PrintTask(cls, task, runs):
+    """Prints the trend of a task.
+
+    Args:
+      task: string: The task.
+      runs: list(dict): The recent executions of the task, latest first.
+    """
+    last = runs[0]
+    # Executions restored from the cache or that failed do not say much about the duration.
+    durations = [x['duration'] for x in runs if not x['exit_code'] and not x['cached']]
+    median = statistics.median(durations) if durations else None
+    trend = ''
+    if median and not last['exit_code'] and not last['cached']:
+      trend = '%+.0f%%' % (100 * (last['duration'] - median) / median)
+    status = 'cached' if last['cached'] else last['exit_code']
+    line = '%-50s %5d %10s %10s %7s %10s %10s' % (
+        PipelineUtils.TaskDisplayName(task), len(runs), cls._FormatDuration(last['duration']),
+        cls._FormatDuration(median), trend, cls._FormatSize(last['peak_rss_kb'], 1024),
+        cls._FormatSize(last['log_size']))
+    if last['cached']: TermColor.Info(line + ' (cached)')
+    elif last['exit_code']: TermColor.Failure(line + ' (exit code %d)' % last['exit_code'])
+    else: TermColor.Info(line)
+
+  @classmethod
+  def _FormatDuration(cls, duration):
+    """Returns: string: The duration in a readable form."""
+    if duration is None: return '-'
+    if duration < 60: return '%.2fs' % duration
+    if duration < 3600: return '%dm%02ds' % (duration // 60, duration % 60)
+    return '%dh%02dm' % (duration // 3600, duration % 3600 // 60)
+
+  @classmethod
+  def _FormatSize(cls, size, unit=1):
+    """Returns: string: The size in a readable form. The size is in multiples of the unit."""
+    if size is None: return '-'
+    size *= unit
+    for suffix in ['B', 'KB', 'MB', 'GB']:
+      if size < 1024: return '%.0f%s' % (size, suffix)
+      size /= 1024.0
+    return '%.1fTB' % size
+
+  @classmethod
+  def _FormatValue(cls, value):
+    """Returns: string: The value or '-' if it is not set."""
+    return '-' if value is None else str(value)
+
+
+def main():
+  try:
+    Historian.Init(Flags.PARSER)
+    Flags.InitArgs()
+    return Historian.Run()
+  except KeyboardInterrupt as e:
+    TermColor.Warning('KeyboardInterrupt')
+    return 1
+
+
+if __name__ == '__main__':
+  sys.exit(main())
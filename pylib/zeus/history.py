@@ -0,0 +1,199 @@
+"""History of the runs of a pipeline."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+import sqlite3
+import statistics
+
+from pylib.base.flags import Flags
+from pylib.base.term_color import TermColor
+from pylib.file.file_utils import FileUtils
+
+from pylib.zeus.pipeline_config import PipelineConfig
+
+
+class History(object):
+  """Class to record the runs of a pipeline and the tasks executed by each run in a sqlite db.
+
+  The db keeps one row per run and one row per executed task with its start, duration, exit code,
+  peak RSS and log size. The runner uses the trailing median duration of each task to order the
+  ready tasks longest first, to estimate the time left and to warn about slow tasks. 'zeus history'
+  shows the trends.
+
+  Members:
+    _filename: string: The db file.
+    _conn: Connection: The connection to the db.
+    _run_id: int: The id of the current run. None if no run was started.
+  """
+
+  SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY AUTOINCREMENT, '
+    'pipeline_id TEXT, pipeline_date TEXT, start REAL, end REAL, successful INTEGER, '
+    'failed INTEGER)',
+    'CREATE TABLE IF NOT EXISTS tasks (run_id INTEGER, task TEXT, start REAL, duration REAL, '
+    'exit_code INTEGER, peak_rss_kb INTEGER, log_size INTEGER, cached INTEGER)',
+    'CREATE INDEX IF NOT EXISTS tasks_task_start ON tasks (task, start)',
+  ]
+
+  def __init__(self, filename):
+    self._filename = filename
+    self._run_id = None
+    FileUtils.MakeDirs(os.path.dirname(filename))
+    self._conn = sqlite3.connect(filename, timeout=30)
+    self._conn.row_factory = sqlite3.Row
+    # Allow 'zeus history' to read the db while a run is writing to it.
+    self._conn.execute('PRAGMA journal_mode=WAL')
+    with self._conn:
+      for statement in self.SCHEMA: self._conn.execute(statement)
+
+  @classmethod
+  def AddArguments(cls, parser):
+    """Adds the options for the history to the parser.
+
+    Args:
+      parser: ArgumentParser: The argument parser.
+    """
+    parser.add_argument('--history_db', type=str, default='',
+                        help='The sqlite db with the history of the pipeline runs. Defaults to '
+                        'history.db in the pipeline output dir.')
+    parser.add_argument('--nohistory', action='store_true', default=False,
+                        help='Do not record the run in the history db.')
+
+  @classmethod
+  def GetHistoryFile(cls):
+    """Returns: string: The history db of the pipeline. None if there is none."""
+    if Flags.ARGS.nohistory: return None
+    if Flags.ARGS.history_db: return Flags.ARGS.history_db
+    if PipelineConfig.Instance().pipeline_output_dir():
+      return os.path.join(PipelineConfig.Instance().pipeline_output_dir(), 'history.db')
+    return None
+
+  @classmethod
+  def Open(cls):
+    """Returns: History: The history of the pipeline. None if there is none or it cannot be
+    opened."""
+    filename = cls.GetHistoryFile()
+    if not filename: return None
+    try:
+      return History(filename)
+    except sqlite3.Error as e:
+      TermColor.Warning('Could not open history db %s. Error: %s' % (filename, e))
+      return None
+
+  def filename(self):
+    """Returns: string: The db file."""
+    return self._filename
+
+  def StartRun(self, pipeline_id, pipeline_date, start):
+    """Records the start of a run. The tasks recorded afterwards belong to the run.
+
+    Args:
+      pipeline_id: string: The id of the pipeline.
+      pipeline_date: string: The date the pipeline is run for.
+      start: float: The time the run started at.
+    """
+    cursor = self.__Execute(
+        'INSERT INTO runs (pipeline_id, pipeline_date, start) VALUES (?, ?, ?)',
+        (pipeline_id, pipeline_date, start))
+    if cursor: self._run_id = cursor.lastrowid
+
+  def FinishRun(self, end, successful, failed):
+    """Records the end of the current run.
+
+    Args:
+      end: float: The time the run ended at.
+      successful: int: The number of successful tasks.
+      failed: int: The number of failed tasks.
+    """
+    self.__Execute('UPDATE runs SET end = ?, successful = ?, failed = ? WHERE run_id = ?',
+                   (end, successful, failed, self._run_id))
+
+  def RecordTask(self, task, start, duration, exit_code, peak_rss_kb=None, log_size=None,
+                 cached=False):
+    """Records a task executed by the current run.
+
+    Args:
+      task: string: The task.
+      start: float: The time the task started at.
+      duration: float: The duration of the task in seconds.
+      exit_code: int: The exit code of the task.
+      peak_rss_kb: int: The peak RSS of the process tree of the task in KB, if it was sampled.
+      log_size: int: The size of the log of the task in bytes, if any.
+      cached: bool: True if the outputs of the task were restored from the cache.
+    """
+    self.__Execute('INSERT INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                   (self._run_id, task, start, duration, exit_code, peak_rss_kb, log_size,
+                    int(cached)))
+
+  def GetMedianDurations(self, tasks, window=10):
+    """Returns the median duration of the tasks over their last successful runs. Runs restored
+    from the cache are not counted.
+
+    Args:
+      tasks: list: The tasks.
+      window: int: The number of runs to consider for each task.
+
+    Return:
+      dict {string, (float, int)}: The task to its median duration and the number of runs it is
+          computed from. Tasks that never succeeded are left out.
+    """
+    durations = {}
+    try:
+      for task in tasks:
+        rows = self._conn.execute(
+            'SELECT duration FROM tasks WHERE task = ? AND exit_code = 0 AND cached = 0 '
+            'ORDER BY start DESC LIMIT ?', (task, window)).fetchall()
+        if rows:
+          durations[task] = (statistics.median([x['duration'] for x in rows]), len(rows))
+    except sqlite3.Error as e:
+      TermColor.Warning('Could not read history db %s. Error: %s' % (self._filename, e))
+    return durations
+
+  def GetTaskRuns(self, task, limit=10):
+    """Returns the last executions of the task.
+
+    Args:
+      task: string: The task.
+      limit: int: The max number of executions to return.
+
+    Return:
+      list(dict): The executions of the task, latest first. Each has the columns of the tasks table
+          and the date of the pipeline run.
+    """
+    rows = self._conn.execute(
+        'SELECT tasks.*, runs.pipeline_date FROM tasks LEFT JOIN runs USING (run_id) '
+        'WHERE task = ? ORDER BY tasks.start DESC LIMIT ?', (task, limit)).fetchall()
+    return [dict(x) for x in rows]
+
+  def GetRuns(self, limit=10):
+    """Returns the last runs.
+
+    Args:
+      limit: int: The max number of runs to return.
+
+    Return:
+      list(dict): The runs, latest first. Each has the columns of the runs table.
+    """
+    rows = self._conn.execute('SELECT * FROM runs ORDER BY start DESC LIMIT ?',
+                              (limit,)).fetchall()
+    return [dict(x) for x in rows]
+
+  def Close(self):
+    """Closes the db."""
+    self._conn.close()
+
+  def __Execute(self, statement, params):
+    """Executes and commits a statement.
+
+    Return:
+      Cursor: The cursor for the statement. None if it failed. Errors are only logged as a missing
+          record merely affects the estimates of later runs.
+    """
+    try:
+      with self._conn:
+        return self._conn.execute(statement, params)
+    except sqlite3.Error as e:
+      TermColor.Warning('Could not write to history db %s. Error: %s' % (self._filename, e))
+      return None
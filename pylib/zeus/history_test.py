@@ -0,0 +1,56 @@
+"""Tests for history."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pylib.zeus.history import History
+
+
+class HistoryTest(unittest.TestCase):
+  """Tests for History."""
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.dir, 'out', 'history.db')
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def _Run(self, start, durations):
+    """Records a run with the durations of the tasks."""
+    history = History(self.filename)
+    history.StartRun('test', '20160101', start)
+    for (task, duration, exit_code, cached) in durations:
+      history.RecordTask(task, start, duration, exit_code, 1024, 10, cached)
+    history.FinishRun(start + 100, 1, 1)
+    history.Close()
+
+  def test_median_durations(self):
+    self._Run(1, [('//000_a', 10, 0, False), ('//000_b', 1, 2, False)])
+    self._Run(2, [('//000_a', 30, 0, False), ('//000_b', 1, 2, False)])
+    self._Run(3, [('//000_a', 20, 0, False)])
+    # Failed runs and runs restored from the cache are not counted.
+    self._Run(4, [('//000_a', 500, 2, False), ('//000_a', 0, 0, True)])
+
+    history = History(self.filename)
+    self.assertEqual(history.GetMedianDurations(['//000_a', '//000_b', '//000_c']),
+                     {'//000_a': (20, 3)})
+    self.assertEqual(history.GetMedianDurations(['//000_a'], window=2), {'//000_a': (25, 2)})
+
+    runs = history.GetRuns()
+    self.assertEqual([x['start'] for x in runs], [4, 3, 2, 1])
+    self.assertEqual(runs[0]['successful'], 1)
+    task_runs = history.GetTaskRuns('//000_b')
+    self.assertEqual(len(task_runs), 2)
+    self.assertEqual(task_runs[0]['exit_code'], 2)
+    self.assertEqual(task_runs[0]['pipeline_date'], '20160101')
+    history.Close()
+
+
+if __name__ == '__main__':
+  unittest.main()
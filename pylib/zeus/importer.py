@@ -5,22 +5,28 @@
 __author__ = 'pramodg@room77.com (Pramod Gupta)'
 __copyright__ = 'Copyright 2012 Room77, Inc.'
 
-import itertools
 import os
 import sys
+import tarfile
 import time
 
 from pylib.base.flags import Flags
 from pylib.base.exec_utils import ExecUtils
 from pylib.base.term_color import TermColor
+from pylib.file.copy_engine import CopyEngine
 from pylib.file.file_utils import FileUtils
+from pylib.file.tree_archive import TreeArchive
 
 from pylib.zeus.pipeline_cmd_base import PipelineCmdBase
 from pylib.zeus.pipeline_config import PipelineConfig
 from pylib.zeus.pipeline_utils import PipelineUtils
 
 class Importer(PipelineCmdBase):
-  """Class to handle import of the output directory to a public location."""
+  """Class to handle import of the output directory to a public location.
+
+  Dirs exported as archives are extracted instead of copied. The parts of all the archives are
+  extracted in parallel.
+  """
 
   # The different exit codes that can be returned after running a task.
   EXITCODE = {
@@ -33,6 +39,7 @@ class Importer(PipelineCmdBase):
     super(Importer, cls).Init(parser)
     parser.add_argument('--pool_size', type=int, default=0,
                         help='The pool size for parallelization.')
+    CopyEngine.AddArguments(parser)
 
   @classmethod
   def WorkHorse(cls, tasks):
@@ -69,22 +76,36 @@ class Importer(PipelineCmdBase):
     for dir in dirs_to_import.values():
       FileUtils.MakeDirs(dir)
 
-    # Run all the copy tasks.
+    # Run all the copy tasks. Archives are extracted as one task per part.
     successful_dirs = []; failed_dirs = []
-    args = zip(itertools.repeat(cls), itertools.repeat('_RunSingeTask'),
-                          list(dirs_to_import), list(dirs_to_import.values()))
-    dir_res = ExecUtils.ExecuteParallel(args, Flags.ARGS.pool_size)
-    if not dir_res:
+    args = []
+    for (src_dir, target_dir) in dirs_to_import.items():
+      if not TreeArchive.IsArchive(src_dir):
+        args += [(cls, '_RunSingeTask', src_dir, target_dir)]
+        continue
+      try:
+        index = TreeArchive.ReadIndex(src_dir)
+        TreeArchive.CreateDirs(target_dir, index)
+      except (OSError, IOError, ValueError) as e:
+        TermColor.Error('Cannot extract %s to %s. %s: %s' % (src_dir, target_dir, type(e), e))
+        failed_dirs += [src_dir]
+        continue
+      TermColor.Info('Extracting %s to %s in %d parts' % (src_dir, target_dir,
+                                                          len(index['parts'])))
+      args += [(cls, '_ExtractPart', src_dir, target_dir, index['compression'], x)
+               for x in index['parts']]
+    dir_res = ExecUtils.ExecuteParallel(args, Flags.ARGS.pool_size) if args else []
+    if args and not dir_res:
       TermColor.Error('Could not process: %s' % all_tasks)
       return ([], all_tasks)
 
     for (res, dir) in dir_res:
-      if res == Importer.EXITCODE['SUCCESS']:
-        successful_dirs += [dir]
-      elif res == Importer.EXITCODE['FAILURE']:
+      if res == Importer.EXITCODE['FAILURE']:
         failed_dirs += [dir]
-      else:
+      elif res != Importer.EXITCODE['SUCCESS']:
         TermColor.Fatal('Invalid return %d code for %s' % (res, dir))
+    failed_dirs = sorted(set(failed_dirs))
+    successful_dirs = [x for x in dirs_to_import if x not in failed_dirs]
 
     # Get the reverse mapping from dirs to tasks.
     successful_tasks = []; failed_tasks = []
@@ -109,14 +130,42 @@ class Importer(PipelineCmdBase):
     """
     TermColor.Info('Copying %s to %s' % (src_dir, target_dir))
     start = time.time()
-    res = FileUtils.CopyDirTree(src_dir, target_dir)
+    stats = CopyEngine.FromArgs(Flags.ARGS).CopyTree(src_dir, target_dir)
     time_taken = time.time() - start
-    status_code = Importer.EXITCODE['FAILURE'] if not res else Importer.EXITCODE['SUCCESS']
-    TermColor.Info('Finished copying %s to %s. Took %.2fs' % (src_dir, target_dir, time_taken))
+    status_code = Importer.EXITCODE['FAILURE'] if stats['failed'] else Importer.EXITCODE['SUCCESS']
+    TermColor.Info('Finished copying %s to %s. Took %.2fs. Copied: %d (%.1f MB), linked: %d, '
+                   'unchanged: %d, failed: %d' % (
+                       src_dir, target_dir, time_taken, stats['copied'], stats['bytes'] / 1e6,
+                       stats['linked'], stats['skipped'], stats['failed']))
 
     # Everything done. Mark the task as successful.
     return (status_code, src_dir)
 
+  @classmethod
+  def _ExtractPart(cls, src_dir, target_dir, compression, part):
+    """Extracts a single part of the archive of a dir.
+
+    Args:
+      src dir: string: The directory of the archive.
+      target dir: string: The target directory.
+      compression: string: The compression of the archive.
+      part: string: The file name of the part.
+
+    Return:
+      (EXITCODE, string): Returns a tuple of the result status and the src_dir.
+    """
+    TermColor.VInfo(1, 'Extracting %s to %s' % (os.path.join(src_dir, part), target_dir))
+    start = time.time()
+    try:
+      (count, size) = TreeArchive.ExtractPart(src_dir, target_dir, compression, part)
+    except (OSError, IOError, tarfile.TarError) as e:
+      TermColor.Error('Cannot extract %s to %s. %s: %s' % (
+          os.path.join(src_dir, part), target_dir, type(e), e))
+      return (Importer.EXITCODE['FAILURE'], src_dir)
+    TermColor.Info('Finished extracting %s of %s: Took %.2fs. Files: %d (%.1f MB)' % (
+        part, src_dir, time.time() - start, count, size / 1e6))
+    return (Importer.EXITCODE['SUCCESS'], src_dir)
+
 
 def main():
   try:
@@ -0,0 +1,108 @@
+"""Journal of the tasks executed by a pipeline run."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import json
+import os
+
+from pylib.base.term_color import TermColor
+from pylib.file.file_utils import FileUtils
+
+from pylib.zeus.pipeline_config import PipelineConfig
+
+
+class Journal(object):
+  """Class to checkpoint the result of each task of a run.
+
+  The journal is a file with one json record per line. A record is appended and synced to disk as
+  soon as a task finishes, so the journal survives a crash of the runner. 'zeus continue' replays
+  the journal and only reruns the tasks that did not succeed. 'zeus run' starts a new journal, while
+  'zeus continue' appends to the journal of the run it resumes. Each record is of the form:
+    {'task': string, 'status': string, 'exit_code': int, 'start': float, 'end': float}
+  with an optional 'reason' for skipped tasks.
+
+  Members:
+    _filename: string: The journal file.
+    _file: file: The journal file opened for appending.
+  """
+
+  def __init__(self, filename, truncate=False):
+    """Opens the journal.
+
+    Args:
+      filename: string: The journal file.
+      truncate: bool: If True, the records of earlier runs are dropped.
+    """
+    self._filename = filename
+    FileUtils.MakeDirs(os.path.dirname(filename))
+    self._file = open(filename, 'w' if truncate else 'a')
+
+  @classmethod
+  def GetJournalFile(cls):
+    """Returns the journal file for the pipeline date.
+
+    Return:
+      string: The journal file. It is in the log dir of the pipeline or in the output dir if there
+          are no logs. None if the pipeline has neither.
+    """
+    config = PipelineConfig.Instance()
+    if config.pipeline_log_dir():
+      return os.path.join(config.pipeline_log_dir(), 'journal.jsonl')
+    if config.pipeline_output_dir():
+      return os.path.join(config.pipeline_output_dir(), 'journal',
+                          '%s.jsonl' % config.pipeline_date())
+    return None
+
+  @classmethod
+  def Replay(cls, filename):
+    """Replays the journal.
+
+    Args:
+      filename: string: The journal file.
+
+    Return:
+      dict {string, dict}: The last record for each task in the journal. None if there is no
+          journal.
+    """
+    if not filename or not os.path.isfile(filename): return None
+    records = {}
+    with open(filename) as f:
+      for line in f:
+        try:
+          record = json.loads(line)
+          records[record['task']] = record
+        except (ValueError, KeyError, TypeError):
+          # The runner may have been killed in the middle of writing the last record.
+          TermColor.Warning('Ignoring invalid journal record in %s: %s' % (filename, line.strip()))
+    return records
+
+  def filename(self):
+    """Returns: string: The journal file."""
+    return self._filename
+
+  def Record(self, task, status, exit_code, start, end, reason=None):
+    """Appends the record for a finished task to the journal.
+
+    Args:
+      task: string: The task.
+      status: string: The description of the status of the task.
+      exit_code: int: The exit code of the task.
+      start: float: The time the task started at.
+      end: float: The time the task ended at.
+      reason: string: The reason the task was skipped, if any.
+    """
+    record = {'task': task, 'status': status, 'exit_code': exit_code,
+              'start': start, 'end': end}
+    if reason: record['reason'] = reason
+    try:
+      self._file.write(json.dumps(record, sort_keys=True) + '\n')
+      self._file.flush()
+      os.fsync(self._file.fileno())
+    except (OSError, IOError) as e:
+      # A missing record only means the task is rerun by 'zeus continue'.
+      TermColor.Warning('Could not write to journal %s. Error: %s' % (self._filename, e))
+
+  def Close(self):
+    """Closes the journal."""
+    self._file.close()
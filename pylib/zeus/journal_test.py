@@ -0,0 +1,58 @@
+"""Tests for journal."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pylib.zeus.journal import Journal
+
+
+class JournalTest(unittest.TestCase):
+  """Tests for Journal."""
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.dir, 'log', 'journal.jsonl')
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_replay(self):
+    self.assertIsNone(Journal.Replay(self.filename))
+
+    journal = Journal(self.filename)
+    journal.Record('/run/000_a', 'SUCCESS', 0, 1.0, 2.0)
+    journal.Record('/run/000_b', 'FAILURE', 2, 1.0, 3.0)
+    journal.Record('/run/100_c', 'SKIPPED', 2, 3.0, 3.0, 'failed dependency //000_b')
+    journal.Close()
+
+    # A continued run appends to the same journal.
+    journal = Journal(self.filename)
+    journal.Record('/run/000_b', 'SUCCESS', 0, 5.0, 6.0)
+    journal.Close()
+    # A record cut short by a crash is ignored.
+    with open(self.filename, 'a') as f: f.write('{"task": "/run/10')
+
+    records = Journal.Replay(self.filename)
+    self.assertEqual(sorted(records), ['/run/000_a', '/run/000_b', '/run/100_c'])
+    self.assertEqual(records['/run/000_b']['status'], 'SUCCESS')
+    self.assertEqual(records['/run/100_c']['reason'], 'failed dependency //000_b')
+
+  def test_truncate(self):
+    journal = Journal(self.filename)
+    journal.Record('/run/000_a', 'SUCCESS', 0, 1.0, 2.0)
+    journal.Close()
+
+    # A new run drops the records of the earlier runs.
+    journal = Journal(self.filename, truncate=True)
+    journal.Record('/run/000_b', 'FAILURE', 2, 3.0, 4.0)
+    journal.Close()
+    self.assertEqual(sorted(Journal.Replay(self.filename)), ['/run/000_b'])
+
+
+if __name__ == '__main__':
+  unittest.main()
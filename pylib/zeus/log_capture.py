@@ -0,0 +1,148 @@
+"""Streaming capture of the output of pipeline tasks."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import collections
+import gzip
+import os
+import time
+import zlib
+
+from pylib.file.file_utils import FileUtils
+
+
+class LogCapture(object):
+  """Class to write the output of a task to its log as the output is produced.
+
+  The log is compressed on the fly with gzip, so it can be read with zcat, zless and zgrep. It is
+  flushed every few seconds so that the output of a running task can be followed as well.
+
+  The size of the log can be capped. The first head_bytes of the output are written to the log as
+  they come. The last tail_bytes are kept in memory and written after a marker for the dropped
+  middle when the log is closed. The last lines of the output are always kept in memory for the
+  mails and failure reports, so the log never needs to be read back. A listener can be passed the
+  last lines as the output is produced, at most once per flush interval.
+
+  Members:
+    _filename: string: The log file.
+    _file: file: The log file opened for writing.
+    _head_bytes: int: The max number of bytes written before the tail. 0 for no cap.
+    _tail_bytes: int: The number of bytes at the end of the output kept after the head.
+    _written: int: The number of bytes of output written to the log.
+    _total: int: The total number of bytes of output.
+    _tail: deque(bytes): The output after the head, at most _tail_bytes of it.
+    _tail_size: int: The number of bytes in _tail.
+    _lines: deque(bytes): The last lines of the output.
+    _partial: bytes: The incomplete last line of the output.
+    _last_flush: float: The time the log was last flushed.
+    _listener: callable: Called with the last lines of the output. None if there is none.
+    _last_update: float: The time the listener was last called.
+  """
+
+  # The suffix for compressed logs.
+  GZIP_SUFFIX = '.gz'
+
+  # Text compresses about as well at level 6 as at level 9 and much faster.
+  COMPRESS_LEVEL = 6
+
+  # Interval in seconds to flush the log at.
+  FLUSH_INTERVAL = 5
+
+  # Max length of a line kept in memory.
+  MAX_LINE_BYTES = 1 << 16
+
+  def __init__(self, filename, compress=True, head_bytes=0, tail_bytes=0, tail_lines=100,
+               listener=None):
+    """
+    Args:
+      filename: string: The log file. The gzip suffix is added if compressed.
+      compress: bool: Compress the log.
+      head_bytes: int: The max number of bytes written before the tail. 0 for no cap.
+      tail_bytes: int: The number of bytes at the end of the output kept after the head.
+      tail_lines: int: The number of lines at the end of the output kept in memory.
+      listener: callable: If given, called with the string of the last lines of the output every
+          FLUSH_INTERVAL seconds while there is output.
+    """
+    self._filename = filename + self.GZIP_SUFFIX if compress else filename
+    FileUtils.MakeDirs(os.path.dirname(self._filename))
+    if compress:
+      self._file = gzip.open(self._filename, 'wb', compresslevel=self.COMPRESS_LEVEL)
+    else:
+      self._file = open(self._filename, 'wb')
+    self._head_bytes = head_bytes
+    self._tail_bytes = tail_bytes
+    self._written = 0
+    self._total = 0
+    self._tail = collections.deque()
+    self._tail_size = 0
+    self._lines = collections.deque(maxlen=tail_lines)
+    self._partial = b''
+    self._last_flush = time.time()
+    self._listener = listener
+    self._last_update = 0
+
+  def filename(self):
+    """Returns: string: The log file."""
+    return self._filename
+
+  def total(self):
+    """Returns: int: The total number of bytes of output."""
+    return self._total
+
+  def write(self, data):
+    """Adds the output to the log.
+
+    Args:
+      data: bytes: The output.
+    """
+    self._total += len(data)
+    self._AddLines(data)
+
+    if not self._head_bytes or self._written < self._head_bytes:
+      head = data[:self._head_bytes - self._written] if self._head_bytes else data
+      self._file.write(head)
+      self._written += len(head)
+      data = data[len(head):]
+      if time.time() - self._last_flush >= self.FLUSH_INTERVAL: self.Flush()
+
+    if data and self._tail_bytes:
+      self._tail.append(data)
+      self._tail_size += len(data)
+      # Drop the oldest chunks that are no longer needed for the tail.
+      while self._tail_size - len(self._tail[0]) >= self._tail_bytes:
+        self._tail_size -= len(self._tail.popleft())
+
+    if self._listener and time.time() - self._last_update >= self.FLUSH_INTERVAL:
+      self._listener(self.GetTail())
+      self._last_update = time.time()
+
+  def Flush(self):
+    """Flushes the log so that the output so far can be read."""
+    if isinstance(self._file, gzip.GzipFile): self._file.flush(zlib.Z_SYNC_FLUSH)
+    else: self._file.flush()
+    self._last_flush = time.time()
+
+  def Close(self):
+    """Writes the tail and closes the log."""
+    tail = b''.join(self._tail)[-self._tail_bytes:] if self._tail_bytes else b''
+    if self._total - self._written > len(tail) and b'\n' in tail:
+      # Start the tail at a line.
+      tail = tail[tail.index(b'\n') + 1:]
+    dropped = self._total - self._written - len(tail)
+    if dropped:
+      self._file.write(b'\n[... %d bytes dropped ...]\n' % dropped)
+    self._file.write(tail)
+    self._file.close()
+
+  def GetTail(self):
+    """Returns: string: The last lines of the output."""
+    lines = list(self._lines) + ([self._partial] if self._partial else [])
+    text = b'\n'.join(lines).decode('utf-8', 'replace')
+    return text + '\n' if text else text
+
+  def _AddLines(self, data):
+    """Keeps the last lines of the output in memory."""
+    lines = (self._partial + data).split(b'\n')
+    self._partial = lines.pop()[-self.MAX_LINE_BYTES:]
+    self._lines.extend(x[-self.MAX_LINE_BYTES:] for x in lines[-self._lines.maxlen:])
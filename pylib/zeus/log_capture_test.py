@@ -0,0 +1,60 @@
+"""Tests for log_capture."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from pylib.zeus.log_capture import LogCapture
+
+
+class LogCaptureTest(unittest.TestCase):
+  """Tests for LogCapture."""
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.dir, 'log', '000_task.log')
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def _Write(self, capture, data):
+    # Write in uneven chunks like a pipe would.
+    for i in range(0, len(data), 7): capture.write(data[i:i + 7])
+    capture.Close()
+
+  def test_compressed(self):
+    data = b''.join(b'line %d\n' % x for x in range(10000))
+    capture = LogCapture(self.filename, tail_lines=2)
+    self._Write(capture, data)
+    self.assertEqual(capture.filename(), self.filename + '.gz')
+    with gzip.open(capture.filename()) as f: self.assertEqual(f.read(), data)
+    self.assertLess(os.path.getsize(capture.filename()), len(data) / 4)
+    self.assertEqual(capture.GetTail(), 'line 9998\nline 9999\n')
+    self.assertEqual(capture.total(), len(data))
+
+  def test_capped(self):
+    data = b''.join(b'%04d\n' % x for x in range(1000))
+    capture = LogCapture(self.filename, compress=False, head_bytes=10, tail_bytes=15)
+    self._Write(capture, data + b'end')
+    self.assertEqual(capture.filename(), self.filename)
+    with open(capture.filename(), 'rb') as f:
+      self.assertEqual(f.read(), b'0000\n0001\n\n[... 4980 bytes dropped ...]\n0998\n0999\nend')
+    self.assertEqual(capture.GetTail().split('\n')[-3:], ['0999', 'end', ''])
+
+  def test_listener(self):
+    tails = []
+    capture = LogCapture(self.filename, compress=False, tail_lines=1, listener=tails.append)
+    capture.write(b'a\n')
+    # The listener is called at most once per flush interval.
+    capture.write(b'b\n')
+    capture.Close()
+    self.assertEqual(tails, ['a\n'])
+
+
+if __name__ == '__main__':
+  unittest.main()
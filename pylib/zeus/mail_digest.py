@@ -0,0 +1,109 @@
+"""Digest of the mails for the tasks of a pipeline run."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import smtplib
+import time
+
+from pylib.base.term_color import TermColor
+from pylib.util.mail.mailer import Mailer
+
+
+class MailDigest(object):
+  """Class to batch the mails for the tasks of a run.
+
+  The mails for the tasks are queued per receiver and sent as one digest mail per receiver when
+  the digest is flushed. All the mails of a flush are sent over a single SMTP connection.
+
+  Members:
+    _sender: string: The sender of the mails.
+    _subject_prefix: string: The prefix for the subject of the mails.
+    _smtp_host: string: The SMTP server.
+    _smtp_port: int: The port of the SMTP server.
+    _entries: dict {string, list((string, string, string))}: The receiver to the queued
+        (status, task, text) entries.
+    _last_flush: float: The time of the last flush.
+  """
+
+  def __init__(self, sender, subject_prefix, smtp_host='localhost', smtp_port=0):
+    self._sender = sender
+    self._subject_prefix = subject_prefix
+    self._smtp_host = smtp_host
+    self._smtp_port = smtp_port
+    self._entries = {}
+    self._last_flush = time.time()
+
+  @classmethod
+  def TruncateToTail(cls, text, lines):
+    """Returns: string: The last lines of the text with a note if any lines were dropped."""
+    text_lines = text.rstrip('\n').split('\n')
+    if len(text_lines) <= lines: return text
+    return '[... %d lines truncated ...]\n%s\n' % (len(text_lines) - lines,
+                                                   '\n'.join(text_lines[-lines:]))
+
+  def Add(self, receiver, status, task, text):
+    """Queues the mail for a task.
+
+    Args:
+      receiver: string: The receiver of the mail.
+      status: string: The status of the task.
+      task: string: The display name of the task.
+      text: string: The details for the task, e.g. the tail of its log.
+    """
+    self._entries.setdefault(receiver, []).append((status, task, text))
+
+  def pending(self):
+    """Returns: int: The number of queued mails."""
+    return sum(len(x) for x in self._entries.values())
+
+  def FlushIfDue(self, interval):
+    """Flushes the digest if the interval passed since the last flush.
+
+    Args:
+      interval: float: The interval in seconds.
+    """
+    if time.time() - self._last_flush >= interval: self.Flush()
+
+  def Flush(self):
+    """Sends the queued mails as one digest per receiver.
+
+    Return:
+      bool: True if all the digests were sent.
+    """
+    self._last_flush = time.time()
+    if not self._entries: return True
+    (entries, self._entries) = (self._entries, {})
+    mailer = None
+    try:
+      mailer = Mailer(self._smtp_host, self._smtp_port)
+      sent = True
+      for receiver in sorted(entries):
+        if not mailer.send_simple_message(self._sender, [receiver],
+                                          self._GetSubject(entries[receiver]),
+                                          self._GetBody(entries[receiver])):
+          TermColor.Error('Could not send the mail digest for %d tasks to %s.' %
+                          (len(entries[receiver]), receiver))
+          sent = False
+      return sent
+    except (smtplib.SMTPException, OSError) as e:
+      TermColor.Error('Could not send the mail digest for %d tasks. Error: %s' %
+                      (sum(len(x) for x in entries.values()), e))
+      return False
+    finally:
+      if mailer: mailer.close()
+
+  def _GetSubject(self, entries):
+    """Returns: string: The subject of the digest with the number of tasks per status."""
+    counts = {}
+    for (status, unused_task, unused_text) in entries:
+      counts[status] = counts.get(status, 0) + 1
+    return '%s Digest: %s' % (self._subject_prefix,
+                              ', '.join('%d %s' % (counts[x], x) for x in sorted(counts)))
+
+  def _GetBody(self, entries):
+    """Returns: string: The body of the digest with a summary followed by the task details."""
+    body = '\n'.join('%-10s %s' % (status, task) for (status, task, unused_text) in entries)
+    for (status, task, text) in entries:
+      body += '\n\n%s\n%s: %s\n%s' % ('=' * 80, status, task, text)
+    return body + '\n'
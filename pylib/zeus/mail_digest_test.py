@@ -0,0 +1,104 @@
+"""Tests for mail_digest."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import argparse
+import email
+import socketserver
+import threading
+import unittest
+
+from pylib.base.flags import Flags
+from pylib.zeus.mail_digest import MailDigest
+
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+  """Local SMTP server that keeps the messages it receives.
+
+  Members:
+    connections: int: The number of connections accepted.
+    messages: list(email.message.Message): The messages received.
+  """
+
+  allow_reuse_address = True
+  daemon_threads = True
+
+  class Handler(socketserver.StreamRequestHandler):
+    """Handles a single SMTP session."""
+
+    def handle(self):
+      self.server.connections += 1
+      self.wfile.write(b'220 sink\r\n')
+      for line in self.rfile:
+        cmd = line.strip().upper()
+        if cmd.startswith(b'EHLO'):
+          self.wfile.write(b'250-sink\r\n250 SIZE 10000000\r\n')
+        elif cmd == b'DATA':
+          self.wfile.write(b'354 go ahead\r\n')
+          data = b''.join(iter(self.rfile.readline, b'.\r\n'))
+          self.server.messages += [email.message_from_bytes(data)]
+          self.wfile.write(b'250 ok\r\n')
+        elif cmd == b'QUIT':
+          self.wfile.write(b'221 bye\r\n')
+          return
+        else:
+          self.wfile.write(b'250 ok\r\n')
+
+  def __init__(self):
+    socketserver.ThreadingTCPServer.__init__(self, ('localhost', 0), SmtpSink.Handler)
+    self.connections = 0
+    self.messages = []
+
+
+class MailDigestTest(unittest.TestCase):
+  """Tests for MailDigest."""
+
+  def setUp(self):
+    # The mailer logs with the verbosity from the flags.
+    self.args = Flags.ARGS
+    Flags.ARGS = argparse.Namespace(verbose=0)
+    self.sink = SmtpSink()
+    threading.Thread(target=self.sink.serve_forever, daemon=True).start()
+    self.digest = MailDigest('zeus@test.com', '[test:20160101]', 'localhost',
+                             self.sink.server_address[1])
+
+  def tearDown(self):
+    self.sink.shutdown()
+    self.sink.server_close()
+    Flags.ARGS = self.args
+
+  def test_flush(self):
+    self.assertTrue(self.digest.Flush())
+    self.assertEqual(self.sink.connections, 0)
+
+    self.digest.Add('a@test.com', 'FAILURE', '//000_a', 'error')
+    self.digest.Add('a@test.com', 'SUCCESS', '//000_b', 'done')
+    self.digest.Add('b@test.com', 'FAILURE', '//000_c', 'error')
+    self.assertEqual(self.digest.pending(), 3)
+    self.assertTrue(self.digest.Flush())
+    self.assertEqual(self.digest.pending(), 0)
+
+    # All the digests are sent over a single connection.
+    self.assertEqual(self.sink.connections, 1)
+    self.assertEqual([x['To'] for x in self.sink.messages], ['a@test.com', 'b@test.com'])
+    self.assertEqual(self.sink.messages[0]['Subject'],
+                     '[test:20160101] Digest: 1 FAILURE, 1 SUCCESS')
+    body = self.sink.messages[0].get_payload()[0].get_payload()
+    self.assertIn('//000_a', body)
+    self.assertIn('//000_b', body)
+
+  def test_flush_error(self):
+    self.digest = MailDigest('zeus@test.com', '[test:20160101]', 'localhost', 1)
+    self.digest.Add('a@test.com', 'FAILURE', '//000_a', 'error')
+    self.assertFalse(self.digest.Flush())
+    self.assertEqual(self.digest.pending(), 0)
+
+  def test_tail(self):
+    self.assertEqual(MailDigest.TruncateToTail('a\nb\nc\n', 2),
+                     '[... 1 lines truncated ...]\nb\nc\n')
+    self.assertEqual(MailDigest.TruncateToTail('a\nb\n', 2), 'a\nb\n')
+
+
+if __name__ == '__main__':
+  unittest.main()
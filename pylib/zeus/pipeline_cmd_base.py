@@ -13,10 +13,21 @@ from pylib.file.file_utils import FileUtils
 
 from pylib.zeus.pipeline_config import PipelineConfig
 from pylib.zeus.pipeline_utils import PipelineUtils
+from pylib.zeus.stage_link import StageLinks
+from pylib.zeus.task_cache import TaskCache
+from pylib.zeus.task_graph import TaskGraph
+from pylib.zeus.task_manifest import TaskManifest
+from pylib.zeus.task_resources import TaskResources
+from pylib.zeus.task_shards import TaskShards
 
 class PipelineCmdBase(object):
   """Base class for various pipeline commands."""
 
+  # The suffixes of the sidecar files next to the tasks. These are never tasks themselves.
+  SIDECAR_SUFFIXES = (TaskGraph.DEPS_SUFFIX, TaskCache.CACHE_SUFFIX,
+                      TaskResources.RESOURCES_SUFFIX, StageLinks.PIPE_SUFFIX,
+                      TaskShards.SHARDS_SUFFIX, TaskShards.MERGE_SUFFIX)
+
   @classmethod
   def Init(cls, parser):
     """Initialize the cleaner.
@@ -37,6 +48,7 @@ class PipelineCmdBase(object):
                             'tasks: "meta/search/search_server"; '
                             'Directories: "meta" "meta/*"; '
                             'Tree: "meta/..." ')
+    TaskManifest.AddArguments(parser)
 
   @classmethod
   def Run(cls):
@@ -45,7 +57,7 @@ class PipelineCmdBase(object):
     Return:
       int: Exit status. 0 means no error.
     """
-    tasks = cls._ComputeTasks(Flags.ARGS.task, Flags.ARGS.ignore_tasks)
+    tasks = cls._GetTasks(Flags.ARGS.task, Flags.ARGS.ignore_tasks)
     # TermColor.Info('Tasks: %s' % tasks)
     # TermColor.Info('')
     # for key in tasks.iterkeys():
@@ -89,11 +101,43 @@ class PipelineCmdBase(object):
     return (None, None)
 
   @classmethod
-  def _ComputeTasks(cls, targets, ignore_list=[]):
+  def IsSidecar(cls, path):
+    """Returns: bool: True if the file is the sidecar of a task. Only the suffix of its name is
+    checked, so that the dirs of the pipeline and the tasks may contain the suffixes."""
+    return os.path.basename(path).endswith(cls.SIDECAR_SUFFIXES)
+
+  @classmethod
+  def _GetTasks(cls, targets, ignore_list=[]):
+    """Returns the tasks for the input targets. The tasks saved in the manifest by an earlier
+    command are reused if the pipeline tree did not change since.
+
+    Args:
+      targets: list: List of input targets.
+      ignore_list: list: List of strings to ignore.
+
+    Return:
+      OrderedDict {string, set(string)}: Dict from priority to set of tasks to execute at the
+          priority. Note: the dict is ordered by priority.
+    """
+    manifest = TaskManifest.Instance()
+    filename = TaskManifest.GetManifestFile()
+    key = TaskManifest.GetKey(targets, ignore_list)
+    tasks = manifest.Load(filename, key)
+    if tasks is not None: return tasks
+
+    roots = []
+    tasks = cls._ComputeTasks(list(targets), list(ignore_list), roots)
+    manifest.Save(filename, key, tasks, roots)
+    return tasks
+
+  @classmethod
+  def _ComputeTasks(cls, targets, ignore_list=[], roots=None):
     """Computes the tasks to be evaluate given the input targets.
     Args:
       targets: list: List of input targets.
       ignore_list: list: List of strings to ignore.
+      roots: list: If not None, the (dir, recurse) pairs for the dirs the tasks are discovered in
+          are added to it.
 
     Return:
       dict{int, set(string)}: Dict from priority to set of tasks to execute at the priority.
@@ -101,6 +145,7 @@ class PipelineCmdBase(object):
     # First create a simple task list of priority string to task.
     # Once all the tasks have been collected, then sort them to create an actual priority order.
     tasks = {}
+    if roots is None: roots = []
     ignore_list += ['timeout']
     for target in targets:
       ignore = FileUtils.IgnorePath(target, ignore_list)
@@ -124,8 +169,13 @@ class PipelineCmdBase(object):
         continue
 
       if os.path.isfile(abs_target):
+        if cls.IsSidecar(abs_target):
+          TermColor.VInfo(3, 'Ignored sidecar file %s' % abs_target)
+          continue
         cls.__AddFileToTasks(tasks, abs_target)
+        roots += [(os.path.dirname(abs_target), False)]
       elif os.path.isdir(abs_target):
+        roots += [(abs_target, recurse)]
         targets += FileUtils.GetFilesInDir(abs_target, recurse, ignore_list)
       else:
         TermColor.Warning('[%s] is not supported' % (abs_target))
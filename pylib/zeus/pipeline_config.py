@@ -3,6 +3,7 @@
 __author__ = 'pramodg@room77.com (Pramod Gupta)'
 __copyright__ = 'Copyright 2012 Room77, Inc.'
 
+import copy
 import json
 import os
 from datetime import datetime
@@ -83,6 +84,32 @@ class PipelineConfig(singleton.Singleton):
     self.__CreateInitialSubDirs()
     self.PrintConfig()
 
+  @classmethod
+  def Select(cls, config):
+    """Makes the config the one returned by Instance(), e.g. to run a task for another date.
+
+    Args:
+      config: PipelineConfig: The config. See ForDate().
+    """
+    cls._instance = config
+
+  def ForDate(self, date):
+    """Returns the config of the pipeline for another date. Only the date and the log dir differ.
+
+    Args:
+      date: string: The date, e.g. 20140107.
+
+    Return:
+      PipelineConfig: The config for the date.
+    """
+    if date == self._pipeline_date: return self
+    config = copy.copy(self)
+    config._pipeline_date = date
+    if self._pipeline_log_dir:
+      config._pipeline_log_dir = os.path.join(os.path.dirname(self._pipeline_log_dir), date)
+      FileUtils.MakeDirs(config._pipeline_log_dir)
+    return config
+
   def pipeline_id(self):
     """Returns: string: the pipeline id."""
     return self._id
@@ -4,13 +4,13 @@
 __author__ = 'pramodg@room77.com (Pramod Gupta)'
 __copyright__ = 'Copyright 2013 Room77, Inc.'
 
-import glob
 import os
 import socket
 
 from pylib.base.flags import Flags
 from pylib.base.term_color import TermColor
 from pylib.file.file_utils import FileUtils
+from pylib.zeus.dated_dir_index import DatedDirIndex
 from pylib.zeus.pipeline_config import PipelineConfig
 
 class PipelineUtils:
@@ -217,12 +217,7 @@ class PipelineUtils:
     Returns:
       string: the out dir base for the pipeline. None if there is no out dir.
     """
-    while path:
-      prev_dir = FileUtils.GetPreviousDatedDir(path)
-      if prev_dir and glob.glob(os.path.join(prev_dir, pattern)):
-        return prev_dir
-      path = prev_dir
-    return None
+    return DatedDirIndex.Instance().GetPreviousDatedDirContaining(path, pattern)
 
   @classmethod
   def ZeusEmailId(cls, mail_domain):
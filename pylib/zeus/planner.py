@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+
+"""Handles plan."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import copy
+import datetime
+import heapq
+import json
+import multiprocessing
+import os
+import sys
+
+from pylib.base.flags import Flags
+from pylib.base.term_color import TermColor
+
+from pylib.zeus.history import History
+from pylib.zeus.pipeline_config import PipelineConfig
+from pylib.zeus.pipeline_utils import PipelineUtils
+from pylib.zeus.runner import Runner
+from pylib.zeus.task_resources import ResourceScheduler, TaskResources
+from pylib.zeus.task_shards import TaskShards
+
+
+class Planner(Runner):
+  """Class to show what a run would do without running any task.
+
+  The tasks are listed by wave: the first wave has the tasks without dependencies and each later
+  wave the tasks whose dependencies are all in earlier waves. When the pipeline has a history, the
+  run is simulated with the median durations of the tasks, the pool size and the resource budget
+  of the run to predict when each task starts and how long the run takes. All the tasks are
+  assumed to succeed.
+  """
+
+  @classmethod
+  def WorkHorse(cls, tasks):
+    """Runs the workhorse for the command.
+
+    Args:
+      tasks: OrderedDict {int, set(string)}: Dict from priority to set of tasks to execute at the
+          priority. Note: the dict is ordered by priority.
+
+    Return:
+      (list, list): Returns a tuple of list in the form
+          (successful_tasks, failed_tasks) specifying tasks that succeeded and
+          ones that failed.
+    """
+    (graph, unused_dir_deps) = cls._CreateTaskGraph(tasks)
+    waves = cls._GetWaves(copy.deepcopy(graph))
+    pool_size = Flags.ARGS.pool_size or max(multiprocessing.cpu_count(), 1)
+
+    durations = {}
+    filename = History.GetHistoryFile()
+    if filename and os.path.isfile(filename):
+      history = History(filename)
+      try:
+        durations = cls._GetMedianDurations(history, graph.tasks())
+      finally:
+        history.Close()
+    shard_counts = {x: cls._GetShardCount(x, pool_size) for x in graph.tasks()}
+    resources = {x: cls._LoadTaskResources(x, shard_counts[x]) for x in graph.tasks()}
+    schedule = cls._SimulateRun(copy.deepcopy(graph), durations, resources, pool_size)
+
+    common_vars = PipelineConfig.Instance().GetAllENVVars()
+    TermColor.Info('Env vars of all the tasks: %s' % json.dumps(common_vars, indent=2,
+                                                                  sort_keys=True))
+    for (i, wave) in enumerate(waves):
+      TermColor.Info('')
+      TermColor.Info('Wave %d: %d tasks' % (i + 1, len(wave)))
+      for task in wave:
+        cls._PrintTask(task, durations, resources, shard_counts, schedule, common_vars)
+
+    planned = sum(waves, [])
+    blocked = [x for x in graph.tasks() if x not in set(planned)]
+    if blocked:
+      TermColor.Error('Tasks blocked by cyclic dependencies: %s' %
+                      PipelineUtils.TasksDisplayNames(blocked))
+    cls._PrintSummary(graph, durations, schedule, pool_size)
+    return (planned, blocked)
+
+  @classmethod
+  def _GetWaves(cls, graph):
+    """Groups the tasks by wave.
+
+    Args:
+      graph: TaskGraph: The graph of the run. It is consumed.
+
+    Return:
+      list(list(string)): The tasks of each wave in priority order. Tasks on dependency cycles are
+          in no wave.
+    """
+    waves = []
+    ready = graph.GetReadyTasks()
+    while ready:
+      waves += [ready]
+      for task in ready: graph.Finish(task, Runner.EXITCODE['SUCCESS'])
+      ready = graph.GetReadyTasks()
+    return waves
+
+  @classmethod
+  def _SimulateRun(cls, graph, durations, resources, pool_size):
+    """Simulates the run the way the runner schedules the tasks: the ready tasks with the longest
+    median durations start first as long as the pool and the resource budget allow. Tasks without
+    history are assumed to take no time.
+
+    Args:
+      graph: TaskGraph: The graph of the run. It is consumed.
+      durations: dict {string, (float, int)}: The median duration of the tasks.
+      resources: dict {string, TaskResources}: The resources declared by the tasks.
+      pool_size: int: The number of tasks run in parallel.
+
+    Return:
+      dict: The simulated run with the keys:
+          start: dict {string, float}: The task to the time it starts at.
+          duration: float: The duration of the run.
+          peak_cpus: int: The most cpu slots declared by the tasks running at the same time.
+          peak_mem: int: The most memory declared by the tasks running at the same time.
+    """
+    scheduler = cls._CreateResourceScheduler(pool_size, check_machine=False)
+    now = 0.0
+    start = {}
+    # The (end, task) of the running tasks.
+    running = []
+    (peak_cpus, peak_mem) = (0, 0)
+    while True:
+      reserved = None
+      for task in cls._SortByDuration(graph.GetReadyTasks(), durations):
+        if len(running) >= pool_size: break
+        block_reason = scheduler.GetBlockReason(resources[task], reserved)
+        if block_reason:
+          if not reserved and block_reason in ResourceScheduler.BUDGET_REASONS:
+            reserved = resources[task]
+          continue
+        scheduler.Acquire(task, resources[task])
+        graph.Start(task)
+        start[task] = now
+        heapq.heappush(running, (now + durations.get(task, (0.0, 0))[0], task))
+
+      if not running: break
+      used = [resources[x] for (unused_end, x) in running]
+      peak_cpus = max(peak_cpus, sum(x.cpus for x in used))
+      peak_mem = max(peak_mem, sum(x.mem for x in used))
+
+      # Finish all the tasks ending at the same time before starting more.
+      now = running[0][0]
+      while running and running[0][0] <= now:
+        (unused_end, task) = heapq.heappop(running)
+        scheduler.Release(task)
+        graph.Finish(task, Runner.EXITCODE['SUCCESS'])
+
+    return {'start': start, 'duration': now, 'peak_cpus': peak_cpus, 'peak_mem': peak_mem}
+
+  @classmethod
+  def _PrintTask(cls, task, durations, resources, shard_counts, schedule, common_vars):
+    """Prints the plan for a task.
+
+    Args:
+      task: string: The task.
+      durations: dict {string, (float, int)}: The median duration of the tasks.
+      resources: dict {string, TaskResources}: The resources declared by the tasks for all their
+          shards.
+      shard_counts: dict {string, int}: The number of shards of the tasks.
+      schedule: dict: The simulated run. See _SimulateRun().
+      common_vars: dict {string, string}: The env vars shared by all the tasks.
+    """
+    task_options = cls._GetTaskOptions(task)
+    options = [k.lower() for (k, v) in sorted(Runner.TASK_OPTIONS.items(), key=lambda x: x[1])
+               if task_options[v]]
+    line = '  %s [%s] timeout: %s' % (
+        PipelineUtils.TaskDisplayName(task), ', '.join(options) or 'normal',
+        cls._FormatDuration(cls._GetTimeOutForTask(task)))
+    if durations:
+      line += ' predicted: %s' % (cls._FormatDuration(durations[task][0])
+                                  if task in durations else 'unknown')
+      if task in schedule['start']:
+        line += ' starts at: +%s' % cls._FormatDuration(schedule['start'][task])
+    task_resources = resources[task]
+    if task_resources.mem or task_resources.cpus != 1 or task_resources.exclusive:
+      line += ' resources: cpu %d, mem %s%s' % (
+          task_resources.cpus, TaskResources.FormatSize(task_resources.mem),
+          ''.join(', exclusive %s' % x for x in sorted(task_resources.exclusive)))
+    if shard_counts[task] > 1:
+      line += ' shards: %d%s' % (shard_counts[task],
+                                 ' + merge' if TaskShards.GetMergeFile(task) else '')
+    TermColor.Info(line)
+
+    task_vars = cls._GetEnvVarsForTask(task)
+    for k in sorted(task_vars):
+      if common_vars.get(k) != task_vars[k]: TermColor.Info('      %s=%s' % (k, task_vars[k]))
+
+  @classmethod
+  def _PrintSummary(cls, graph, durations, schedule, pool_size):
+    """Prints the predicted duration of the run.
+
+    Args:
+      graph: TaskGraph: The graph of the run.
+      durations: dict {string, (float, int)}: The median duration of the tasks.
+      schedule: dict: The simulated run. See _SimulateRun().
+      pool_size: int: The number of tasks run in parallel.
+    """
+    TermColor.Info('')
+    TermColor.Info('Pool size: %d' % pool_size)
+    if not durations:
+      TermColor.Warning('No history for the pipeline. Cannot predict the duration of the run.')
+      return
+
+    remaining = {x: durations[x][0] for x in graph.tasks() if x in durations}
+    TermColor.Info('Predicted duration: %s' % cls._FormatDuration(schedule['duration']))
+    TermColor.Info('Lower bound: %s (the longest chain of tasks or %s of work spread over the '
+                   'pool, whichever is longer)' % (
+                       cls._FormatDuration(cls._GetEta(graph, remaining, pool_size)),
+                       cls._FormatDuration(sum(remaining.values()))))
+    peak = 'Peak declared resources: cpu %d' % schedule['peak_cpus']
+    if schedule['peak_mem']: peak += ', mem %s' % TaskResources.FormatSize(schedule['peak_mem'])
+    TermColor.Info(peak)
+    unknown = len(graph.tasks()) - len(remaining)
+    if unknown:
+      TermColor.Warning('%d tasks have no history and are assumed to take no time.' % unknown)
+
+  @classmethod
+  def _FormatDuration(cls, duration):
+    """Returns: string: The duration in a readable form."""
+    if duration < 60: return '%.2fs' % duration
+    return str(datetime.timedelta(seconds=int(duration)))
+
+
+def main():
+  try:
+    Planner.Init(Flags.PARSER)
+    Flags.InitArgs()
+    return Planner.Run()
+  except KeyboardInterrupt as e:
+    TermColor.Warning('KeyboardInterrupt')
+    return 1
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,52 @@
+"""Tests for planner."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import argparse
+import copy
+import unittest
+from collections import OrderedDict
+
+from pylib.base.flags import Flags
+from pylib.zeus.planner import Planner
+from pylib.zeus.task_graph import TaskGraph
+from pylib.zeus.task_resources import TaskResources
+
+
+class PlannerTest(unittest.TestCase):
+  """Tests for Planner."""
+
+  def setUp(self):
+    self.args = Flags.ARGS
+    Flags.ARGS = argparse.Namespace(verbose=0, cpu_budget=0, mem_budget='', min_free_mem='0',
+                                    max_load=0)
+    # The tasks do not exist, so none of them declares dependencies.
+    self.graph = TaskGraph(OrderedDict([('000', {'a', 'b', 'c'}), ('100', {'d'})]))
+    self.durations = {'a': (4.0, 3), 'b': (2.0, 3), 'c': (1.0, 3), 'd': (1.0, 3)}
+    self.resources = {x: TaskResources() for x in self.durations}
+
+  def tearDown(self):
+    Flags.ARGS = self.args
+
+  def test_waves(self):
+    self.assertEqual(Planner._GetWaves(copy.deepcopy(self.graph)), [['a', 'b', 'c'], ['d']])
+
+  def test_simulate(self):
+    schedule = Planner._SimulateRun(self.graph, self.durations, self.resources, 2)
+    # The longest tasks start first.
+    self.assertEqual(schedule['start'], {'a': 0, 'b': 0, 'c': 2, 'd': 4})
+    self.assertEqual(schedule['duration'], 5)
+    self.assertEqual(schedule['peak_cpus'], 2)
+
+  def test_simulate_budget(self):
+    Flags.ARGS.cpu_budget = 2
+    self.resources['a'] = TaskResources(mem=1 << 30, cpus=2)
+    schedule = Planner._SimulateRun(self.graph, self.durations, self.resources, 2)
+    self.assertEqual(schedule['start'], {'a': 0, 'b': 4, 'c': 4, 'd': 6})
+    self.assertEqual(schedule['duration'], 7)
+    self.assertEqual(schedule['peak_mem'], 1 << 30)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,228 @@
+"""Samples the resource usage of the process tree of a pipeline task from /proc."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+import threading
+import time
+
+from pylib.zeus.task_resources import TaskResources
+
+
+class ProcSampler(object):
+  """Class to sample the cpu, memory and io of a process and all its descendants.
+
+  A thread reads /proc/<pid>/stat and /proc/<pid>/io for each process of the tree at a regular
+  interval. The tree is walked down from the root through /proc/<pid>/task/<tid>/children, so each
+  sample only reads a few small files per process of the tree and the overhead is negligible at
+  the default interval. Kernels without these files fall back to reading the stat of every process
+  to find the tree. The processes are keyed by their pid and start time, so that a reused pid is
+  never taken for an earlier process.
+
+  The peaks are those of the whole tree: the RSS summed over its processes and the cpus used
+  between two samples. The io totals add up the last counters seen for each process, so the io
+  of a process after its last sample is not counted. The total cpu time is exact as it comes from
+  the rusage of the task.
+
+  Members:
+    _interval: float: The interval in seconds between two samples.
+    _pid: int: The root of the process tree.
+    _start_time: string: The start time of the root. Once the root is reaped, its pid may be
+        reused by an unrelated process.
+    _thread: Thread: The sampling thread.
+    _stop: Event: Set to stop the sampling.
+    _cpu: dict {(int, int), float}: The (pid, start time) of each process seen to its cpu time.
+    _io: dict {(int, int), list(int)}: The (pid, start time) of each process seen to its io
+        counters: chars read, chars written, bytes read from disk and bytes written to disk.
+    _last: (float, float): The time of the last sample and the total cpu time at it.
+    _samples: int: The number of samples taken.
+    _tree_rss_kb: int: The peak RSS of the tree in KB.
+    _peak_cpus: float: The peak number of cpus used by the tree.
+  """
+
+  PROC = '/proc'
+
+  # Whether the kernel lists the children of each thread (CONFIG_PROC_CHILDREN).
+  LISTS_CHILDREN = os.path.exists(os.path.join(PROC, str(os.getpid()), 'task', str(os.getpid()),
+                                               'children'))
+
+  # The counters of /proc/<pid>/io in the order of _io.
+  IO_COUNTERS = ['rchar', 'wchar', 'read_bytes', 'write_bytes']
+
+  CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+  PAGE_KB = os.sysconf('SC_PAGE_SIZE') // 1024
+
+  def __init__(self, interval):
+    self._interval = interval
+    self._pid = None
+    self._start_time = None
+    self._thread = None
+    self._stop = threading.Event()
+    self._cpu = {}
+    self._io = {}
+    self._last = None
+    self._samples = 0
+    self._tree_rss_kb = 0
+    self._peak_cpus = 0.0
+
+  def Start(self, pid):
+    """Starts sampling the tree of the process.
+
+    Args:
+      pid: int: The root of the tree.
+    """
+    self._pid = pid
+    self._thread = threading.Thread(target=self._Run)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def Stop(self):
+    """Stops sampling."""
+    self._stop.set()
+    if self._thread: self._thread.join()
+
+  def usage(self):
+    """Returns the usage of the tree.
+
+    Return:
+      dict: The usage with the keys: 'tree_rss_kb', 'read_chars', 'write_chars', 'read_bytes',
+          'write_bytes' and 'peak_cpus' if several samples were taken. Empty if no sample was
+          taken.
+    """
+    if not self._samples: return {}
+    io = [sum(x) for x in zip(*self._io.values())] or [0] * len(self.IO_COUNTERS)
+    usage = {'tree_rss_kb': self._tree_rss_kb, 'read_chars': io[0], 'write_chars': io[1],
+             'read_bytes': io[2], 'write_bytes': io[3]}
+    # The cpus used are only known between two samples.
+    if self._samples > 1: usage['peak_cpus'] = round(self._peak_cpus, 2)
+    return usage
+
+  @classmethod
+  def GetCpuTime(cls, usage):
+    """Returns: float: The cpu time in seconds of a task from its usage."""
+    return usage.get('utime', 0) + usage.get('stime', 0)
+
+  @classmethod
+  def GetPeakRssKb(cls, usage):
+    """Returns: int: The peak RSS in KB of the sampled tree of a task from its usage. 0 if the
+    task was not sampled."""
+    return usage.get('tree_rss_kb', 0)
+
+  @classmethod
+  def FormatUsage(cls, usage):
+    """Returns: string: The usage of a task in a readable form. Empty if nothing is known."""
+    parts = []
+    if 'utime' in usage: parts += ['cpu %.2fs' % cls.GetCpuTime(usage)]
+    if 'peak_cpus' in usage: parts += ['peak %.1f cpus' % usage['peak_cpus']]
+    if cls.GetPeakRssKb(usage):
+      parts += ['peak rss %s' % TaskResources.FormatSize(cls.GetPeakRssKb(usage) * 1024)]
+    if 'read_chars' in usage:
+      parts += ['read %s (disk %s)' % (TaskResources.FormatSize(usage['read_chars']),
+                                       TaskResources.FormatSize(usage['read_bytes'])),
+                'written %s (disk %s)' % (TaskResources.FormatSize(usage['write_chars']),
+                                          TaskResources.FormatSize(usage['write_bytes']))]
+    return ', '.join(parts)
+
+  def Sample(self):
+    """Takes a sample of the tree."""
+    now = time.time()
+    rss_kb = 0
+    for (pid, stat) in self._GetTree():
+      # The command may contain spaces and parentheses. The fields start after the last ')'.
+      fields = stat[stat.rfind(')') + 2:].split()
+      key = (pid, int(fields[19]))
+      self._cpu[key] = (int(fields[11]) + int(fields[12])) / float(self.CLOCK_TICKS)
+      rss_kb += int(fields[21]) * self.PAGE_KB
+      io = self._ReadIo(pid)
+      if io: self._io[key] = io
+
+    cpu = sum(self._cpu.values())
+    if self._last and now > self._last[0]:
+      self._peak_cpus = max(self._peak_cpus, (cpu - self._last[1]) / (now - self._last[0]))
+    self._last = (now, cpu)
+    self._tree_rss_kb = max(self._tree_rss_kb, rss_kb)
+    self._samples += 1
+
+  def _Run(self):
+    """Samples the tree until stopped."""
+    while True:
+      self.Sample()
+      if self._stop.wait(self._interval): break
+
+  def _GetTree(self):
+    """Returns: list((int, string)): The pid and the contents of /proc/<pid>/stat of each process
+    of the tree."""
+    if self.LISTS_CHILDREN:
+      stats = {}
+      get_children = self._ReadChildren
+    else:
+      (stats, children) = self._ScanProcs()
+      get_children = lambda pid: children.get(pid, [])
+
+    tree = []
+    pids = [self._pid]
+    while pids:
+      pid = pids.pop()
+      stat = stats.get(pid) or self._ReadFile(os.path.join(self.PROC, str(pid), 'stat'))
+      if not stat: continue
+      if pid == self._pid:
+        start_time = stat[stat.rfind(')') + 2:].split()[19]
+        if self._start_time is None: self._start_time = start_time
+        if start_time != self._start_time: return []
+      tree += [(pid, stat)]
+      pids += get_children(pid)
+    return tree
+
+  def _ReadChildren(self, pid):
+    """Returns: list(int): The children of the process, as listed for each of its threads."""
+    task_dir = os.path.join(self.PROC, str(pid), 'task')
+    try:
+      tids = os.listdir(task_dir)
+    except (IOError, OSError):
+      return []
+    children = []
+    for tid in tids:
+      children += [int(x) for x in
+                   (self._ReadFile(os.path.join(task_dir, tid, 'children')) or '').split()]
+    return children
+
+  def _ScanProcs(self):
+    """Reads the stat of every process.
+
+    Return:
+      (dict {int, string}, dict {int, list(int)}): The contents of /proc/<pid>/stat of each
+          process and the children of each process.
+    """
+    stats = {}
+    for name in os.listdir(self.PROC):
+      if not name.isdigit(): continue
+      stat = self._ReadFile(os.path.join(self.PROC, name, 'stat'))
+      if stat: stats[int(name)] = stat
+
+    children = {}
+    for (pid, stat) in stats.items():
+      ppid = int(stat[stat.rfind(')') + 2:].split()[1])
+      children.setdefault(ppid, []).append(pid)
+    return (stats, children)
+
+  def _ReadIo(self, pid):
+    """Returns: list(int): The io counters of the process. None if they cannot be read."""
+    contents = self._ReadFile(os.path.join(self.PROC, str(pid), 'io'))
+    if not contents: return None
+    counters = {}
+    for line in contents.splitlines():
+      (key, unused_sep, value) = line.partition(':')
+      counters[key.strip()] = value.strip()
+    try:
+      return [int(counters[x]) for x in self.IO_COUNTERS]
+    except (KeyError, ValueError):
+      return None
+
+  @classmethod
+  def _ReadFile(cls, filename):
+    """Returns: string: The contents of the file. None if the process is gone."""
+    try:
+      with open(filename) as f: return f.read()
+    except (IOError, OSError):
+      return None
@@ -0,0 +1,86 @@
+"""Tests for proc_sampler."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from pylib.zeus.proc_sampler import ProcSampler
+
+
+class ProcSamplerTest(unittest.TestCase):
+  """Tests for ProcSampler."""
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_sample_tree(self):
+    # The work is done by a child of the shell, so only sampling the tree sees it.
+    script = os.path.join(self.dir, 'task.py')
+    with open(script, 'w') as f:
+      f.write('import time\n'
+              'data = bytearray(64 * 1024 * 1024)\n'
+              'open(%r, "w").write("x" * 1024 * 1024)\n'
+              'end = time.time() + 0.5\n'
+              'while time.time() < end: pass\n' % os.path.join(self.dir, 'out'))
+    proc = subprocess.Popen('%s %s; true' % (sys.executable, script), shell=True)
+    sampler = ProcSampler(0.05)
+    sampler.Start(proc.pid)
+    proc.wait()
+    sampler.Stop()
+
+    usage = sampler.usage()
+    self.assertGreaterEqual(usage['tree_rss_kb'], 64 * 1024)
+    self.assertGreater(usage['peak_cpus'], 0.5)
+    self.assertGreaterEqual(usage['write_chars'], 1024 * 1024)
+
+  def test_children(self):
+    # A fake /proc with the root 10, its child 20 forked by its second thread, and 30 forked by
+    # 20. 40 is not in the tree.
+    proc = os.path.join(self.dir, 'proc')
+    for (pid, ppid, tids) in [(10, 1, [10, 11]), (20, 10, [20]), (30, 20, [30]), (40, 1, [40])]:
+      # The fields after the command: the state, the ppid, ..., the start time at index 19 and
+      # the RSS in pages at index 21.
+      fields = ['S', str(ppid)] + ['0'] * 17 + [str(pid * 100), '0', '1']
+      os.makedirs(os.path.join(proc, str(pid)))
+      with open(os.path.join(proc, str(pid), 'stat'), 'w') as f:
+        f.write('%d (a) b) %s\n' % (pid, ' '.join(fields)))
+      for tid in tids:
+        os.makedirs(os.path.join(proc, str(pid), 'task', str(tid)))
+        children = {11: '20', 20: '30'}.get(tid, '')
+        with open(os.path.join(proc, str(pid), 'task', str(tid), 'children'), 'w') as f:
+          f.write(children + ' ' if children else '')
+
+    # Walking down the children and scanning all the processes find the same tree.
+    for lists_children in [True, False]:
+      sampler = ProcSampler(1)
+      sampler.PROC = proc
+      sampler.LISTS_CHILDREN = lists_children
+      sampler._pid = 10
+      self.assertEqual(sorted(x for (x, unused_stat) in sampler._GetTree()), [10, 20, 30])
+      sampler.Sample()
+      self.assertEqual(sampler.usage()['tree_rss_kb'], 3 * ProcSampler.PAGE_KB)
+
+  def test_no_sample(self):
+    self.assertEqual(ProcSampler(1).usage(), {})
+
+  def test_format_usage(self):
+    self.assertEqual(
+        ProcSampler.FormatUsage({'utime': 1.5, 'stime': 0.5, 'peak_cpus': 2, 'tree_rss_kb': 2048,
+                                 'read_chars': 0, 'write_chars': 0, 'read_bytes': 0,
+                                 'write_bytes': 0}),
+        'cpu 2.00s, peak 2.0 cpus, peak rss 2.0MB, read 0.0B (disk 0.0B), '
+        'written 0.0B (disk 0.0B)')
+    self.assertEqual(ProcSampler.FormatUsage({}), '')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -5,22 +5,39 @@
 __author__ = 'pramodg@room77.com (Pramod Gupta)'
 __copyright__ = 'Copyright 2012 Room77, Inc.'
 
-import itertools
+import datetime
 import json
+import multiprocessing
 import os
+import queue
 import re
+import signal
+import smtplib
 import sys
 import time
 
 from pylib.base.flags import Flags
-from pylib.base.exec_utils import ExecUtils
+from pylib.base.exec_utils import ExecUtils, PicklableCallback
 from pylib.base.term_color import TermColor
 from pylib.file.file_utils import FileUtils
 from pylib.util.mail.mailer import Mailer
 
+from pylib.zeus.dated_dir_index import DatedDirIndex
+from pylib.zeus.history import History
+from pylib.zeus.journal import Journal
+from pylib.zeus.log_capture import LogCapture
+from pylib.zeus.mail_digest import MailDigest
 from pylib.zeus.pipeline_cmd_base import PipelineCmdBase
 from pylib.zeus.pipeline_config import PipelineConfig
 from pylib.zeus.pipeline_utils import PipelineUtils
+from pylib.zeus.proc_sampler import ProcSampler
+from pylib.zeus.stage_link import StageLinks
+from pylib.zeus.status_server import StatusServer
+from pylib.zeus.task_cache import TaskCache
+from pylib.zeus.task_graph import TaskGraph
+from pylib.zeus.task_manifest import TaskManifest
+from pylib.zeus.task_resources import ResourceScheduler, TaskResources
+from pylib.zeus.task_shards import TaskShards
 
 class Runner(PipelineCmdBase):
   """Class to handle run."""
@@ -48,6 +65,26 @@ class Runner(PipelineCmdBase):
     3: 'ABORT',
   }
 
+  # Tasks need this many successful runs in the history before they are reported as slow.
+  SLOW_TASK_MIN_RUNS = 3
+  # Tasks are only reported as slow if they take this many seconds longer than their median.
+  SLOW_TASK_MIN_EXCESS = 10
+
+  # The number of lines at the end of the log of a failed task to show.
+  FAILURE_TAIL_LINES = 20
+
+  # Interval in seconds to wake up linked tasks blocked on the pipe of a task that finished.
+  PIPE_UNBLOCK_INTERVAL = 1
+
+  # The number of tasks using the most cpu to report the usage of at the end of the run.
+  USAGE_REPORT_TASKS = 10
+
+  # The output of a task that could not allocate memory contains one of these.
+  OUT_OF_MEMORY_MESSAGES = ('Cannot allocate memory', 'MemoryError', 'OutOfMemoryError',
+                            'std::bad_alloc', 'out of memory')
+  # A failed task only ran out of memory if its peak RSS reached this fraction of its limit.
+  OUT_OF_MEMORY_RSS_FRACTION = 0.8
+
   TASK_OPTIONS = {
     # Default option. Task will run regardless of if earlier tasks in the directory
     # were successful or not. Task will not run if any task across the pipeline was
@@ -85,6 +122,68 @@ class Runner(PipelineCmdBase):
     parser.add_argument('--mail_domain', type=str, default='corp.room77.com',
                         help='The domain to use when sending automated '
                              'pipeline mail.')
+    parser.add_argument('--smtp_host', type=str, default='localhost',
+                        help='The SMTP server to send the mails with.')
+    parser.add_argument('--smtp_port', type=int, default=0,
+                        help='The port of the SMTP server. 0 for the default port.')
+    parser.add_argument('--mail_digest', action='store_true', default=False,
+                        help='Batch the mails for the tasks into digests instead of sending a '
+                        'mail per task. Failures of abort_fail tasks are still sent right away.')
+    parser.add_argument('--mail_digest_interval', type=float, default=0,
+                        help='Interval in seconds to send the digest at. 0 sends it whenever all '
+                        'the tasks of a priority level are done.')
+    parser.add_argument('--mail_tail_lines', type=int, default=100,
+                        help='The number of lines at the end of the output of a task to include '
+                        'in the digests and in the mails of sharded tasks. Without --mail_digest, '
+                        'the mail for a task has all its output.')
+    parser.add_argument('--nolog_compression', action='store_true', default=False,
+                        help='Write the logs of the tasks uncompressed.')
+    parser.add_argument('--log_head_size', type=str, default='1g',
+                        help='Keep at most this much of the start of the output of a task in its '
+                        'log, e.g. 512m. 0 keeps all the output.')
+    parser.add_argument('--log_tail_size', type=str, default='16m',
+                        help='Also keep this much of the end of the output of a task in its log '
+                        'when the output is longer than --log_head_size.')
+    parser.add_argument('--task_cache_dir', type=str, default='',
+                        help='The dir to cache the outputs of tasks with a .cache sidecar in. '
+                        'Defaults to .cache in the pipeline output dir.')
+    parser.add_argument('--notask_cache', action='store_true', default=False,
+                        help='Always run tasks with a .cache sidecar and do not cache their '
+                        'outputs.')
+    parser.add_argument('--slow_task_factor', type=float, default=2.0,
+                        help='Warn when a task runs this many times longer than its median '
+                        'duration over the recent runs. 0 disables the warning.')
+    parser.add_argument('--progress_interval', type=float, default=60,
+                        help='Interval in seconds to log the progress and ETA of the run.')
+    parser.add_argument('--cpu_budget', type=int, default=0,
+                        help='The number of cpu slots shared by the running tasks. Tasks use 1 '
+                        'slot unless they declare more in a .resources file. Defaults to the pool '
+                        'size.')
+    parser.add_argument('--mem_budget', type=str, default='',
+                        help='The memory shared by the running tasks, e.g. 64g. Tasks declare '
+                        'their memory in a .resources file.')
+    parser.add_argument('--min_free_mem', type=str, default='0',
+                        help='Only start a task if this much memory remains available on the '
+                        'machine after its declared memory, e.g. 2g.')
+    parser.add_argument('--max_load', type=float, default=0,
+                        help='Only start a task if the 1 minute load average is below this. 0 '
+                        'for no max.')
+    parser.add_argument('--mem_limit_factor', type=float, default=1.5,
+                        help='Limit the data size (RLIMIT_DATA) of each process of the tasks '
+                        'that declare their memory to this many times the declared memory. '
+                        'Unlike the address space, it does not count file mappings and reserved '
+                        'address space, e.g. of JVM and Go heaps. But it applies to each process '
+                        'of a task on its own and counts allocated memory that is not resident '
+                        'yet. 0 for no limit.')
+    parser.add_argument('--sample_interval', type=float, default=1,
+                        help='Interval in seconds to sample the cpu, memory and io of the process '
+                        'tree of each task from /proc. 0 disables the sampling.')
+    parser.add_argument('--status_port', type=int, default=0,
+                        help='Serve the live status of the run over HTTP on this port. 0 '
+                        'disables the status server.')
+    parser.add_argument('--status_host', type=str, default='localhost',
+                        help='The host to serve the live status of the run on.')
+    History.AddArguments(parser)
 
   @classmethod
   def WorkHorse(cls, tasks):
@@ -104,87 +203,270 @@ class Runner(PipelineCmdBase):
 
     os.chdir(FileUtils.GetSrcRoot())
     cls._CreateDirsForTasks(tasks)
+    (graph, dir_deps) = cls._CreateTaskGraph(tasks)
+    # Index the dated output dirs once. The forked workers share the index.
+    DatedDirIndex.Instance().Load(cls._GetDatedDirParents(graph.tasks()))
 
     successful_run = []; failed_run = []
     aborted_task = None
+    # The usage of each task that ran.
+    task_usage = {}
 
     # NOTE(stephen): Storing task dir status and task out dir status separately since
     # pipelines do not always have an out dir defined.
-    dirs_status = {}
     out_dirs_status = {}
-    for set_tasks in tasks.values():
-      if aborted_task:
-        failed_run += set_tasks
-        continue
-
-      tasks_to_run = []
-      for task in set_tasks:
-        task_options = cls.__GetTaskOptions(task)
-        # Check if this task requires all previous tasks in the same directory to be
-        # successful.
-        if task_options[Runner.TASK_OPTIONS['REQUIRE_DIR_SUCCESS']]:
-          task_dir = PipelineUtils.TaskDirName(task)
-          cur_dir_status = dirs_status.get(task_dir)
-          # If any previous tasks have been run in this directory, check to ensure all
-          # of them were successful.
-          if cur_dir_status and cur_dir_status != Runner.EXITCODE['SUCCESS']:
-            failed_run += [task]
-            task_display_name = PipelineUtils.TaskDisplayName(task)
-            TermColor.Info('Skipped   %s' % task_display_name)
-            TermColor.Failure(
-              'Skipped Task: %s due to earlier failures in task dir' % task_display_name
-            )
+    # The number of tasks in each out dir that have not finished yet. The status of an out dir is
+    # written as soon as all its tasks are done.
+    out_dirs_pending = {}
+    for task in graph.tasks():
+      out_dir = PipelineUtils.GetOutDirForTask(task)
+      if out_dir: out_dirs_pending[out_dir] = out_dirs_pending.get(out_dir, 0) + 1
+
+    # The status server must run before the pool is forked, so that the workers can send it the
+    # tails of their logs.
+    status = cls._CreateStatusServer(cls._GetMailSubjectPrefix(),
+                                     [cls._GetTaskDisplayName(x) for x in graph.tasks()])
+
+    # Start each task as soon as all its dependencies have finished. A single pool is used for the
+    # whole run and the results are streamed back through a queue as the tasks complete.
+    pool_size = Flags.ARGS.pool_size or max(multiprocessing.cpu_count(), 1)
+    # NOTE(stephen): Require use of `fork` for multiprocessing instead of `spawn` since
+    # there are issues with the reuse of some libraries (like Flags) when `spawn` is
+    # used.
+    # Linked tasks must all run at the same time, so the pool must fit the longest chain of them.
+    links = StageLinks.Instance()
+    max_group = max([len(links.GetGroup(x) or []) for x in graph.tasks()] + [1])
+    pool = multiprocessing.get_context('fork').Pool(processes=max(pool_size, max_group))
+    completed = queue.Queue()
+    running = {}
+    # Sharded tasks run a process per shard. The slots of the pool held by each running task.
+    shard_counts = {x: cls._GetShardCount(x, pool_size) for x in graph.tasks()}
+    slots = {}
+    # The results of the shards of the running sharded tasks, and of the tasks running their
+    # merge step.
+    shard_results = {}
+    # Checkpoint each finished task so that 'zeus continue' can resume the run.
+    journal = cls._OpenJournal()
+    # Record the run in the history. The durations of earlier runs are used to start the longest
+    # tasks first, to estimate the time left and to detect slow tasks.
+    history = History.Open()
+    durations = {}
+    if history:
+      history.StartRun(PipelineConfig.Instance().pipeline_id(),
+                       PipelineConfig.Instance().pipeline_date(), start)
+      durations = cls._GetMedianDurations(history, graph.tasks())
+    # The tasks already reported as slow.
+    slow_tasks = set()
+    last_progress = time.time()
+    # Admit the ready tasks only when the resources they declare are available.
+    scheduler = cls._CreateResourceScheduler(pool_size)
+    resources = {x: cls._LoadTaskResources(x, shard_counts[x]) for x in graph.tasks()}
+    # The tasks already reported as waiting for resources.
+    waiting = set()
+    # Batch the mails for the tasks. The number of unfinished tasks per priority level is tracked
+    # to send the digest at the end of each level.
+    digest = None
+    if Flags.ARGS.mail_digest:
+      digest = MailDigest(PipelineUtils.ZeusEmailId(Flags.ARGS.mail_domain),
+                          cls._GetMailSubjectPrefix(), Flags.ARGS.smtp_host, Flags.ARGS.smtp_port)
+    task_levels = {x: k for (k, v) in tasks.items() for x in v}
+    levels_pending = {k: len(v) for (k, v) in tasks.items()}
+    try:
+      while True:
+        ready = [] if aborted_task else cls._SortByDuration(graph.GetReadyTasks(), durations)
+        # The ready tasks that cannot start yet and the resources reserved by the first of them
+        # blocked by the budget.
+        blocked = set()
+        reserved = None
+        while ready and sum(slots.values()) < pool_size:
+          task = ready.pop(0)
+          # Linked tasks start together once all of them are ready.
+          group = links.GetGroup(task) or [task]
+          if any(x != task and x not in ready for x in group):
+            blocked.add(task)
+            continue
+          # Keep the pool for the chain or the shards instead of filling it with smaller tasks.
+          if running and sum(slots.values()) + sum(shard_counts[x] for x in group) > pool_size:
+            break
+          ready = [x for x in ready if x not in group]
+
+          skip_reason = next((y for y in [cls._GetSkipReason(x, graph, dir_deps.get(x, set()))
+                                          for x in group] if y), None)
+          if skip_reason:
+            for x in group:
+              failed_run += [x]
+              graph.Finish(x, Runner.EXITCODE['FAILURE'])
+              cls._UpdateOutDirStatus(x, None, out_dirs_status, out_dirs_pending)
+              if journal:
+                now = time.time()
+                journal.Record(x, 'SKIPPED', Runner.EXITCODE['FAILURE'], now, now, skip_reason)
+              if status: status.Finish(cls._GetTaskDisplayName(x), False, 'SKIPPED', skip_reason)
+              task_display_name = PipelineUtils.TaskDisplayName(x)
+              TermColor.Info('Skipped   %s' % task_display_name)
+              TermColor.Failure('Skipped Task: %s due to %s' % (task_display_name, skip_reason))
+              cls._UpdateDigest(digest, x, task_levels, levels_pending)
+            # Skipping a task may make its dependents ready.
+            ready = [x for x in cls._SortByDuration(graph.GetReadyTasks(), durations)
+                     if x not in blocked]
             continue
 
-        tasks_to_run.append(task)
-
-      # It is possible for all steps at this priority level to be skipped due to the
-      # task options selected.
-      if set_tasks and not tasks_to_run:
-        continue
-
-      # Run all the tasks at the same priority in parallel.
-      args = zip(itertools.repeat(cls), itertools.repeat('_RunSingeTask'),
-                            tasks_to_run)
-      task_res = ExecUtils.ExecuteParallel(args, Flags.ARGS.pool_size)
-      # task_res = []
-      # for task in tasks_to_run: task_res += [cls._RunSingeTask(task)]
-      if not task_res:
-        TermColor.Error('Could not process: %s' % tasks_to_run)
-        failed_run += tasks_to_run
-        continue
-      for (res, task) in task_res:
-        if res == Runner.EXITCODE['SUCCESS']:
-          successful_run += [task]
-        elif res == Runner.EXITCODE['FAILURE']:
-          failed_run += [task]
-        elif res == Runner.EXITCODE['ALLOW_FAIL']:
-          failed_run += [task]
-        elif res == Runner.EXITCODE['ABORT_FAIL']:
-          failed_run += [task]
-          aborted_task = task
-        else:
-          TermColor.Fatal('Invalid return %d code for %s' % (res, task))
-
-        # Update the current status of all tasks in the same directory.
-        task_dir = PipelineUtils.TaskDirName(task)
-        dirs_status[task_dir] = max(
-          dirs_status.get(task_dir, Runner.EXITCODE['_LOWEST']), res,
-        )
-
-        # Update the out dir status.
-        out_dir = PipelineUtils.GetOutDirForTask(task)
-        if out_dir:
-          out_dirs_status[out_dir] = max(
-            out_dirs_status.get(out_dir, Runner.EXITCODE['_LOWEST']), res,
-          )
+          group_resources = resources[task]
+          if len(group) > 1:
+            group_resources = TaskResources(
+                sum(resources[x].mem for x in group), sum(resources[x].cpus for x in group),
+                set().union(*[resources[x].exclusive for x in group]))
+          block_reason = scheduler.GetBlockReason(group_resources, reserved)
+          if block_reason:
+            blocked.add(task)
+            if not reserved and block_reason in ResourceScheduler.BUDGET_REASONS:
+              reserved = group_resources
+            if task not in waiting:
+              waiting.add(task)
+              TermColor.VInfo(1, 'Waiting   %s for %s' % (PipelineUtils.TaskDisplayName(task),
+                                                        block_reason))
+            continue
 
-    # Write the status files to the dirs.
-    cls._WriteOutDirsStatus(out_dirs_status)
+          if len(group) > 1: links.Open(group)
+          for x in group:
+            scheduler.Acquire(x, resources[x])
+            graph.Start(x)
+            running[x] = time.time()
+            slots[x] = shard_counts[x]
+            if status: status.Start(cls._GetTaskDisplayName(x))
+            if shard_counts[x] == 1:
+              cls._SubmitTask(pool, completed, x)
+              continue
+            for shard_index in range(shard_counts[x]):
+              cls._SubmitTask(pool, completed, x, shard_index, shard_counts[x])
+
+        if status: status.Queue([cls._GetTaskDisplayName(x) for x in set(ready) | blocked])
+        if not running: break
+
+        try:
+          timeout = None
+          if Flags.ARGS.progress_interval:
+            timeout = max(last_progress + Flags.ARGS.progress_interval - time.time(), 0)
+          # Check regularly for linked tasks blocked on the pipe of a task that finished.
+          if links.Unblock():
+            timeout = min(timeout, cls.PIPE_UNBLOCK_INTERVAL) if timeout is not None else \
+                cls.PIPE_UNBLOCK_INTERVAL
+          (res, task, usage) = completed.get(timeout=timeout)
+        except queue.Empty:
+          if (Flags.ARGS.progress_interval and
+              time.time() >= last_progress + Flags.ARGS.progress_interval):
+            cls._ReportProgress(graph, running, durations, slow_tasks, pool_size)
+            last_progress = time.time()
+          if digest and Flags.ARGS.mail_digest_interval:
+            digest.FlushIfDue(Flags.ARGS.mail_digest_interval)
+          continue
+
+        if isinstance(res, BaseException):
+          TermColor.Error('Could not process: %s. %s: %s' % (task, type(res), res))
+          res = Runner.EXITCODE['FAILURE']
+        if shard_counts[task] > 1:
+          # A sharded task finishes once all its shards and its merge step did.
+          if usage.get('merge'):
+            (res, usage) = TaskShards.CombineResults(shard_results.pop(task) + [(res, usage)])
+          else:
+            shard_results.setdefault(task, []).append((res, usage))
+            if len(shard_results[task]) < shard_counts[task]: continue
+            (res, usage) = TaskShards.CombineResults(shard_results.pop(task))
+            if res == Runner.EXITCODE['SUCCESS'] and TaskShards.GetMergeFile(task):
+              # The merge step is a single process.
+              shard_results[task] = [(res, usage)]
+              slots[task] = 1
+              scheduler.Release(task)
+              scheduler.Acquire(task, TaskResources.Load(task))
+              cls._SubmitTask(pool, completed, task, None, shard_counts[task])
+              continue
+
+        task_start = running.pop(task)
+        task_end = time.time()
+        slots.pop(task)
+        scheduler.Release(task)
+        finished = [(res, task, usage, task_start, task_end)]
+        if links.GetGroup(task):
+          # The results of linked tasks are handled once the whole chain finished. If any of them
+          # failed, all of them fail.
+          chain = links.Finish(task, finished[0], res != Runner.EXITCODE['SUCCESS'])
+          finished = []
+          for ((res, task, usage, task_start, task_end), failed_task) in chain:
+            if failed_task and failed_task != task and res == Runner.EXITCODE['SUCCESS']:
+              res = Runner.EXITCODE['FAILURE']
+              usage['reason'] = 'linked task %s failed' % PipelineUtils.TaskDisplayName(failed_task)
+              TermColor.Failure('Failed Task: %s as %s' % (PipelineUtils.TaskDisplayName(task),
+                                                         usage['reason']))
+            finished += [(res, task, usage, task_start, task_end)]
+
+        for (res, task, usage, task_start, task_end) in finished:
+          graph.Finish(task, res)
+          if journal:
+            journal.Record(task, Runner.EXITCODE_DESCRIPTION.get(res, str(res)), res, task_start,
+                           task_end, usage.get('reason'))
+          if status:
+            status.Finish(cls._GetTaskDisplayName(task), res == Runner.EXITCODE['SUCCESS'],
+                          Runner.EXITCODE_DESCRIPTION.get(res, str(res)), usage.get('reason'))
+          if history:
+            history.RecordTask(PipelineUtils.TaskRelativeName(task), task_start,
+                               task_end - task_start, res, ProcSampler.GetPeakRssKb(usage) or None,
+                               usage.get('log_size'), usage.get('cached', False))
+          if not usage.get('cached'):
+            cls._CheckSlowTask(task, task_end - task_start, durations, slow_tasks)
+            task_usage[task] = usage
+
+          if res == Runner.EXITCODE['SUCCESS']:
+            successful_run += [task]
+          elif res == Runner.EXITCODE['FAILURE']:
+            failed_run += [task]
+          elif res == Runner.EXITCODE['ALLOW_FAIL']:
+            failed_run += [task]
+          elif res == Runner.EXITCODE['ABORT_FAIL']:
+            failed_run += [task]
+            aborted_task = task
+          else:
+            TermColor.Fatal('Invalid return %d code for %s' % (res, task))
+
+          cls._UpdateOutDirStatus(task, res, out_dirs_status, out_dirs_pending)
+          # The mails of sharded tasks are sent once for all the shards.
+          if usage.get('mail'):
+            (receiver, body) = usage['mail']
+            if digest and res != Runner.EXITCODE['ABORT_FAIL']:
+              digest.Add(receiver, Runner.EXITCODE_DESCRIPTION.get(res, str(res)),
+                         PipelineUtils.TaskDisplayName(task), body)
+            else:
+              cls._SendMail(receiver, cls._GetMailSubjectForTask(task, res), body)
+          cls._UpdateDigest(digest, task, task_levels, levels_pending)
+      pool.close()
+      pool.join()
+    except KeyboardInterrupt:
+      pool.terminate()
+      raise
+    finally:
+      if journal: journal.Close()
+      if status: status.Stop()
+      links.Close()
+
+    # Tasks left at this point were either not started due to an abort or are blocked by a
+    # dependency cycle.
+    pending = graph.GetPendingTasks()
+    if pending and not aborted_task:
+      TermColor.Error('Could not run tasks blocked by cyclic dependencies: %s' %
+                      PipelineUtils.TasksDisplayNames(pending))
+    failed_run += pending
+
+    if history:
+      history.FinishRun(time.time(), len(successful_run), len(failed_run))
+      history.Close()
+
+    # Write the status of the out dirs with tasks that were never run.
+    cls._WriteOutDirsStatus({k: v for (k, v) in out_dirs_status.items()
+                             if out_dirs_pending.get(k)})
 
     # Send the final status mail.
+    if digest: digest.Flush()
     time_taken = time.time() - start
-    cls._SendFinalStatusMail(successful_run, failed_run, aborted_task, time_taken)
+    if task_usage: TermColor.Info(cls._GetUsageReport(task_usage))
+    cls._SendFinalStatusMail(successful_run, failed_run, aborted_task, time_taken, task_usage)
 
     if aborted_task:
       TermColor.Failure('Aborted by task: %s' % aborted_task)
@@ -200,39 +482,348 @@ class Runner(PipelineCmdBase):
           priority. Note: the dict is ordered by priority.
 
     """
+    # Most tasks share their dir with other tasks. Create the dirs for each of them only once.
+    rel_paths = set()
+    for set_tasks in tasks.values():
+      rel_paths |= set([TaskManifest.Instance().GetOutputRelativeDir(x) for x in set_tasks])
+    for rel_path in rel_paths:
+      PipelineConfig.Instance().CreateAllSubDirsForPath(rel_path)
+
+  @classmethod
+  def _GetDatedDirParents(cls, tasks):
+    """Returns the parents of the dated output dirs for the tasks.
+
+    Args:
+      tasks: list: The tasks.
+
+    Return:
+      set(string): The dirs containing the dated output dirs of the tasks.
+    """
+    parents = set()
+    for rel_path in set([TaskManifest.Instance().GetOutputRelativeDir(x) for x in tasks]):
+      for v in PipelineConfig.Instance().GetAllSubDirsForPath(rel_path).values():
+        parents.add(os.path.dirname(v))
+    return parents
+
+  @classmethod
+  def _CreateTaskGraph(cls, tasks):
+    """Creates the dependency graph for the tasks.
+
+    Args:
+      tasks: OrderedDict {int, set(string)}: Dict from priority to set of tasks to execute at the
+          priority. Note: the dict is ordered by priority.
+
+    Return:
+      (TaskGraph, dict {string, set(string)}): The graph and the earlier tasks in the same dir for
+          each task that requires dir success.
+    """
+    graph = TaskGraph(tasks, PipelineConfig.Instance().pipeline_base_dir())
+    for cycle in graph.FindCycles():
+      TermColor.Error('Dependency cycle: %s' %
+                      ' -> '.join(PipelineUtils.TasksDisplayNames(cycle + cycle[:1])))
+    dir_deps = {}
+    earlier_dir_tasks = {}
     for set_tasks in tasks.values():
       for task in set_tasks:
-        rel_path = PipelineUtils.GetTaskOutputRelativeDir(task)
-        PipelineConfig.Instance().CreateAllSubDirsForPath(rel_path)
+        if not cls._GetTaskOptions(task)[Runner.TASK_OPTIONS['REQUIRE_DIR_SUCCESS']]: continue
+        # The task must wait for all earlier tasks in the same dir to know if they succeeded.
+        dir_deps[task] = set(earlier_dir_tasks.get(PipelineUtils.TaskDirName(task), set()))
+        for dep in dir_deps[task]: graph.AddOrderDep(task, dep)
+      for task in set_tasks:
+        earlier_dir_tasks.setdefault(PipelineUtils.TaskDirName(task), set()).add(task)
+
+    # Linked tasks run at the same time instead of one after the other.
+    links = StageLinks.Instance()
+    links.Load(graph.tasks(), PipelineConfig.Instance().pipeline_base_dir())
+    for (consumer, producer) in links.links():
+      graph.RemoveDep(consumer, producer)
+      dir_deps.get(consumer, set()).discard(producer)
+    return (graph, dir_deps)
+
+  @classmethod
+  def _GetSkipReason(cls, task, graph, dir_deps):
+    """Checks if a ready task must be skipped.
+
+    Args:
+      task: string: The task to check.
+      graph: TaskGraph: The graph of the run.
+      dir_deps: set(string): The earlier tasks in the same dir that must succeed for the task.
+
+    Return:
+      string: The reason to skip the task. None if the task should run.
+    """
+    failed_dep = graph.GetFailedDep(
+        task, [Runner.EXITCODE['SUCCESS'], Runner.EXITCODE['ALLOW_FAIL']])
+    if failed_dep:
+      return 'failed dependency %s' % PipelineUtils.TaskDisplayName(failed_dep)
+    # Check if all previous tasks in the same directory were successful.
+    if any(graph.status(x) != Runner.EXITCODE['SUCCESS'] for x in dir_deps):
+      return 'earlier failures in task dir'
+    return None
+
+  @classmethod
+  def _SubmitTask(cls, pool, completed, task, shard_index=None, shard_count=None):
+    """Submits a task, or a shard of a task, to the pool.
+
+    Args:
+      pool: Pool: The pool of the run.
+      completed: Queue: The queue the result is put in.
+      task: string: The task.
+      shard_index: int: The shard to run. None to run the merge step of a sharded task.
+      shard_count: int: The number of shards of the task. None if the task is not sharded.
+    """
+    args = (cls, '_RunSingeTask', task)
+    if shard_count: args += (shard_index, shard_count)
+    usage = {'merge': True} if shard_count and shard_index is None else {}
+    pool.apply_async(PicklableCallback(), [args], callback=completed.put,
+                     error_callback=lambda e: completed.put((e, task, usage)))
+
+  @classmethod
+  def _GetShardCount(cls, task, pool_size):
+    """Returns: int: The number of shards of the task. 1 if it is not sharded. See TaskShards."""
+    shard_count = TaskShards.GetShardCount(task, pool_size)
+    if shard_count > 1 and StageLinks.Instance().GetGroup(task):
+      TermColor.Warning('Not sharding %s as it is linked to other tasks.' %
+                        PipelineUtils.TaskDisplayName(task))
+      return 1
+    return shard_count
+
+  @classmethod
+  def _LoadTaskResources(cls, task, shard_count):
+    """Returns: TaskResources: The resources of the task for all of its shards."""
+    resources = TaskResources.Load(task)
+    if shard_count == 1: return resources
+    return TaskResources(resources.mem * shard_count, resources.cpus * shard_count,
+                         resources.exclusive)
+
+  @classmethod
+  def _CreateStatusServer(cls, title, tasks):
+    """Creates the server for the live status of the run if required.
+
+    Args:
+      title: string: The title of the status.
+      tasks: list(string): The display names of the tasks of the run in priority order.
+
+    Return:
+      StatusServer: The server. None if there is none.
+    """
+    if not Flags.ARGS.status_port: return None
+    try:
+      return StatusServer(Flags.ARGS.status_host, Flags.ARGS.status_port, title, tasks)
+    except OSError as e:
+      TermColor.Error('Could not serve the status on port %d. Error: %s' %
+                      (Flags.ARGS.status_port, e))
+      return None
+
+  @classmethod
+  def _CreateResourceScheduler(cls, pool_size, check_machine=True):
+    """Creates the scheduler for the resource budget of the run.
+
+    Args:
+      pool_size: int: The number of tasks run in parallel.
+      check_machine: bool: Also check the memory available and the load of the machine.
+
+    Return:
+      ResourceScheduler: The scheduler.
+    """
+    try:
+      mem_budget = TaskResources.ParseSize(Flags.ARGS.mem_budget) if Flags.ARGS.mem_budget else 0
+      min_free_mem = TaskResources.ParseSize(Flags.ARGS.min_free_mem)
+    except ValueError as e:
+      TermColor.Fatal('Invalid memory flag: %s' % e)
+    return ResourceScheduler(Flags.ARGS.cpu_budget or pool_size, mem_budget, min_free_mem,
+                             Flags.ARGS.max_load, check_machine)
 
   @classmethod
-  def _RunSingeTask(cls, task):
+  def _GetMedianDurations(cls, history, tasks):
+    """Returns the median durations of the tasks in the recent runs.
+
+    Args:
+      history: History: The history of the pipeline.
+      tasks: list: The tasks.
+
+    Return:
+      dict {string, (float, int)}: The task to its median duration and the number of runs it is
+          computed from. Tasks without history are left out.
+    """
+    # The history is keyed by the relative task names so that it is independent of the root.
+    rel_tasks = {PipelineUtils.TaskRelativeName(x): x for x in tasks}
+    return {rel_tasks[k]: v for (k, v) in history.GetMedianDurations(list(rel_tasks)).items()}
+
+  @classmethod
+  def _SortByDuration(cls, tasks, durations):
+    """Sorts the ready tasks so that the longest tasks start first and do not end up holding up
+    the run at the end. Tasks without history go first as they may be long as well.
+
+    Args:
+      tasks: list: The ready tasks in the order of the graph.
+      durations: dict {string, (float, int)}: The median duration of the tasks.
+
+    Return:
+      list: The sorted tasks.
+    """
+    return sorted(tasks, key=lambda x: -durations[x][0] if x in durations else -float('inf'))
+
+  @classmethod
+  def _CheckSlowTask(cls, task, duration, durations, slow_tasks):
+    """Warns if a task is running much longer than in the recent runs.
+
+    Args:
+      task: string: The task.
+      duration: float: The time the task has taken so far.
+      durations: dict {string, (float, int)}: The median duration of the tasks.
+      slow_tasks: set(string): The tasks already reported. Each task is reported once.
+    """
+    if not Flags.ARGS.slow_task_factor or task in slow_tasks or task not in durations: return
+    (median, count) = durations[task]
+    # The median of a couple of runs is not meaningful and short tasks are too noisy.
+    if count < cls.SLOW_TASK_MIN_RUNS or duration - median < cls.SLOW_TASK_MIN_EXCESS: return
+    if duration <= median * Flags.ARGS.slow_task_factor: return
+    slow_tasks.add(task)
+    TermColor.Warning('Slow task: %s has taken %.2fs. Its median over the last %d runs is %.2fs.' %
+                      (PipelineUtils.TaskDisplayName(task), duration, count, median))
+
+  @classmethod
+  def _ReportProgress(cls, graph, running, durations, slow_tasks, pool_size):
+    """Logs the progress of the run with an estimate of the time left and warns about running
+    tasks that are slow.
+
+    Args:
+      graph: TaskGraph: The graph of the run.
+      running: dict {string, float}: The running tasks to the time they started at.
+      durations: dict {string, (float, int)}: The median duration of the tasks.
+      slow_tasks: set(string): The tasks already reported as slow.
+      pool_size: int: The number of tasks run in parallel.
+    """
+    now = time.time()
+    pending = graph.GetPendingTasks()
+    msg = 'Progress: %d/%d tasks done, %d running.' % (
+        len(graph.tasks()) - len(pending) - len(running), len(graph.tasks()), len(running))
+    if durations:
+      remaining = {x: durations[x][0] for x in pending if x in durations}
+      remaining.update({x: max(durations[x][0] - (now - y), 0)
+                        for (x, y) in running.items() if x in durations})
+      eta = cls._GetEta(graph, remaining, pool_size)
+      unknown = len([x for x in pending + list(running) if x not in durations])
+      msg += ' ETA: %s' % datetime.timedelta(seconds=int(eta))
+      if unknown: msg += ' (%d tasks without history)' % unknown
+    TermColor.Info(msg)
+
+    for (task, task_start) in running.items():
+      cls._CheckSlowTask(task, now - task_start, durations, slow_tasks)
+
+  @classmethod
+  def _GetEta(cls, graph, remaining, pool_size):
+    """Estimates the time left for the run. The run takes at least as long as the longest chain
+    of dependent tasks left and as long as the work left spread over the pool.
+
+    Args:
+      graph: TaskGraph: The graph of the run.
+      remaining: dict {string, float}: The unfinished tasks to the time they are expected to take.
+      pool_size: int: The number of tasks run in parallel.
+
+    Return:
+      float: The estimated time left in seconds.
+    """
+    # The time from now until each task is expected to finish.
+    finish = {}
+    # The tasks on the current path of the search.
+    visiting = set()
+    for task in remaining:
+      stack = [task]
+      while stack:
+        x = stack[-1]
+        if x in finish:
+          stack.pop()
+        elif x not in visiting:
+          visiting.add(x)
+          # Deps on the current path are part of a cycle and never run.
+          stack += [y for y in graph.deps(x)
+                    if y in remaining and y not in finish and y not in visiting]
+        else:
+          stack.pop()
+          visiting.remove(x)
+          finish[x] = remaining[x] + max([finish.get(y, 0) for y in graph.deps(x)] + [0])
+    return max(max(finish.values()) if finish else 0, sum(remaining.values()) / pool_size)
+
+  @classmethod
+  def _RunSingeTask(cls, task, shard_index=None, shard_count=None):
     """Runs a Single Task.
 
     Args:
       task: string: The task to run.
+      shard_index: int: The shard of the task to run. None to run the merge step of a sharded
+          task.
+      shard_count: int: The number of shards of the task. None if the task is not sharded.
 
     Return:
-      (EXITCODE, string): Returns a tuple of the result status and the task.
+      (EXITCODE, string, dict): Returns a tuple of the result status, the task and its usage:
+          'utime', 'stime', the sampled usage of its tree (see ProcSampler),
+          'log_size', 'cached', 'merge' and 'mail' if the runner sends it.
     """
-    TermColor.Info('Executing %s' % PipelineUtils.TaskDisplayName(task))
-    task_vars = cls.__GetEnvVarsForTask(task)
+    display_name = cls._GetTaskDisplayName(task)
+    if shard_count: display_name += ' [%s]' % TaskShards.GetShardName(shard_index)
+    TermColor.Info('Executing %s' % display_name)
+    task_vars = cls._GetEnvVarsForTask(task)
+    if shard_count: task_vars.update(TaskShards.GetEnvVars(shard_index, shard_count))
     TermColor.VInfo(4, 'VARS: \n%s' % task_vars)
 
     task_cmd = task
-    pipe_output = True
     log_file = PipelineUtils.GetLogFileForTask(task)
-    if log_file:
-       task_cmd += ' > ' + PipelineUtils.GetLogFileForTask(task) + ' 2>&1'
-       pipe_output = False
-
-    timeout = cls.__GetTimeOutForTask(task)
+    if shard_count:
+      if shard_index is None: task_cmd = TaskShards.GetMergeFile(task)
+      log_file = TaskShards.GetLogFile(log_file, shard_index)
+
+    # The shards write different parts of the outputs, so they cannot be restored one by one.
+    task_cache = None if shard_count else cls._GetTaskCache(task, task_vars)
+    if task_cache:
+      if task_cache.Restore():
+        TermColor.Info('Restored  %s from cache [%s]' % (display_name, task_cache.key()))
+        return (Runner.EXITCODE['SUCCESS'], task, {'cached': True})
+      task_cache.RemoveOutputs()
+
+    # Limit the memory of the task if it declares how much it needs. See --mem_limit_factor.
+    mem_limit = int(TaskResources.Load(task).mem * Flags.ARGS.mem_limit_factor)
+    if mem_limit: task_cmd = 'ulimit -d %d; %s' % (mem_limit // 1024, task_cmd)
+
+    # Stream the output of the task to its log, and its last lines to the status server if any.
+    tail_listener = None
+    if Flags.ARGS.status_port:
+      part = TaskShards.GetShardName(shard_index) if shard_count else ''
+      tail_listener = lambda tail: StatusServer.PostTail(cls._GetTaskDisplayName(task), part,
+                                                         tail)
+    log_capture = cls._CreateLogCapture(log_file, tail_listener) if log_file else None
+    if log_capture: log_file = log_capture.filename()
+
+    timeout = cls._GetTimeOutForTask(task)
     start = time.time()
-    (status, out) = ExecUtils.RunCmd(task_cmd, timeout, pipe_output, task_vars)
+    usage = {'merge': True} if shard_count and shard_index is None else {}
+    sampler = ProcSampler(Flags.ARGS.sample_interval) if Flags.ARGS.sample_interval else None
+    try:
+      (status, out) = ExecUtils.RunCmd(task_cmd, timeout, not log_capture, task_vars, usage,
+                                       log_capture, sampler)
+    finally:
+      if log_capture: log_capture.Close()
     time_taken = time.time() - start
-    TermColor.Info('Executed  %s. Took %.2fs' % (PipelineUtils.TaskDisplayName(task), time_taken))
+    if sampler: usage.update(sampler.usage())
+    TermColor.Info('Executed  %s. Took %.2fs [%s]' % (display_name, time_taken,
+                                                      ProcSampler.FormatUsage(usage)))
+    # The end of the output is kept in memory, so the log is never read back.
+    if log_capture: out = log_capture.GetTail()
+    if log_capture and tail_listener: tail_listener(out)
     if status:
-      TermColor.Failure('Failed Task: %s' % PipelineUtils.TaskDisplayName(task))
+      TermColor.Failure('Failed Task: %s' % display_name)
+      if log_capture:
+        TermColor.Info('Last lines of %s:\n%s' % (
+            log_file, MailDigest.TruncateToTail(out, cls.FAILURE_TAIL_LINES)))
+      if mem_limit and time_taken < timeout and cls._IsOutOfMemory(status, out, usage,
+                                                                   mem_limit):
+        usage['reason'] = 'memory limit %s, peak RSS %s' % (
+            TaskResources.FormatSize(mem_limit),
+            TaskResources.FormatSize(ProcSampler.GetPeakRssKb(usage) * 1024))
+        TermColor.Failure('Task %s ran out of memory (%s). Declare more in %s.' %
+                          (display_name, usage['reason'],
+                           TaskResources.GetResourcesFile(task)))
       if task_vars.get('PIPELINE_TASK_ABORT_FAIL', None):
         status_code = Runner.EXITCODE['ABORT_FAIL']
       elif task_vars.get('PIPELINE_TASK_ALLOW_FAIL', None):
@@ -241,14 +832,89 @@ class Runner(PipelineCmdBase):
         status_code = Runner.EXITCODE['FAILURE']
     else:
       status_code = Runner.EXITCODE['SUCCESS']
+      if task_cache: task_cache.Save()
 
-    cls._SendMailForTask(task, status_code, time_taken, log_file, out)
+    if shard_count or (Flags.ARGS.mail_digest and status_code != Runner.EXITCODE['ABORT_FAIL']):
+      # The runner adds the mail to the digest, or sends it once for all the shards.
+      usage['mail'] = cls._GetMailForTask(task, status_code, time_taken, log_file, out)
+    else:
+      cls._SendMailForTask(task, status_code, time_taken, log_file, out)
+    if log_file and os.path.isfile(log_file): usage['log_size'] = os.path.getsize(log_file)
 
     # Everything done. Mark the task as successful.
-    return (status_code, task)
+    return (status_code, task, usage)
+
+  @classmethod
+  def _IsOutOfMemory(cls, status, out, usage, mem_limit):
+    """Returns whether a failed task ran out of memory. It must have been killed, e.g. by the
+    OOM killer, or have failed to allocate memory, with a sampled peak RSS close to its limit.
+
+    Args:
+      status: int: The exit status of the task.
+      out: string: The end of the output of the task.
+      usage: dict: The usage of the task.
+      mem_limit: int: The memory limit of the task in bytes.
+
+    Return:
+      bool: True if the task ran out of memory.
+    """
+    if ProcSampler.GetPeakRssKb(usage) * 1024 < mem_limit * cls.OUT_OF_MEMORY_RSS_FRACTION:
+      return False
+    if status in (-signal.SIGKILL, 128 + signal.SIGKILL): return True
+    if isinstance(out, bytes): out = out.decode('utf-8', 'replace')
+    return any(x in (out or '') for x in cls.OUT_OF_MEMORY_MESSAGES)
+
+  @classmethod
+  def _GetTaskDisplayName(cls, task):
+    """Returns: string: The display name of the task in the output of the run."""
+    return PipelineUtils.TaskDisplayName(task)
+
+  @classmethod
+  def _CreateLogCapture(cls, log_file, listener=None):
+    """Creates the capture of the output of a task.
+
+    Args:
+      log_file: string: The log file for the task.
+      listener: callable: If given, called with the last lines of the output as it is produced.
+
+    Return:
+      LogCapture: The capture. Its file has the gzip suffix if it is compressed.
+    """
+    try:
+      head_bytes = TaskResources.ParseSize(Flags.ARGS.log_head_size)
+      tail_bytes = TaskResources.ParseSize(Flags.ARGS.log_tail_size)
+    except ValueError as e:
+      TermColor.Fatal('Invalid log size flag: %s' % e)
+    return LogCapture(log_file, not Flags.ARGS.nolog_compression, head_bytes, tail_bytes,
+                      Flags.ARGS.mail_tail_lines, listener)
+
+  @classmethod
+  def _GetTaskCache(cls, task, task_vars):
+    """Returns the cache for the task.
+
+    Args:
+      task: string: The task.
+      task_vars: dict {string, string}: The env vars for the task.
+
+    Return:
+      TaskCache: The cache for the task. None if the task is not cached.
+    """
+    # The output of linked tasks is streamed and cannot be restored.
+    if Flags.ARGS.notask_cache or StageLinks.Instance().GetGroup(task): return None
+    cache_dir = Flags.ARGS.task_cache_dir
+    if not cache_dir and PipelineConfig.Instance().pipeline_output_dir():
+      cache_dir = os.path.join(PipelineConfig.Instance().pipeline_output_dir(), '.cache')
+    out_dirs = PipelineConfig.Instance().GetAllSubDirsForPath(
+        TaskManifest.Instance().GetOutputRelativeDir(task)).values()
+    try:
+      return TaskCache.Create(task, task_vars, PipelineConfig.Instance().pipeline_base_dir(),
+                              cache_dir, list(out_dirs))
+    except (OSError, IOError) as e:
+      TermColor.Warning('Not caching %s. Error: %s' % (PipelineUtils.TaskDisplayName(task), e))
+      return None
 
   @classmethod
-  def __GetEnvVarsForTask(cls, task):
+  def _GetEnvVarsForTask(cls, task):
     """Returns the env vars for the task.
 
     Args:
@@ -257,17 +923,18 @@ class Runner(PipelineCmdBase):
     Returns:
       dict {string, string}: The dictionary of IDS to values.
     """
-    rel_path = PipelineUtils.GetTaskOutputRelativeDir(task)
+    rel_path = TaskManifest.Instance().GetOutputRelativeDir(task)
     vars = {}
     for k, v in PipelineConfig.Instance().GetAllSubDirsForPath(rel_path).items():
       vars[k] = v
-      prev_dir = FileUtils.GetPreviousDatedDir(v)
+      prev_dir = DatedDirIndex.Instance().GetPreviousDatedDir(v)
       if not prev_dir: prev_dir = v
       vars[k + '_PREV'] = prev_dir
     vars.update(PipelineConfig.Instance().GetAllENVVars())
+    vars.update(StageLinks.Instance().GetEnvVars(task))
 
     # Check if the task is critical or not.
-    task_options = cls.__GetTaskOptions(task)
+    task_options = cls._GetTaskOptions(task)
     if task_options[Runner.TASK_OPTIONS['ABORT_FAIL']]:
       vars['PIPELINE_TASK_ABORT_FAIL'] = '1'
     if task_options[Runner.TASK_OPTIONS['ALLOW_FAIL']]:
@@ -275,7 +942,7 @@ class Runner(PipelineCmdBase):
     return vars
 
   @classmethod
-  def __GetTimeOutForTask(cls, task):
+  def _GetTimeOutForTask(cls, task):
     """Returns the timeout for the task.
 
     Args:
@@ -284,10 +951,7 @@ class Runner(PipelineCmdBase):
     Returns:
       int: The timeout in seconds.
     """
-    timeout = FileUtils.FileContents(task + '.timeout')
-    if not timeout:
-      timeout = FileUtils.FileContents(os.path.join(PipelineUtils.TaskDirName(task), 'timeout'))
-
+    timeout = TaskManifest.Instance().GetTimeout(task)
     if not timeout: return Flags.ARGS.timeout
 
     timeout = re.sub('\s*', '', timeout)
@@ -307,7 +971,7 @@ class Runner(PipelineCmdBase):
     return timeout
 
   @classmethod
-  def __GetTaskOptions(cls, task):
+  def _GetTaskOptions(cls, task):
     rel_task = PipelineUtils.TaskRelativeName(task)
     options = {
       v: False
@@ -326,43 +990,144 @@ class Runner(PipelineCmdBase):
     return options
 
   @classmethod
-  def _SendMailForTask(cls, task, status_code, time_taken, log_file, msg):
-    """Sends the mail if required for the task.
+  def _GetMailSubjectPrefix(cls):
+    """Returns: string: The prefix for the subject of the mails for the pipeline."""
+    return '[%s:%s]' % (PipelineConfig.Instance().pipeline_id(),
+                        PipelineConfig.Instance().pipeline_date())
+
+  @classmethod
+  def _GetMailSubjectForTask(cls, task, status_code):
+    """Returns: string: The subject of the mail for the task."""
+    return '%s %s : %s' % (cls._GetMailSubjectPrefix(), Runner.EXITCODE_DESCRIPTION[status_code],
+                           PipelineUtils.TaskDisplayName(task))
+
+  @classmethod
+  def _GetMailForTask(cls, task, status_code, time_taken, log_file, msg, attach_log=False):
+    """Returns the mail for the task if one is required.
 
     Args:
-      task: string: The task for which the envvar should be prepared.
+      task: string: The task.
       status_code: EXITCODE: The exit code for the task.
       time_taken: float: Time taken in seconds.
       log_file: string: The log file containing the output of the task.
-      msg: string: The output message piped directly. Note only one of msg or log_file will be
-          present at any time.
+      msg: string: The output of the task. Only the end of it if the task has a log.
+      attach_log: bool: If True, the log is attached to the mail, so the body only has the output
+          of a task without a log, in full. Otherwise the body has the end of the output.
 
     Returns:
-      dict {string, string}: The dictionary of IDS to values.
+      (string, string): The receiver and the body of the mail. None if no mail is required.
     """
     if status_code == Runner.EXITCODE['SUCCESS']:
-      if not Flags.ARGS.detailed_success_mail: return
+      if not Flags.ARGS.detailed_success_mail: return None
       receiver = Flags.ARGS.success_mail
     else: receiver = Flags.ARGS.failure_mail
 
-
     # Check if there is no receiver for the mail.
-    if not receiver: return
-    mail_domain = Flags.ARGS.mail_domain
+    if not receiver: return None
     status_description = Runner.EXITCODE_DESCRIPTION[status_code]
-    subject = "[%s:%s] %s : %s" % (PipelineConfig.Instance().pipeline_id(),
-                                   PipelineConfig.Instance().pipeline_date(),
-                                   status_description, PipelineUtils.TaskDisplayName(task))
-
     body = 'Executed task: %s. \nStatus:%s \nTime: %.2fs.' % (task, status_description, time_taken)
-    if msg:
-      body += '\n%s' % msg
-      Mailer().send_simple_message(
-        PipelineUtils.ZeusEmailId(mail_domain), [receiver], subject, body)
-    else:
-      Mailer().send_message_from_files(
-        PipelineUtils.ZeusEmailId(mail_domain), [receiver], subject, [log_file],
-        body)
+
+    if isinstance(msg, bytes): msg = msg.decode('utf-8', 'replace')
+    if attach_log:
+      if msg and not log_file: body += '\n%s' % msg
+    elif msg and Flags.ARGS.mail_tail_lines:
+      # Only include the end of the output. It is where the errors usually are.
+      body += '\n%s%s' % ('$tail %s\n' % log_file if log_file else '',
+                          MailDigest.TruncateToTail(msg, Flags.ARGS.mail_tail_lines))
+    return (receiver, body)
+
+  @classmethod
+  def _SendMailForTask(cls, task, status_code, time_taken, log_file, msg):
+    """Sends the mail if required for the task. The mail has all the output of the task: its log is
+    attached, or the output is in the body if it has no log.
+
+    Args:
+      task: string: The task.
+      status_code: EXITCODE: The exit code for the task.
+      time_taken: float: Time taken in seconds.
+      log_file: string: The log file containing the output of the task.
+      msg: string: The output of the task. Only the end of it if the task has a log.
+    """
+    mail = cls._GetMailForTask(task, status_code, time_taken, log_file, msg, attach_log=True)
+    if not mail: return
+    (receiver, body) = mail
+    cls._SendMail(receiver, cls._GetMailSubjectForTask(task, status_code), body,
+                  [log_file] if log_file else None)
+
+  @classmethod
+  def _SendMail(cls, receiver, subject, body, filenames=None):
+    """Sends a single mail.
+
+    Args:
+      receiver: string: The receiver of the mail.
+      subject: string: The subject of the mail.
+      body: string: The body of the mail.
+      filenames: list(string): The files to append to the mail, if any.
+    """
+    mailer = None
+    try:
+      mailer = Mailer(Flags.ARGS.smtp_host, Flags.ARGS.smtp_port)
+      sender = PipelineUtils.ZeusEmailId(Flags.ARGS.mail_domain)
+      if filenames:
+        sent = mailer.send_message_from_files(sender, [receiver], subject, filenames, body)
+      else:
+        sent = mailer.send_simple_message(sender, [receiver], subject, body)
+      if not sent: TermColor.Error('Could not send mail: %s' % subject)
+    except (smtplib.SMTPException, OSError) as e:
+      TermColor.Error('Could not send mail: %s. Error: %s' % (subject, e))
+    finally:
+      if mailer: mailer.close()
+
+  @classmethod
+  def _UpdateDigest(cls, digest, task, task_levels, levels_pending):
+    """Sends the digest when all the tasks of the level of a finished task are done, or when the
+    digest interval has passed.
+
+    Args:
+      digest: MailDigest: The digest of the run. None if mails are not batched.
+      task: string: The task that finished.
+      task_levels: dict {string, string}: The task to its priority level.
+      levels_pending: dict {string, int}: The priority level to the number of unfinished tasks.
+    """
+    if not digest: return
+    levels_pending[task_levels[task]] -= 1
+    if Flags.ARGS.mail_digest_interval:
+      digest.FlushIfDue(Flags.ARGS.mail_digest_interval)
+    elif not levels_pending[task_levels[task]]:
+      digest.Flush()
+
+  @classmethod
+  def _OpenJournal(cls):
+    """Opens the journal for the run. A run starts a new journal, so that 'zeus continue' never
+    skips a task for a success recorded by an earlier run.
+
+    Return:
+      Journal: The journal. None if the pipeline has no journal.
+    """
+    journal_file = Journal.GetJournalFile()
+    return Journal(journal_file, truncate=True) if journal_file else None
+
+  @classmethod
+  def _UpdateOutDirStatus(cls, task, res, out_dirs_status, out_dirs_pending):
+    """Updates the status of the out dir of a finished task. The status file is written once all
+    the tasks in the out dir are done.
+
+    Args:
+      task: string: The task that finished.
+      res: EXITCODE: The exit code for the task. None if the task was skipped.
+      out_dirs_status: dict {string, EXITCODE}: Dict of dir -> exit status.
+      out_dirs_pending: dict {string, int}: Dict of dir -> number of unfinished tasks.
+    """
+    out_dir = PipelineUtils.GetOutDirForTask(task)
+    if not out_dir: return
+
+    if res is not None:
+      out_dirs_status[out_dir] = max(
+        out_dirs_status.get(out_dir, Runner.EXITCODE['_LOWEST']), res,
+      )
+    out_dirs_pending[out_dir] -= 1
+    if not out_dirs_pending[out_dir] and out_dir in out_dirs_status:
+      cls._WriteOutDirsStatus({out_dir: out_dirs_status[out_dir]})
 
   @classmethod
   def _WriteOutDirsStatus(cls, out_dirs_status):
@@ -378,7 +1143,8 @@ class Runner(PipelineCmdBase):
       FileUtils.CreateFileWithData(os.path.join(k, status_file))
 
   @classmethod
-  def _SendFinalStatusMail(cls, successful_run, failed_run, aborted_task, time_taken):
+  def _SendFinalStatusMail(cls, successful_run, failed_run, aborted_task, time_taken,
+                           task_usage=None):
     """Sends the final status mail if required.
 
     Args:
@@ -387,6 +1153,7 @@ class Runner(PipelineCmdBase):
           ones that failed.
       aborted_task: string: True if the pipeline was aborted.
       time_taken: float: Time taken in seconds.
+      task_usage: dict {string, dict}: The usage of each task that ran.
 
     """
     if not successful_run and not failed_run: return
@@ -401,10 +1168,7 @@ class Runner(PipelineCmdBase):
     # Check if there is no receiver for the mail.
     if not receiver: return
 
-    mail_domain = Flags.ARGS.mail_domain
-    subject = "[%s:%s] Final Status: %s" % (PipelineConfig.Instance().pipeline_id(),
-                                            PipelineConfig.Instance().pipeline_date(),
-                                            status_description)
+    subject = '%s Final Status: %s' % (cls._GetMailSubjectPrefix(), status_description)
     body = 'Aborted by: %s\n\n' % aborted_task if aborted_task else ''
     body += ('Successful tasks: %d\n%s\n\n'
              'Failed tasks: %d\n%s\n\n'
@@ -414,8 +1178,37 @@ class Runner(PipelineCmdBase):
               len(failed_run), json.dumps(failed_run, indent=2),
               time_taken,
               PipelineConfig.Instance().GetConfigString()))
-    Mailer().send_simple_message(
-      PipelineUtils.ZeusEmailId(mail_domain), [receiver], subject, body)
+    if task_usage: body += '%s\n\n' % cls._GetUsageReport(task_usage)
+    cls._SendMail(receiver, subject, body)
+
+  @classmethod
+  def _GetUsageReport(cls, task_usage):
+    """Returns the report of the resources used by the tasks of the run.
+
+    Args:
+      task_usage: dict {string, dict}: The usage of each task that ran.
+
+    Return:
+      string: The totals and peaks over all the tasks and the usage of the tasks using the most
+          cpu.
+    """
+    totals = {}
+    for usage in task_usage.values():
+      for key in TaskShards.SUMMED_USAGE:
+        if key in usage: totals[key] = totals.get(key, 0) + usage[key]
+    peak_task = max(task_usage, key=lambda x: ProcSampler.GetPeakRssKb(task_usage[x]))
+    report = 'Resource usage of %d tasks: %s' % (len(task_usage), ProcSampler.FormatUsage(totals))
+    if ProcSampler.GetPeakRssKb(task_usage[peak_task]):
+      report += '\nPeak task RSS: %s (%s)' % (
+          TaskResources.FormatSize(ProcSampler.GetPeakRssKb(task_usage[peak_task]) * 1024),
+          PipelineUtils.TaskDisplayName(peak_task))
+
+    top = sorted(task_usage, key=lambda x: ProcSampler.GetCpuTime(task_usage[x]), reverse=True)
+    report += '\nTop tasks by cpu:'
+    for task in top[:cls.USAGE_REPORT_TASKS]:
+      report += '\n  %s: %s' % (PipelineUtils.TaskDisplayName(task),
+                                ProcSampler.FormatUsage(task_usage[task]))
+    return report
 
 
 def main():
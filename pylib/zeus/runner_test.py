@@ -0,0 +1,182 @@
+"""Tests for runner."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+from pylib.file.file_utils import FileUtils
+from pylib.zeus.mail_digest_test import SmtpSink
+from pylib.zeus.runner import Runner
+from pylib.zeus.task_graph import TaskGraph
+
+
+class RunnerTest(unittest.TestCase):
+  """Tests for Runner. Each test runs 'zeus run' on a pipeline in a temp dir."""
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.root = os.path.join(self.dir, 'run')
+    self.order = os.path.join(self.dir, 'order')
+    FileUtils.MakeDirs(self.root)
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def _Task(self, name, cmd, deps=None):
+    """Creates a task that runs the cmd and then appends its name to the order file."""
+    task = os.path.join(self.root, name)
+    FileUtils.CreateFileWithData(task, '#!/bin/bash\n%s\necho %s >> %s\n' % (cmd, name, self.order))
+    os.chmod(task, 0o755)
+    if deps is not None:
+      FileUtils.CreateFileWithData(TaskGraph.GetDepsFile(task), deps)
+
+  def _Run(self, cmd='run', success=True, log_output=False, args=None, code=None):
+    """Runs the pipeline and returns the tasks in the order they finished.
+
+    Args:
+      cmd: string: The zeus command to run.
+      success: bool: Whether the run is expected to succeed.
+      log_output: bool: Whether the output of the tasks is logged.
+      args: list(string): The extra arguments for the command.
+      code: string: The python code to run in zeus before the command.
+    """
+    src_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ, R77_SRC_ROOT=self.dir, PYTHONPATH=src_root)
+    zeus = [sys.executable, '-m', 'pylib.zeus.zeus']
+    if code:
+      zeus = [sys.executable, '-c',
+              'import sys\n%s\nfrom pylib.zeus import zeus\nsys.exit(zeus.main())' % code]
+    status = subprocess.call(
+        zeus + ['--id=test', '--root=%s' % self.root, '--out_dirs=out'] +
+        ([] if log_output else ['--nolog_output']) +
+        [cmd, '--pool_size=4', '--nohistory', '--sample_interval=0'] + (args or []),
+        cwd=self.dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    self.assertEqual(status == 0, success)
+    return (FileUtils.FileContents(self.order) or '').split()
+
+  def _GetText(self, mail):
+    """Returns: string: The text of all the parts of the mail."""
+    return ''.join(x.get_payload() for x in mail.get_payload()).replace('\r\n', '\n')
+
+  def test_default_deps_after_declared_deps(self):
+    self._Task('000_a', 'sleep 2')
+    self._Task('100_b', 'true', '')
+    self._Task('200_c', 'true')
+    # 100_b does not wait for 000_a, but 200_c waits for both as it declares no dependencies.
+    self.assertEqual(self._Run(), ['100_b', '000_a', '200_c'])
+
+  def test_start_while_running(self):
+    self._Task('000_a', 'sleep 2', '')
+    self._Task('000_b', 'true', '')
+    self._Task('100_c', 'true', '000_b')
+    # 100_c starts once 000_b is done, without waiting for the unrelated 000_a.
+    self.assertEqual(self._Run(), ['000_b', '100_c', '000_a'])
+
+  def test_worker_error(self):
+    # Make the worker raise for the task instead of running it.
+    code = '\n'.join([
+        'from pylib.zeus.runner import Runner',
+        'run = Runner._RunSingeTask.__func__',
+        'def _Run(cls, task, *args):',
+        '  if task.endswith("_error"): raise RuntimeError(task)',
+        '  return run(cls, task, *args)',
+        'Runner._RunSingeTask = classmethod(_Run)'])
+    self._Task('000_a_error', 'true', '')
+    self._Task('000_b', 'true', '')
+    self._Task('100_c', 'true', '000_a_error')
+    self._Task('100_d', 'true', '000_b')
+    # The error is a failure of the task. Its dependents are skipped and the others still run.
+    self.assertEqual(sorted(self._Run(success=False, code=code)), ['000_b', '100_d'])
+
+  def test_out_dir_status(self):
+    for name in ['000_x', '000_y']: FileUtils.MakeDirs(os.path.join(self.root, name))
+    self._Task('000_x/000_a', 'true', '')
+    # The status of the out dir of 000_a is written while 000_b still runs.
+    status = '$PIPELINE_OUT_DIR/../../x/*/SUCCESS'
+    self._Task('000_y/000_b', 'for i in $(seq 100); do [ -e %s ] && break; sleep 0.1; done\n'
+               '[ -e %s ] || exit 1' % (status, status), '')
+    self.assertEqual(self._Run(), ['000_x/000_a', '000_y/000_b'])
+
+  def test_sidecars(self):
+    # The suffixes of the sidecars in the path of the pipeline or of a task do not hide it.
+    self.root = os.path.join(self.dir, '.cache', 'run')
+    FileUtils.MakeDirs(self.root)
+    self._Task('000_a', 'true', '')
+    self._Task('100_x.merged', 'true')
+    FileUtils.CreateFileWithData(os.path.join(self.root, '000_a.resources'), 'cpu 1\n')
+    self.assertEqual(self._Run(), ['000_a', '100_x.merged'])
+
+  def test_mem_limit(self):
+    # Reserved address space does not count towards the limit, e.g. for JVM and Go heaps.
+    self._Task('000_a', '%s -c "import mmap; mmap.mmap(-1, 1 << 32, flags=mmap.MAP_PRIVATE, '
+               'prot=0)" || exit 1' % sys.executable)
+    FileUtils.CreateFileWithData(os.path.join(self.root, '000_a.resources'), 'mem: 256m\n')
+    self.assertEqual(self._Run(), ['000_a'])
+
+  def test_out_of_memory(self):
+    limit = 100 << 20
+    usage = {'tree_rss_kb': 90 << 10}
+    self.assertTrue(Runner._IsOutOfMemory(137, '', usage, limit))
+    self.assertTrue(Runner._IsOutOfMemory(1, b'MemoryError\n', usage, limit))
+    # Other failures, or a peak RSS far below the limit, are not a lack of memory.
+    self.assertFalse(Runner._IsOutOfMemory(1, 'error\n', usage, limit))
+    self.assertFalse(Runner._IsOutOfMemory(137, '', {'tree_rss_kb': 10 << 10}, limit))
+    self.assertFalse(Runner._IsOutOfMemory(137, '', {}, limit))
+
+  def test_continue(self):
+    flag = os.path.join(self.dir, 'flag')
+    self._Task('000_a.allow_fail', 'echo 000_a.allow_fail >> %s; exit 1' % self.order)
+    self._Task('000_c', 'true')
+    self._Task('100_b', 'test -e %s || exit 1' % flag)
+    self.assertEqual(sorted(self._Run(success=False)), ['000_a.allow_fail', '000_c'])
+
+    # Only the failed task is run again. The tasks allowed to fail are done.
+    FileUtils.CreateFileWithData(flag)
+    os.remove(self.order)
+    self.assertEqual(self._Run('continue'), ['100_b'])
+
+    # A new run aborts before 100_b. Its success in the earlier run is not continued from.
+    self._Task('000_x.abort_fail', 'exit 1')
+    os.remove(self.order)
+    self.assertNotIn('100_b', self._Run(success=False))
+    os.remove(os.path.join(self.root, '000_x.abort_fail'))
+    self.assertIn('100_b', self._Run('continue'))
+
+  def test_mail(self):
+    sink = SmtpSink()
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    try:
+      self._Task('000_a', 'seq 10; exit 1')
+      args = ['--failure_mail=a@test.com', '--smtp_port=%d' % sink.server_address[1],
+              '--mail_tail_lines=2']
+      # Without digests, the mail for a task has all its output, from its log if it has one.
+      for log_output in [False, True]:
+        sink.messages = []
+        self._Run(success=False, log_output=log_output, args=args)
+        mail = [x for x in sink.messages if '000_a' in x['Subject']]
+        self.assertEqual(len(mail), 1)
+        text = self._GetText(mail[0])
+        self.assertIn('\n'.join(str(x) for x in range(1, 11)), text)
+
+      # The digests only have the end of the output.
+      sink.messages = []
+      self._Run(success=False, args=args + ['--mail_digest'])
+      mail = [x for x in sink.messages if 'Digest' in x['Subject']]
+      self.assertEqual(len(mail), 1)
+      text = self._GetText(mail[0])
+      self.assertIn('9\n10', text)
+      self.assertNotIn('8\n9', text)
+    finally:
+      sink.shutdown()
+      sink.server_close()
+
+
+if __name__ == '__main__':
+  unittest.main()
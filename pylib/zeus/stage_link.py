@@ -0,0 +1,230 @@
+"""Streaming links between the stages of a pipeline."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+import shutil
+import tempfile
+
+from pylib.base.term_color import TermColor
+from pylib.file.file_utils import FileUtils
+from pylib.zeus.pipeline_utils import PipelineUtils
+import pylib.util.singleton as singleton
+
+
+class StageLinks(singleton.Singleton):
+  """Class to run producer and consumer tasks together, connected by a named pipe.
+  This is a singleton class. Make sure to always access it through StageLinks.Instance().
+
+  A consumer links to its producer with a <consumer>.pipe_from sidecar naming the producer, either
+  relative to the dir of the consumer or as //path from the pipeline base dir. The producer writes
+  its output to the pipe in $PIPELINE_PIPE_OUT instead of its out dir and the consumer reads it
+  from the pipe in $PIPELINE_PIPE_IN, so the intermediate data never hits the disk. A producer
+  has at most one consumer. A consumer may itself produce for a later stage, so links form chains
+  and all the tasks of a chain start together.
+
+  Opening a pipe blocks until its other end is opened. The runner holds both ends of each pipe
+  while its tasks run, so that neither task blocks opening the pipe if the other never opens it.
+  The write end is closed when the producer finishes, so that the consumer sees the end of the
+  data, and the read end when the consumer finishes, so that a producer writing to a consumer
+  that is gone fails instead of blocking. A task that opens its pipe only after the other task
+  finished is woken up by Unblock(). If any task of a chain fails, all of them fail.
+
+  The links are loaded before the workers are forked, so that the workers know the pipes of
+  their tasks.
+
+  Members:
+    _producers: dict {string, string}: The consumer to its producer.
+    _consumers: dict {string, string}: The producer to its consumer.
+    _groups: dict {string, list(string)}: The task to the tasks of its chain, producers first.
+    _base_dir: string: The pipeline base dir.
+    _pipe_dir: string: The dir for the pipes of the run.
+    _fds: dict {string, (int, int)}: The producer to the read and write ends of its pipe held by
+        the runner.
+    _results: dict {string, tuple}: The tasks of the running chains that finished to their
+        results.
+  """
+
+  # The suffix of the sidecar of a consumer naming its producer.
+  PIPE_SUFFIX = '.pipe_from'
+
+  def __init__(self):
+    """Initialize the singleton instance."""
+    self._producers = {}
+    self._consumers = {}
+    self._groups = {}
+    self._base_dir = ''
+    self._pipe_dir = None
+    self._fds = {}
+    self._results = {}
+
+  @classmethod
+  def GetPipeFile(cls, task):
+    """Returns: string: The sidecar of the task naming its producer."""
+    return task + cls.PIPE_SUFFIX
+
+  @classmethod
+  def GetDeclaredProducer(cls, task, base_dir=''):
+    """Returns the producer declared for the task.
+
+    Args:
+      task: string: The task.
+      base_dir: string: The pipeline base dir used to resolve '//' producers.
+
+    Return:
+      string: The absolute path of the producer. None if the task does not declare one.
+    """
+    pipe_file = cls.GetPipeFile(task)
+    if not os.path.isfile(pipe_file): return None
+    for line in (FileUtils.FileContents(pipe_file) or '').splitlines():
+      line = line.split('#', 1)[0].strip()
+      if not line: continue
+      if line.startswith('//'): return os.path.normpath(os.path.join(base_dir, line[2:]))
+      return os.path.normpath(os.path.join(PipelineUtils.TaskDirName(task), line))
+    return None
+
+  def Load(self, tasks, base_dir='', pipe_dir=None):
+    """Loads the links between the tasks of the run.
+
+    Args:
+      tasks: list: The tasks of the run. Links to producers not in the run are ignored.
+      base_dir: string: The pipeline base dir.
+      pipe_dir: string: The dir for the pipes. Defaults to a dir in the temp dir for the process.
+    """
+    self.__init__()
+    tasks = set(tasks)
+    self._base_dir = base_dir
+    self._pipe_dir = pipe_dir or os.path.join(tempfile.gettempdir(),
+                                              'zeus_pipes_%d' % os.getpid())
+    for consumer in tasks:
+      producer = self.GetDeclaredProducer(consumer, base_dir)
+      if not producer: continue
+      if producer not in tasks or producer == consumer:
+        TermColor.Warning('Ignored the pipe from %s to %s as the producer is not in the run.' %
+                          (producer, PipelineUtils.TaskDisplayName(consumer)))
+      elif producer in self._consumers:
+        TermColor.Warning('Ignored the pipe from %s to %s as it already has a consumer: %s' % (
+            PipelineUtils.TaskDisplayName(producer), PipelineUtils.TaskDisplayName(consumer),
+            PipelineUtils.TaskDisplayName(self._consumers[producer])))
+      else:
+        self._producers[consumer] = producer
+        self._consumers[producer] = consumer
+
+    for task in list(self._consumers):
+      if task in self._producers: continue
+      # Follow the chain from its first producer.
+      group = [task]
+      while group[-1] in self._consumers and self._consumers[group[-1]] not in group:
+        group += [self._consumers[group[-1]]]
+      for x in group: self._groups[x] = group
+
+    # Links on a cycle have no first producer and are never started together.
+    for consumer in [x for x in self._producers if x not in self._groups]:
+      TermColor.Warning('Ignored the pipe to %s as it is on a cycle of pipes.' %
+                        PipelineUtils.TaskDisplayName(consumer))
+      del self._consumers[self._producers.pop(consumer)]
+
+  def links(self):
+    """Returns: list((string, string)): The (consumer, producer) links."""
+    return sorted(self._producers.items())
+
+  def GetGroup(self, task):
+    """Returns: list(string): The tasks of the chain of the task. None if it has no link."""
+    return self._groups.get(task)
+
+  def GetEnvVars(self, task):
+    """Returns: dict {string, string}: The pipes of the task to read from and to write to."""
+    vars = {}
+    if task in self._producers: vars['PIPELINE_PIPE_IN'] = self._GetPipe(self._producers[task])
+    if task in self._consumers: vars['PIPELINE_PIPE_OUT'] = self._GetPipe(task)
+    return vars
+
+  def Open(self, group):
+    """Creates the pipes of the chain and holds both of their ends.
+
+    Args:
+      group: list(string): The tasks of the chain.
+    """
+    FileUtils.MakeDirs(self._pipe_dir)
+    for producer in group:
+      if producer not in self._consumers: continue
+      pipe = self._GetPipe(producer)
+      if os.path.exists(pipe): os.remove(pipe)
+      os.mkfifo(pipe)
+      # The read end must be opened first. Opening the write end fails without a reader.
+      read_fd = os.open(pipe, os.O_RDONLY | os.O_NONBLOCK)
+      self._fds[producer] = (read_fd, os.open(pipe, os.O_WRONLY | os.O_NONBLOCK))
+
+  def Finish(self, task, result, failed):
+    """Records that a task of a chain finished and releases its ends of the pipes.
+
+    Args:
+      task: string: The task.
+      result: tuple: The result of the task.
+      failed: bool: If the task failed.
+
+    Return:
+      list((tuple, string)): The results of all the tasks of the chain once all of them finished,
+          each with the task of the chain that failed or None. Empty until then.
+    """
+    if task in self._consumers: self._CloseEnd(task, 1)
+    if task in self._producers: self._CloseEnd(self._producers[task], 0)
+    self._results[task] = (result, failed)
+
+    group = self._groups[task]
+    if any(x not in self._results for x in group): return []
+    failed_task = next((x for x in group if self._results[x][1]), None)
+    res = [(self._results.pop(x)[0], failed_task) for x in group]
+    for x in group:
+      if x in self._consumers:
+        self._fds.pop(x, None)
+        try:
+          os.remove(self._GetPipe(x))
+        except OSError:
+          pass
+    return res
+
+  def Unblock(self):
+    """Wakes up the tasks blocked opening a pipe whose other task already finished, by briefly
+    opening the other end: a consumer then sees the end of the data and a producer fails writing.
+
+    Return:
+      bool: True if any pipe has a finished task and a running one. The runner calls this
+          regularly until there are none, as the running task may open the pipe at any time.
+    """
+    waiting = False
+    for producer in list(self._fds):
+      consumer = self._consumers[producer]
+      if (producer in self._results) == (consumer in self._results): continue
+      waiting = True
+      flags = os.O_WRONLY if producer in self._results else os.O_RDONLY
+      try:
+        os.close(os.open(self._GetPipe(producer), flags | os.O_NONBLOCK))
+      except OSError:
+        pass
+    return waiting
+
+  def Close(self):
+    """Releases all the pipes."""
+    for producer in list(self._fds):
+      for end in [0, 1]: self._CloseEnd(producer, end)
+    if self._pipe_dir: shutil.rmtree(self._pipe_dir, ignore_errors=True)
+
+  def _GetPipe(self, producer):
+    """Returns: string: The pipe written to by the producer."""
+    return os.path.join(self._pipe_dir,
+                        os.path.relpath(producer, self._base_dir).replace(os.sep, '.') + '.fifo')
+
+  def _CloseEnd(self, producer, end):
+    """Closes the end of the pipe of the producer held by the runner.
+
+    Args:
+      producer: string: The producer.
+      end: int: 0 for the read end and 1 for the write end.
+    """
+    fds = list(self._fds.get(producer, (None, None)))
+    if fds[end] is None: return
+    os.close(fds[end])
+    fds[end] = None
+    self._fds[producer] = tuple(fds)
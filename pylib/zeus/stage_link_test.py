@@ -0,0 +1,62 @@
+"""Tests for stage_link."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pylib.file.file_utils import FileUtils
+from pylib.zeus.stage_link import StageLinks
+
+
+class StageLinksTest(unittest.TestCase):
+  """Tests for StageLinks."""
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.pipe_dir = os.path.join(self.dir, 'pipes')
+    (self.a, self.b, self.c) = [os.path.join(self.dir, '000_x', x) for x in ['a', 'b', 'c']]
+    FileUtils.MakeDirs(os.path.dirname(self.a))
+    for task in [self.a, self.b, self.c]: FileUtils.CreateFileWithData(task)
+    FileUtils.CreateFileWithData(StageLinks.GetPipeFile(self.b), '# The producer.\na\n')
+    FileUtils.CreateFileWithData(StageLinks.GetPipeFile(self.c), '//000_x/b')
+    self.links = StageLinks.Instance()
+    self.links.Load([self.a, self.b, self.c], self.dir, self.pipe_dir)
+
+  def tearDown(self):
+    self.links.Close()
+    self.links.Load([])
+    shutil.rmtree(self.dir)
+
+  def test_load(self):
+    self.assertEqual(self.links.links(), [(self.b, self.a), (self.c, self.b)])
+    self.assertEqual(self.links.GetGroup(self.c), [self.a, self.b, self.c])
+    env = self.links.GetEnvVars(self.b)
+    self.assertEqual(env['PIPELINE_PIPE_IN'], self.links.GetEnvVars(self.a)['PIPELINE_PIPE_OUT'])
+    self.assertEqual(env['PIPELINE_PIPE_OUT'], self.links.GetEnvVars(self.c)['PIPELINE_PIPE_IN'])
+
+  def test_stream(self):
+    group = self.links.GetGroup(self.a)
+    self.links.Open(group)
+    with open(self.links.GetEnvVars(self.a)['PIPELINE_PIPE_OUT'], 'w') as f: f.write('data')
+    self.assertEqual(self.links.Finish(self.a, 'a', False), [])
+    # The runner closed its write end, so the consumer sees the end of the data. Opening the pipe
+    # without a writer blocks until Unblock(), so the test opens it without blocking.
+    fd = os.open(self.links.GetEnvVars(self.b)['PIPELINE_PIPE_IN'], os.O_RDONLY | os.O_NONBLOCK)
+    self.assertEqual(os.read(fd, 10), b'data')
+    self.assertEqual(os.read(fd, 10), b'')
+    os.close(fd)
+    self.assertEqual(self.links.Finish(self.b, 'b', True), [])
+    # The consumer of b never opened its pipe.
+    self.assertTrue(self.links.Unblock())
+    self.assertEqual(self.links.Finish(self.c, 'c', False),
+                     [('a', self.b), ('b', self.b), ('c', self.b)])
+    self.assertFalse(self.links.Unblock())
+    self.assertEqual(os.listdir(self.pipe_dir), [])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,225 @@
+"""Live status of a running pipeline served over HTTP."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import html
+import http.server
+import json
+import multiprocessing
+import threading
+import time
+
+from pylib.base.term_color import TermColor
+from pylib.zeus.mail_digest import MailDigest
+
+
+class StatusServer(object):
+  """Class to serve the status of the tasks of a running pipeline on a local HTTP port.
+
+  '/' serves a minimal HTML page that refreshes itself and '/status.json' the same status as JSON:
+  the running, queued, pending, succeeded and failed tasks with their elapsed times and the last
+  lines of their logs.
+
+  The runner updates the status in memory as the tasks start and finish. The workers send the
+  last lines of the output of their task through a queue each time their log is flushed. Queries
+  are served from this state by threads of the runner, so they never touch the files of the tasks
+  and never wait on the run.
+
+  Members:
+    _updates: multiprocessing.Queue: The (task, part, tail) updates sent by the workers. Set on
+        the class while a server runs, so that the workers forked after it can send updates.
+    _title: string: The title of the status, e.g. the id and date of the run.
+    _start: float: The time the run started.
+    _lock: Lock: Guards _tasks and _tails.
+    _tasks: dict {string, dict}: The display name of each task to its status: 'state', 'queued',
+        'start' and 'end' times, 'status' and 'reason'.
+    _order: list(string): The tasks in priority order.
+    _tails: dict {string, dict {string, string}}: The task to the last lines of the log of each of
+        its parts. The part is empty for a task that is not sharded.
+    _server: ThreadingHTTPServer: The HTTP server.
+    _threads: list(Thread): The threads serving the queries and reading the updates.
+  """
+
+  # The states of the tasks, in the order they are listed.
+  STATES = ['running', 'queued', 'pending', 'failed', 'succeeded']
+
+  # The number of lines at the end of the log of a task to show.
+  TAIL_LINES = 20
+
+  # Interval in seconds for the HTML page to refresh itself.
+  REFRESH_INTERVAL = 5
+
+  _updates = None
+
+  def __init__(self, host, port, title, tasks):
+    """
+    Args:
+      host: string: The host to serve on.
+      port: int: The port to serve on.
+      title: string: The title of the status.
+      tasks: list(string): The display names of the tasks of the run in priority order.
+
+    Raises:
+      OSError: If the port cannot be bound.
+    """
+    self._title = title
+    self._start = time.time()
+    self._lock = threading.Lock()
+    self._order = list(tasks)
+    self._tasks = {x: {'state': 'pending'} for x in self._order}
+    self._tails = {}
+    self._server = http.server.ThreadingHTTPServer((host, port), _StatusRequestHandler)
+    self._server.daemon_threads = True
+    self._server.status = self
+    StatusServer._updates = multiprocessing.get_context('fork').Queue()
+    self._threads = [threading.Thread(target=self._server.serve_forever),
+                     threading.Thread(target=self._ReadUpdates, args=(StatusServer._updates,))]
+    for thread in self._threads:
+      thread.daemon = True
+      thread.start()
+    TermColor.Info('Serving the status of the run on http://%s:%d/' %
+                   (host, self._server.server_address[1]))
+
+  def address(self):
+    """Returns: (string, int): The host and port served on."""
+    return self._server.server_address
+
+  def Stop(self):
+    """Stops serving the status."""
+    StatusServer._updates.put(None)
+    self._server.shutdown()
+    self._server.server_close()
+    for thread in self._threads: thread.join()
+    StatusServer._updates.close()
+    StatusServer._updates = None
+
+  @classmethod
+  def PostTail(cls, task, part, tail):
+    """Sends the last lines of the log of a task to the server of the run, if any. Called by the
+    workers.
+
+    Args:
+      task: string: The display name of the task.
+      part: string: The part of the task, e.g. its shard. Empty if the task is not sharded.
+      tail: string: The last lines of the log.
+    """
+    if cls._updates is None: return
+    cls._updates.put((task, part, MailDigest.TruncateToTail(tail, cls.TAIL_LINES)))
+
+  def Queue(self, tasks):
+    """Marks the pending tasks among the tasks as queued. They are ready but wait for a slot or
+    resources."""
+    now = time.time()
+    with self._lock:
+      for task in tasks:
+        status = self._tasks.get(task)
+        if status and status['state'] == 'pending':
+          status.update({'state': 'queued', 'queued': now})
+
+  def Start(self, task):
+    """Marks the task as running."""
+    with self._lock:
+      self._tasks[task].update({'state': 'running', 'start': time.time()})
+
+  def Finish(self, task, succeeded, status, reason=None):
+    """Marks the task as finished.
+
+    Args:
+      task: string: The display name of the task.
+      succeeded: bool: True if the task succeeded.
+      status: string: The description of the status of the task.
+      reason: string: The reason the task failed, if known.
+    """
+    with self._lock:
+      self._tasks[task].update({'state': 'succeeded' if succeeded else 'failed',
+                                'end': time.time(), 'status': status, 'reason': reason})
+
+  def GetStatus(self):
+    """Returns the status of the run.
+
+    Return:
+      dict: The 'title', 'elapsed' time of the run, 'counts' of tasks per state and the 'tasks'
+          ordered by state and priority, each with its 'task', 'state', 'elapsed' time, 'status',
+          'reason' and 'log_tail' if known.
+    """
+    now = time.time()
+    with self._lock:
+      tasks = []
+      for task in self._order:
+        status = self._tasks[task]
+        entry = {'task': task, 'state': status['state']}
+        if 'start' in status: entry['elapsed'] = round(status.get('end', now) - status['start'], 2)
+        elif 'queued' in status: entry['elapsed'] = round(now - status['queued'], 2)
+        if status.get('status'): entry['status'] = status['status']
+        if status.get('reason'): entry['reason'] = status['reason']
+        tails = self._tails.get(task)
+        if tails:
+          entry['log_tail'] = ''.join(
+              ('[%s]\n%s' % (x, tails[x]) if x else tails[x]) for x in sorted(tails))
+        tasks += [entry]
+    tasks.sort(key=lambda x: self.STATES.index(x['state']))
+    counts = {x: len([y for y in tasks if y['state'] == x]) for x in self.STATES}
+    return {'title': self._title, 'elapsed': round(now - self._start, 2), 'counts': counts,
+            'tasks': tasks}
+
+  def GetHtml(self):
+    """Returns: string: The status of the run as an HTML page."""
+    status = self.GetStatus()
+    title = html.escape(status['title'])
+    lines = ['<!DOCTYPE html>', '<html><head>',
+             '<meta http-equiv="refresh" content="%d">' % self.REFRESH_INTERVAL,
+             '<title>%s</title>' % title, '</head><body>',
+             '<h1>%s</h1>' % title,
+             '<p>Elapsed: %.0fs. %s</p>' % (status['elapsed'], ', '.join(
+                 '%s: %d' % (x, status['counts'][x]) for x in self.STATES))]
+    for state in self.STATES:
+      tasks = [x for x in status['tasks'] if x['state'] == state]
+      if not tasks: continue
+      lines += ['<h2>%s (%d)</h2>' % (state.capitalize(), len(tasks)),
+                '<table border="1" cellpadding="4">',
+                '<tr><th>Task</th><th>Elapsed</th><th>Status</th></tr>']
+      for task in tasks:
+        elapsed = '%.0fs' % task['elapsed'] if 'elapsed' in task else ''
+        description = ' '.join(html.escape(task[x]) for x in ['status', 'reason'] if x in task)
+        lines += ['<tr><td>%s</td><td>%s</td><td>%s</td></tr>' %
+                  (html.escape(task['task']), elapsed, description)]
+        if task.get('log_tail') and state in ['running', 'failed']:
+          lines += ['<tr><td colspan="3"><pre>%s</pre></td></tr>' % html.escape(task['log_tail'])]
+      lines += ['</table>']
+    lines += ['</body></html>']
+    return '\n'.join(lines)
+
+  def _ReadUpdates(self, updates):
+    """Reads the updates sent by the workers until the server stops."""
+    while True:
+      update = updates.get()
+      if update is None: break
+      (task, part, tail) = update
+      with self._lock:
+        self._tails.setdefault(task, {})[part] = tail
+
+
+class _StatusRequestHandler(http.server.BaseHTTPRequestHandler):
+  """Handler for the queries of the status server."""
+
+  def do_GET(self):
+    path = self.path.split('?')[0]
+    if path == '/status.json':
+      self._Send(json.dumps(self.server.status.GetStatus(), indent=2), 'application/json')
+    elif path in ['/', '/index.html']:
+      self._Send(self.server.status.GetHtml(), 'text/html')
+    else:
+      self.send_error(404)
+
+  def log_message(self, format, *args):
+    TermColor.VInfo(3, 'Status query: %s' % (format % args))
+
+  def _Send(self, body, content_type):
+    """Sends the body of the response."""
+    data = body.encode('utf-8')
+    self.send_response(200)
+    self.send_header('Content-Type', '%s; charset=utf-8' % content_type)
+    self.send_header('Content-Length', str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
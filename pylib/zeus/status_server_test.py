@@ -0,0 +1,64 @@
+"""Tests for status_server."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import argparse
+import json
+import time
+import unittest
+import urllib.error
+import urllib.request
+
+from pylib.base.flags import Flags
+from pylib.zeus.status_server import StatusServer
+
+
+class StatusServerTest(unittest.TestCase):
+  """Tests for StatusServer."""
+
+  def setUp(self):
+    Flags.ARGS = argparse.Namespace(verbose=0)
+    self.server = StatusServer('localhost', 0, '[test:20140107]', ['//a', '//b', '//c', '//d'])
+    self.url = 'http://localhost:%d' % self.server.address()[1]
+
+  def tearDown(self):
+    self.server.Stop()
+    self.assertIsNone(StatusServer._updates)
+
+  def _Get(self, path):
+    with urllib.request.urlopen(self.url + path) as f: return f.read().decode('utf-8')
+
+  def test_status(self):
+    self.server.Start('//a')
+    self.server.Finish('//a', False, 'FAILURE', 'memory limit')
+    self.server.Start('//b')
+    self.server.Queue(['//a', '//c'])
+    StatusServer.PostTail('//b', 'shard1', '\n'.join(str(x) for x in range(100)) + '\n')
+    StatusServer.PostTail('//b', 'shard0', 'done\n')
+    # The tails are read by a thread of the server.
+    for unused_i in range(100):
+      status = json.loads(self._Get('/status.json'))
+      if 'shard0' in status['tasks'][0].get('log_tail', ''): break
+      time.sleep(0.01)
+
+    self.assertEqual(status['title'], '[test:20140107]')
+    self.assertEqual(status['counts'], {'running': 1, 'queued': 1, 'pending': 1, 'failed': 1,
+                                        'succeeded': 0})
+    self.assertEqual([(x['task'], x['state']) for x in status['tasks']],
+                     [('//b', 'running'), ('//c', 'queued'), ('//d', 'pending'),
+                      ('//a', 'failed')])
+    self.assertEqual(status['tasks'][3]['reason'], 'memory limit')
+    self.assertIn('elapsed', status['tasks'][0])
+    self.assertNotIn('elapsed', status['tasks'][2])
+    tail = status['tasks'][0]['log_tail']
+    self.assertTrue(tail.startswith('[shard0]\ndone\n[shard1]\n[... 80 lines truncated ...]\n80\n'))
+
+    page = self._Get('/')
+    self.assertIn('<h2>Running (1)</h2>', page)
+    self.assertIn('FAILURE memory limit', page)
+    with self.assertRaises(urllib.error.HTTPError): self._Get('/missing')
+
+
+if __name__ == '__main__':
+  unittest.main()
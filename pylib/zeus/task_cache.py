@@ -0,0 +1,247 @@
+"""Caches the outputs of pipeline tasks keyed by the hash of their inputs."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from pylib.base.term_color import TermColor
+from pylib.file.copy_engine import CopyEngine
+from pylib.file.file_utils import FileUtils
+
+
+class TaskCache(object):
+  """Class to memoize a single task.
+
+  Caching is opt-in. A task is cached if it has a '<task>.cache' sidecar file listing its inputs
+  and outputs, one per line:
+    input: //000_feeds/raw
+    input: ${PIPELINE_FEED_DIR_PREV}/hotels.tsv
+    output: ${PIPELINE_OUT_DIR}/hotels
+  Env vars of the task are expanded. Paths starting with '//' are relative to the pipeline base
+  dir, other relative paths are relative to the dir of the task. Lines starting with '#' are
+  comments. The outputs must be inside the out dirs of the task, e.g. its PIPELINE_OUT_DIR, as
+  they are removed before it runs. A task declaring any other output is not cached.
+
+  The key of the task is the hash of the task file, the sidecar, the env vars of the task and the
+  contents of all the files under the inputs. After a successful run the outputs are copied into
+  '<cache_dir>/<key>'. When a later run has the same key, the outputs are copied back from there
+  and the task is not executed. The files are cloned where the file system supports it, but never
+  hardlinked, so a task rewriting an output in place cannot change the cache. Restoring an entry
+  marks it as used. See GetExpiredEntries() for its removal.
+
+  Members:
+    _task: string: The task.
+    _outputs: list: The declared outputs of the task.
+    _key: string: The key for the current inputs of the task.
+    _entry_dir: string: The dir of the cache entry for the key.
+  """
+
+  CACHE_SUFFIX = '.cache'
+
+  # The file describing a complete cache entry. Written last.
+  MANIFEST = 'MANIFEST.json'
+
+  # Hashes of the input files computed by this process, keyed by (path, size, mtime).
+  _FILE_HASHES = {}
+
+  def __init__(self, task, outputs, key, cache_dir):
+    self._task = task
+    self._outputs = outputs
+    self._key = key
+    self._entry_dir = os.path.join(cache_dir, key[:2], key)
+
+  @classmethod
+  def GetCacheFile(cls, task):
+    """Returns: string: The sidecar file with the cache declaration of the task."""
+    return task + cls.CACHE_SUFFIX
+
+  @classmethod
+  def Create(cls, task, task_vars, base_dir, cache_dir, out_dirs):
+    """Creates the cache for the task.
+
+    Args:
+      task: string: The task.
+      task_vars: dict {string, string}: The env vars for the task.
+      base_dir: string: The pipeline base dir used to resolve '//' paths.
+      cache_dir: string: The root dir of the cache.
+      out_dirs: list(string): The out dirs of the task. The outputs must be inside them.
+
+    Return:
+      TaskCache: The cache for the task. None if the task is not cached.
+    """
+    cache_file = cls.GetCacheFile(task)
+    if not cache_dir or not os.path.isfile(cache_file): return None
+
+    declaration = FileUtils.FileContents(cache_file) or ''
+    inputs = []; outputs = []
+    for line in declaration.splitlines():
+      line = line.split('#', 1)[0].strip()
+      if not line: continue
+      (kind, sep, path) = [x.strip() for x in line.partition(':')]
+      if not sep or kind not in ('input', 'output') or not path:
+        TermColor.Warning('Ignoring invalid line [%s] in %s' % (line, cache_file))
+        continue
+      path = cls._ResolvePath(task, path, task_vars, base_dir)
+      if kind == 'input': inputs += [path]
+      else: outputs += [path]
+
+    # The outputs are removed before the task runs. Never remove the dirs shared with other tasks.
+    for output in outputs:
+      if not any(output.startswith(os.path.normpath(x) + os.sep) for x in out_dirs if x):
+        TermColor.Warning('Not caching %s. The output %s is not inside the out dirs of the task.' %
+                          (task, output))
+        return None
+
+    key = hashlib.sha256()
+    for data in [FileUtils.FileContents(task) or '', declaration,
+                 json.dumps(task_vars, sort_keys=True)]:
+      key.update(data.encode('utf-8'))
+    for (path, digest) in cls.GetInputManifest(inputs):
+      key.update(('%s %s\n' % (path, digest)).encode('utf-8'))
+    return TaskCache(task, outputs, key.hexdigest(), cache_dir)
+
+  @classmethod
+  def _ResolvePath(cls, task, path, task_vars, base_dir):
+    """Returns the absolute path for a path in the sidecar."""
+    for (k, v) in sorted(task_vars.items(), key=lambda x: -len(x[0])):
+      path = path.replace('${%s}' % k, v).replace('$%s' % k, v)
+    if path.startswith('//'): return os.path.normpath(os.path.join(base_dir, path[2:]))
+    return os.path.normpath(os.path.join(os.path.dirname(task), path))
+
+  @classmethod
+  def GetInputManifest(cls, inputs):
+    """Returns the manifest of the inputs.
+
+    Args:
+      inputs: list: List of input files and dirs.
+
+    Return:
+      list: Sorted list of (path, md5) for all the files under the inputs. The md5 is 'missing'
+          for inputs that do not exist.
+    """
+    manifest = set()
+    for path in inputs:
+      if os.path.isfile(path):
+        manifest.add((path, cls.GetFileHash(path)))
+      elif os.path.isdir(path):
+        for (root, dirs, files) in os.walk(path):
+          for f in files:
+            f = os.path.join(root, f)
+            manifest.add((f, cls.GetFileHash(f)))
+      else:
+        manifest.add((path, 'missing'))
+    return sorted(manifest)
+
+  @classmethod
+  def GetFileHash(cls, path):
+    """Returns: string: The md5 of the contents of the file."""
+    st = os.stat(path)
+    stat_key = (path, st.st_size, st.st_mtime_ns)
+    if stat_key not in cls._FILE_HASHES:
+      md5 = hashlib.md5()
+      with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+          md5.update(chunk)
+      cls._FILE_HASHES[stat_key] = md5.hexdigest()
+    return cls._FILE_HASHES[stat_key]
+
+  def key(self):
+    """Returns: string: The key for the current inputs of the task."""
+    return self._key
+
+  def Restore(self):
+    """Restores the outputs of the task from the cache.
+
+    Return:
+      bool: True if the outputs were restored. False if there is no entry for the key.
+    """
+    manifest = FileUtils.FileContents(os.path.join(self._entry_dir, self.MANIFEST))
+    if not manifest: return False
+    try:
+      entry = json.loads(manifest)
+      if entry['outputs'] != self._outputs: return False
+      self.RemoveOutputs()
+      for (i, output) in enumerate(self._outputs):
+        cached = os.path.join(self._entry_dir, str(i))
+        if os.path.lexists(cached): self._CopyTree(cached, output)
+      # Mark the entry as used.
+      os.utime(os.path.join(self._entry_dir, self.MANIFEST))
+    except (OSError, IOError, ValueError, KeyError) as e:
+      TermColor.Warning('Could not restore %s from the cache. Error: %s' % (self._task, e))
+      return False
+    return True
+
+  def RemoveOutputs(self):
+    """Removes the declared outputs of the task. They are all inside its out dirs."""
+    for output in self._outputs:
+      if os.path.isdir(output) and not os.path.islink(output):
+        shutil.rmtree(output)
+      elif os.path.lexists(output):
+        os.remove(output)
+
+  def Save(self):
+    """Saves the outputs of the task in the cache. Missing outputs are recorded as such."""
+    tmp_dir = '%s.tmp.%d' % (self._entry_dir, os.getpid())
+    try:
+      shutil.rmtree(tmp_dir, ignore_errors=True)
+      FileUtils.MakeDirs(tmp_dir)
+      for (i, output) in enumerate(self._outputs):
+        if os.path.lexists(output): self._CopyTree(output, os.path.join(tmp_dir, str(i)))
+      FileUtils.CreateFileWithData(os.path.join(tmp_dir, self.MANIFEST), json.dumps(
+          {'task': self._task, 'outputs': self._outputs, 'time': time.time()}, indent=2))
+      # Another run may have saved the same entry in the meantime.
+      shutil.rmtree(self._entry_dir, ignore_errors=True)
+      os.rename(tmp_dir, self._entry_dir)
+    except (OSError, IOError) as e:
+      # The cache is only an optimization. Never fail the task because of it.
+      TermColor.Warning('Could not cache the outputs of %s. Error: %s' % (self._task, e))
+      shutil.rmtree(tmp_dir, ignore_errors=True)
+
+  @classmethod
+  def GetExpiredEntries(cls, cache_dir, max_age):
+    """Returns the entries of the cache that were not used recently.
+
+    Args:
+      cache_dir: string: The root dir of the cache.
+      max_age: float: The entries not saved or restored for this many seconds expire.
+
+    Return:
+      list(string): The dirs of the expired entries, including the partial entries of saves that
+          were interrupted.
+    """
+    expired = []
+    now = time.time()
+    try:
+      prefixes = [x.path for x in os.scandir(cache_dir) if x.is_dir(follow_symlinks=False)]
+    except OSError:
+      return []
+    for prefix in prefixes:
+      try:
+        entries = [x for x in os.scandir(prefix) if x.is_dir(follow_symlinks=False)]
+      except OSError:
+        continue
+      for entry in entries:
+        try:
+          used = os.stat(os.path.join(entry.path, cls.MANIFEST)).st_mtime
+        except OSError:
+          used = entry.stat(follow_symlinks=False).st_mtime
+        if now - used > max_age: expired += [entry.path]
+    return sorted(expired)
+
+  @classmethod
+  def _CopyTree(cls, src, dst):
+    """Copies the file or dir tree src to dst. Links are copied as links."""
+    if os.path.islink(src):
+      FileUtils.MakeDirs(os.path.dirname(dst))
+      os.symlink(os.readlink(src), dst)
+    elif os.path.isdir(src):
+      if CopyEngine(link='reflink').CopyTree(src, dst)['failed']:
+        raise OSError('Could not copy %s to %s' % (src, dst))
+    else:
+      FileUtils.MakeDirs(os.path.dirname(dst))
+      shutil.copy2(src, dst)
@@ -0,0 +1,109 @@
+"""Tests for task_cache."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pylib.file.file_utils import FileUtils
+from pylib.zeus.task_cache import TaskCache
+
+
+class TaskCacheTest(unittest.TestCase):
+  """Tests for TaskCache."""
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.cache_dir = os.path.join(self.dir, 'cache')
+    self.out_dir = os.path.join(self.dir, 'out')
+    self.task = os.path.join(self.dir, 'run', '000_task')
+    self.input = os.path.join(self.dir, 'run', 'input.tsv')
+    FileUtils.MakeDirs(os.path.dirname(self.task))
+    FileUtils.CreateFileWithData(self.task, '#!/bin/bash\n')
+    FileUtils.CreateFileWithData(self.input, 'a\n')
+    FileUtils.CreateFileWithData(TaskCache.GetCacheFile(self.task),
+                                 '# Cached.\ninput: input.tsv\noutput: $PIPELINE_OUT_DIR/res\n')
+    self.vars = {'PIPELINE_OUT_DIR': self.out_dir}
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def _Create(self):
+    return TaskCache.Create(self.task, self.vars, self.dir, self.cache_dir, [self.out_dir])
+
+  def _Run(self):
+    """Writes the outputs like the task would."""
+    FileUtils.MakeDirs(os.path.join(self.out_dir, 'res'))
+    FileUtils.CreateFileWithData(os.path.join(self.out_dir, 'res', 'data'),
+                                 FileUtils.FileContents(self.input))
+
+  def test_not_cached(self):
+    os.remove(TaskCache.GetCacheFile(self.task))
+    self.assertIsNone(self._Create())
+
+  def test_not_owned_outputs(self):
+    # The out dir of the task is shared with other tasks. Never cache and remove it.
+    for output in ['$PIPELINE_OUT_DIR', '$PIPELINE_OUT_DIR/../res', '//res']:
+      FileUtils.CreateFileWithData(TaskCache.GetCacheFile(self.task), 'output: %s\n' % output)
+      self.assertIsNone(self._Create())
+
+  def test_key(self):
+    key = self._Create().key()
+    self.assertEqual(self._Create().key(), key)
+
+    # The env, the task and the contents of the inputs are all part of the key.
+    self.vars['PIPELINE_DATE'] = '20160101'
+    self.assertNotEqual(self._Create().key(), key)
+    key = self._Create().key()
+    FileUtils.CreateFileWithData(self.input, 'b\n')
+    self.assertNotEqual(self._Create().key(), key)
+    key = self._Create().key()
+    FileUtils.CreateFileWithData(self.task, '#!/bin/bash\necho\n')
+    self.assertNotEqual(self._Create().key(), key)
+
+  def test_save_and_restore(self):
+    cache = self._Create()
+    self.assertFalse(cache.Restore())
+    self._Run()
+    cache.Save()
+
+    shutil.rmtree(self.out_dir)
+    self.assertTrue(self._Create().Restore())
+    self.assertEqual(FileUtils.FileContents(os.path.join(self.out_dir, 'res', 'data')), 'a\n')
+
+    # A changed input misses the cache.
+    FileUtils.CreateFileWithData(self.input, 'b\n')
+    self.assertFalse(self._Create().Restore())
+
+  def test_rewrite_restored_output(self):
+    self._Run()
+    self._Create().Save()
+    shutil.rmtree(self.out_dir)
+    self.assertTrue(self._Create().Restore())
+
+    # Rewriting a restored output in place does not change the cache.
+    with open(os.path.join(self.out_dir, 'res', 'data'), 'w') as f: f.write('changed\n')
+    self.assertTrue(self._Create().Restore())
+    self.assertEqual(FileUtils.FileContents(os.path.join(self.out_dir, 'res', 'data')), 'a\n')
+
+  def test_expired_entries(self):
+    self._Run()
+    self._Create().Save()
+    entry = os.path.join(self.cache_dir, self._Create().key()[:2], self._Create().key())
+    self.assertEqual(TaskCache.GetExpiredEntries(self.cache_dir, 3600), [])
+
+    old = time.time() - 7200
+    os.utime(os.path.join(entry, TaskCache.MANIFEST), (old, old))
+    self.assertEqual(TaskCache.GetExpiredEntries(self.cache_dir, 3600), [entry])
+    # Restoring the entry marks it as used.
+    self.assertTrue(self._Create().Restore())
+    self.assertEqual(TaskCache.GetExpiredEntries(self.cache_dir, 3600), [])
+    self.assertEqual(TaskCache.GetExpiredEntries(os.path.join(self.dir, 'missing'), 0), [])
+
+
+if __name__ == '__main__':
+  unittest.main()
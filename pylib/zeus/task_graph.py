@@ -0,0 +1,230 @@
+"""Dependency graph for the tasks of a pipeline run."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+
+from pylib.file.file_utils import FileUtils
+
+from pylib.zeus.pipeline_utils import PipelineUtils
+
+
+class TaskGraph(object):
+  """Class to track the dependencies between the tasks of a run.
+
+  By default a task waits for all the tasks at the earlier priority levels. This is the same as
+  running each priority level as a barrier. A task may instead declare its dependencies in a
+  '<task>.deps' sidecar file, one per line. Each line is either
+    - a path relative to the dir of the task, e.g. '000_gen_feed',
+    - a path relative to the pipeline base dir, starting with '//', e.g. '//100_hotels/000_gen',
+    - a directory, in which case the task depends on all the tasks in it.
+  Lines starting with '#' are comments. An empty sidecar means the task has no dependencies.
+
+  Declared dependencies must succeed (or fail with '.allow_fail') for the task to run. The
+  default dependencies only order the tasks, exactly like the priority barrier did. Dependencies
+  that are not part of the current run are considered satisfied.
+
+  Members:
+    _order: dict {string, int}: The position of each task in the priority order.
+    _deps: dict {string, set(string)}: The tasks each task must wait for.
+    _required: dict {string, set(string)}: The subset of _deps that must succeed.
+    _dependents: dict {string, set(string)}: The tasks waiting for each task.
+    _waiting: dict {string, int}: The number of unfinished dependencies of each task.
+    _status: dict {string, int}: The exit status of the finished tasks.
+    _started: set(string): The tasks that were started or skipped.
+    _ready: set(string): The tasks not yet started with all their dependencies finished.
+  """
+
+  DEPS_SUFFIX = '.deps'
+
+  def __init__(self, tasks, base_dir=''):
+    """Creates the graph.
+
+    Args:
+      tasks: OrderedDict {string, set(string)}: Dict from priority to set of tasks to execute at
+          the priority. Note: the dict is ordered by priority.
+      base_dir: string: The pipeline base dir used to resolve '//' dependencies.
+    """
+    self._order = {}
+    self._deps = {}
+    self._required = {}
+    self._dependents = {}
+    self._waiting = {}
+    self._status = {}
+    self._started = set()
+    self._ready = set()
+
+    for set_tasks in tasks.values():
+      for task in sorted(set_tasks):
+        self._order[task] = len(self._order)
+
+    # The tasks that finish only once all the tasks of the earlier levels have finished. The tasks
+    # without declared dependencies wait for them. Waiting for these instead of for every earlier
+    # task keeps the graph linear in the size of the run.
+    barrier = set()
+    for set_tasks in tasks.values():
+      undeclared = False
+      for task in set_tasks:
+        declared = self.GetDeclaredDeps(task, base_dir)
+        self._required[task] = set()
+        if declared is None:
+          self._deps[task] = set(barrier)
+          undeclared = True
+        else:
+          self._deps[task] = set()
+          for dep in declared:
+            self._AddDeclaredDep(task, dep)
+      # A task with declared dependencies may finish before the earlier levels. The level only
+      # replaces the barrier if one of its tasks waits for it.
+      barrier = set(set_tasks) if undeclared else barrier | set(set_tasks)
+
+    for task in self._order:
+      self._dependents.setdefault(task, set())
+      for dep in self._deps[task]:
+        self._dependents.setdefault(dep, set()).add(task)
+      self._waiting[task] = len(self._deps[task])
+      if not self._waiting[task]: self._ready.add(task)
+
+  @classmethod
+  def GetDepsFile(cls, task):
+    """Returns: string: The sidecar file with the dependencies of the task."""
+    return task + cls.DEPS_SUFFIX
+
+  @classmethod
+  def GetDeclaredDeps(cls, task, base_dir=''):
+    """Returns the dependencies declared for the task.
+
+    Args:
+      task: string: The task.
+      base_dir: string: The pipeline base dir used to resolve '//' dependencies.
+
+    Return:
+      list: List of absolute paths of the declared dependencies. None if the task does not declare
+          any dependencies.
+    """
+    deps_file = cls.GetDepsFile(task)
+    if not os.path.isfile(deps_file): return None
+
+    deps = []
+    for line in (FileUtils.FileContents(deps_file) or '').splitlines():
+      line = line.split('#', 1)[0].strip()
+      if not line: continue
+      if line.startswith('//'):
+        deps += [os.path.normpath(os.path.join(base_dir, line[2:]))]
+      else:
+        deps += [os.path.normpath(os.path.join(PipelineUtils.TaskDirName(task), line))]
+    return deps
+
+  def _AddDeclaredDep(self, task, dep):
+    """Adds the dependency to the task. Directories add all the tasks in the run under them."""
+    if dep in self._order:
+      matches = [dep]
+    else:
+      prefix = dep.rstrip(os.sep) + os.sep
+      matches = [x for x in self._order if x.startswith(prefix)]
+    matches = [x for x in matches if x != task]
+    self._deps[task] |= set(matches)
+    self._required[task] |= set(matches)
+
+  def AddOrderDep(self, task, dep):
+    """Makes the task wait for dep without requiring it to succeed."""
+    if dep not in self._order or dep == task or dep in self._deps[task]: return
+    self._deps[task].add(dep)
+    self._dependents[dep].add(task)
+    if dep not in self._status:
+      self._waiting[task] += 1
+      self._ready.discard(task)
+
+  def RemoveDep(self, task, dep):
+    """Makes the task no longer wait for dep, e.g. when they must run at the same time."""
+    if dep not in self._deps[task]: return
+    self._deps[task].discard(dep)
+    self._required[task].discard(dep)
+    self._dependents[dep].discard(task)
+    if dep not in self._status:
+      self._waiting[task] -= 1
+      if not self._waiting[task] and task not in self._started: self._ready.add(task)
+
+  def tasks(self):
+    """Returns: list: All the tasks in priority order."""
+    return sorted(self._order, key=self._order.get)
+
+  def deps(self, task):
+    """Returns: set(string): The tasks the task waits for."""
+    return self._deps[task]
+
+  def required_deps(self, task):
+    """Returns: set(string): The tasks that must succeed for the task to run."""
+    return self._required[task]
+
+  def status(self, task):
+    """Returns: int: The status of the task. None if the task has not finished."""
+    return self._status.get(task)
+
+  def GetReadyTasks(self):
+    """Returns the tasks that have not been started and whose dependencies have all finished.
+
+    Return:
+      list: The ready tasks in priority order.
+    """
+    return sorted(self._ready, key=self._order.get)
+
+  def GetPendingTasks(self):
+    """Returns: list: The tasks that have not been started in priority order."""
+    return [x for x in self.tasks() if x not in self._started]
+
+  def Start(self, task):
+    """Marks the task as started."""
+    self._started.add(task)
+    self._ready.discard(task)
+
+  def Finish(self, task, status):
+    """Marks the task as finished with the given status."""
+    self.Start(task)
+    if task in self._status: return
+    self._status[task] = status
+    for x in self._dependents[task]:
+      self._waiting[x] -= 1
+      if not self._waiting[x] and x not in self._started: self._ready.add(x)
+
+  def GetFailedDep(self, task, ok_statuses):
+    """Returns the first required dependency of the task that did not succeed.
+
+    Args:
+      task: string: The task.
+      ok_statuses: list: The statuses considered successful.
+
+    Return:
+      string: The failed dependency. None if all the required dependencies succeeded.
+    """
+    return next((x for x in sorted(self._required[task], key=self._order.get)
+                 if self._status.get(x) not in ok_statuses), None)
+
+  def FindCycles(self):
+    """Returns the cycles in the graph. Declared dependencies may point to later tasks and form
+    cycles. The tasks on a cycle never become ready.
+
+    Return:
+      list: List of cycles. Each cycle is a list of tasks.
+    """
+    cycles = []
+    # 0: not visited, 1: on the current path, 2: done.
+    state = dict.fromkeys(self._order, 0)
+    for root in self.tasks():
+      if state[root]: continue
+      path = [root]
+      stack = [iter(sorted(self._deps[root], key=self._order.get))]
+      state[root] = 1
+      while stack:
+        dep = next(stack[-1], None)
+        if dep is None:
+          state[path.pop()] = 2
+          stack.pop()
+        elif state[dep] == 1:
+          cycles += [path[path.index(dep):]]
+        elif not state[dep]:
+          state[dep] = 1
+          path += [dep]
+          stack += [iter(sorted(self._deps[dep], key=self._order.get))]
+    return cycles
@@ -0,0 +1,105 @@
+"""Tests for task_graph."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+
+from pylib.file.file_utils import FileUtils
+from pylib.zeus.task_graph import TaskGraph
+
+
+class TaskGraphTest(unittest.TestCase):
+  """Tests for TaskGraph."""
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def _Task(self, name, deps=None):
+    """Creates the task and its deps sidecar if deps is not None."""
+    task = os.path.join(self.dir, name)
+    FileUtils.CreateFileWithData(task, '#!/bin/bash\n')
+    if deps is not None:
+      FileUtils.CreateFileWithData(TaskGraph.GetDepsFile(task), deps)
+    return task
+
+  def test_default_deps(self):
+    a = self._Task('000_a'); b = self._Task('000_b'); c = self._Task('100_c')
+    graph = TaskGraph(OrderedDict([('000', {a, b}), ('100', {c})]), self.dir)
+    self.assertEqual(graph.GetReadyTasks(), [a, b])
+    self.assertEqual(graph.required_deps(c), set())
+
+    graph.Start(a); graph.Start(b)
+    graph.Finish(a, 2)
+    self.assertEqual(graph.GetReadyTasks(), [])
+    graph.Finish(b, 0)
+    self.assertEqual(graph.GetReadyTasks(), [c])
+    # Default deps only order the tasks.
+    self.assertIsNone(graph.GetFailedDep(c, [0]))
+
+  def test_declared_deps(self):
+    slow = self._Task('000_slow'); fast = self._Task('000_fast')
+    FileUtils.MakeDirs(os.path.join(self.dir, '010_dir'))
+    sub = self._Task(os.path.join('010_dir', '000_x'))
+    c = self._Task('100_c', '# comment\n000_fast\n')
+    d = self._Task('100_d', '//010_dir\n//missing\n')
+    e = self._Task('100_e', '')
+    graph = TaskGraph(OrderedDict([('000', {slow, fast}), ('010', {sub}),
+                                   ('100', {c, d, e})]), self.dir)
+    self.assertEqual(graph.deps(c), {fast})
+    self.assertEqual(graph.deps(d), {sub})
+    self.assertEqual(graph.GetReadyTasks(), [fast, slow, e])
+
+    graph.Finish(fast, 0)
+    self.assertEqual(graph.GetReadyTasks(), [slow, c, e])
+    graph.Finish(sub, 2)
+    self.assertEqual(graph.GetFailedDep(d, [0, 1]), sub)
+    self.assertIsNone(graph.GetFailedDep(c, [0, 1]))
+
+  def test_default_deps_after_declared_deps(self):
+    a = self._Task('000_a'); b = self._Task('100_b', ''); c = self._Task('200_c')
+    d = self._Task('300_d')
+    graph = TaskGraph(OrderedDict([('000', {a}), ('100', {b}), ('200', {c}), ('300', {d})]),
+                      self.dir)
+    # Tasks without declared deps still wait for all the earlier levels.
+    self.assertEqual(graph.deps(c), {a, b})
+    self.assertEqual(graph.deps(d), {c})
+    self.assertEqual(graph.GetReadyTasks(), [a, b])
+    graph.Finish(b, 0)
+    self.assertEqual(graph.GetReadyTasks(), [a])
+    graph.Finish(a, 0)
+    self.assertEqual(graph.GetReadyTasks(), [c])
+
+  def test_order_deps_and_cycles(self):
+    a = self._Task('000_a', '100_b'); b = self._Task('100_b')
+    graph = TaskGraph(OrderedDict([('000', {a}), ('100', {b})]), self.dir)
+    self.assertEqual(graph.FindCycles(), [[a, b]])
+    self.assertEqual(graph.GetReadyTasks(), [])
+
+    c = self._Task('000_c'); d = self._Task('100_d', '')
+    graph = TaskGraph(OrderedDict([('000', {c}), ('100', {d})]), self.dir)
+    self.assertEqual(graph.GetReadyTasks(), [c, d])
+    graph.AddOrderDep(d, c)
+    self.assertEqual(graph.GetReadyTasks(), [c])
+    graph.Finish(c, 2)
+    self.assertEqual(graph.GetReadyTasks(), [d])
+    self.assertIsNone(graph.GetFailedDep(d, [0]))
+
+  def test_remove_dep(self):
+    a = self._Task('000_a'); b = self._Task('100_b')
+    graph = TaskGraph(OrderedDict([('000', {a}), ('100', {b})]), self.dir)
+    self.assertEqual(graph.GetReadyTasks(), [a])
+    graph.RemoveDep(b, a)
+    self.assertEqual(graph.GetReadyTasks(), [a, b])
+    self.assertEqual(graph.deps(b), set())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,183 @@
+"""Manifest of the tasks discovered in a pipeline."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import json
+import os
+import time
+from collections import OrderedDict
+
+from pylib.base.flags import Flags
+from pylib.base.term_color import TermColor
+from pylib.file.file_utils import FileUtils
+from pylib.zeus.pipeline_config import PipelineConfig
+from pylib.zeus.pipeline_utils import PipelineUtils
+import pylib.util.singleton as singleton
+
+
+class TaskManifest(singleton.Singleton):
+  """Class to save the tasks discovered in a pipeline and reuse them in later runs.
+  This is a singleton class. Make sure to always access it through TaskManifest.Instance().
+
+  Discovering the tasks walks the whole pipeline tree and reads the timeout of every task, which
+  takes seconds for large pipelines on network filesystems. The manifest keeps the tasks by
+  priority with their timeouts and output dirs, and the mtimes of the dirs and timeout files they
+  were discovered from. Files are only added to or removed from a dir by changing its mtime, so
+  the manifest is valid as long as none of the mtimes changed. Checking it only stats the dirs.
+
+  Members:
+    _key: dict: The targets the tasks were discovered for.
+    _tasks: OrderedDict {string, set(string)}: The priority to the tasks at the priority.
+    _timeouts: dict {string, string}: The task to the contents of its timeout file, if any.
+    _out_dirs: dict {string, string}: The task to its output dir relative to the subdirs.
+  """
+
+  # The version of the manifest. Manifests of other versions are ignored.
+  VERSION = 1
+
+  # Entries modified this many seconds before the manifest was saved could have changed again in
+  # the same mtime tick, so the manifest is not trusted for them.
+  RACY_SECONDS = 2
+
+  def __init__(self):
+    """Initialize the singleton instance."""
+    self.Reset()
+
+  @classmethod
+  def AddArguments(cls, parser):
+    """Adds the arguments for the manifest.
+
+    Args:
+      parser: ArgumentParser: The argument parser for the command.
+    """
+    parser.add_argument('--nomanifest', action='store_true', default=False,
+                        help='Always discover the tasks by walking the pipeline tree instead of '
+                        'reusing the tasks saved by an earlier command.')
+
+  @classmethod
+  def GetManifestFile(cls):
+    """Returns: string: The manifest of the pipeline. None if there is none."""
+    if getattr(Flags.ARGS, 'nomanifest', False): return None
+    if PipelineConfig.Instance().pipeline_output_dir():
+      return os.path.join(PipelineConfig.Instance().pipeline_output_dir(), 'manifest.json')
+    return None
+
+  @classmethod
+  def GetKey(cls, targets, ignore_list):
+    """Returns the key for the tasks discovered for the targets.
+
+    Args:
+      targets: list: List of input targets.
+      ignore_list: list: List of strings to ignore.
+
+    Return:
+      dict: The key. Relative targets depend on the working dir.
+    """
+    return {'targets': list(targets), 'ignore_list': list(ignore_list), 'cwd': os.getcwd(),
+            'base_dir': PipelineConfig.Instance().pipeline_base_dir()}
+
+  @classmethod
+  def ReadTimeout(cls, task):
+    """Returns: string: The contents of the timeout file of the task. None if there is none."""
+    timeout = FileUtils.FileContents(task + '.timeout')
+    if not timeout:
+      timeout = FileUtils.FileContents(os.path.join(PipelineUtils.TaskDirName(task), 'timeout'))
+    return timeout
+
+  def Reset(self):
+    """Forgets the tasks."""
+    self._key = None
+    self._tasks = None
+    self._timeouts = {}
+    self._out_dirs = {}
+
+  def tasks(self):
+    """Returns: OrderedDict {string, set(string)}: The priority to the tasks at the priority."""
+    return self._tasks
+
+  def GetTimeout(self, task):
+    """Returns: string: The contents of the timeout file of the task. None if there is none."""
+    if task in self._timeouts: return self._timeouts[task]
+    return self.ReadTimeout(task)
+
+  def GetOutputRelativeDir(self, task):
+    """Returns: string: The output dir of the task relative to the subdirs. See
+    PipelineUtils.GetTaskOutputRelativeDir()."""
+    if task in self._out_dirs: return self._out_dirs[task]
+    return PipelineUtils.GetTaskOutputRelativeDir(task)
+
+  def Load(self, filename, key):
+    """Loads the tasks saved for the key if none of their sources changed.
+
+    Args:
+      filename: string: The manifest. See GetManifestFile().
+      key: dict: The key for the tasks. See GetKey().
+
+    Return:
+      OrderedDict {string, set(string)}: The priority to the tasks at the priority. None if there
+          is no valid manifest.
+    """
+    self.Reset()
+    if not filename: return None
+    try:
+      with open(filename) as f: manifest = json.load(f)
+    except (OSError, ValueError):
+      return None
+
+    if manifest.get('version') != self.VERSION or manifest.get('key') != key: return None
+    racy = manifest['time'] - self.RACY_SECONDS
+    for (path, mtime) in manifest['mtimes'].items():
+      try:
+        if os.stat(path).st_mtime != mtime or mtime >= racy: return None
+      except OSError:
+        return None
+
+    self._key = key
+    self._tasks = OrderedDict((k, set(v)) for (k, v) in manifest['tasks'])
+    self._timeouts = manifest['timeouts']
+    self._out_dirs = manifest['out_dirs']
+    TermColor.VInfo(1, 'Reusing the tasks discovered in %s' % filename)
+    return self._tasks
+
+  def Save(self, filename, key, tasks, roots):
+    """Saves the tasks discovered for the key.
+
+    Args:
+      filename: string: The manifest. None to only keep the tasks in memory.
+      key: dict: The key for the tasks. See GetKey().
+      tasks: OrderedDict {string, set(string)}: The priority to the tasks at the priority.
+      roots: list((string, bool)): The dirs the tasks were discovered in and if they were walked
+          recursively.
+    """
+    self._key = key
+    self._tasks = tasks
+    self._timeouts = {}
+    self._out_dirs = {}
+    mtimes = {}
+    for (root, recurse) in roots:
+      if not recurse:
+        mtimes[root] = os.stat(root).st_mtime
+        continue
+      for (dir, unused_subdirs, unused_files) in os.walk(root):
+        mtimes[dir] = os.stat(dir).st_mtime
+
+    for set_tasks in tasks.values():
+      for task in set_tasks:
+        self._out_dirs[task] = PipelineUtils.GetTaskOutputRelativeDir(task)
+        self._timeouts[task] = self.ReadTimeout(task)
+        for timeout_file in [task + '.timeout',
+                             os.path.join(PipelineUtils.TaskDirName(task), 'timeout')]:
+          if os.path.isfile(timeout_file): mtimes[timeout_file] = os.stat(timeout_file).st_mtime
+
+    if not filename: return
+    manifest = {'version': self.VERSION, 'key': key, 'time': time.time(), 'mtimes': mtimes,
+                'tasks': [(k, sorted(v)) for (k, v) in tasks.items()],
+                'timeouts': self._timeouts, 'out_dirs': self._out_dirs}
+    # Write a new file and rename it so that concurrent commands never read a partial manifest.
+    tmp_filename = '%s.%d' % (filename, os.getpid())
+    try:
+      with open(tmp_filename, 'w') as f: json.dump(manifest, f)
+      os.rename(tmp_filename, filename)
+    except OSError as e:
+      TermColor.Warning('Could not save the task manifest %s. Error: %s' % (filename, e))
@@ -0,0 +1,83 @@
+"""Tests for task_manifest."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pylib.base.flags import Flags
+from pylib.file.file_utils import FileUtils
+from pylib.zeus.pipeline_config import PipelineConfig
+from pylib.zeus.task_manifest import TaskManifest
+
+
+class TaskManifestTest(unittest.TestCase):
+  """Tests for TaskManifest."""
+
+  @classmethod
+  def setUpClass(cls):
+    # The config is a singleton. All the tests share the same pipeline.
+    cls.dir = tempfile.mkdtemp()
+    cls.root = os.path.join(cls.dir, 'run')
+    cls.args = Flags.ARGS
+    Flags.ARGS = argparse.Namespace(
+        verbose=0, id='test', root=cls.root, date='20160101', bin_root='', utils_root=cls.root,
+        publish_root='', nolog_output=True, log_to_tmp=False, out_dirs=[])
+    FileUtils.MakeDirs(cls.root)
+    PipelineConfig.Instance()
+
+  @classmethod
+  def tearDownClass(cls):
+    Flags.ARGS = cls.args
+    shutil.rmtree(cls.dir)
+
+  def setUp(self):
+    self.manifest = TaskManifest.Instance()
+    self.filename = os.path.join(self.dir, 'manifest.json')
+    self.tasks = {'000': [os.path.join(self.root, '000_a', '000_task')],
+                  '100': [os.path.join(self.root, '100_b', '000_task')]}
+    for task in sum(self.tasks.values(), []):
+      FileUtils.MakeDirs(os.path.dirname(task))
+      FileUtils.CreateFileWithData(task)
+    FileUtils.CreateFileWithData(os.path.join(self.root, '100_b', 'timeout'), '5m')
+    self._Age()
+    self.key = {'targets': ['...']}
+    self.manifest.Save(self.filename, self.key,
+                       dict((k, set(v)) for (k, v) in self.tasks.items()), [(self.root, True)])
+
+  def tearDown(self):
+    self.manifest.Reset()
+    shutil.rmtree(self.root)
+    FileUtils.MakeDirs(self.root)
+
+  def _Age(self):
+    # Entries modified just before the manifest is saved are not trusted.
+    old = time.time() - 100
+    for (dir, unused_subdirs, files) in os.walk(self.root):
+      for path in [dir] + [os.path.join(dir, x) for x in files]: os.utime(path, (old, old))
+
+  def test_load(self):
+    tasks = self.manifest.Load(self.filename, self.key)
+    self.assertEqual(dict((k, sorted(v)) for (k, v) in tasks.items()), self.tasks)
+    self.assertEqual(list(tasks), ['000', '100'])
+    self.assertEqual(self.manifest.GetTimeout(self.tasks['100'][0]), '5m')
+    self.assertEqual(self.manifest.GetOutputRelativeDir(self.tasks['100'][0]), 'b')
+    self.assertIsNone(self.manifest.Load(self.filename, {'targets': ['100_b/...']}))
+
+  def test_invalidate(self):
+    # A new task changes the mtime of its dir.
+    FileUtils.CreateFileWithData(os.path.join(self.root, '000_a', '100_task'))
+    self.assertIsNone(self.manifest.Load(self.filename, self.key))
+
+  def test_invalidate_timeout(self):
+    FileUtils.CreateFileWithData(os.path.join(self.root, '100_b', 'timeout'), '1h')
+    self.assertIsNone(self.manifest.Load(self.filename, self.key))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,187 @@
+"""Resources needed by pipeline tasks and admission of tasks within a resource budget."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+import re
+
+from pylib.base.term_color import TermColor
+from pylib.file.file_utils import FileUtils
+
+
+class TaskResources(object):
+  """Class to hold the resources a task needs.
+
+  The resources are declared in a '<task>.resources' sidecar file or, for all the tasks of a dir
+  without a sidecar, in a '.resources' file in the dir. One resource per line:
+    # Peak memory of the task. Suffixes k, m, g and t.
+    mem: 8g
+    # The number of cpu slots used by the task.
+    cpu: 4
+    # Tasks sharing any of these tags never run at the same time.
+    exclusive: mysql, big_disk
+  Lines starting with '#' are comments. A task without a declaration uses 1 cpu slot, no declared
+  memory and no tags.
+
+  Members:
+    mem: int: The memory needed by the task in bytes. 0 if not declared.
+    cpus: int: The number of cpu slots used by the task.
+    exclusive: set(string): The tags of the task.
+  """
+
+  RESOURCES_SUFFIX = '.resources'
+
+  SIZE_SUFFIXES = {'': 1, 'b': 1, 'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30, 't': 1 << 40}
+
+  def __init__(self, mem=0, cpus=1, exclusive=None):
+    self.mem = mem
+    self.cpus = cpus
+    self.exclusive = set(exclusive or [])
+
+  @classmethod
+  def GetResourcesFile(cls, task):
+    """Returns: string: The resources file that applies to the task. None if there is none."""
+    for filename in [task + cls.RESOURCES_SUFFIX,
+                     os.path.join(os.path.dirname(task), cls.RESOURCES_SUFFIX)]:
+      if os.path.isfile(filename): return filename
+    return None
+
+  @classmethod
+  def Load(cls, task):
+    """Loads the resources declared for the task.
+
+    Args:
+      task: string: The task.
+
+    Return:
+      TaskResources: The resources of the task.
+    """
+    resources = TaskResources()
+    filename = cls.GetResourcesFile(task)
+    if not filename: return resources
+
+    for line in (FileUtils.FileContents(filename) or '').splitlines():
+      line = line.split('#', 1)[0].strip()
+      if not line: continue
+      (key, unused_sep, value) = [x.strip() for x in line.partition(':')]
+      try:
+        if key == 'mem': resources.mem = cls.ParseSize(value)
+        elif key == 'cpu': resources.cpus = max(int(value), 0)
+        elif key == 'exclusive':
+          resources.exclusive |= set([x.strip() for x in value.split(',') if x.strip()])
+        else: raise ValueError('unknown resource')
+      except ValueError as e:
+        TermColor.Warning('Ignoring invalid line [%s] in %s: %s' % (line, filename, e))
+    return resources
+
+  @classmethod
+  def ParseSize(cls, size):
+    """Parses a size like 512m or 8g.
+
+    Args:
+      size: string: The size.
+
+    Return:
+      int: The size in bytes.
+
+    Raises:
+      ValueError: If the size is invalid.
+    """
+    match = re.match(r'^(\d+(?:\.\d+)?)\s*([kmgtb]?)b?$', size.strip().lower())
+    if not match: raise ValueError('invalid size %s' % size)
+    return int(float(match.group(1)) * cls.SIZE_SUFFIXES[match.group(2)])
+
+  @classmethod
+  def FormatSize(cls, size):
+    """Returns: string: The size in bytes in a readable form."""
+    for suffix in ['B', 'KB', 'MB', 'GB']:
+      if size < 1024: return '%.1f%s' % (size, suffix)
+      size /= 1024.0
+    return '%.1fTB' % size
+
+
+class ResourceScheduler(object):
+  """Class to admit tasks only when the resources they need are available.
+
+  A task is admitted if its cpu slots and memory fit in what is left of the budget, none of its
+  exclusive tags is held by a running task, the machine has enough memory available and the load
+  average is below the max. When no task is running, the next task is always admitted so that a
+  task needing more than the whole budget still runs, by itself.
+
+  The first ready task that does not fit in the budget reserves its resources: later ready tasks
+  are only admitted if they fit alongside it, so that it is not starved by a stream of smaller
+  tasks.
+
+  Members:
+    _cpu_budget: int: The total number of cpu slots.
+    _mem_budget: int: The total memory in bytes. 0 for no budget.
+    _min_free_mem: int: The memory in bytes that must remain available on the machine.
+    _max_load: float: The max 1 minute load average to start tasks at. 0 for no max.
+    _running: dict {string, TaskResources}: The resources held by the running tasks.
+    _check_machine: bool: Check the memory available and the load of the machine. The budget
+        alone is checked when planning a run.
+  """
+
+  MEMINFO = '/proc/meminfo'
+
+  # The reasons for which the first blocked task reserves its resources.
+  BUDGET_REASONS = ('cpu budget', 'memory budget')
+
+  def __init__(self, cpu_budget, mem_budget=0, min_free_mem=0, max_load=0, check_machine=True):
+    self._cpu_budget = cpu_budget
+    self._mem_budget = mem_budget
+    self._min_free_mem = min_free_mem
+    self._max_load = max_load
+    self._running = {}
+    self._check_machine = check_machine
+
+  def GetBlockReason(self, resources, reserved=None):
+    """Checks if a task can be admitted now.
+
+    Args:
+      resources: TaskResources: The resources of the task.
+      reserved: TaskResources: The resources reserved by an earlier task waiting for the budget.
+
+    Return:
+      string: Why the task cannot run now. None if it can.
+    """
+    if not self._running: return None
+
+    used = list(self._running.values())
+    tags = set().union(*[x.exclusive for x in used])
+    if resources.exclusive & tags:
+      return 'exclusive %s' % ', '.join(sorted(resources.exclusive & tags))
+
+    used += [reserved] if reserved else []
+    if sum(x.cpus for x in used) + resources.cpus > self._cpu_budget:
+      return 'cpu budget'
+    if self._mem_budget and sum(x.mem for x in used) + resources.mem > self._mem_budget:
+      return 'memory budget'
+
+    if not self._check_machine: return None
+    available = self.GetAvailableMemory()
+    if available is not None and resources.mem + self._min_free_mem > available:
+      return 'available memory'
+    if self._max_load and os.getloadavg()[0] >= self._max_load:
+      return 'load average'
+    return None
+
+  def Acquire(self, task, resources):
+    """Marks the resources as held by the running task."""
+    self._running[task] = resources
+
+  def Release(self, task):
+    """Releases the resources held by the task."""
+    self._running.pop(task, None)
+
+  @classmethod
+  def GetAvailableMemory(cls):
+    """Returns: int: The memory available on the machine in bytes. None if unknown."""
+    try:
+      with open(cls.MEMINFO) as f:
+        for line in f:
+          if line.startswith('MemAvailable:'): return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError, IndexError):
+      pass
+    return None
@@ -0,0 +1,84 @@
+"""Tests for task_resources."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pylib.file.file_utils import FileUtils
+from pylib.zeus.task_resources import ResourceScheduler, TaskResources
+
+
+class TaskResourcesTest(unittest.TestCase):
+  """Tests for TaskResources."""
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_load(self):
+    task = os.path.join(self.dir, '000_task')
+    other = os.path.join(self.dir, '100_other')
+    resources = TaskResources.Load(task)
+    self.assertEqual((resources.mem, resources.cpus, resources.exclusive), (0, 1, set()))
+
+    FileUtils.CreateFileWithData(task + TaskResources.RESOURCES_SUFFIX,
+                                 '# Big.\nmem: 1.5g\ncpu: 4\nexclusive: db, disk\nbad: 1\n')
+    FileUtils.CreateFileWithData(os.path.join(self.dir, TaskResources.RESOURCES_SUFFIX),
+                                 'mem: 512m\n')
+    resources = TaskResources.Load(task)
+    self.assertEqual((resources.mem, resources.cpus, resources.exclusive),
+                     (3 << 29, 4, set(['db', 'disk'])))
+    # Tasks without a sidecar use the file of the dir.
+    self.assertEqual(TaskResources.Load(other).mem, 512 << 20)
+
+  def test_parse_size(self):
+    self.assertEqual(TaskResources.ParseSize('100'), 100)
+    self.assertEqual(TaskResources.ParseSize('2K'), 2048)
+    self.assertEqual(TaskResources.ParseSize('8gb'), 8 << 30)
+    self.assertRaises(ValueError, TaskResources.ParseSize, '8x')
+
+
+class ResourceSchedulerTest(unittest.TestCase):
+  """Tests for ResourceScheduler."""
+
+  def setUp(self):
+    # Do not depend on the memory of the machine.
+    self.meminfo = ResourceScheduler.MEMINFO
+    ResourceScheduler.MEMINFO = '/nonexistent'
+
+  def tearDown(self):
+    ResourceScheduler.MEMINFO = self.meminfo
+
+  def test_budget(self):
+    scheduler = ResourceScheduler(4, mem_budget=10)
+    big = TaskResources(mem=8, cpus=3)
+    # A task exceeding the budget still runs by itself.
+    self.assertIsNone(scheduler.GetBlockReason(TaskResources(mem=20, cpus=8)))
+
+    scheduler.Acquire('big', big)
+    self.assertIsNone(scheduler.GetBlockReason(TaskResources()))
+    self.assertEqual(scheduler.GetBlockReason(TaskResources(cpus=2)), 'cpu budget')
+    self.assertEqual(scheduler.GetBlockReason(TaskResources(mem=4)), 'memory budget')
+    # A reservation keeps smaller tasks from starving a blocked one.
+    self.assertEqual(scheduler.GetBlockReason(TaskResources(), TaskResources(cpus=1)),
+                     'cpu budget')
+
+    scheduler.Release('big')
+    self.assertIsNone(scheduler.GetBlockReason(TaskResources(cpus=2)))
+
+  def test_exclusive(self):
+    scheduler = ResourceScheduler(10)
+    scheduler.Acquire('a', TaskResources(exclusive=['db']))
+    self.assertEqual(scheduler.GetBlockReason(TaskResources(exclusive=['db', 'disk'])),
+                     'exclusive db')
+    self.assertIsNone(scheduler.GetBlockReason(TaskResources(exclusive=['disk'])))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,129 @@
+"""Shards of pipeline tasks that fan out over several processes."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+
+from pylib.base.term_color import TermColor
+from pylib.file.file_utils import FileUtils
+
+
+class TaskShards(object):
+  """Class to run a task as several shards of the same executable.
+
+  Sharding is opt-in. A task is sharded if it has a '<task>.shards' sidecar file with the number
+  of shards, or 'auto' for one shard per slot of the pool of the run. Lines starting with '#' are
+  comments. Each shard runs the task with the env vars:
+    PIPELINE_SHARD_INDEX: The index of the shard, from 0.
+    PIPELINE_SHARD_COUNT: The number of shards.
+  and writes its log to '<log>.shard<index>.log'.
+
+  The shards are one task for the rest of the pipeline: they start together, hold the resources of
+  the task once per shard, and the task finishes once all of them did, with the worst status of
+  the shards. If the task has a '<task>.merge' executable, it runs after all the shards succeeded
+  with PIPELINE_SHARD_COUNT set, and the task fails if it fails.
+  """
+
+  SHARDS_SUFFIX = '.shards'
+  MERGE_SUFFIX = '.merge'
+
+  # The usage added up over the shards.
+  SUMMED_USAGE = ['utime', 'stime', 'read_chars', 'write_chars', 'read_bytes', 'write_bytes']
+  # The usage of the sampled tree of each shard at its peak.
+  PEAK_USAGE = ['tree_rss_kb', 'peak_cpus']
+
+  @classmethod
+  def GetShardsFile(cls, task):
+    """Returns: string: The sidecar file with the number of shards of the task."""
+    return task + cls.SHARDS_SUFFIX
+
+  @classmethod
+  def GetMergeFile(cls, task):
+    """Returns: string: The merge step of the task. None if it has none."""
+    merge_file = task + cls.MERGE_SUFFIX
+    return merge_file if os.path.isfile(merge_file) else None
+
+  @classmethod
+  def GetShardCount(cls, task, pool_size):
+    """Returns the number of shards of the task.
+
+    Args:
+      task: string: The task.
+      pool_size: int: The number of tasks run in parallel. Used for 'auto'.
+
+    Return:
+      int: The number of shards. 1 if the task is not sharded.
+    """
+    shards_file = cls.GetShardsFile(task)
+    if not os.path.isfile(shards_file): return 1
+
+    lines = [x.split('#', 1)[0].strip() for x in
+             (FileUtils.FileContents(shards_file) or '').splitlines()]
+    count = next((x for x in lines if x), 'auto')
+    if count == 'auto': return max(pool_size, 1)
+    try:
+      if int(count) < 1: raise ValueError('must be at least 1')
+      return int(count)
+    except ValueError as e:
+      TermColor.Warning('Not sharding the task. Invalid number of shards [%s] in %s: %s' %
+                        (count, shards_file, e))
+      return 1
+
+  @classmethod
+  def GetEnvVars(cls, shard_index, shard_count):
+    """Returns the env vars for a shard.
+
+    Args:
+      shard_index: int: The index of the shard. None for the merge step.
+      shard_count: int: The number of shards.
+
+    Return:
+      dict {string, string}: The env vars.
+    """
+    vars = {'PIPELINE_SHARD_COUNT': str(shard_count)}
+    if shard_index is not None: vars['PIPELINE_SHARD_INDEX'] = str(shard_index)
+    return vars
+
+  @classmethod
+  def GetShardName(cls, shard_index):
+    """Returns: string: The name of the shard, or of the merge step if shard_index is None."""
+    return 'merge' if shard_index is None else 'shard%d' % shard_index
+
+  @classmethod
+  def GetLogFile(cls, log_file, shard_index):
+    """Returns: string: The log file of the shard for the log file of the task."""
+    if not log_file: return None
+    return '%s.%s.log' % (os.path.splitext(log_file)[0], cls.GetShardName(shard_index))
+
+  @classmethod
+  def CombineResults(cls, results):
+    """Combines the results of the shards into the result of the task.
+
+    Args:
+      results: list((int, dict)): The status and usage of each shard, and of the merge step if it
+          ran.
+
+    Return:
+      (int, dict): The worst status of the shards and their combined usage. The cpu time, io and
+          log size are their total and the mail that of the shards with the worst status. The
+          shards run side by side, so the peaks of the sampled tree are the sums over the shards,
+          or those of the merge step if larger.
+    """
+    status = max(x for (x, unused_usage) in results)
+    usage = {}
+    log_sizes = [y['log_size'] for (unused_x, y) in results if 'log_size' in y]
+    if log_sizes: usage['log_size'] = sum(log_sizes)
+    for key in cls.SUMMED_USAGE:
+      values = [y[key] for (unused_x, y) in results if key in y]
+      if values: usage[key] = sum(values)
+    for key in cls.PEAK_USAGE:
+      shards = [y[key] for (unused_x, y) in results if key in y and not y.get('merge')]
+      merge = [y[key] for (unused_x, y) in results if key in y and y.get('merge')]
+      if shards or merge: usage[key] = max([sum(shards)] + merge)
+
+    reasons = [y['reason'] for (x, y) in results if x == status and y.get('reason')]
+    if reasons: usage['reason'] = reasons[0]
+    mails = [y['mail'] for (x, y) in results if x == status and y.get('mail')]
+    if mails: usage['mail'] = (mails[0][0], '\n\n'.join(body for (unused_r, body) in mails))
+    return (status, usage)
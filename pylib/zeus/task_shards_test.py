@@ -0,0 +1,61 @@
+"""Tests for task_shards."""
+
+__author__ = 'pramodg@room77.com (Pramod Gupta)'
+__copyright__ = 'Copyright 2012 Room77, Inc.'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pylib.file.file_utils import FileUtils
+from pylib.zeus.task_shards import TaskShards
+
+
+class TaskShardsTest(unittest.TestCase):
+  """Tests for TaskShards."""
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.task = os.path.join(self.dir, '000_task')
+    FileUtils.CreateFileWithData(self.task, '#!/bin/bash\n')
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_shard_count(self):
+    self.assertEqual(TaskShards.GetShardCount(self.task, 8), 1)
+    FileUtils.CreateFileWithData(TaskShards.GetShardsFile(self.task), '# Shards.\n4\n')
+    self.assertEqual(TaskShards.GetShardCount(self.task, 8), 4)
+    FileUtils.CreateFileWithData(TaskShards.GetShardsFile(self.task), 'auto')
+    self.assertEqual(TaskShards.GetShardCount(self.task, 8), 8)
+    FileUtils.CreateFileWithData(TaskShards.GetShardsFile(self.task), '0')
+    self.assertEqual(TaskShards.GetShardCount(self.task, 8), 1)
+
+  def test_env_vars_and_logs(self):
+    self.assertEqual(TaskShards.GetEnvVars(2, 4),
+                     {'PIPELINE_SHARD_INDEX': '2', 'PIPELINE_SHARD_COUNT': '4'})
+    self.assertEqual(TaskShards.GetEnvVars(None, 4), {'PIPELINE_SHARD_COUNT': '4'})
+    self.assertEqual(TaskShards.GetLogFile('/log/a.b.log', 2), '/log/a.b.shard2.log')
+    self.assertEqual(TaskShards.GetLogFile('/log/a.b.log', None), '/log/a.b.merge.log')
+    self.assertIsNone(TaskShards.GetMergeFile(self.task))
+
+  def test_combine_results(self):
+    (status, usage) = TaskShards.CombineResults([
+        (0, {'log_size': 5, 'mail': ('ok@', 'shard0')}),
+        (2, {'log_size': 7, 'reason': 'oom', 'mail': ('fail@', 'shard1')}),
+        (2, {'mail': ('fail@', 'shard2')})])
+    self.assertEqual(status, 2)
+    self.assertEqual(usage, {'log_size': 12, 'reason': 'oom',
+                             'mail': ('fail@', 'shard1\n\nshard2')})
+
+    # The shards run side by side, the merge step after them.
+    (status, usage) = TaskShards.CombineResults([
+        (0, {'utime': 1.0, 'tree_rss_kb': 10, 'peak_cpus': 1.0}),
+        (0, {'utime': 2.0, 'tree_rss_kb': 20, 'peak_cpus': 1.0}),
+        (0, {'utime': 3.0, 'tree_rss_kb': 50, 'peak_cpus': 1.5, 'merge': True})])
+    self.assertEqual(usage, {'utime': 6.0, 'tree_rss_kb': 50, 'peak_cpus': 2.0})
+
+
+if __name__ == '__main__':
+  unittest.main()
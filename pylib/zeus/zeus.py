@@ -9,11 +9,14 @@ import argparse
 import sys
 import time
 
+import pylib.zeus.backfiller as backfiller
 import pylib.zeus.cleaner as cleaner
 import pylib.zeus.continuer as continuer
 import pylib.zeus.exporter as exporter
+import pylib.zeus.historian as historian
 import pylib.zeus.importer as importer
 import pylib.zeus.pipeline_config as pc
+import pylib.zeus.planner as planner
 import pylib.zeus.publisher as publisher
 import pylib.zeus.runner as runner
 
@@ -23,7 +26,8 @@ from pylib.base.term_color import TermColor
 class Zeus(object):
   """Main class to handle all pipeline commands."""
   # List of supported commands.
-  SUPPORTED_CMDS = ['clean', 'continue', 'export', 'import', 'publish', 'run', 'help']
+  SUPPORTED_CMDS = ['backfill', 'clean', 'continue', 'export', 'history', 'import', 'plan',
+                    'publish', 'run', 'help']
 
   def Run(self):
     self._Init()
@@ -59,6 +63,16 @@ class Zeus(object):
   def _GetHandler(self, command, type):
     return getattr(self, '_Handle_' + command.lower() + '_' + type, None);
 
+  def _Handle_backfill_init(self, parser):
+    """
+    Args:
+      parser: ArgumentParser: The argument parser for the command.
+    """
+    backfiller.Backfiller.Init(parser)
+
+  def _Handle_backfill_run(self):
+    return backfiller.Backfiller.Run();
+
   def _Handle_clean_init(self, parser):
     """
     Args:
@@ -90,6 +104,16 @@ class Zeus(object):
   def _Handle_export_run(self):
     return exporter.Exporter.Run();
 
+  def _Handle_history_init(self, parser):
+    """
+    Args:
+      parser: ArgumentParser: The argument parser for the command.
+    """
+    historian.Historian.Init(parser)
+
+  def _Handle_history_run(self):
+    return historian.Historian.Run();
+
   def _Handle_import_init(self, parser):
     """
     Args:
@@ -100,6 +124,16 @@ class Zeus(object):
   def _Handle_import_run(self):
     return importer.Importer.Run();
 
+  def _Handle_plan_init(self, parser):
+    """
+    Args:
+      parser: ArgumentParser: The argument parser for the command.
+    """
+    planner.Planner.Init(parser)
+
+  def _Handle_plan_run(self):
+    return planner.Planner.Run();
+
   def _Handle_publish_init(self, parser):
     """
     Args: